@@ -3,14 +3,19 @@
 用于对接不同的交易系统和券商接口
 """
 
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
 
+from ..core.config import settings
 from ..models.order import Order, OrderFill, OrderStatus, OrderSide, OrderType
+from ..services.matching_engine import MatchFill, MatchingEngine
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,85 @@ class OrderSubmissionResult:
         self.error_code = error_code
 
 
+class PooledConnection:
+    """连接池中的一条连接"""
+    
+    def __init__(self, index: int, handle: Any = None):
+        self.index = index
+        self.handle = handle  # 具体交易系统的会话/套接字对象
+        self.in_flight = 0
+        self.requests = 0
+
+
+class ConnectionPool:
+    """
+    交易系统连接池
+    固定数量的连接，每条连接允许 max_in_flight 个在途请求（流水线），
+    请求分配给在途数最少的连接，全部占满时排队等待
+    """
+    
+    def __init__(self, size: int = None, max_in_flight: int = None):
+        self.size = max(1, size or settings.TRADING_ADAPTER_POOL_SIZE)
+        self.max_in_flight = max(1, max_in_flight or settings.TRADING_ADAPTER_MAX_IN_FLIGHT)
+        self.connections = [PooledConnection(i) for i in range(self.size)]
+        self._waiters: deque = deque()
+        self.peak_in_flight = 0
+    
+    @asynccontextmanager
+    async def request(self):
+        """占用一个在途请求名额，返回承载该请求的连接"""
+        connection = self._least_loaded()
+        while connection is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # 已被唤醒但随即取消：把名额让给下一个等待者
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            connection = self._least_loaded()
+        
+        connection.in_flight += 1
+        connection.requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield connection
+        finally:
+            connection.in_flight -= 1
+            self._wake()
+    
+    @property
+    def in_flight(self) -> int:
+        return sum(c.in_flight for c in self.connections)
+    
+    def _least_loaded(self) -> Optional[PooledConnection]:
+        connection = min(self.connections, key=lambda c: c.in_flight)
+        return connection if connection.in_flight < self.max_in_flight else None
+    
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        return {
+            'size': self.size,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'waiting': len(self._waiters),
+            'requests': [c.requests for c in self.connections]
+        }
+
+
 class TradingSystemAdapter(ABC):
     """交易系统适配器基类"""
     
@@ -43,6 +127,8 @@ class TradingSystemAdapter(ABC):
         self.config = config
         self.is_connected = False
         self.connection_info = {}
+        self.pool = ConnectionPool(config.get('pool_size'), config.get('max_in_flight'))
+        self._order_update_queues: List[asyncio.Queue] = []
     
     @abstractmethod
     async def connect(self) -> bool:
@@ -69,6 +155,36 @@ class TradingSystemAdapter(ABC):
         """修改订单"""
         pass
     
+    async def submit_orders(self, orders: List[Order]) -> List[OrderSubmissionResult]:
+        """
+        批量提交订单，结果与 orders 一一对应
+        默认并发发送单笔请求，由连接池流水线化；交易系统有批量接口时应覆盖为一次请求
+        """
+        return list(await asyncio.gather(*(self.submit_order(order) for order in orders)))
+    
+    async def cancel_orders(self, orders: List[Order]) -> List[bool]:
+        """批量取消订单，结果与 orders 一一对应；默认实现同 submit_orders"""
+        return list(await asyncio.gather(*(self.cancel_order(order) for order in orders)))
+    
+    async def subscribe_order_updates(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        订阅订单状态事件流，替代逐单轮询 get_order_status
+        事件字段与 get_order_status 返回一致，另带 external_order_id；迭代器关闭即取消订阅
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._order_update_queues.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._order_update_queues.remove(queue)
+    
+    def _publish_order_update(self, external_order_id: str, order_info: Dict[str, Any]):
+        """向所有订阅者推送订单状态事件，状态事件不能丢弃，队列不设上限"""
+        event = {**order_info, 'external_order_id': external_order_id}
+        for queue in self._order_update_queues:
+            queue.put_nowait(event)
+    
     @abstractmethod
     async def get_order_status(self, external_order_id: str) -> Optional[Dict[str, Any]]:
         """获取订单状态"""
@@ -98,6 +214,9 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
         self.orders: Dict[str, Dict[str, Any]] = {}
         self.positions: Dict[str, Dict[str, Any]] = {}
         self.account_balance = Decimal('1000000')  # 100万模拟资金
+        self.matching = MatchingEngine(participation_rate=config.get('participation_rate'))
+        self.latency = config.get('latency', 0.0)  # 模拟单次请求往返耗时（秒）
+        self.round_trips = 0
         
     async def connect(self) -> bool:
         """连接到模拟交易系统"""
@@ -122,6 +241,16 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
     
     async def submit_order(self, order: Order) -> OrderSubmissionResult:
         """提交订单到模拟系统"""
+        async with self._round_trip():
+            return await self._accept_order(order)
+    
+    async def submit_orders(self, orders: List[Order]) -> List[OrderSubmissionResult]:
+        """批量提交订单，一次往返"""
+        async with self._round_trip():
+            return [await self._accept_order(order) for order in orders]
+    
+    async def _accept_order(self, order: Order) -> OrderSubmissionResult:
+        """模拟系统受理一笔订单"""
         try:
             if not self.is_connected:
                 return OrderSubmissionResult(
@@ -151,6 +280,9 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
                 'filled_quantity': 0,
                 'submitted_at': datetime.now().isoformat()
             }
+            self._add_to_book(external_order_id, order.order_type, order.side, order.symbol,
+                              float(order.quantity), order.price, order.stop_price)
+            self._publish_order_update(external_order_id, self.orders[external_order_id])
             
             logger.info(f"模拟系统接受订单: {external_order_id}")
             
@@ -167,8 +299,17 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
     
     async def cancel_order(self, order: Order) -> bool:
         """取消模拟订单"""
+        async with self._round_trip():
+            return self._cancel(order.order_id_external)
+    
+    async def cancel_orders(self, orders: List[Order]) -> List[bool]:
+        """批量取消订单，一次往返"""
+        async with self._round_trip():
+            return [self._cancel(order.order_id_external) for order in orders]
+    
+    def _cancel(self, external_order_id: Optional[str]) -> bool:
+        """模拟系统撤销一笔订单"""
         try:
-            external_order_id = order.order_id_external
             if not external_order_id or external_order_id not in self.orders:
                 logger.warning(f"未找到外部订单ID: {external_order_id}")
                 return False
@@ -179,8 +320,10 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
                 return False
             
             # 更新订单状态
+            self.matching.cancel(external_order_id)
             order_info['status'] = 'cancelled'
             order_info['cancelled_at'] = datetime.now().isoformat()
+            self._publish_order_update(external_order_id, order_info)
             
             logger.info(f"模拟系统取消订单: {external_order_id}")
             return True
@@ -191,13 +334,18 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
     
     async def modify_order(self, order: Order, modifications: Dict[str, Any]) -> bool:
         """修改模拟订单"""
+        async with self._round_trip():
+            return self._modify(order, modifications)
+    
+    def _modify(self, order: Order, modifications: Dict[str, Any]) -> bool:
+        """模拟系统改单"""
         try:
             external_order_id = order.order_id_external
             if not external_order_id or external_order_id not in self.orders:
                 return False
             
             order_info = self.orders[external_order_id]
-            if order_info['status'] not in ['submitted', 'accepted']:
+            if order_info['status'] not in ['submitted', 'accepted', 'partially_filled']:
                 return False
             
             # 应用修改
@@ -205,7 +353,14 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
                 if field in order_info:
                     order_info[field] = value
             
+            # 改单后重新排队
+            self.matching.cancel(external_order_id)
+            self._add_to_book(external_order_id, order_info['order_type'], order_info['side'], order_info['symbol'],
+                              order_info['quantity'] - order_info['filled_quantity'], order_info['price'],
+                              order.stop_price)
+            
             order_info['modified_at'] = datetime.now().isoformat()
+            self._publish_order_update(external_order_id, order_info)
             
             logger.info(f"模拟系统修改订单: {external_order_id}")
             return True
@@ -257,16 +412,72 @@ class MockTradingSystemAdapter(TradingSystemAdapter):
         # 添加随机波动
         import random
         current_price = base_price * random.uniform(0.98, 1.02)
+        volume = random.randint(1000, 10000)
+        
+        # 用最新价格撮合该合约的挂单
+        if self.matching.has_orders(symbol):
+            self._apply_fills(self.matching.on_price(symbol, current_price, volume))
         
         return {
             'symbol': symbol,
             'price': current_price,
             'bid': current_price * 0.999,
             'ask': current_price * 1.001,
-            'volume': random.randint(1000, 10000),
+            'volume': volume,
             'timestamp': datetime.now().isoformat()
         }
     
+    @asynccontextmanager
+    async def _round_trip(self):
+        """模拟一次请求往返：占用连接池名额并等待网络延迟"""
+        async with self.pool.request():
+            self.round_trips += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            yield
+    
+    def _add_to_book(self, external_order_id: str, order_type: Any, side: Any, symbol: str,
+                     quantity: float, price: Any, stop_price: Any):
+        """订单挂入撮合簿，撮合引擎不支持的类型按市价单处理"""
+        if order_type not in (OrderType.MARKET, OrderType.LIMIT, OrderType.STOP, OrderType.STOP_LIMIT):
+            order_type = OrderType.MARKET
+        self.matching.add(
+            external_order_id, symbol, side, order_type, quantity,
+            price=float(price) if price else None,
+            stop_price=float(stop_price) if stop_price else None
+        )
+    
+    def _apply_fills(self, fills: List[MatchFill]):
+        """把撮合成交写回模拟订单和持仓"""
+        for fill in fills:
+            order_info = self.orders[fill.order.order_id]
+            filled = order_info['filled_quantity'] + fill.quantity
+            order_info['avg_fill_price'] = (
+                order_info.get('avg_fill_price', 0.0) * order_info['filled_quantity'] + fill.price * fill.quantity
+            ) / filled
+            order_info['filled_quantity'] = filled
+            order_info['last_fill_price'] = fill.price
+            order_info['liquidity'] = fill.liquidity
+            order_info['status'] = 'filled' if fill.order.is_filled else 'partially_filled'
+            self._publish_order_update(fill.order.order_id, order_info)
+            
+            # 持仓数量带方向：多头为正、空头为负
+            position = self.positions.setdefault(fill.order.symbol, {
+                'symbol': fill.order.symbol, 'quantity': 0.0, 'average_price': 0.0,
+                'current_price': fill.price, 'unrealized_pnl': 0.0
+            })
+            signed = fill.quantity if fill.order.side == OrderSide.BUY.value else -fill.quantity
+            new_quantity = position['quantity'] + signed
+            if position['quantity'] == 0 or (position['quantity'] > 0) == (signed > 0):
+                position['average_price'] = (
+                    position['average_price'] * abs(position['quantity']) + fill.price * fill.quantity
+                ) / abs(new_quantity)
+            elif new_quantity == 0 or (new_quantity > 0) != (position['quantity'] > 0):
+                position['average_price'] = fill.price if new_quantity else 0.0
+            position['quantity'] = new_quantity
+            position['current_price'] = fill.price
+            position['unrealized_pnl'] = (fill.price - position['average_price']) * new_quantity
+    
     async def _validate_order(self, order: Order) -> Dict[str, Any]:
         """验证订单"""
         try:
@@ -411,7 +622,8 @@ class TradingSystemManager:
         for system_type, adapter in self.adapters.items():
             status[system_type] = {
                 'connected': adapter.is_connected,
-                'connection_info': adapter.connection_info
+                'connection_info': adapter.connection_info,
+                'pool': adapter.pool.get_stats()
             }
         return status
 
@@ -563,6 +563,58 @@ async def compare_backtests(
         raise HTTPException(status_code=500, detail="回测比较失败")
 
 
+# 参数优化相关路由
+@router.post("/{backtest_id}/optimizations", response_model=dict, status_code=status.HTTP_201_CREATED)
+async def start_parameter_sweep(
+    backtest_id: int,
+    sweep_data: dict,
+    current_user: User = Depends(get_current_user)
+):
+    """以回测为模板启动参数扫描"""
+    try:
+        from ...services.backtest_optimization_service import backtest_optimization_service
+
+        sweep = await backtest_optimization_service.start_sweep(backtest_id, current_user.id, sweep_data)
+
+        return success_response(data=sweep.to_dict(), message="参数扫描已启动")
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="启动参数扫描失败")
+
+
+@router.get("/optimizations/{sweep_id}", response_model=dict)
+async def get_parameter_sweep(
+    sweep_id: str,
+    top_n: int = Query(20, ge=1, le=200, description="排行榜数量"),
+    current_user: User = Depends(get_current_user)
+):
+    """获取参数扫描进度和排行榜"""
+    from ...services.backtest_optimization_service import backtest_optimization_service
+
+    sweep = backtest_optimization_service.get_sweep(sweep_id, current_user.id)
+    if not sweep:
+        raise HTTPException(status_code=404, detail="参数扫描不存在")
+
+    return success_response(data=sweep.to_dict(top_n), message="获取参数扫描成功")
+
+
+@router.post("/optimizations/{sweep_id}/cancel", response_model=dict)
+async def cancel_parameter_sweep(
+    sweep_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """取消参数扫描"""
+    from ...services.backtest_optimization_service import backtest_optimization_service
+
+    if not backtest_optimization_service.cancel_sweep(sweep_id, current_user.id):
+        raise HTTPException(status_code=400, detail="参数扫描不存在或未在运行")
+
+    return success_response(message="参数扫描已取消")
+
+
 # WebSocket路由
 from fastapi import WebSocket, WebSocketDisconnect
 from ...core.websocket import websocket_manager, websocket_handler
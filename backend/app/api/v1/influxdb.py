@@ -9,6 +9,7 @@ from pydantic import BaseModel
 from ...core.dependencies import get_current_user
 from ...services.influxdb_market_service import influxdb_market_service
 from ...core.influxdb import influx_manager
+from ...core.influxdb_writer import influx_writer
 from ...schemas.base import BaseResponse
 
 router = APIRouter()
@@ -324,5 +325,17 @@ async def flush_batches(
         raise HTTPException(status_code=500, detail=f"刷新批处理失败: {str(e)}")
 
 
+@router.get("/writer/metrics", summary="批量写入指标")
+async def get_writer_metrics(
+    current_user = Depends(get_current_user)
+):
+    """获取批量写入队列深度、吞吐、刷新延迟等指标"""
+    return BaseResponse(
+        success=True,
+        message="获取写入指标成功",
+        data=influx_writer.get_metrics()
+    )
+
+
 # 导入asyncio
 import asyncio
\ No newline at end of file
@@ -10,6 +10,8 @@ from ...core.dependencies import get_current_user, require_trader_or_admin, get_
 from ...core.response import success_response, paginated_response
 from ...services.market_service import market_service
 from ...services.history_service import history_service
+from ...core.tiered_cache import tiered_cache
+from ...core.cache import count_keys
 from ...schemas.market import (
     InstrumentInfo,
     QuoteData,
@@ -462,7 +464,11 @@ async def clear_cache(
     current_user: User = Depends(require_trader_or_admin),
 ):
     """清理历史数据缓存"""
-    history_service.clear_cache(symbol)
+    await asyncio.to_thread(history_service.clear_cache, symbol)
+    if symbol:
+        await tiered_cache.invalidate_tags(f"symbol:{symbol}")
+    else:
+        await tiered_cache.invalidate_local("market_summary")
     
     message = f"清理{symbol}的缓存成功" if symbol else "清理所有历史数据缓存成功"
     
@@ -480,21 +486,26 @@ async def get_cache_stats(
     try:
         redis_client = history_service.redis_client
         
-        # 统计缓存键数量
-        all_keys = redis_client.keys("*")
-        kline_keys = redis_client.keys("klines:*")
-        quote_keys = redis_client.keys("quotes:*")
+        # 统计缓存键数量（SCAN遍历，不阻塞Redis，在线程中执行不阻塞事件循环）
+        total_keys = await asyncio.to_thread(redis_client.dbsize)
+        kline_keys = await asyncio.to_thread(count_keys, redis_client, "klines:*")
+        quote_keys = await asyncio.to_thread(count_keys, redis_client, "quotes:*")
         
         # 估算缓存大小（简化计算）
-        cache_size_mb = len(all_keys) * 0.001  # 粗略估算
+        cache_size_mb = total_keys * 0.001  # 粗略估算
+        
+        segment_stats = history_service.get_cache_stats()
         
         stats = CacheStats(
-            total_keys=len(all_keys),
-            kline_cache_keys=len(kline_keys),
-            quote_cache_keys=len(quote_keys),
+            total_keys=total_keys,
+            kline_cache_keys=kline_keys,
+            quote_cache_keys=quote_keys,
             cache_size_mb=cache_size_mb,
-            hit_rate=0.85,  # 模拟值
-            last_cleanup=None
+            hit_rate=segment_stats["hit_rate"],
+            kline_segment_hits=segment_stats["hits"],
+            kline_segment_misses=segment_stats["misses"],
+            kline_open_segment_fetches=segment_stats["open_segment_fetches"],
+            last_cleanup=segment_stats["last_cleanup"]
         )
         
         return success_response(
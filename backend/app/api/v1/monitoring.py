@@ -6,6 +6,7 @@
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_
 
@@ -24,6 +25,8 @@ from app.schemas.monitoring import (
     AlertHistoryResponse
 )
 from app.services.monitoring_service import monitoring_service
+from app.core.loop_monitor import loop_monitor
+from app.core.tiered_cache import tiered_cache
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
@@ -411,6 +414,38 @@ async def stop_monitoring(
         return error_response(message=f"停止监控服务失败: {str(e)}")
 
 
+@router.get("/loop")
+async def get_loop_stats(
+    top: int = Query(20, ge=1, le=200, description="返回阻塞调用点数量"),
+    current_user: User = Depends(get_current_user)
+):
+    """获取事件循环延迟和阻塞调用点排行"""
+    return success_response(data=loop_monitor.get_stats(top))
+
+
+@router.post("/loop/reset")
+async def reset_loop_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """清空事件循环监控统计"""
+    loop_monitor.reset()
+    return success_response(message="事件循环监控统计已清空")
+
+
+@router.get("/loop/prometheus", response_class=PlainTextResponse)
+async def get_loop_prometheus_metrics():
+    """事件循环监控指标（Prometheus文本格式，供抓取，不需要登录）"""
+    return PlainTextResponse(loop_monitor.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/cache")
+async def get_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """获取两级缓存各命名空间的命中率"""
+    return success_response(data=tiered_cache.get_stats())
+
+
 @router.get("/dashboard")
 async def get_monitoring_dashboard(
     db: Session = Depends(get_db),
@@ -6,10 +6,11 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Background
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from ...core.database import get_db
+from ...core.async_repository import AsyncRepository
+from ...core.database import AsyncSession, get_async_db, get_db
 from ...core.dependencies import get_current_user
 from ...models.user import User
-from ...models.order import OrderStatus, OrderType, OrderSide
+from ...models.order import Order, OrderFill, OrderStatus, OrderType, OrderSide
 from ...schemas.order import (
     OrderCreate, OrderUpdate, OrderResponse, OrderListResponse,
     OrderSearchParams, OrderStatsResponse, OrderActionRequest, OrderActionResponse,
@@ -24,6 +25,24 @@ from ...core.response import success_response, error_response
 
 router = APIRouter()
 
+order_repository = AsyncRepository(Order)
+fill_repository = AsyncRepository(OrderFill)
+
+ACTIVE_ORDER_STATUSES = [
+    OrderStatus.PENDING,
+    OrderStatus.SUBMITTED,
+    OrderStatus.ACCEPTED,
+    OrderStatus.PARTIALLY_FILLED
+]
+
+
+async def get_user_order(db: AsyncSession, user_id: int, *criteria) -> Order:
+    """获取当前用户的订单，不存在或无权限时抛出 NotFoundError"""
+    order = await order_repository.first(db, Order.user_id == user_id, *criteria)
+    if not order:
+        raise NotFoundError("订单不存在或无权限访问")
+    return order
+
 
 @router.post("/", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
 async def create_order(
@@ -122,13 +141,17 @@ async def get_order_stats(
 
 @router.get("/active", response_model=List[OrderListResponse])
 async def get_active_orders(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取活跃订单"""
     try:
-        service = OrderService(db)
-        orders = service.get_active_orders(current_user.id)
+        orders = await order_repository.list(
+            db,
+            Order.user_id == current_user.id,
+            Order.status.in_(ACTIVE_ORDER_STATUSES),
+            order_by=Order.created_at.desc()
+        )
         return success_response(
             data=[order.to_dict() for order in orders],
             message="获取活跃订单成功"
@@ -140,13 +163,12 @@ async def get_active_orders(
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取订单详情"""
     try:
-        service = OrderService(db)
-        order = service.get_order(order_id, current_user.id)
+        order = await get_user_order(db, current_user.id, Order.id == order_id)
         return success_response(data=order.to_dict(), message="获取订单详情成功")
     except NotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -157,13 +179,12 @@ async def get_order(
 @router.get("/uuid/{order_uuid}", response_model=OrderResponse)
 async def get_order_by_uuid(
     order_uuid: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """通过UUID获取订单详情"""
     try:
-        service = OrderService(db)
-        order = service.get_order_by_uuid(order_uuid, current_user.id)
+        order = await get_user_order(db, current_user.id, Order.uuid == order_uuid)
         return success_response(data=order.to_dict(), message="获取订单详情成功")
     except NotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -324,17 +345,18 @@ async def add_order_fill(
 @router.get("/{order_id}/fills")
 async def get_order_fills(
     order_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取订单成交记录"""
     try:
-        service = OrderService(db)
-        
         # 验证订单权限
-        order = service.get_order(order_id, current_user.id)
+        await get_user_order(db, current_user.id, Order.id == order_id)
         
-        fills = [fill.to_dict() for fill in order.fills]
+        fills = [
+            fill.to_dict()
+            for fill in await fill_repository.list(db, OrderFill.order_id == order_id, order_by=OrderFill.id)
+        ]
         return success_response(data=fills, message="获取成交记录成功")
     except NotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
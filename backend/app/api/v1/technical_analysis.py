@@ -6,8 +6,11 @@ from typing import Optional, List
 import logging
 
 from ...services.technical_analysis_service import technical_analysis_service
+from ...services.indicator_library import list_indicators
 from ...core.dependencies import get_current_user
+from ...core.exceptions import ValidationError
 from ...models import User
+from ...schemas.market import IndicatorBatchRequest
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +46,50 @@ async def get_technical_indicators(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/indicators/batch")
+async def get_indicator_batch(
+    request: IndicatorBatchRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """批量获取多个合约的多个指标（列式数组）
+    
+    指标格式: [{"ema": 12}, {"macd": [12, 26, 9]}, {"atr": 14}, {"boll": [20, 2]}, "rsi"]
+    """
+    try:
+        result = await technical_analysis_service.get_indicator_batch(
+            symbols=request.symbols,
+            indicators=request.indicators,
+            period=request.period,
+            limit=request.limit,
+            tail=request.tail,
+            decimals=request.decimals
+        )
+        
+        return {
+            "success": True,
+            "data": result,
+            "message": "批量获取技术指标成功"
+        }
+        
+    except ValidationError:
+        raise
+    except Exception as e:
+        logger.error(f"批量获取技术指标失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/indicators")
+async def get_available_indicators(
+    current_user: User = Depends(get_current_user)
+):
+    """获取可用指标及默认参数"""
+    return {
+        "success": True,
+        "data": list_indicators(),
+        "message": "获取可用指标成功"
+    }
+
+
 @router.get("/multi-timeframe/{symbol}")
 async def get_multi_timeframe_analysis(
     symbol: str,
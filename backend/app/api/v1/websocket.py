@@ -6,9 +6,11 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPExce
 from sqlalchemy.orm import Session
 import logging
 import json
+import uuid
 
 from ...core.database import get_db
 from ...core.websocket import websocket_manager, websocket_handler
+from ...services.realtime_service import realtime_service
 from ...websocket.routes import get_current_user_from_token
 from ...models.user import User
 
@@ -96,4 +98,47 @@ async def websocket_general_endpoint(
         logger.error(f"通用WebSocket连接错误: {str(e)}")
     finally:
         websocket_manager.disconnect(websocket)
-from datetime import datetime
\ No newline at end of file
+
+
+@router.websocket("/quotes/{user_id}")
+async def websocket_quotes_endpoint(
+    websocket: WebSocket,
+    user_id: int,
+    token: str = None,
+    db: Session = Depends(get_db)
+):
+    """实时行情WebSocket连接端点
+    
+    订阅消息示例:
+        {"type": "subscribe", "symbols": ["SHFE.cu2401"], "mode": "compact",
+         "encoding": "msgpack", "max_updates_per_sec": 4}
+    compact模式先推送quote_snapshot，之后推送quote_delta；
+    客户端发现版本不连续时发送 {"type": "resync", "symbols": [...]} 重新获取快照
+    """
+    connection_id = str(uuid.uuid4())
+    try:
+        # 验证用户身份
+        if token:
+            current_user = await get_current_user_from_token(token, db)
+            if current_user is None or current_user.id != user_id:
+                await websocket.close(code=1008, reason="Unauthorized")
+                return
+        
+        # 建立连接
+        await realtime_service.add_connection(websocket, user_id, connection_id)
+        
+        try:
+            while True:
+                data = await websocket.receive_text()
+                await realtime_service.handle_client_message(connection_id, data)
+                
+        except WebSocketDisconnect:
+            logger.info(f"用户 {user_id} 断开行情WebSocket连接")
+        
+    except Exception as e:
+        logger.error(f"行情WebSocket连接错误: {str(e)}")
+    finally:
+        await realtime_service.remove_connection(connection_id)
+
+
+from datetime import datetime
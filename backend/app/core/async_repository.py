@@ -0,0 +1,63 @@
+"""
+异步仓储助手
+按模型封装常用的异步查询和写入，方法均接收调用方的 AsyncSession，事务边界由调用方
+（get_async_db / async_session_scope）控制
+"""
+from typing import Any, Generic, List, Optional, Type, TypeVar
+
+from sqlalchemy import func, select, update
+
+from .database import AsyncSession
+
+ModelType = TypeVar("ModelType")
+
+
+class AsyncRepository(Generic[ModelType]):
+    """单个模型的异步仓储"""
+
+    def __init__(self, model: Type[ModelType]):
+        self.model = model
+
+    async def get(self, session: AsyncSession, ident: Any) -> Optional[ModelType]:
+        """按主键获取"""
+        return await session.get(self.model, ident)
+
+    async def first(self, session: AsyncSession, *criteria, order_by=None) -> Optional[ModelType]:
+        """按条件获取第一条"""
+        statement = select(self.model).where(*criteria)
+        if order_by is not None:
+            statement = statement.order_by(order_by)
+        return (await session.scalars(statement.limit(1))).first()
+
+    async def list(self, session: AsyncSession, *criteria, order_by=None,
+                   limit: Optional[int] = None) -> List[ModelType]:
+        """按条件获取列表"""
+        statement = select(self.model).where(*criteria)
+        if order_by is not None:
+            statement = statement.order_by(order_by)
+        if limit is not None:
+            statement = statement.limit(limit)
+        return list((await session.scalars(statement)).all())
+
+    async def count(self, session: AsyncSession, *criteria) -> int:
+        """按条件计数"""
+        statement = select(func.count()).select_from(self.model).where(*criteria)
+        return int(await session.scalar(statement) or 0)
+
+    async def distinct_values(self, session: AsyncSession, column, *criteria) -> List[Any]:
+        """按条件获取某列的去重值"""
+        statement = select(column).where(*criteria).distinct()
+        return list((await session.scalars(statement)).all())
+
+    async def update_where(self, session: AsyncSession, *criteria, **values) -> int:
+        """按条件直接更新列值（不加载对象），返回更新行数"""
+        statement = update(self.model).where(*criteria).values(**values).execution_options(
+            synchronize_session=False
+        )
+        result = await session.execute(statement)
+        return result.rowcount
+
+    def add(self, session: AsyncSession, instance: ModelType) -> ModelType:
+        """新增对象，随会话提交写入"""
+        session.add(instance)
+        return instance
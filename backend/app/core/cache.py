@@ -2,27 +2,107 @@
 缓存管理模块
 """
 import json
-import pickle
-from typing import Any, Optional, Union, Dict, List
+import threading
+from typing import Any, Optional, Union, Dict, List, Iterable
 from datetime import datetime, timedelta
 from functools import wraps
 import hashlib
 import redis
 from sqlalchemy.orm import Session
 
+from app.core.codecs import STRUCTURED_CODEC, Codec, decode, encode
 from app.core.config import settings
-from app.core.logging import logger
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# 标签集合键前缀：每个标签一个Redis集合，保存登记在该标签下的缓存键
+TAG_KEY_PREFIX = "cache:tag:"
+# SCAN每批返回数量及UNLINK每批删除数量
+SCAN_BATCH_SIZE = 500
+
+
+def tag_key(tag: str) -> str:
+    """标签集合的Redis键"""
+    return f"{TAG_KEY_PREFIX}{tag}"
+
+
+def register_cache_tags(pipeline, key: str, tags: Iterable[str], ttl: int):
+    """在管道中把缓存键登记到各标签集合
+
+    标签集合的过期时间取其中最晚过期的条目（EXPIRE NX设置初值，GT只延长），
+    同步和异步Redis客户端的管道均可使用
+    """
+    ttl = max(1, int(ttl))
+    for tag in tags:
+        pipeline.sadd(tag_key(tag), key)
+        pipeline.expire(tag_key(tag), ttl, nx=True)
+        pipeline.expire(tag_key(tag), ttl, gt=True)
+
+
+def invalidate_cache_tags(redis_client, *tags: str) -> int:
+    """删除登记在标签下的全部缓存键，返回删除的缓存键数量
+
+    取出并删除标签集合在同一事务中完成，之后新登记的键不会被遗漏；
+    代价与标签下的条目数成正比，与Redis中的总键数无关
+    """
+    deleted = 0
+    for tag in tags:
+        pipeline = redis_client.pipeline(transaction=True)
+        pipeline.smembers(tag_key(tag))
+        pipeline.unlink(tag_key(tag))
+        members = list(pipeline.execute()[0])
+        for start in range(0, len(members), SCAN_BATCH_SIZE):
+            deleted += redis_client.unlink(*members[start:start + SCAN_BATCH_SIZE])
+    return deleted
+
+
+def scan_unlink(redis_client, pattern: str) -> int:
+    """按模式批量删除：SCAN增量遍历不阻塞Redis，UNLINK由Redis后台线程释放内存"""
+    deleted = 0
+    batch = []
+    for key in redis_client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH_SIZE:
+            deleted += redis_client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += redis_client.unlink(*batch)
+    return deleted
+
+
+def scan_unlink_in_background(redis_client, pattern: str) -> threading.Thread:
+    """在后台线程中按模式批量删除，调用方不等待遍历完成"""
+    def run():
+        try:
+            deleted = scan_unlink(redis_client, pattern)
+            logger.info(f"后台清除缓存完成: {pattern} {deleted}个键")
+        except Exception as e:
+            logger.error(f"后台清除缓存失败 {pattern}: {e}")
+
+    thread = threading.Thread(target=run, name=f"cache-unlink:{pattern}", daemon=True)
+    thread.start()
+    return thread
+
+
+def count_keys(redis_client, pattern: str) -> int:
+    """按模式统计键数量（SCAN遍历，不阻塞Redis）"""
+    return sum(1 for _ in redis_client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE))
 
 
 class CacheManager:
-    """缓存管理器"""
+    """缓存管理器
+
+    写入的数据带编解码器标识，读取时按标识解码；codec为未指定编码时的默认值
+    """
     
-    def __init__(self):
+    def __init__(self, codec: Optional[Union[str, Codec]] = None):
         self.redis_client = redis.Redis.from_url(
             settings.REDIS_URL,
             decode_responses=False  # 支持二进制数据
         )
         self.default_ttl = 3600  # 默认1小时过期
+        self.codec = codec or settings.CACHE_CODEC
         
     def _generate_key(self, prefix: str, *args, **kwargs) -> str:
         """生成缓存键"""
@@ -34,18 +114,24 @@ class CacheManager:
         try:
             data = self.redis_client.get(key)
             if data:
-                return pickle.loads(data)
+                return decode(data)
             return None
         except Exception as e:
             logger.error(f"缓存获取失败: {e}")
             return None
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """设置缓存值"""
+    def set(self, key: str, value: Any, ttl: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None, codec: Optional[Union[str, Codec]] = None) -> bool:
+        """设置缓存值，tags为失效标签（如 user:42、symbol:rb2405），codec为编解码器"""
         try:
             ttl = ttl or self.default_ttl
-            data = pickle.dumps(value)
-            return self.redis_client.setex(key, ttl, data)
+            data = encode(value, codec or self.codec)
+            if not tags:
+                return self.redis_client.setex(key, ttl, data)
+            pipeline = self.redis_client.pipeline()
+            pipeline.setex(key, ttl, data)
+            register_cache_tags(pipeline, key, tags, ttl)
+            return bool(pipeline.execute()[0])
         except Exception as e:
             logger.error(f"缓存设置失败: {e}")
             return False
@@ -66,13 +152,25 @@ class CacheManager:
             logger.error(f"缓存检查失败: {e}")
             return False
     
-    def clear_pattern(self, pattern: str) -> int:
-        """清除匹配模式的缓存"""
+    def invalidate_tags(self, *tags: str) -> int:
+        """按标签失效缓存，返回删除的缓存键数量"""
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
+            return invalidate_cache_tags(self.redis_client, *tags)
+        except Exception as e:
+            logger.error(f"缓存标签失效失败 {tags}: {e}")
             return 0
+
+    def clear_pattern(self, pattern: str, background: bool = False) -> int:
+        """清除匹配模式的缓存
+
+        遍历整个键空间，代价与总键数成正比，仅用于运维性的批量清理；
+        按业务对象失效请使用invalidate_tags。background为True时在后台线程中执行并返回0
+        """
+        try:
+            if background:
+                scan_unlink_in_background(self.redis_client, pattern)
+                return 0
+            return scan_unlink(self.redis_client, pattern)
         except Exception as e:
             logger.error(f"缓存模式清除失败: {e}")
             return 0
@@ -136,8 +234,12 @@ class QueryCache:
         self.query_ttl = 300  # 查询缓存5分钟
     
     def cache_query(self, query_key: str, query_func: callable, 
-                   ttl: Optional[int] = None) -> Any:
-        """缓存数据库查询结果"""
+                   ttl: Optional[int] = None, tags: Optional[Iterable[str]] = None) -> Any:
+        """缓存数据库查询结果
+
+        tags决定哪些失效操作会清除该结果：用户数据登记 user:{id}，
+        用户的策略列表再登记 strategies:user:{id}，策略数据登记 strategy:{id}，行情数据登记 symbol:{symbol}
+        """
         ttl = ttl or self.query_ttl
         
         # 检查缓存
@@ -147,44 +249,21 @@ class QueryCache:
         
         # 执行查询并缓存
         result = query_func()
-        self.cache.set(query_key, result, ttl)
+        self.cache.set(query_key, result, ttl, tags=tags)
         
         return result
     
     def invalidate_user_cache(self, user_id: str):
         """清除用户相关缓存"""
-        patterns = [
-            f"user:{user_id}:*",
-            f"strategies:user:{user_id}:*",
-            f"backtests:user:{user_id}:*",
-            f"orders:user:{user_id}:*",
-            f"positions:user:{user_id}:*"
-        ]
-        
-        for pattern in patterns:
-            self.cache.clear_pattern(pattern)
+        self.cache.invalidate_tags(f"user:{user_id}")
     
     def invalidate_strategy_cache(self, strategy_id: str, user_id: str):
         """清除策略相关缓存"""
-        patterns = [
-            f"strategy:{strategy_id}:*",
-            f"strategies:user:{user_id}:*",
-            f"backtests:strategy:{strategy_id}:*"
-        ]
-        
-        for pattern in patterns:
-            self.cache.clear_pattern(pattern)
+        self.cache.invalidate_tags(f"strategy:{strategy_id}", f"strategies:user:{user_id}")
     
     def invalidate_market_cache(self, symbol: str):
         """清除市场数据缓存"""
-        patterns = [
-            f"market:{symbol}:*",
-            f"quote:{symbol}:*",
-            f"kline:{symbol}:*"
-        ]
-        
-        for pattern in patterns:
-            self.cache.clear_pattern(pattern)
+        self.cache.invalidate_tags(f"symbol:{symbol}")
 
 
 # 全局查询缓存实例
@@ -202,7 +281,8 @@ class APIResponseCache:
                       ttl: Optional[int] = None) -> bool:
         """缓存API响应"""
         ttl = ttl or self.response_ttl
-        return self.cache.set(cache_key, response_data, ttl)
+        # 响应本身可JSON序列化，使用紧凑的结构化编码
+        return self.cache.set(cache_key, response_data, ttl, codec=STRUCTURED_CODEC)
     
     def get_cached_response(self, cache_key: str) -> Optional[Any]:
         """获取缓存的API响应"""
@@ -219,7 +299,7 @@ api_cache = APIResponseCache(cache_manager)
 
 
 class SessionCache:
-    """会话缓存"""
+    """会话缓存，会话数据是JSON兼容的字典，使用结构化编码"""
     
     def __init__(self, cache_manager: CacheManager):
         self.cache = cache_manager
@@ -228,7 +308,7 @@ class SessionCache:
     def set_user_session(self, user_id: str, session_data: Dict[str, Any]) -> bool:
         """设置用户会话"""
         key = f"session:user:{user_id}"
-        return self.cache.set(key, session_data, self.session_ttl)
+        return self.cache.set(key, session_data, self.session_ttl, codec=STRUCTURED_CODEC)
     
     def get_user_session(self, user_id: str) -> Optional[Dict[str, Any]]:
         """获取用户会话"""
@@ -243,7 +323,7 @@ class SessionCache:
     def set_strategy_session(self, strategy_id: str, session_data: Dict[str, Any]) -> bool:
         """设置策略会话"""
         key = f"session:strategy:{strategy_id}"
-        return self.cache.set(key, session_data, self.session_ttl)
+        return self.cache.set(key, session_data, self.session_ttl, codec=STRUCTURED_CODEC)
     
     def get_strategy_session(self, strategy_id: str) -> Optional[Dict[str, Any]]:
         """获取策略会话"""
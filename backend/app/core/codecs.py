@@ -0,0 +1,307 @@
+"""
+编解码器
+缓存、发布订阅和WebSocket消息共用的序列化层：
+- json: orjson（未安装时退回标准库json），无法序列化的对象转为字符串
+- msgpack: 二进制紧凑格式，NumPy数组/DataFrame以扩展类型嵌入原始内存
+- pickle: 任意Python对象，用于ORM对象等无法转为JSON兼容类型的值
+- numpy: 列式数值序列，头部之后依次是各列的原始内存，解码时直接映射为NumPy数组，不逐元素创建Python对象
+
+写入缓存的数据以1字节编解码器标识开头，decode按标识自动选择编解码器；
+没有标识的旧数据按pickle（0x80开头）或JSON解析。WebSocket等对外消息使用dumps，不带标识。
+"""
+
+import json
+import pickle
+import struct
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# MessagePack中嵌入numpy编码数据的扩展类型
+NUMPY_EXT_TYPE = 1
+
+# numpy编码各列内存按8字节对齐，解码得到的数组可直接参与向量化计算
+COLUMN_ALIGNMENT = 8
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _to_bytes(data: Any) -> Any:
+    return data.tobytes() if isinstance(data, memoryview) else data
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class Codec:
+    """编解码器基类
+
+    dumps/loads处理不带标识的数据；encode/decode处理带1字节标识的缓存数据
+    """
+
+    name = ""
+    codec_id = 0
+
+    @property
+    def prefix(self) -> bytes:
+        return bytes((self.codec_id,))
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: Buffer) -> Any:
+        raise NotImplementedError
+
+    def encode(self, obj: Any) -> bytes:
+        return self.prefix + self.dumps(obj)
+
+    def decode(self, data: Buffer) -> Any:
+        return self.loads(memoryview(data)[1:])
+
+
+class JsonCodec(Codec):
+    """JSON编解码，键可以是非字符串，NumPy数组转为列表"""
+
+    name = "json"
+    codec_id = 1
+
+    def dumps(self, obj: Any) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(obj, default=_json_default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(obj, ensure_ascii=False, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: Union[Buffer, str]) -> Any:
+        if ORJSON_AVAILABLE:
+            return orjson.loads(data)
+        return json.loads(_to_bytes(data))
+
+
+class MsgpackCodec(Codec):
+    """MessagePack编解码
+
+    wire为True时用于对外消息：NumPy数组转为列表，无法序列化的对象转为字符串；
+    否则用于缓存：NumPy数组和DataFrame以扩展类型嵌入原始内存，无法序列化的对象抛出TypeError。
+    日期时间统一转为ISO格式字符串，Decimal转为float，元组解码后为列表。
+    """
+
+    name = "msgpack"
+    codec_id = 2
+
+    def __init__(self, wire: bool = False):
+        self.wire = wire
+
+    def _default(self, value: Any) -> Any:
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (np.ndarray, pd.DataFrame)):
+            if self.wire:
+                return value.tolist() if isinstance(value, np.ndarray) else value.to_dict("list")
+            return msgpack.ExtType(NUMPY_EXT_TYPE, numpy_codec.dumps(value))
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        if self.wire:
+            return str(value)
+        raise TypeError(f"msgpack无法序列化类型: {type(value).__name__}")
+
+    @staticmethod
+    def _ext_hook(code: int, data: bytes) -> Any:
+        if code == NUMPY_EXT_TYPE:
+            return numpy_codec.loads(data)
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=self._default, use_bin_type=True)
+
+    def loads(self, data: Buffer) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=self._ext_hook)
+
+
+class PickleCodec(Codec):
+    """pickle编解码，支持任意Python对象，只能用于可信数据"""
+
+    name = "pickle"
+    codec_id = 3
+
+    def dumps(self, obj: Any) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: Buffer) -> Any:
+        return pickle.loads(data)
+
+
+class NumpyCodec(Codec):
+    """NumPy列式编解码
+
+    支持单个数组、列名到数组的字典、DataFrame（索引作为第一列保存）。格式::
+
+        [标识] 元数据长度(uint32) 元数据(JSON) 填充 列0内存 填充 列1内存 ...
+
+    元数据记录类型、各列名称/dtype/形状；各列内存按8字节对齐。
+    解码得到的数组直接引用输入数据（只读），DataFrame由pandas按列组装。
+    不支持object类型的列。
+    """
+
+    name = "numpy"
+    codec_id = 4
+
+    _META_LENGTH = struct.Struct("<I")
+
+    @staticmethod
+    def _columns(obj: Any) -> Tuple[Dict[str, Any], List[Tuple[str, np.ndarray]]]:
+        if isinstance(obj, pd.DataFrame):
+            index = obj.index
+            meta = {"kind": "frame", "index": index.name, "tz": None}
+            if getattr(index, "tz", None) is not None:
+                meta["tz"] = str(index.tz)
+                index = index.tz_convert(None)
+            columns = [("__index__", index.to_numpy())]
+            columns += [(str(name), obj[name].to_numpy()) for name in obj.columns]
+        elif isinstance(obj, np.ndarray):
+            meta = {"kind": "array"}
+            columns = [("", obj)]
+        elif isinstance(obj, Mapping):
+            meta = {"kind": "columns"}
+            columns = [(str(name), np.asarray(values)) for name, values in obj.items()]
+        else:
+            raise TypeError(f"numpy编码只支持ndarray、数组字典和DataFrame: {type(obj).__name__}")
+
+        for name, values in columns:
+            if values.dtype.hasobject:
+                raise TypeError(f"numpy编码不支持object类型的列: {name or 'array'}")
+        meta["columns"] = [[name, values.dtype.str, list(values.shape)] for name, values in columns]
+        return meta, columns
+
+    def _pack(self, obj: Any, prefix: bytes) -> bytes:
+        meta, columns = self._columns(obj)
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        parts = [prefix, self._META_LENGTH.pack(len(meta_bytes)), meta_bytes]
+        size = len(prefix) + self._META_LENGTH.size + len(meta_bytes)
+        for _, values in columns:
+            padding = -size % COLUMN_ALIGNMENT
+            parts.append(b"\0" * padding)
+            buffer = np.ascontiguousarray(values).reshape(-1).view(np.uint8)
+            parts.append(buffer)
+            size += padding + buffer.nbytes
+        return b"".join(parts)
+
+    def _unpack(self, data: Buffer, start: int) -> Any:
+        view = memoryview(data)
+        (meta_length,) = self._META_LENGTH.unpack_from(view, start)
+        offset = start + self._META_LENGTH.size
+        meta = json.loads(view[offset:offset + meta_length].tobytes())
+        offset += meta_length
+
+        arrays = []
+        for name, dtype, shape in meta["columns"]:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            offset += -offset % COLUMN_ALIGNMENT
+            values = np.frombuffer(view, dtype=dtype, count=count, offset=offset).reshape(shape)
+            arrays.append((name, values))
+            offset += count * dtype.itemsize
+
+        kind = meta["kind"]
+        if kind == "array":
+            return arrays[0][1]
+        if kind == "columns":
+            return dict(arrays)
+        index = pd.Index(arrays[0][1], name=meta["index"])
+        if meta["tz"]:
+            index = index.tz_localize("UTC").tz_convert(meta["tz"])
+        return pd.DataFrame(dict(arrays[1:]), index=index, columns=[name for name, _ in arrays[1:]])
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._pack(obj, b"")
+
+    def loads(self, data: Buffer) -> Any:
+        return self._unpack(data, 0)
+
+    def encode(self, obj: Any) -> bytes:
+        # 标识与数据一次拼接，不为大块数组多复制一次
+        return self._pack(obj, self.prefix)
+
+    def decode(self, data: Buffer) -> Any:
+        return self._unpack(data, 1)
+
+
+json_codec = JsonCodec()
+pickle_codec = PickleCodec()
+numpy_codec = NumpyCodec()
+msgpack_codec = MsgpackCodec() if MSGPACK_AVAILABLE else None
+
+# 结构化数据（字典/列表等JSON兼容值）缓存时使用的编解码器
+STRUCTURED_CODEC = "msgpack" if MSGPACK_AVAILABLE else "json"
+
+_codecs: Dict[str, Codec] = {}
+_codecs_by_id: Dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec):
+    """注册编解码器，标识不能与已注册的其他编解码器重复"""
+    existing = _codecs_by_id.get(codec.codec_id)
+    if existing is not None and existing.name != codec.name:
+        raise ValueError(f"编解码器标识冲突: {codec.name} 与 {existing.name}")
+    _codecs[codec.name] = codec
+    _codecs_by_id[codec.codec_id] = codec
+
+
+for _codec in (json_codec, msgpack_codec, pickle_codec, numpy_codec):
+    if _codec is not None:
+        register_codec(_codec)
+
+
+def get_codec(codec: Union[str, Codec]) -> Codec:
+    """按名称获取编解码器"""
+    if isinstance(codec, Codec):
+        return codec
+    try:
+        return _codecs[codec]
+    except KeyError:
+        raise ValueError(f"未知或不可用的编解码器: {codec}，可用: {', '.join(sorted(_codecs))}") from None
+
+
+def available_codecs() -> List[str]:
+    """已注册的编解码器名称"""
+    return sorted(_codecs)
+
+
+def encode(obj: Any, codec: Union[str, Codec] = "pickle") -> bytes:
+    """编码为带标识的缓存数据"""
+    return get_codec(codec).encode(obj)
+
+
+def decode(data: Union[Buffer, str]) -> Any:
+    """按标识解码缓存数据，兼容没有标识的pickle和JSON旧数据"""
+    if isinstance(data, str):
+        return json_codec.loads(data)
+    codec = _codecs_by_id.get(data[0])
+    if codec is not None:
+        return codec.decode(data)
+    if data[0] == 0x80:
+        return pickle.loads(data)
+    return json_codec.loads(data)
@@ -35,10 +35,20 @@ class Settings(BaseSettings):
     INFLUXDB_TOKEN: str = "my-super-secret-auth-token"
     INFLUXDB_ORG: str = "trading-org"
     INFLUXDB_BUCKET: str = "market-data"
+
+    # InfluxDB批量写入配置
+    INFLUX_WRITE_BATCH_SIZE: int = 5000
+    INFLUX_WRITE_FLUSH_INTERVAL: float = 1.0
+    INFLUX_WRITE_QUEUE_SIZE: int = 100000
+    INFLUX_WRITE_OVERFLOW_POLICY: str = "drop_oldest"  # block/drop_newest/drop_oldest
+    INFLUX_WRITE_SPOOL_DIR: str = "data/influx_spool"
     
     # Redis配置
     REDIS_URL: str = "redis://redis:6379/0"
-    
+
+    # 本地K线列式存储目录
+    KLINE_STORE_DIR: str = "data/klines"
+
     # 数据库连接池配置
     DB_POOL_SIZE: int = 10
     DB_MAX_OVERFLOW: int = 20
@@ -62,6 +72,7 @@ class Settings(BaseSettings):
     # ============================================================================
     TQSDK_AUTH: Optional[str] = None
     TQSDK_ACCOUNT: Optional[str] = None
+    TQSDK_MOCK_QUOTE_INTERVAL: float = 0.5  # 未接入tqsdk时模拟行情的推送间隔（秒）
     
     # ============================================================================
     # 邮件服务配置
@@ -83,6 +94,43 @@ class Settings(BaseSettings):
     MAX_DAILY_LOSS_PERCENT: float = 5.0
     MAX_POSITION_PERCENT: float = 20.0
     MAX_ORDERS_PER_MINUTE: int = 10
+    RISK_BOOK_RECONCILE_INTERVAL: float = 60.0  # 内存风控账本与数据库对账间隔（秒），0表示不对账
+
+    # 实时风险监控：按用户ID分片，只检查持仓或价格变动的用户
+    RISK_MONITOR_INTERVAL: float = 5.0  # 监控周期（秒）
+    RISK_MONITOR_SHARDS: int = 64  # 分片数
+    RISK_MONITOR_WORKERS: int = 8  # 每个节点并行检查的线程数
+    RISK_MONITOR_FULL_SCAN_INTERVAL: float = 600.0  # 全量检查间隔（秒），捕获规则等非事件变化
+    RISK_MONITOR_COORDINATION: str = "local"  # local: 单进程; redis: 多进程/多节点经Redis分配分片
+    RISK_MONITOR_NODE_TTL: float = 30.0  # redis协调时节点心跳过期时间（秒）
+
+    # 组合风险分析：按合约维护滚动日收益率矩阵，批量计算全部用户的VaR/CVaR
+    RISK_ANALYTICS_WINDOW: int = 252  # 收益率窗口（交易日）
+    RISK_ANALYTICS_SIMULATIONS: int = 5000  # 蒙特卡洛模拟情景数
+
+    # 持仓批量盯市：未实现盈亏变化达到阈值（金额或占持仓成本的比例，取较大者）才推送
+    POSITION_MTM_MIN_PNL_CHANGE: float = 1.0
+    POSITION_MTM_MIN_PNL_CHANGE_RATIO: float = 0.001
+
+    # 持仓账本：每回放多少笔新成交追加一个检查点；写入不足该秒数的成交暂不进入检查点
+    POSITION_LEDGER_CHECKPOINT_INTERVAL: int = 500
+    POSITION_LEDGER_SETTLE_SECONDS: float = 60.0
+
+    # 模拟撮合：每根K线挂单最多成交该K线成交量的比例
+    MATCHING_PARTICIPATION_RATE: float = 0.1
+
+    # 订单执行引擎：固定数量的执行协程按优先级通道处理订单
+    ORDER_EXECUTION_WORKERS: int = 8
+
+    # 交易系统适配器连接池：每条连接允许多个在途请求（流水线），超出上限的请求排队
+    TRADING_ADAPTER_POOL_SIZE: int = 4
+    TRADING_ADAPTER_MAX_IN_FLIGHT: int = 32
+
+    # 事件循环监控：探针间隔测量调度延迟，循环停顿超过阈值时采集事件循环线程的调用栈
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.05
+    LOOP_MONITOR_BLOCK_THRESHOLD: float = 0.1
+    LOOP_MONITOR_TOP_N: int = 20
     
     # ============================================================================
     # Docker 和部署配置
@@ -133,7 +181,19 @@ class Settings(BaseSettings):
     KEEPALIVE_TIMEOUT: int = 65
     REDIS_MAX_CONNECTIONS: int = 50
     REDIS_CONNECTION_TIMEOUT: int = 5
-    
+
+    # 两级缓存：进程内LRU在前、Redis在后，跨进程失效通过Redis发布订阅通知
+    CACHE_LOCAL_MAX_ENTRIES: int = 10000
+    CACHE_DEFAULT_TTL: int = 60
+    # 过期后仍可返回旧值并在后台刷新的时长（秒）
+    CACHE_STALE_TTL: int = 30
+    # 提前刷新系数，越大越早触发概率刷新，0为关闭
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    CACHE_KEY_PREFIX: str = "tc:"
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
+    # 缓存值未指定编解码器时使用的编码：pickle（任意对象）/msgpack/json
+    CACHE_CODEC: str = "pickle"
+
     # ============================================================================
     # 验证器
     # ============================================================================
@@ -1,15 +1,29 @@
 """
 数据库连接和会话管理
+同步引擎供同步服务和线程中的批处理使用；异步引擎（asyncpg）供 async 接口和服务使用，
+查询期间不阻塞事件循环
 """
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from influxdb_client import InfluxDBClient
-from typing import Generator
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Generator, Optional
 import redis
 
 from .config import settings
 
+try:
+    import asyncpg  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    AsyncSession = None
+    ASYNCPG_AVAILABLE = False
+
 # PostgreSQL数据库配置
 engine = create_engine(
     settings.DATABASE_URL,
@@ -24,6 +38,106 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # SQLAlchemy基类
 Base = declarative_base()
 
+# ThreadedAsyncSession.run_sync 工作线程所属的事件循环
+_run_sync_loop: ContextVar[Optional[asyncio.AbstractEventLoop]] = ContextVar('run_sync_loop', default=None)
+
+
+def call_on_loop(callback: Callable[..., Any], *args) -> None:
+    """
+    执行依赖事件循环的回调（WebSocket通知、内存风控账本更新等）
+    在 ThreadedAsyncSession.run_sync 的工作线程中调用时交回事件循环执行，否则直接执行
+    """
+    loop = _run_sync_loop.get()
+    if loop is None:
+        callback(*args)
+    else:
+        loop.call_soon_threadsafe(callback, *args)
+
+
+class ThreadedAsyncSession:
+    """
+    未安装 asyncpg 时的异步会话：提供 AsyncSession 的常用接口，
+    每次数据库操作在线程中执行同步会话，同样不阻塞事件循环
+    """
+    
+    def __init__(self, session: Session = None):
+        # 提交后不过期对象，避免在事件循环线程中触发懒加载查询
+        self.sync_session = session or SessionLocal(expire_on_commit=False)
+    
+    async def execute(self, statement, params=None):
+        result = await asyncio.to_thread(self.sync_session.execute, statement, params)
+        # 在线程中取完结果行，调用方在事件循环中读取时不再访问数据库；
+        # UPDATE/DELETE 等不返回行的结果直接返回（保留 rowcount）
+        return result.freeze()() if getattr(result, 'returns_rows', True) else result
+    
+    async def scalar(self, statement, params=None):
+        return (await self.execute(statement, params)).scalar()
+    
+    async def scalars(self, statement, params=None):
+        return (await self.execute(statement, params)).scalars()
+    
+    async def get(self, entity, ident):
+        return await asyncio.to_thread(self.sync_session.get, entity, ident)
+    
+    def add(self, instance):
+        self.sync_session.add(instance)
+    
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+    
+    async def delete(self, instance):
+        await asyncio.to_thread(self.sync_session.delete, instance)
+    
+    async def flush(self):
+        await asyncio.to_thread(self.sync_session.flush)
+    
+    async def commit(self):
+        await asyncio.to_thread(self.sync_session.commit)
+    
+    async def rollback(self):
+        await asyncio.to_thread(self.sync_session.rollback)
+    
+    async def refresh(self, instance):
+        await asyncio.to_thread(self.sync_session.refresh, instance)
+    
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在会话上执行同步ORM代码（与 AsyncSession.run_sync 一致，fn 的第一个参数为同步会话）
+        fn 在工作线程中执行，其中依赖事件循环的操作需经 call_on_loop 交回事件循环
+        """
+        loop = asyncio.get_running_loop()
+        
+        def call():
+            # to_thread 在复制的上下文中执行，设置的事件循环只对本次调用可见
+            _run_sync_loop.set(loop)
+            return fn(self.sync_session, *args, **kwargs)
+        
+        return await asyncio.to_thread(call)
+    
+    async def close(self):
+        await asyncio.to_thread(self.sync_session.close)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+if ASYNCPG_AVAILABLE:
+    # PostgreSQL异步引擎，与同步引擎使用同一数据库
+    async_engine = create_async_engine(
+        make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=10,
+        max_overflow=20,
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = ThreadedAsyncSession
+
 # InfluxDB客户端
 influx_client = InfluxDBClient(
     url=settings.INFLUXDB_URL,
@@ -33,6 +147,8 @@ influx_client = InfluxDBClient(
 
 # Redis客户端
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# 二进制Redis客户端，读写编解码器编码的缓存数据
+binary_redis_client = redis.from_url(settings.REDIS_URL, decode_responses=False)
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -44,6 +160,24 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """获取异步数据库会话（用于 async 接口的依赖注入）"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator[AsyncSession]:
+    """异步数据库会话上下文：正常退出时提交，异常时回滚"""
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+
 def get_influx_client() -> InfluxDBClient:
     """获取InfluxDB客户端"""
     return influx_client
@@ -51,4 +185,9 @@ def get_influx_client() -> InfluxDBClient:
 
 def get_redis_client() -> redis.Redis:
     """获取Redis客户端"""
-    return redis_client
\ No newline at end of file
+    return redis_client
+
+
+def get_binary_redis_client() -> redis.Redis:
+    """获取不解码响应的Redis客户端"""
+    return binary_redis_client
\ No newline at end of file
@@ -1,13 +1,21 @@
 """
 InfluxDB时序数据库操作工具
 """
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from datetime import datetime, timedelta
+from influxdb_client import InfluxDBClient
 from influxdb_client.client.write_api import SYNCHRONOUS
 import logging
+import pandas as pd
+
+try:
+    from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+    ASYNC_CLIENT_AVAILABLE = True
+except ImportError:
+    ASYNC_CLIENT_AVAILABLE = False
 
 from .config import settings
+from .influxdb_writer import influx_writer
 
 logger = logging.getLogger(__name__)
 
@@ -26,63 +34,61 @@ class InfluxDBManager:
         self.bucket = settings.INFLUXDB_BUCKET
     
     def write_quote(self, symbol: str, quote_data: Dict[str, Any]) -> bool:
-        """写入行情数据"""
+        """写入行情数据（进入批量写入队列）"""
         try:
-            point = (
-                Point("quotes")
-                .tag("symbol", symbol)
-                .field("last_price", float(quote_data.get("last_price", 0)))
-                .field("bid_price", float(quote_data.get("bid_price", 0)))
-                .field("ask_price", float(quote_data.get("ask_price", 0)))
-                .field("volume", int(quote_data.get("volume", 0)))
-                .field("open_interest", int(quote_data.get("open_interest", 0)))
-                .time(quote_data.get("timestamp", datetime.utcnow()), WritePrecision.MS)
+            return influx_writer.write_nowait(
+                "quotes",
+                {"symbol": symbol},
+                {
+                    "last_price": float(quote_data.get("last_price", 0)),
+                    "bid_price": float(quote_data.get("bid_price", 0)),
+                    "ask_price": float(quote_data.get("ask_price", 0)),
+                    "volume": int(quote_data.get("volume", 0)),
+                    "open_interest": int(quote_data.get("open_interest", 0)),
+                },
+                quote_data.get("timestamp"),
             )
-            
-            self.write_api.write(bucket=self.bucket, record=point)
-            return True
         except Exception as e:
             logger.error(f"写入行情数据失败: {e}")
             return False
     
     def write_kline(self, symbol: str, kline_data: Dict[str, Any]) -> bool:
-        """写入K线数据"""
+        """写入K线数据（进入批量写入队列）"""
         try:
-            point = (
-                Point("klines")
-                .tag("symbol", symbol)
-                .tag("period", kline_data.get("period", "1m"))
-                .field("open", float(kline_data.get("open", 0)))
-                .field("high", float(kline_data.get("high", 0)))
-                .field("low", float(kline_data.get("low", 0)))
-                .field("close", float(kline_data.get("close", 0)))
-                .field("volume", int(kline_data.get("volume", 0)))
-                .time(kline_data.get("datetime", datetime.utcnow()), WritePrecision.MS)
+            return influx_writer.write_nowait(
+                "klines",
+                {"symbol": symbol, "period": kline_data.get("period", "1m")},
+                {
+                    "open": float(kline_data.get("open", 0)),
+                    "high": float(kline_data.get("high", 0)),
+                    "low": float(kline_data.get("low", 0)),
+                    "close": float(kline_data.get("close", 0)),
+                    "volume": int(kline_data.get("volume", 0)),
+                },
+                kline_data.get("datetime"),
             )
-            
-            self.write_api.write(bucket=self.bucket, record=point)
-            return True
         except Exception as e:
             logger.error(f"写入K线数据失败: {e}")
             return False
     
     def write_trade_record(self, trade_data: Dict[str, Any]) -> bool:
-        """写入交易记录"""
+        """写入交易记录（进入批量写入队列）"""
         try:
-            point = (
-                Point("trades")
-                .tag("symbol", trade_data.get("symbol"))
-                .tag("strategy_id", str(trade_data.get("strategy_id")))
-                .tag("direction", trade_data.get("direction"))
-                .field("price", float(trade_data.get("price", 0)))
-                .field("volume", int(trade_data.get("volume", 0)))
-                .field("amount", float(trade_data.get("amount", 0)))
-                .field("commission", float(trade_data.get("commission", 0)))
-                .time(trade_data.get("timestamp", datetime.utcnow()), WritePrecision.MS)
+            return influx_writer.write_nowait(
+                "trades",
+                {
+                    "symbol": trade_data.get("symbol"),
+                    "strategy_id": str(trade_data.get("strategy_id")),
+                    "direction": trade_data.get("direction"),
+                },
+                {
+                    "price": float(trade_data.get("price", 0)),
+                    "volume": int(trade_data.get("volume", 0)),
+                    "amount": float(trade_data.get("amount", 0)),
+                    "commission": float(trade_data.get("commission", 0)),
+                },
+                trade_data.get("timestamp"),
             )
-            
-            self.write_api.write(bucket=self.bucket, record=point)
-            return True
         except Exception as e:
             logger.error(f"写入交易记录失败: {e}")
             return False
@@ -94,31 +100,16 @@ class InfluxDBManager:
         end_time: Optional[datetime] = None,
         limit: int = 1000
     ) -> List[Dict[str, Any]]:
-        """查询行情数据"""
+        """查询行情数据，每行一条完整行情"""
         try:
-            time_filter = f'time >= {int(start_time.timestamp())}s'
-            if end_time:
-                time_filter += f' and time <= {int(end_time.timestamp())}s'
-            
-            query = f'''
-                from(bucket: "{self.bucket}")
-                |> range(start: {int(start_time.timestamp())}s{f', stop: {int(end_time.timestamp())}s' if end_time else ''})
-                |> filter(fn: (r) => r._measurement == "quotes")
-                |> filter(fn: (r) => r.symbol == "{symbol}")
-                |> limit(n: {limit})
-                |> sort(columns: ["_time"])
-            '''
-            
-            result = self.query_api.query(query)
+            query, params = build_quote_query(self.bucket, symbol, start_time, end_time, limit)
+            result = self.query_api.query(query, params=params)
             
             quotes = []
             for table in result:
                 for record in table.records:
-                    quote = {
-                        "symbol": record.values.get("symbol"),
-                        "timestamp": record.get_time(),
-                        record.get_field(): record.get_value()
-                    }
+                    quote = _pivoted_row(record.values)
+                    quote["timestamp"] = quote["datetime"]
                     quotes.append(quote)
             
             return quotes
@@ -134,32 +125,12 @@ class InfluxDBManager:
         end_time: Optional[datetime] = None,
         limit: int = 1000
     ) -> List[Dict[str, Any]]:
-        """查询K线数据"""
+        """查询K线数据，每行一根完整K线"""
         try:
-            query = f'''
-                from(bucket: "{self.bucket}")
-                |> range(start: {int(start_time.timestamp())}s{f', stop: {int(end_time.timestamp())}s' if end_time else ''})
-                |> filter(fn: (r) => r._measurement == "klines")
-                |> filter(fn: (r) => r.symbol == "{symbol}")
-                |> filter(fn: (r) => r.period == "{period}")
-                |> limit(n: {limit})
-                |> sort(columns: ["_time"])
-            '''
-            
-            result = self.query_api.query(query)
+            query, params = build_kline_query(self.bucket, symbol, period, start_time, end_time, limit)
+            result = self.query_api.query(query, params=params)
             
-            klines = []
-            for table in result:
-                for record in table.records:
-                    kline = {
-                        "symbol": record.values.get("symbol"),
-                        "period": record.values.get("period"),
-                        "datetime": record.get_time(),
-                        record.get_field(): record.get_value()
-                    }
-                    klines.append(kline)
-            
-            return klines
+            return [_pivoted_row(record.values) for table in result for record in table.records]
         except Exception as e:
             logger.error(f"查询K线数据失败: {e}")
             return []
@@ -170,5 +141,192 @@ class InfluxDBManager:
             self.client.close()
 
 
+class AsyncInfluxQuery:
+    """基于异步客户端的InfluxDB查询
+
+    查询不阻塞事件循环，结果按批次以DataFrame流式返回，大范围历史数据不会一次性载入内存。
+    """
+    
+    def __init__(self):
+        self.bucket = settings.INFLUXDB_BUCKET
+        self._client = None
+    
+    @property
+    def available(self) -> bool:
+        return ASYNC_CLIENT_AVAILABLE
+    
+    def _get_client(self):
+        """异步客户端需要在事件循环中创建"""
+        if self._client is None:
+            self._client = InfluxDBClientAsync(
+                url=settings.INFLUXDB_URL,
+                token=settings.INFLUXDB_TOKEN,
+                org=settings.INFLUXDB_ORG,
+            )
+        return self._client
+    
+    async def stream_frames(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_rows: int = 50000
+    ) -> AsyncIterator[pd.DataFrame]:
+        """执行查询并按批次返回DataFrame，每批不超过batch_rows行"""
+        if not self.available:
+            raise RuntimeError("InfluxDB异步客户端不可用，需要安装 influxdb-client[async]")
+        
+        stream = await self._get_client().query_api().query_data_frame_stream(query, params=params)
+        async for frame in stream:
+            frame = frame.drop(columns=[c for c in ("result", "table") if c in frame.columns])
+            for begin in range(0, len(frame), batch_rows):
+                yield frame.iloc[begin:begin + batch_rows]
+    
+    async def stream_klines(
+        self,
+        symbol: str,
+        period: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        batch_rows: int = 50000
+    ) -> AsyncIterator[pd.DataFrame]:
+        """按批次流式返回K线，datetime为索引"""
+        query, params = build_kline_query(self.bucket, symbol, period, start_time, end_time, limit)
+        async for frame in self.stream_frames(query, params, batch_rows):
+            yield _time_indexed(frame, KLINE_FIELDS)
+    
+    async def stream_quotes(
+        self,
+        symbol: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        batch_rows: int = 50000
+    ) -> AsyncIterator[pd.DataFrame]:
+        """按批次流式返回行情，datetime为索引"""
+        query, params = build_quote_query(self.bucket, symbol, start_time, end_time, limit)
+        async for frame in self.stream_frames(query, params, batch_rows):
+            yield _time_indexed(frame, QUOTE_FIELDS)
+    
+    async def query_klines_frame(
+        self,
+        symbol: str,
+        period: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """查询K线并合并为一个DataFrame"""
+        frames = [frame async for frame in self.stream_klines(symbol, period, start_time, end_time, limit)]
+        return _concat_frames(frames, KLINE_FIELDS)
+    
+    async def query_quotes_frame(
+        self,
+        symbol: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """查询行情并合并为一个DataFrame"""
+        frames = [frame async for frame in self.stream_quotes(symbol, start_time, end_time, limit)]
+        return _concat_frames(frames, QUOTE_FIELDS)
+    
+    async def close(self):
+        """关闭连接"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# ============================================================================
+# Flux查询构建
+# ============================================================================
+
+KLINE_FIELDS = ("open", "high", "low", "close", "volume", "open_interest")
+
+QUOTE_FIELDS = (
+    "last_price", "bid_price", "ask_price", "bid_volume", "ask_volume", "volume",
+    "open_interest", "open", "high", "low", "pre_close", "upper_limit", "lower_limit"
+)
+
+
+def _time_range(start_time: datetime, end_time: Optional[datetime]) -> Dict[str, datetime]:
+    """查询时间范围参数，range的stop不含端点，加1微秒使结束时间包含在内
+
+    无时区的时间按本地时间处理。
+    """
+    end_time = end_time or datetime.now()
+    return {
+        "start": start_time if start_time.tzinfo else start_time.astimezone(),
+        "stop": (end_time if end_time.tzinfo else end_time.astimezone()) + timedelta(microseconds=1),
+    }
+
+
+def _pivoted_flux(bucket: str, measurement: str, tag_filter: str, columns: tuple,
+                  limit: Optional[int]) -> str:
+    """服务端pivot为每行一条完整记录，先排序再limit"""
+    keep = ", ".join(f'"{column}"' for column in ("_time", "symbol") + columns)
+    limit_clause = f"\n  |> limit(n: {int(limit)})" if limit else ""
+    return (
+        f'from(bucket: "{bucket}")\n'
+        f'  |> range(start: params.start, stop: params.stop)\n'
+        f'  |> filter(fn: (r) => r._measurement == "{measurement}" and {tag_filter})\n'
+        f'  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")\n'
+        f'  |> group()\n'
+        f'  |> keep(columns: [{keep}])\n'
+        f'  |> sort(columns: ["_time"])'
+        f'{limit_clause}'
+    )
+
+
+def build_kline_query(
+    bucket: str,
+    symbol: str,
+    period: str,
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    limit: Optional[int] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """构建K线查询，合约等参数通过绑定参数传入"""
+    query = _pivoted_flux(
+        bucket, "klines", "r.symbol == params.symbol and r.period == params.period", KLINE_FIELDS, limit
+    )
+    return query, {"symbol": symbol, "period": period, **_time_range(start_time, end_time)}
+
+
+def build_quote_query(
+    bucket: str,
+    symbol: str,
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    limit: Optional[int] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """构建行情查询"""
+    query = _pivoted_flux(bucket, "quotes", "r.symbol == params.symbol", QUOTE_FIELDS, limit)
+    return query, {"symbol": symbol, **_time_range(start_time, end_time)}
+
+
+def _pivoted_row(values: Dict[str, Any]) -> Dict[str, Any]:
+    """把pivot后的记录转换为字典"""
+    row = {key: value for key, value in values.items() if not key.startswith("_") and key not in ("result", "table")}
+    row["datetime"] = values.get("_time")
+    return row
+
+
+def _time_indexed(frame: pd.DataFrame, fields: tuple) -> pd.DataFrame:
+    """以_time为索引，只保留字段列"""
+    frame = frame.set_index(pd.DatetimeIndex(frame["_time"], name="datetime"))
+    return frame[[field for field in fields if field in frame.columns]]
+
+
+def _concat_frames(frames: List[pd.DataFrame], fields: tuple) -> pd.DataFrame:
+    if not frames:
+        return pd.DataFrame(columns=list(fields), index=pd.DatetimeIndex([], name="datetime"))
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
 # 创建全局InfluxDB管理器实例
-influx_manager = InfluxDBManager()
\ No newline at end of file
+influx_manager = InfluxDBManager()
+
+# 创建全局InfluxDB异步查询实例
+influx_query = AsyncInfluxQuery()
\ No newline at end of file
@@ -0,0 +1,472 @@
+"""
+InfluxDB批量写入管道
+
+所有时序数据写入共用一个异步队列，后台任务按数量或时间批量刷新，直接拼接行协议，
+不创建Point对象。队列有界，满时按配置阻塞或丢弃；InfluxDB不可用时重试，
+重试失败的批次落盘，恢复后补写。
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy(Enum):
+    """队列满时的处理策略"""
+    BLOCK = "block"              # 等待队列有空位
+    DROP_NEWEST = "drop_newest"  # 丢弃新写入的数据
+    DROP_OLDEST = "drop_oldest"  # 丢弃队列中最早的数据
+
+
+# ============================================================================
+# 行协议
+# ============================================================================
+
+_TAG_ESCAPES = str.maketrans({",": r"\,", " ": r"\ ", "=": r"\="})
+_MEASUREMENT_ESCAPES = str.maketrans({",": r"\,", " ": r"\ "})
+
+
+def _format_field(value: Any) -> Optional[str]:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else None
+    if value is None:
+        return None
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def _timestamp_ns(value: Any) -> int:
+    """转换为纳秒时间戳，无时区的datetime按UTC处理"""
+    if value is None:
+        return time.time_ns()
+    if isinstance(value, (int, float)):
+        # 按量级判断秒、毫秒、纳秒
+        value = int(value)
+        if value < 10 ** 11:
+            return value * 10 ** 9
+        if value < 10 ** 14:
+            return value * 10 ** 6
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp()) * 10 ** 9 + value.microsecond * 1000
+    raise ValueError(f"无法识别的时间: {value!r}")
+
+
+def to_line_protocol(
+    measurement: str,
+    tags: Dict[str, Any],
+    fields: Dict[str, Any],
+    timestamp: Any = None
+) -> Optional[str]:
+    """生成一行行协议，没有有效字段时返回None"""
+    field_parts = []
+    for key, value in fields.items():
+        formatted = _format_field(value)
+        if formatted is not None:
+            field_parts.append(f"{str(key).translate(_TAG_ESCAPES)}={formatted}")
+    if not field_parts:
+        return None
+
+    tag_parts = [
+        f"{str(key).translate(_TAG_ESCAPES)}={str(value).translate(_TAG_ESCAPES)}"
+        for key, value in sorted(tags.items())
+        if value is not None and value != ""
+    ]
+    series = ",".join([measurement.translate(_MEASUREMENT_ESCAPES)] + tag_parts)
+    return f"{series} {','.join(field_parts)} {_timestamp_ns(timestamp)}"
+
+
+# ============================================================================
+# 写入管道
+# ============================================================================
+
+class InfluxBatchWriter:
+    """InfluxDB批量写入器"""
+
+    def __init__(
+        self,
+        write_func: Optional[Callable[[str], None]] = None,
+        batch_size: int = 5000,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 100000,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        spool_dir: Optional[str] = None
+    ):
+        self._write_func = write_func or self._write_to_influx
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spool_dir = spool_dir
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        # 启动前或从其他线程写入的数据先放在这里
+        self._pending: Deque[str] = deque()
+        self._pending_lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self.points_written = 0
+        self.points_dropped = 0
+        self.points_spooled = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.last_flush_latency_ms = 0.0
+        self.total_flush_latency_ms = 0.0
+        self._rate_window: Deque = deque()
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """启动后台刷新任务"""
+        if self.is_running:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._flush_lock = asyncio.Lock()
+        self._drain_pending()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"InfluxDB批量写入器已启动，批量{self.batch_size}条，间隔{self.flush_interval}秒")
+
+    async def stop(self):
+        """停止并写出队列中剩余的数据"""
+        if not self.is_running:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        await self.flush()
+        logger.info("InfluxDB批量写入器已停止")
+
+    # ------------------------------------------------------------------
+    # 写入接口
+    # ------------------------------------------------------------------
+
+    async def write(self, measurement: str, tags: Dict[str, Any], fields: Dict[str, Any],
+                    timestamp: Any = None) -> bool:
+        """写入一个数据点，返回是否进入队列"""
+        line = to_line_protocol(measurement, tags, fields, timestamp)
+        if line is None:
+            return False
+        return await self.write_line(line)
+
+    async def write_line(self, line: str) -> bool:
+        """写入一行行协议"""
+        if not self.is_running:
+            await self.start()
+
+        if self.overflow_policy == OverflowPolicy.BLOCK:
+            await self._queue.put(line)
+            return True
+        return self._offer(line)
+
+    def write_nowait(self, measurement: str, tags: Dict[str, Any], fields: Dict[str, Any],
+                     timestamp: Any = None) -> bool:
+        """同步代码或其他线程使用的写入接口，不会阻塞"""
+        line = to_line_protocol(measurement, tags, fields, timestamp)
+        if line is None:
+            return False
+
+        if self.is_running and self._in_loop_thread():
+            return self._offer(line)
+
+        with self._pending_lock:
+            if len(self._pending) >= self.max_queue_size:
+                self.points_dropped += 1
+                return False
+            self._pending.append(line)
+
+        if self.is_running:
+            self._loop.call_soon_threadsafe(self._drain_pending)
+        return True
+
+    async def write_quote(self, symbol: str, data: Dict[str, Any]) -> bool:
+        """写入行情"""
+        fields = {
+            "last_price": _float(data.get("last_price")),
+            "bid_price": _float(data.get("bid_price")),
+            "ask_price": _float(data.get("ask_price")),
+            "bid_volume": _int(data.get("bid_volume")),
+            "ask_volume": _int(data.get("ask_volume")),
+            "volume": _int(data.get("volume")),
+            "open_interest": _int(data.get("open_interest")),
+            "open": _float(data.get("open")),
+            "high": _float(data.get("high")),
+            "low": _float(data.get("low")),
+            "pre_close": _float(data.get("pre_close")),
+            "upper_limit": _float(data.get("upper_limit")),
+            "lower_limit": _float(data.get("lower_limit")),
+        }
+        tags = {"symbol": symbol, "exchange": data.get("exchange")}
+        return await self.write("quotes", tags, fields, data.get("timestamp") or data.get("datetime"))
+
+    async def write_kline(self, symbol: str, data: Dict[str, Any], period: str = "1m") -> bool:
+        """写入K线"""
+        fields = {
+            "open": _float(data.get("open")),
+            "high": _float(data.get("high")),
+            "low": _float(data.get("low")),
+            "close": _float(data.get("close")),
+            "volume": _int(data.get("volume")),
+            "open_interest": _int(data.get("open_interest")),
+        }
+        tags = {"symbol": symbol, "period": data.get("period", period), "exchange": data.get("exchange")}
+        return await self.write("klines", tags, fields, data.get("datetime"))
+
+    async def write_trade(self, data: Dict[str, Any]) -> bool:
+        """写入逐笔成交"""
+        fields = {
+            "price": _float(data.get("price")),
+            "volume": _int(data.get("volume") or data.get("quantity")),
+            "amount": _float(data.get("amount")),
+        }
+        tags = {"symbol": data.get("symbol"), "direction": data.get("direction") or data.get("side")}
+        return await self.write("market_trades", tags, fields, data.get("timestamp") or data.get("datetime"))
+
+    async def write_depth(self, data: Dict[str, Any], levels: int = 5) -> bool:
+        """写入盘口深度，每档价量展开为字段"""
+        fields = {}
+        for side in ("bids", "asks"):
+            for level, entry in enumerate((data.get(side) or [])[:levels], start=1):
+                price, volume = (entry[0], entry[1]) if isinstance(entry, (list, tuple)) else \
+                    (entry.get("price"), entry.get("volume"))
+                fields[f"{side[:-1]}_price_{level}"] = _float(price)
+                fields[f"{side[:-1]}_volume_{level}"] = _int(volume)
+        tags = {"symbol": data.get("symbol")}
+        return await self.write("depth", tags, fields, data.get("timestamp") or data.get("datetime"))
+
+    async def flush(self):
+        """立即写出队列中的所有数据"""
+        self._drain_pending()
+        while self._queue is not None and not self._queue.empty():
+            await self._flush_batch(self._take_batch())
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """写入管道运行指标"""
+        now = time.monotonic()
+        while self._rate_window and now - self._rate_window[0][0] > 60:
+            self._rate_window.popleft()
+        window_points = sum(count for _, count in self._rate_window)
+        window_seconds = now - self._rate_window[0][0] if self._rate_window else 0.0
+
+        return {
+            "running": self.is_running,
+            "queue_depth": (self._queue.qsize() if self._queue else 0) + len(self._pending),
+            "max_queue_size": self.max_queue_size,
+            "overflow_policy": self.overflow_policy.value,
+            "points_written": self.points_written,
+            "points_dropped": self.points_dropped,
+            "points_spooled": self.points_spooled,
+            "points_per_second": window_points / max(window_seconds, self.flush_interval) if window_points else 0.0,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_latency_ms": self.last_flush_latency_ms,
+            "avg_flush_latency_ms": self.total_flush_latency_ms / self.flush_count if self.flush_count else 0.0,
+            "spool_files": len(self._spool_files()),
+        }
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _offer(self, line: str) -> bool:
+        """非阻塞入队，队列满时按策略丢弃"""
+        try:
+            self._queue.put_nowait(line)
+            return True
+        except asyncio.QueueFull:
+            self.points_dropped += 1
+            if self.overflow_policy == OverflowPolicy.DROP_OLDEST:
+                self._queue.get_nowait()
+                self._queue.put_nowait(line)
+                return True
+            return False
+
+    def _drain_pending(self):
+        """把启动前或其他线程写入的数据移入队列"""
+        if self._queue is None:
+            return
+        with self._pending_lock:
+            while self._pending:
+                self._offer(self._pending.popleft())
+
+    def _take_batch(self, limit: Optional[int] = None) -> List[str]:
+        limit = limit or self.batch_size
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        """后台刷新：攒满一批或到达刷新间隔时写出"""
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    batch.extend(self._take_batch(self.batch_size - len(batch)))
+                    if len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 停止时未写出的数据放回，由stop中的flush写出
+                with self._pending_lock:
+                    self._pending.extendleft(reversed(batch))
+                raise
+
+            # 写入过程不随任务取消中断
+            written = await asyncio.shield(self._flush_batch(batch))
+
+            # 写入成功说明InfluxDB可用，补写落盘的批次
+            if written and self.spool_dir and self._spool_files():
+                await self._replay_spool()
+
+    async def _flush_batch(self, lines: List[str]) -> bool:
+        if not lines:
+            return True
+
+        async with self._flush_lock:
+            body = "\n".join(lines)
+            started = time.perf_counter()
+            if await self._write_with_retry(body):
+                latency = (time.perf_counter() - started) * 1000
+                self.flush_count += 1
+                self.points_written += len(lines)
+                self.last_flush_latency_ms = latency
+                self.total_flush_latency_ms += latency
+                self._rate_window.append((time.monotonic(), len(lines)))
+                return True
+
+            self.failed_flushes += 1
+            self._spool(body, len(lines))
+            return False
+
+    async def _write_with_retry(self, body: str) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self._write_func, body)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"写入InfluxDB失败，已重试{self.max_retries}次: {e}")
+                    return False
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+        return False
+
+    def _spool(self, body: str, count: int):
+        """写入失败的批次落盘，InfluxDB恢复后补写"""
+        if not self.spool_dir:
+            self.points_dropped += count
+            return
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = os.path.join(self.spool_dir, f"{time.time_ns()}.lp")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(body)
+            self.points_spooled += count
+            logger.warning(f"InfluxDB不可用，{count}条数据已落盘: {path}")
+        except Exception as e:
+            self.points_dropped += count
+            logger.error(f"落盘写入数据失败: {e}")
+
+    def _spool_files(self) -> List[str]:
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(
+            os.path.join(self.spool_dir, name)
+            for name in os.listdir(self.spool_dir) if name.endswith(".lp")
+        )
+
+    async def _replay_spool(self):
+        """按时间顺序补写落盘数据，遇到失败停止等待下次"""
+        for path in self._spool_files():
+            with open(path, encoding="utf-8") as f:
+                body = f.read()
+            try:
+                await asyncio.to_thread(self._write_func, body)
+            except Exception as e:
+                logger.warning(f"补写落盘数据失败，稍后重试: {e}")
+                return
+            count = body.count("\n") + 1
+            self.points_written += count
+            self.points_spooled -= min(self.points_spooled, count)
+            os.remove(path)
+            logger.info(f"已补写落盘数据: {path}, {count}条")
+
+    @staticmethod
+    def _write_to_influx(body: str):
+        from influxdb_client import WritePrecision
+        from .influxdb import influx_manager
+
+        influx_manager.write_api.write(
+            bucket=settings.INFLUXDB_BUCKET, record=body, write_precision=WritePrecision.NS
+        )
+
+
+def _float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def _int(value: Any) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+# 全局InfluxDB批量写入器
+influx_writer = InfluxBatchWriter(
+    batch_size=settings.INFLUX_WRITE_BATCH_SIZE,
+    flush_interval=settings.INFLUX_WRITE_FLUSH_INTERVAL,
+    max_queue_size=settings.INFLUX_WRITE_QUEUE_SIZE,
+    overflow_policy=OverflowPolicy(settings.INFLUX_WRITE_OVERFLOW_POLICY),
+    spool_dir=settings.INFLUX_WRITE_SPOOL_DIR
+)
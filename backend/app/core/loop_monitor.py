@@ -0,0 +1,261 @@
+"""
+事件循环监控
+探针协程按固定间隔唤醒，测量事件循环的调度延迟；看门狗线程发现事件循环停顿超过阈值时，
+采集事件循环线程当前的调用栈，按调用点汇总阻塞次数和累计时长。
+正常运行时只有一个定时探针和一个休眠的线程，可在生产环境常开。
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .metrics import Histogram, LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+# 调度延迟直方图分桶（毫秒）
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# 调用栈保留的帧数
+STACK_DEPTH = 12
+# 调用点数量上限，超出后归入OTHER_SITE，避免异常情况下无限增长
+MAX_SITES = 500
+UNKNOWN_SITE = "<unknown>"
+OTHER_SITE = "<other>"
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(APP_ROOT)
+MODULE_FILE = os.path.abspath(__file__)
+
+
+@dataclass
+class BlockingSite:
+    """阻塞调用点统计"""
+    site: str
+    stack: List[str]
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_seen: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "site": self.site,
+            "count": self.count,
+            "total_ms": self.total_seconds * 1000,
+            "max_ms": self.max_seconds * 1000,
+            "last_seen": self.last_seen,
+            "stack": self.stack,
+        }
+
+
+def _format_frame(filename: str, lineno: int, name: str) -> str:
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    return f"{filename}:{lineno} {name}"
+
+
+def describe_stack(frame) -> Tuple[str, List[str]]:
+    """返回（阻塞调用点, 调用栈）
+
+    调用点取栈中最内层的应用代码帧（app包内、本模块除外），即应用发起阻塞调用的位置；
+    栈中没有应用代码时取最内层帧。调用栈按由内到外排列。
+    """
+    summary = traceback.StackSummary.extract(traceback.walk_stack(frame), limit=64, lookup_lines=False)
+    site = None
+    for entry in summary:
+        if entry.filename.startswith(APP_ROOT) and entry.filename != MODULE_FILE:
+            site = _format_frame(entry.filename, entry.lineno, entry.name)
+            break
+    stack = [_format_frame(entry.filename, entry.lineno, entry.name) for entry in summary[:STACK_DEPTH]]
+    if site is None:
+        site = stack[0] if stack else UNKNOWN_SITE
+    return site, stack
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LoopMonitor:
+    """事件循环延迟与阻塞调用检测"""
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None,
+                 top_n: Optional[int] = None):
+        self.interval = interval or settings.LOOP_MONITOR_INTERVAL
+        self.threshold = threshold or settings.LOOP_MONITOR_BLOCK_THRESHOLD
+        self.top_n = top_n or settings.LOOP_MONITOR_TOP_N
+        self.lag = LatencyRecorder()
+        self.lag_histogram = Histogram(LAG_BUCKETS_MS)
+        self.blocked_total = 0
+        self.blocked_seconds = 0.0
+        self.sites: Dict[str, BlockingSite] = {}
+        self._lock = threading.Lock()
+        self._loop_thread_id: Optional[int] = None
+        # 探针下一次应被唤醒的时间（time.perf_counter），由看门狗线程读取
+        self._expected_beat = 0.0
+        # 看门狗在当前停顿中采集到的调用栈：(对应的探针时间, 调用点, 调用栈)
+        self._captured: Optional[Tuple[float, str, List[str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """在事件循环线程中启动探针和看门狗线程"""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._expected_beat = time.perf_counter() + self.interval
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        logger.info(f"事件循环监控已启动: 探针间隔{self.interval * 1000:.0f}ms, 阻塞阈值{self.threshold * 1000:.0f}ms")
+
+    async def stop(self):
+        """停止探针和看门狗线程"""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+        logger.info("事件循环监控已停止")
+
+    async def _probe(self):
+        while True:
+            self._expected_beat = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self._on_beat(time.perf_counter() - self._expected_beat)
+
+    def _on_beat(self, lag: float):
+        """探针被唤醒：记录调度延迟，超过阈值时把本次停顿计入看门狗采集到的调用点"""
+        lag = max(lag, 0.0)
+        self.lag.record(lag)
+        self.lag_histogram.record(lag * 1000)
+        with self._lock:
+            captured, self._captured = self._captured, None
+        if lag < self.threshold:
+            return
+        self.blocked_total += 1
+        self.blocked_seconds += lag
+        if captured is None:
+            # 停顿结束于看门狗下一次检查之前，未采集到调用栈
+            self._record_site(UNKNOWN_SITE, [], lag)
+        else:
+            self._record_site(captured[1], captured[2], lag)
+
+    def _record_site(self, site: str, stack: List[str], seconds: float):
+        entry = self.sites.get(site)
+        if entry is None:
+            if len(self.sites) >= MAX_SITES:
+                site, stack = OTHER_SITE, []
+                entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = BlockingSite(site=site, stack=stack)
+                logger.warning(
+                    f"事件循环阻塞{seconds * 1000:.0f}ms, 调用点: {site}\n" + "\n".join(f"  {line}" for line in stack)
+                )
+        entry.count += 1
+        entry.total_seconds += seconds
+        entry.max_seconds = max(entry.max_seconds, seconds)
+        entry.last_seen = time.time()
+
+    def _watch(self):
+        """看门狗线程：事件循环停顿超过阈值时采集一次事件循环线程的调用栈"""
+        poll = self.threshold / 2
+        while not self._stopping.wait(poll):
+            expected = self._expected_beat
+            if time.perf_counter() - expected < self.threshold:
+                continue
+            with self._lock:
+                if self._captured is not None and self._captured[0] == expected:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            try:
+                site, stack = describe_stack(frame)
+            finally:
+                del frame
+            with self._lock:
+                self._captured = (expected, site, stack)
+
+    def top_sites(self, n: Optional[int] = None) -> List[BlockingSite]:
+        """按累计阻塞时长排序的调用点"""
+        return sorted(self.sites.values(), key=lambda s: s.total_seconds, reverse=True)[:n or self.top_n]
+
+    def reset(self):
+        """清空统计"""
+        self.lag = LatencyRecorder()
+        self.lag_histogram = Histogram(LAG_BUCKETS_MS)
+        self.blocked_total = 0
+        self.blocked_seconds = 0.0
+        self.sites = {}
+
+    def get_stats(self, top_n: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag": self.lag.snapshot(),
+            "lag_histogram_ms": self.lag_histogram.snapshot(),
+            "blocked_total": self.blocked_total,
+            "blocked_ms": self.blocked_seconds * 1000,
+            "blocking_sites": [site.to_dict() for site in self.top_sites(top_n)],
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式的指标，调用点只输出前top_n个以控制标签基数"""
+        histogram = self.lag_histogram
+        lag_sum = histogram.snapshot()["avg"] * histogram.count
+        lines = [
+            "# HELP event_loop_lag_seconds Event loop scheduling lag measured by the probe.",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'event_loop_lag_seconds_bucket{{le="{bound / 1000:g}"}} {cumulative}')
+        lines.append(f'event_loop_lag_seconds_bucket{{le="+Inf"}} {histogram.count}')
+        lines.append(f"event_loop_lag_seconds_sum {lag_sum / 1000:.6f}")
+        lines.append(f"event_loop_lag_seconds_count {histogram.count}")
+        lines += [
+            "# HELP event_loop_lag_max_seconds Maximum event loop lag since start.",
+            "# TYPE event_loop_lag_max_seconds gauge",
+            f"event_loop_lag_max_seconds {histogram.max / 1000:.6f}",
+            "# HELP event_loop_blocked_total Event loop stalls longer than the blocking threshold.",
+            "# TYPE event_loop_blocked_total counter",
+            f"event_loop_blocked_total {self.blocked_total}",
+            "# HELP event_loop_blocking_calls_total Event loop stalls by blocking call site.",
+            "# TYPE event_loop_blocking_calls_total counter",
+        ]
+        top = self.top_sites()
+        for site in top:
+            lines.append(f'event_loop_blocking_calls_total{{site="{_escape_label(site.site)}"}} {site.count}')
+        lines += [
+            "# HELP event_loop_blocking_seconds_total Cumulative event loop stall time by blocking call site.",
+            "# TYPE event_loop_blocking_seconds_total counter",
+        ]
+        for site in top:
+            lines.append(
+                f'event_loop_blocking_seconds_total{{site="{_escape_label(site.site)}"}} {site.total_seconds:.6f}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+# 全局事件循环监控实例
+loop_monitor = LoopMonitor()
@@ -8,7 +8,9 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from ..adapters.market_data_adapter import MarketDataAdapter, MarketDataAdapterFactory
 from ..services.market_data_service import MarketDataService
-from ..core.database import get_db
+from ..services.quote_bus import quote_bus
+from ..core.database import async_session_scope
+from .influxdb_writer import influx_writer
 
 logger = logging.getLogger(__name__)
 
@@ -229,6 +231,9 @@ class MarketDataManager:
                 if not self.is_running:
                     break
                 
+                # 推送到行情总线
+                quote_bus.publish(quote_data['symbol'], quote_data)
+                
                 # 保存报价数据到数据库
                 await self._save_quote_data(quote_data)
                 
@@ -276,90 +281,47 @@ class MarketDataManager:
             logger.error(f"深度数据订阅处理失败: {provider_name}, {e}")
     
     async def _save_quote_data(self, quote_data: Dict[str, Any]):
-        """保存报价数据"""
+        """保存报价数据（进入InfluxDB批量写入队列）"""
         try:
-            # 获取数据库会话
-            db = next(get_db())
-            service = MarketDataService(db)
-            
-            # 获取标的ID
-            symbol = service.get_symbol(quote_data['symbol'])
-            if not symbol:
-                logger.warning(f"标的不存在: {quote_data['symbol']}")
-                return
-            
-            # 准备报价数据
-            quote_data['symbol_id'] = symbol.id
-            
-            # 保存到数据库
-            service.save_quote(quote_data)
-            
+            await influx_writer.write_quote(quote_data['symbol'], quote_data)
         except Exception as e:
             logger.error(f"保存报价数据失败: {e}")
     
     async def _save_trade_data(self, trade_data: Dict[str, Any]):
-        """保存成交数据"""
+        """保存成交数据（进入InfluxDB批量写入队列）"""
         try:
-            # 获取数据库会话
-            db = next(get_db())
-            service = MarketDataService(db)
-            
-            # 获取标的ID
-            symbol = service.get_symbol(trade_data['symbol'])
-            if not symbol:
-                logger.warning(f"标的不存在: {trade_data['symbol']}")
-                return
-            
-            # 准备成交数据
-            trade_data['symbol_id'] = symbol.id
-            
-            # 保存到数据库
-            service.save_trade(trade_data)
-            
+            await influx_writer.write_trade(trade_data)
         except Exception as e:
             logger.error(f"保存成交数据失败: {e}")
     
     async def _save_depth_data(self, depth_data: Dict[str, Any]):
-        """保存深度数据"""
+        """保存深度数据（进入InfluxDB批量写入队列）"""
         try:
-            # 获取数据库会话
-            db = next(get_db())
-            service = MarketDataService(db)
-            
-            # 获取标的ID
-            symbol = service.get_symbol(depth_data['symbol'])
-            if not symbol:
-                logger.warning(f"标的不存在: {depth_data['symbol']}")
-                return
-            
-            # 准备深度数据
-            depth_data['symbol_id'] = symbol.id
-            
-            # 保存到数据库
-            service.save_depth_data(depth_data)
-            
+            await influx_writer.write_depth(depth_data)
         except Exception as e:
             logger.error(f"保存深度数据失败: {e}")
     
+    def _calculate_data_quality(self, db: Session):
+        """为每个提供商计算数据质量"""
+        service = MarketDataService(db)
+        for provider_name in self.adapters.keys():
+            try:
+                # 计算报价数据质量
+                service.calculate_data_quality(provider_name, data_type='QUOTE')
+                
+                # 计算K线数据质量
+                service.calculate_data_quality(provider_name, data_type='KLINE')
+                
+            except Exception as e:
+                logger.error(f"计算数据质量失败: {provider_name}, {e}")
+    
     async def _monitor_data_quality(self):
         """监控数据质量"""
         try:
             while self.is_running:
-                # 获取数据库会话
-                db = next(get_db())
-                service = MarketDataService(db)
-                
-                # 为每个提供商计算数据质量
-                for provider_name in self.adapters.keys():
-                    try:
-                        # 计算报价数据质量
-                        service.calculate_data_quality(provider_name, data_type='QUOTE')
-                        
-                        # 计算K线数据质量
-                        service.calculate_data_quality(provider_name, data_type='KLINE')
-                        
-                    except Exception as e:
-                        logger.error(f"计算数据质量失败: {provider_name}, {e}")
+                # 每轮使用独立的异步会话，结束后关闭
+                async with async_session_scope() as session:
+                    await session.run_sync(self._calculate_data_quality)
                 
                 # 每小时检查一次
                 await asyncio.sleep(3600)
@@ -0,0 +1,69 @@
+"""
+延迟与分布统计
+行情扇出、订单执行、风控和事件循环监控共用的轻量指标，只在进程内累计，由各模块的统计接口输出。
+"""
+
+import bisect
+from collections import deque
+from typing import Any, Dict, Sequence
+
+
+class LatencyRecorder:
+    """延迟统计，保留最近window个样本计算分位数"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self._total_ms = 0.0
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        self.count += 1
+        self.last_ms = ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self._total_ms += ms
+        self._samples.append(ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "last_ms": 0.0, "max_ms": 0.0, "avg_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "count": self.count,
+            "last_ms": self.last_ms,
+            "max_ms": self.max_ms,
+            "avg_ms": self._total_ms / self.count,
+            "p50_ms": samples[len(samples) // 2],
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        }
+
+
+class Histogram:
+    """按上界分桶计数的直方图"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.max = 0.0
+        self._total = 0.0
+
+    def record(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self._total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"<={bound:g}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets[f">{self.bounds[-1]:g}"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg": self._total / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": buckets,
+        }
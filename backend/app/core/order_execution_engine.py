@@ -1,19 +1,31 @@
 """
 订单执行引擎
 负责订单的提交、执行、成交处理等核心逻辑
+
+新订单和被行情触发的挂单进入按优先级分通道的执行队列，由固定数量的执行协程处理。
+价格条件未满足的订单登记到按合约的价格触发索引，不占用等待协程，
+行情总线推送的行情穿越触发价时才重新进入执行队列。
 """
 
 import logging
 import asyncio
-from typing import Dict, Any, Optional, List, Callable
+import heapq
+import itertools
+import time
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
 from enum import Enum
 import uuid
 
-from ..models.order import Order, OrderFill, OrderStatus, OrderType, OrderSide
+from ..models.order import Order, OrderFill, OrderStatus, OrderType, OrderSide, OrderPriority
 from ..services.order_notification_service import order_notification_service
-from ..core.database import SessionLocal
+from ..services.matching_engine import depth_liquidity
+from ..services.quote_bus import QuoteSubscription, QuoteTick, quote_bus
+from ..core.metrics import Histogram, LatencyRecorder
+from ..core.config import settings
+from ..core.async_repository import AsyncRepository
+from ..core.database import async_session_scope
 
 logger = logging.getLogger(__name__)
 
@@ -27,19 +39,152 @@ class ExecutionResult(Enum):
     CANCELLED = "cancelled"
 
 
+# 优先级通道，数值越小越先处理
+PRIORITY_LANES = {
+    OrderPriority.URGENT: 0,
+    OrderPriority.HIGH: 1,
+    OrderPriority.NORMAL: 2,
+    OrderPriority.LOW: 3,
+}
+
+# 同一通道内被行情触发的挂单先于新订单处理
+JOB_TRIGGERED = 0
+JOB_NEW = 1
+
+# 价格触发方向：DOWN 参考价 <= 触发价时触发，UP 参考价 >= 触发价时触发
+TRIGGER_DOWN = "down"
+TRIGGER_UP = "up"
+
+# 成交后从数据库同步回内存订单对象的字段
+ORDER_FILL_FIELDS = ('filled_quantity', 'remaining_quantity', 'avg_fill_price', 'commission', 'status', 'filled_at')
+
+order_repository = AsyncRepository(Order)
+
+
+async def persist_order_fill(order: Order, fill_data: Dict[str, Any]):
+    """经异步会话写入成交记录，并把数据库中更新后的成交状态同步到内存订单对象"""
+    def add_fill(session):
+        from ..services.order_service import OrderService
+        OrderService(session).add_order_fill(order.id, fill_data)
+        stored = session.get(Order, order.id)
+        return {field: getattr(stored, field) for field in ORDER_FILL_FIELDS}
+    
+    async with async_session_scope() as session:
+        state = await session.run_sync(add_fill)
+    for field, value in state.items():
+        setattr(order, field, value)
+
+
+class PriceTriggerIndex:
+    """按合约的价格触发索引
+    
+    买方订单以卖一价、卖方订单以买一价为参考价，每个合约每个方向一个堆，
+    堆顶是最先被触发的订单；一笔行情只弹出被穿越的订单。移除采用惰性删除。
+    """
+    
+    def __init__(self):
+        # symbol -> {(side, direction): [(排序键, 序号, 订单ID)]}
+        self._heaps: Dict[str, Dict[Tuple[str, str], list]] = {}
+        # 订单ID -> (合约, 序号, 订单)，序号与堆中一致的条目才有效
+        self._entries: Dict[int, Tuple[str, int, Order]] = {}
+        self._symbol_counts: Dict[str, int] = {}
+        self._seq = itertools.count()
+    
+    def add(self, order: Order, direction: str, threshold: float):
+        """登记订单，已登记的订单以新的触发价替换"""
+        self.remove(order.id)
+        seq = next(self._seq)
+        side = OrderSide(order.side).value
+        heaps = self._heaps.setdefault(order.symbol, {})
+        key = -threshold if direction == TRIGGER_DOWN else threshold
+        heapq.heappush(heaps.setdefault((side, direction), []), (key, seq, order.id))
+        self._entries[order.id] = (order.symbol, seq, order)
+        self._symbol_counts[order.symbol] = self._symbol_counts.get(order.symbol, 0) + 1
+    
+    def remove(self, order_id: int) -> Optional[Order]:
+        entry = self._entries.pop(order_id, None)
+        if entry is None:
+            return None
+        self._discount(entry[0])
+        return entry[2]
+    
+    def _discount(self, symbol: str):
+        count = self._symbol_counts[symbol] - 1
+        if count:
+            self._symbol_counts[symbol] = count
+        else:
+            # 合约上已没有挂单，丢弃只剩失效条目的堆
+            del self._symbol_counts[symbol]
+            self._heaps.pop(symbol, None)
+    
+    def pop_triggered(self, symbol: str, bid: Optional[float], ask: Optional[float]) -> List[Order]:
+        """弹出被本笔行情穿越的订单（按登记顺序）"""
+        heaps = self._heaps.get(symbol)
+        if not heaps:
+            return []
+        
+        triggered = []
+        for (side, direction), heap in heaps.items():
+            price = ask if side == OrderSide.BUY.value else bid
+            if price is None:
+                continue
+            while heap:
+                key, seq, order_id = heap[0]
+                entry = self._entries.get(order_id)
+                if entry is None or entry[1] != seq:
+                    heapq.heappop(heap)
+                    continue
+                threshold = -key if direction == TRIGGER_DOWN else key
+                if (price > threshold) if direction == TRIGGER_DOWN else (price < threshold):
+                    break
+                heapq.heappop(heap)
+                del self._entries[order_id]
+                triggered.append((seq, entry[2]))
+        
+        for _ in triggered:
+            self._discount(symbol)
+        
+        triggered.sort(key=lambda item: item[0])
+        return [order for _, order in triggered]
+    
+    def has_symbol(self, symbol: str) -> bool:
+        return symbol in self._symbol_counts
+    
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._entries
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 class OrderExecutionEngine:
     """订单执行引擎"""
     
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None):
         self.execution_handlers: Dict[str, Callable] = {}
         self.market_data_provider = None
         self.risk_manager = None
         self.position_manager = None
         self.account_manager = None
+        self.quote_bus = quote_bus
+        
+        # 执行队列：(优先级通道, 任务类型, 序号, 订单, 触发价, 触发时间)
+        self.worker_count = workers or settings.ORDER_EXECUTION_WORKERS
+        self.execution_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.active_executions: Dict[int, Order] = {}
+        self._workers: List[asyncio.Task] = []
+        self._job_seq = itertools.count()
+        self._lane_depth: Dict[int, int] = {lane: 0 for lane in PRIORITY_LANES.values()}
+        
+        # 价格条件未满足的挂单
+        self.trigger_index = PriceTriggerIndex()
+        self._stop_triggered: set = set()  # 止损条件已触发的止损限价单
+        self._subscription: Optional[QuoteSubscription] = None
         
-        # 执行队列和状态
-        self.execution_queue = asyncio.Queue()
-        self.active_executions: Dict[int, asyncio.Task] = {}
+        # 执行指标
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.trigger_to_fill = LatencyRecorder()
+        self.trigger_to_fill_histogram = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
         self.execution_stats = {
             'total_orders': 0,
             'successful_orders': 0,
@@ -68,11 +213,7 @@ class OrderExecutionEngine:
             await self._update_order_status(order, OrderStatus.SUBMITTED)
             
             # 添加到执行队列
-            await self.execution_queue.put(order)
-            
-            # 启动异步执行任务
-            execution_task = asyncio.create_task(self._execute_order(order))
-            self.active_executions[order.id] = execution_task
+            self._enqueue(order, JOB_NEW)
             
             return ExecutionResult.SUCCESS
             
@@ -90,17 +231,9 @@ class OrderExecutionEngine:
             if not order.is_active:
                 raise ValueError("订单不是活跃状态，无法取消")
             
-            # 如果订单正在执行，停止执行任务
-            if order.id in self.active_executions:
-                execution_task = self.active_executions[order.id]
-                execution_task.cancel()
-                
-                try:
-                    await execution_task
-                except asyncio.CancelledError:
-                    pass
-                
-                del self.active_executions[order.id]
+            # 从价格触发索引移除；已在执行队列中的任务出队时因订单不再活跃而跳过
+            self.trigger_index.remove(order.id)
+            self._stop_triggered.discard(order.id)
             
             # 更新订单状态
             await self._update_order_status(order, OrderStatus.CANCELLED)
@@ -125,40 +258,35 @@ class OrderExecutionEngine:
             if not order.is_active:
                 raise ValueError("订单不是活跃状态，无法修改")
             
-            # 如果订单正在执行，需要先暂停执行
-            execution_paused = False
-            if order.id in self.active_executions:
-                # 这里可以实现更复杂的暂停逻辑
-                execution_paused = True
+            # 挂单先从价格触发索引移除，修改后按新价格重新登记
+            resting = self.trigger_index.remove(order.id) is not None
             
             # 应用修改
-            db = SessionLocal()
-            try:
-                for field, value in modifications.items():
-                    if hasattr(order, field):
-                        setattr(order, field, value)
-                
-                # 重新计算剩余数量等
-                if 'quantity' in modifications:
-                    order.calculate_remaining_quantity()
-                
-                db.commit()
-                db.refresh(order)
-                
-                # 发送修改通知
-                order_notification_service.notify_order_updated(
-                    order, list(modifications.keys())
-                )
-                
-                # 如果暂停了执行，重新启动
-                if execution_paused:
-                    # 重新提交到执行队列
-                    await self.execution_queue.put(order)
-                
-                return ExecutionResult.SUCCESS
-                
-            finally:
-                db.close()
+            for field, value in modifications.items():
+                if hasattr(order, field):
+                    setattr(order, field, value)
+            
+            # 重新计算剩余数量等
+            if 'quantity' in modifications:
+                order.calculate_remaining_quantity()
+            
+            columns = {
+                field: getattr(order, field) for field in (*modifications, 'remaining_quantity')
+                if field in Order.__table__.columns
+            }
+            async with async_session_scope() as session:
+                await order_repository.update_where(session, Order.id == order.id, **columns)
+            
+            # 发送修改通知
+            order_notification_service.notify_order_updated(
+                order, list(modifications.keys())
+            )
+            
+            # 重新登记挂单
+            if resting:
+                await self._rest_order(order)
+            
+            return ExecutionResult.SUCCESS
                 
         except Exception as e:
             logger.error(f"修改订单失败: {order.id} - {str(e)}")
@@ -197,9 +325,21 @@ class OrderExecutionEngine:
             
             execution_time = (datetime.now() - execution_start_time).total_seconds()
             self._update_execution_stats(execution_time, False)
-        finally:
-            # 清理执行任务
-            self.active_executions.pop(order.id, None)
+    
+    async def _execute_triggered(self, order: Order, price: Decimal, triggered_at: float):
+        """执行被行情触发的挂单"""
+        try:
+            execution_price = await self._determine_execution_price(order, price)
+            if not execution_price:
+                # 止损限价单触发后价格越过限价等情况，继续挂单
+                await self._rest_order(order)
+                return
+            
+            await self._execute_fill(order, execution_price, triggered_at)
+            
+        except Exception as e:
+            logger.error(f"触发订单执行失败: {order.id} - {str(e)}")
+            await self._handle_order_error(order, str(e))
     
     async def _default_execution_logic(self, order: Order):
         """默认订单执行逻辑"""
@@ -212,8 +352,9 @@ class OrderExecutionEngine:
             # 确定执行价格
             execution_price = await self._determine_execution_price(order, market_price)
             if not execution_price:
-                # 价格不满足条件，等待
-                await self._wait_for_price_condition(order, market_price)
+                # 价格不满足条件，登记到价格触发索引等待行情
+                logger.info(f"订单 {order.id} 等待价格条件满足，当前价格: {market_price}")
+                await self._rest_order(order)
                 return
             
             # 执行成交
@@ -251,14 +392,15 @@ class OrderExecutionEngine:
             return None
         
         elif order.order_type == OrderType.STOP_LIMIT:
-            # 先检查是否触发止损条件
-            triggered = False
+            # 先检查是否触发止损条件，触发过一次后按限价单处理
+            triggered = order.id in self._stop_triggered
             if order.side == OrderSide.BUY and market_price >= order.stop_price:
                 triggered = True
             elif order.side == OrderSide.SELL and market_price <= order.stop_price:
                 triggered = True
             
             if triggered:
+                self._stop_triggered.add(order.id)
                 # 触发后按限价单逻辑执行
                 if order.side == OrderSide.BUY:
                     if market_price <= order.price:
@@ -272,12 +414,12 @@ class OrderExecutionEngine:
             # 其他订单类型使用市价
             return market_price
     
-    async def _execute_fill(self, order: Order, price: Decimal):
-        """执行订单成交"""
+    async def _execute_fill(self, order: Order, price: Decimal, triggered_at: Optional[float] = None):
+        """执行订单成交，未全部成交的剩余部分挂单等待下一笔行情"""
         try:
             remaining_quantity = order.quantity - order.filled_quantity
             
-            # 模拟分批成交（可以根据市场深度等因素调整）
+            # 按盘口深度计算本次成交数量
             fill_quantity = await self._calculate_fill_quantity(order, remaining_quantity)
             
             # 创建成交记录
@@ -291,59 +433,95 @@ class OrderExecutionEngine:
                 'counterparty': f'MM_{uuid.uuid4().hex[:8]}'
             }
             
-            # 添加成交记录到数据库
-            db = SessionLocal()
-            try:
-                from ..services.order_service import OrderService
-                order_service = OrderService(db)
-                fill = order_service.add_order_fill(order.id, fill_data)
-                
-                # 刷新订单状态
-                db.refresh(order)
-                
-                logger.info(f"订单成交: {order.id}, 数量: {fill_quantity}, 价格: {price}")
-                
-                # 如果还有剩余数量，继续执行
-                if order.remaining_quantity > 0 and order.status == OrderStatus.PARTIALLY_FILLED:
-                    # 等待一段时间后继续执行
-                    await asyncio.sleep(1)
-                    await self._execute_fill(order, price)
-                
-            finally:
-                db.close()
+            # 添加成交记录到数据库并刷新订单状态
+            await persist_order_fill(order, fill_data)
+            logger.info(f"订单成交: {order.id}, 数量: {fill_quantity}, 价格: {price}")
+            
+            if triggered_at is not None:
+                latency = time.perf_counter() - triggered_at
+                self.trigger_to_fill.record(latency)
+                self.trigger_to_fill_histogram.record(latency * 1000)
+            
+            # 还有剩余数量时等待下一笔行情继续成交
+            if order.remaining_quantity > 0 and order.status == OrderStatus.PARTIALLY_FILLED:
+                await self._rest_order(order)
                 
         except Exception as e:
             logger.error(f"执行成交失败: {order.id} - {str(e)}")
             raise
     
     async def _calculate_fill_quantity(self, order: Order, remaining_quantity: Decimal) -> Decimal:
-        """计算本次成交数量"""
-        # 简化逻辑：随机成交10%-100%的剩余数量
-        import random
-        fill_ratio = random.uniform(0.1, 1.0)
-        return remaining_quantity * Decimal(str(fill_ratio))
+        """计算本次成交数量：按最新盘口对手方在限价内的可见挂量成交，没有深度数据时全部成交"""
+        tick = self.quote_bus.latest(order.symbol)
+        limit = float(order.price) if order.price and order.order_type in (OrderType.LIMIT, OrderType.STOP_LIMIT) else None
+        liquidity = depth_liquidity(tick.data if tick else None, order.side, limit)
+        
+        if not liquidity:
+            return remaining_quantity
+        return min(remaining_quantity, Decimal(str(liquidity)))
+    
+    def _trigger_for(self, order: Order) -> Tuple[str, float]:
+        """挂单的触发方向和触发价"""
+        buy = order.side == OrderSide.BUY
+        if order.order_type == OrderType.LIMIT or (
+            order.order_type == OrderType.STOP_LIMIT and order.id in self._stop_triggered
+        ):
+            return (TRIGGER_DOWN, float(order.price)) if buy else (TRIGGER_UP, float(order.price))
+        if order.order_type in (OrderType.STOP, OrderType.STOP_LIMIT) and order.filled_quantity == 0:
+            return (TRIGGER_UP, float(order.stop_price)) if buy else (TRIGGER_DOWN, float(order.stop_price))
+        # 市价单及已触发止损单的剩余部分：下一笔行情即触发
+        return (TRIGGER_DOWN, float("inf")) if buy else (TRIGGER_UP, float("-inf"))
     
-    async def _wait_for_price_condition(self, order: Order, current_price: Decimal):
-        """等待价格条件满足"""
-        logger.info(f"订单 {order.id} 等待价格条件满足，当前价格: {current_price}")
+    async def _rest_order(self, order: Order):
+        """登记挂单并确保订阅该合约行情"""
+        direction, threshold = self._trigger_for(order)
+        self.trigger_index.add(order, direction, threshold)
         
-        # 等待一段时间后重新检查
-        await asyncio.sleep(5)
+        if self._subscription is None or self._subscription.closed:
+            self._subscription = await self.quote_bus.subscribe(
+                [order.symbol], callback=self._on_quote, name="order_execution_engine"
+            )
+        elif order.symbol not in self._subscription.symbols:
+            await self.quote_bus.add_symbols(self._subscription, [order.symbol])
+    
+    async def _on_quote(self, tick: QuoteTick):
+        """行情回调：把被穿越的挂单放入执行队列"""
+        bid = self._side_price(tick, OrderSide.SELL)
+        ask = self._side_price(tick, OrderSide.BUY)
         
-        # 重新获取价格并检查
-        new_price = await self._get_market_price(order.symbol)
-        if new_price:
-            execution_price = await self._determine_execution_price(order, new_price)
-            if execution_price:
-                await self._execute_fill(order, execution_price)
-            else:
-                # 继续等待
-                await self._wait_for_price_condition(order, new_price)
+        for order in self.trigger_index.pop_triggered(tick.symbol, bid and float(bid), ask and float(ask)):
+            price = ask if order.side == OrderSide.BUY else bid
+            self._enqueue(order, JOB_TRIGGERED, price, tick.received_at)
+        
+        # 合约上已没有挂单时退订；退订期间又有挂单登记时重新订阅
+        if not self.trigger_index.has_symbol(tick.symbol) and self._subscription is not None:
+            await self.quote_bus.remove_symbols(self._subscription, [tick.symbol])
+            if self.trigger_index.has_symbol(tick.symbol):
+                await self.quote_bus.add_symbols(self._subscription, [tick.symbol])
+    
+    @classmethod
+    def _side_price(cls, tick: QuoteTick, side: OrderSide) -> Optional[Decimal]:
+        """买方参考卖一价、卖方参考买一价，没有盘口时用最新价"""
+        value = tick.data.get("ask_price1" if side == OrderSide.BUY else "bid_price1")
+        if value and value == value:  # 排除NaN
+            return Decimal(str(value))
+        return cls._tick_price(tick)
+    
+    @staticmethod
+    def _tick_price(tick: QuoteTick) -> Optional[Decimal]:
+        last_price = tick.last_price
+        return Decimal(str(last_price)) if last_price and last_price == last_price else None
     
     async def _get_market_price(self, symbol: str) -> Optional[Decimal]:
         """获取市场价格"""
-        # 这里应该从市场数据提供商获取实时价格
-        # 简化处理：使用模拟价格
+        # 优先使用行情总线上的最新行情
+        tick = self.quote_bus.latest(symbol)
+        if tick is not None:
+            price = self._tick_price(tick)
+            if price is not None:
+                return price
+        
+        # 尚无行情时使用模拟价格
         mock_prices = {
             'AAPL': Decimal('150.00'),
             'TSLA': Decimal('200.00'),
@@ -389,29 +567,26 @@ class OrderExecutionEngine:
     
     async def _update_order_status(self, order: Order, new_status: OrderStatus):
         """更新订单状态"""
-        db = SessionLocal()
-        try:
-            old_status = order.status
-            order.status = new_status
-            
-            # 更新相关时间戳
-            if new_status == OrderStatus.SUBMITTED:
-                order.submitted_at = datetime.now()
-            elif new_status == OrderStatus.ACCEPTED:
-                order.accepted_at = datetime.now()
-            elif new_status == OrderStatus.FILLED:
-                order.filled_at = datetime.now()
-            elif new_status == OrderStatus.CANCELLED:
-                order.cancelled_at = datetime.now()
-            
-            db.commit()
-            db.refresh(order)
-            
-            # 发送状态变化通知
-            order_notification_service.notify_order_status_change(order, old_status)
-            
-        finally:
-            db.close()
+        old_status = order.status
+        values = {'status': new_status}
+        
+        # 更新相关时间戳
+        timestamp_field = {
+            OrderStatus.SUBMITTED: 'submitted_at',
+            OrderStatus.ACCEPTED: 'accepted_at',
+            OrderStatus.FILLED: 'filled_at',
+            OrderStatus.CANCELLED: 'cancelled_at',
+        }.get(new_status)
+        if timestamp_field:
+            values[timestamp_field] = datetime.now()
+        
+        async with async_session_scope() as session:
+            await order_repository.update_where(session, Order.id == order.id, **values)
+        for field, value in values.items():
+            setattr(order, field, value)
+        
+        # 发送状态变化通知
+        order_notification_service.notify_order_status_change(order, old_status)
     
     async def _handle_order_rejection(self, order: Order, reason: str):
         """处理订单拒绝"""
@@ -442,34 +617,75 @@ class OrderExecutionEngine:
     
     def get_execution_stats(self) -> Dict[str, Any]:
         """获取执行统计信息"""
+        lane_names = {lane: priority.value for priority, lane in PRIORITY_LANES.items()}
         return {
             **self.execution_stats,
             'active_executions': len(self.active_executions),
+            'resting_orders': len(self.trigger_index),
+            'workers': len(self._workers),
             'queue_size': self.execution_queue.qsize(),
+            'lane_depth': {lane_names[lane]: depth for lane, depth in self._lane_depth.items()},
+            'queue_depth': self.queue_depth.snapshot(),
+            'trigger_to_fill_latency': {
+                **self.trigger_to_fill.snapshot(),
+                'histogram_ms': self.trigger_to_fill_histogram.snapshot()['buckets'],
+            },
             'timestamp': datetime.now().isoformat()
         }
     
-    async def start_execution_worker(self):
-        """启动执行工作线程"""
-        logger.info("启动订单执行工作线程")
-        
+    def _enqueue(self, order: Order, job_type: int, price: Optional[Decimal] = None,
+                 triggered_at: Optional[float] = None):
+        """按订单优先级放入执行队列"""
+        lane = PRIORITY_LANES.get(order.priority, PRIORITY_LANES[OrderPriority.NORMAL])
+        self.execution_queue.put_nowait((lane, job_type, next(self._job_seq), order, price, triggered_at))
+        self._lane_depth[lane] += 1
+        self.queue_depth.record(self.execution_queue.qsize())
+        self._ensure_workers()
+    
+    def _ensure_workers(self):
+        """启动固定数量的执行协程"""
+        self._workers = [task for task in self._workers if not task.done()]
+        for index in range(len(self._workers), self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(index)))
+    
+    async def _worker(self, index: int):
+        """执行协程：按优先级从队列取订单执行"""
         while True:
+            lane, job_type, _, order, price, triggered_at = await self.execution_queue.get()
+            self._lane_depth[lane] -= 1
             try:
-                # 从队列获取订单
-                order = await self.execution_queue.get()
-                
                 # 检查订单是否仍然有效
-                if order.is_active:
-                    # 启动执行任务
-                    execution_task = asyncio.create_task(self._execute_order(order))
-                    self.active_executions[order.id] = execution_task
-                
-                # 标记任务完成
-                self.execution_queue.task_done()
+                if not order.is_active:
+                    continue
                 
+                self.active_executions[order.id] = order
+                if job_type == JOB_TRIGGERED:
+                    await self._execute_triggered(order, price, triggered_at)
+                else:
+                    await self._execute_order(order)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"执行工作线程错误: {str(e)}")
-                await asyncio.sleep(1)
+                logger.error(f"执行协程{index}错误: {str(e)}")
+            finally:
+                self.active_executions.pop(order.id, None)
+                self.execution_queue.task_done()
+    
+    async def start_execution_worker(self):
+        """启动执行协程池"""
+        logger.info(f"启动订单执行协程池: {self.worker_count} 个")
+        self._ensure_workers()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+    
+    async def stop_execution_workers(self):
+        """停止执行协程池并退订行情"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._subscription is not None:
+            await self.quote_bus.unsubscribe(self._subscription)
+            self._subscription = None
 
 
 class CheckResult:
@@ -8,11 +8,16 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from contextlib import contextmanager
 
+from ..core.config import settings
 from ..core.database import get_db
+from ..core.risk_monitor import ShardedRiskMonitor, create_coordinator
+from ..services.quote_bus import quote_bus
+from ..services.risk_analytics import risk_analytics
+from ..services.risk_book import risk_book
 from ..services.risk_service import RiskService
 from ..services.notification_service import NotificationService
 from ..models.risk import RiskRule, RiskEvent, RiskMetrics, RiskLimit
-from ..models.position import Position
+from ..models.position import Position, PositionStatus, PositionType
 from ..models.order import Order
 from ..models.user import User
 
@@ -24,9 +29,29 @@ class RiskEngine:
     
     def __init__(self):
         self.is_running = False
-        self.check_interval = 60  # 检查间隔（秒）
         self.notification_service = NotificationService()
         self._tasks = []
+        
+        # 实时风险检查与风险指标计算按用户分片并行执行，只处理持仓或价格有变动的用户
+        self.realtime_monitor = ShardedRiskMonitor(
+            "realtime",
+            check_user=self._check_user_risk,
+            user_loader=self._load_monitored_users,
+            interval=settings.RISK_MONITOR_INTERVAL,
+            coordinator=create_coordinator(prefix="risk_monitor:realtime"),
+            quote_bus=quote_bus
+        )
+        self.metrics_monitor = ShardedRiskMonitor(
+            "metrics",
+            check_user=self._calculate_user_risk_metrics,
+            user_loader=self._load_monitored_users,
+            interval=3600,  # 每小时计算一次风险指标
+            full_scan_interval=0,
+            coordinator=create_coordinator(prefix="risk_monitor:metrics"),
+            quote_bus=quote_bus,
+            prepare_cycle=self._prepare_portfolio_risk
+        )
+        self._monitors = [self.realtime_monitor, self.metrics_monitor]
     
     @contextmanager
     def get_db_session(self):
@@ -46,10 +71,13 @@ class RiskEngine:
         self.is_running = True
         logger.info("Starting risk engine...")
         
+        # 成交和持仓变动时标记用户待检查
+        for monitor in self._monitors:
+            risk_book.add_listener(monitor.mark_dirty)
+            await monitor.start()
+        
         # 启动各种监控任务
         self._tasks = [
-            asyncio.create_task(self._real_time_risk_monitor()),
-            asyncio.create_task(self._periodic_risk_calculation()),
             asyncio.create_task(self._risk_limit_monitor()),
             asyncio.create_task(self._risk_event_processor())
         ]
@@ -65,6 +93,10 @@ class RiskEngine:
         self.is_running = False
         logger.info("Stopping risk engine...")
         
+        for monitor in self._monitors:
+            risk_book.remove_listener(monitor.mark_dirty)
+            await monitor.stop()
+        
         # 取消所有任务
         for task in self._tasks:
             task.cancel()
@@ -75,63 +107,6 @@ class RiskEngine:
         
         logger.info("Risk engine stopped successfully")
     
-    async def _real_time_risk_monitor(self):
-        """实时风险监控"""
-        logger.info("Starting real-time risk monitor")
-        
-        while self.is_running:
-            try:
-                with self.get_db_session() as db:
-                    risk_service = RiskService(db)
-                    
-                    # 获取所有活跃用户
-                    active_users = self._get_active_users(db)
-                    
-                    for user in active_users:
-                        await self._check_user_risk(risk_service, user.id)
-                
-                # 等待下一次检查
-                await asyncio.sleep(self.check_interval)
-                
-            except asyncio.CancelledError:
-                logger.info("Real-time risk monitor cancelled")
-                break
-            except Exception as e:
-                logger.error(f"Error in real-time risk monitor: {e}")
-                await asyncio.sleep(self.check_interval)
-    
-    async def _periodic_risk_calculation(self):
-        """定期风险指标计算"""
-        logger.info("Starting periodic risk calculation")
-        
-        while self.is_running:
-            try:
-                # 每小时计算一次风险指标
-                await asyncio.sleep(3600)
-                
-                if not self.is_running:
-                    break
-                
-                with self.get_db_session() as db:
-                    risk_service = RiskService(db)
-                    
-                    # 获取所有活跃用户
-                    active_users = self._get_active_users(db)
-                    
-                    for user in active_users:
-                        try:
-                            # 计算用户的风险指标
-                            metrics = risk_service.calculate_risk_metrics(user.id)
-                            logger.info(f"Calculated risk metrics for user {user.id}")
-                        except Exception as e:
-                            logger.error(f"Error calculating risk metrics for user {user.id}: {e}")
-                
-            except asyncio.CancelledError:
-                logger.info("Periodic risk calculation cancelled")
-                break
-            except Exception as e:
-                logger.error(f"Error in periodic risk calculation: {e}")
-    
     async def _risk_limit_monitor(self):
         """风险限额监控"""
         logger.info("Starting risk limit monitor")
@@ -204,9 +179,11 @@ class RiskEngine:
                 logger.error(f"Error in risk event processor: {e}")
                 await asyncio.sleep(30)
     
-    async def _check_user_risk(self, risk_service: RiskService, user_id: int):
-        """检查用户风险"""
-        try:
+    def _check_user_risk(self, user_id: int):
+        """检查用户风险（在监控线程池中执行）"""
+        with self.get_db_session() as db:
+            risk_service = RiskService(db)
+            
             # 获取用户持仓
             positions = risk_service._get_user_positions(user_id)
             
@@ -214,19 +191,71 @@ class RiskEngine:
                 return
             
             # 构建风险检查上下文
-            context = await self._build_risk_context(risk_service, user_id, positions)
+            context = self._build_risk_context(risk_service, user_id, positions)
             
             # 检查风险规则
             events = risk_service.check_risk_rules(context)
             
             if events:
                 logger.info(f"User {user_id} triggered {len(events)} risk events")
-        
-        except Exception as e:
-            logger.error(f"Error checking risk for user {user_id}: {e}")
     
-    async def _build_risk_context(self, risk_service: RiskService, user_id: int, 
-                                positions: List[Position]) -> Dict[str, Any]:
+    def _calculate_user_risk_metrics(self, user_id: int):
+        """计算用户风险指标（在监控线程池中执行）"""
+        with self.get_db_session() as db:
+            RiskService(db).calculate_risk_metrics(user_id)
+            logger.debug(f"Calculated risk metrics for user {user_id}")
+    
+    async def _prepare_portfolio_risk(self, user_ids: List[int]):
+        """本周期全部用户的VaR/CVaR一次矩阵运算算出，逐用户计算指标时直接读取"""
+        exposures = await asyncio.to_thread(self._load_exposures, user_ids)
+        await risk_analytics.ensure_symbols({symbol for held in exposures.values() for symbol in held})
+        await asyncio.to_thread(risk_analytics.compute, exposures)
+    
+    def _load_exposures(self, user_ids: List[int]) -> Dict[int, Dict[str, float]]:
+        """一次查询加载用户开放持仓的金额敞口（空头为负）"""
+        exposures: Dict[int, Dict[str, float]] = {user_id: {} for user_id in user_ids}
+        if not user_ids:
+            return exposures
+        with self.get_db_session() as db:
+            rows = db.query(
+                Position.user_id, Position.symbol, Position.position_type,
+                Position.quantity, Position.current_price, Position.average_cost
+            ).filter(
+                Position.user_id.in_(user_ids),
+                Position.status == PositionStatus.OPEN
+            ).all()
+        for user_id, symbol, position_type, quantity, current_price, average_cost in rows:
+            tick = quote_bus.latest(symbol)
+            price = tick.last_price if tick is not None and tick.last_price else float(current_price or average_cost or 0)
+            value = float(quantity or 0) * price
+            if position_type == PositionType.SHORT:
+                value = -value
+            held = exposures[user_id]
+            held[symbol] = held.get(symbol, 0.0) + value
+        return exposures
+    
+    def _load_monitored_users(self) -> Dict[int, List[str]]:
+        """监控范围内的用户及其开放持仓合约"""
+        with self.get_db_session() as db:
+            user_ids = [user.id for user in self._get_active_users(db)]
+            users: Dict[int, List[str]] = {user_id: [] for user_id in user_ids}
+            if user_ids:
+                rows = db.query(Position.user_id, Position.symbol).filter(
+                    Position.user_id.in_(user_ids),
+                    Position.status == PositionStatus.OPEN
+                ).distinct().all()
+                for user_id, symbol in rows:
+                    users[user_id].append(symbol)
+            return users
+    
+    def get_monitor_stats(self) -> Dict[str, Any]:
+        """监控周期耗时与积压"""
+        stats = {monitor.name: monitor.get_stats() for monitor in self._monitors}
+        stats["analytics"] = risk_analytics.get_stats()
+        return stats
+    
+    def _build_risk_context(self, risk_service: RiskService, user_id: int, 
+                          positions: List[Position]) -> Dict[str, Any]:
         """构建风险检查上下文"""
         try:
             # 获取价格数据
@@ -486,7 +515,7 @@ class RiskEngine:
                     }
                 
                 # 构建风险检查上下文
-                context = await self._build_risk_context(risk_service, user_id, positions)
+                context = self._build_risk_context(risk_service, user_id, positions)
                 
                 # 检查风险规则
                 events = risk_service.check_risk_rules(context)
@@ -0,0 +1,405 @@
+"""
+分片实时风险监控
+
+用户按ID哈希分到固定数量的分片，每个周期只检查持仓或价格发生变化的用户（脏用户），
+各分片在有界线程池中并行执行（检查函数通常包含阻塞的SQLAlchemy调用）。
+多进程或多节点部署时通过Redis协调：节点心跳决定各节点负责的分片，脏用户按分片存入Redis集合。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+from .metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+UserSymbolsLoader = Callable[[], Dict[int, Iterable[str]]]
+
+
+def shard_of(user_id: Any, shards: int) -> int:
+    """用户所属分片"""
+    if isinstance(user_id, int):
+        return user_id % shards
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+class LocalShardCoordinator:
+    """单进程协调：本节点负责全部分片，脏用户保存在内存"""
+
+    def __init__(self):
+        self.node_id = "local"
+        self._dirty: Dict[int, Set[Any]] = defaultdict(set)
+
+    async def join(self):
+        pass
+
+    async def leave(self):
+        pass
+
+    async def refresh(self) -> Tuple[int, int]:
+        """返回 (本节点序号, 节点数)"""
+        return 0, 1
+
+    async def push_dirty(self, by_shard: Dict[int, Set[Any]]):
+        for shard, users in by_shard.items():
+            self._dirty[shard].update(users)
+
+    async def take_dirty(self, shards: Iterable[int]) -> Dict[int, List[Any]]:
+        return {shard: list(self._dirty.pop(shard)) for shard in shards if self._dirty.get(shard)}
+
+    async def backlog(self, shards: Iterable[int]) -> int:
+        return sum(len(self._dirty.get(shard, ())) for shard in shards)
+
+    async def publish_metrics(self, metrics: Dict[str, Any]):
+        pass
+
+
+class RedisShardCoordinator:
+    """多进程/多节点协调
+
+    - 节点心跳保存在有序集合中，过期节点被剔除，按节点ID排序得到本节点序号
+    - 分片 s 由序号为 s % 节点数 的节点负责
+    - 脏用户按分片保存在集合中，任一节点标记，负责该分片的节点取走
+    """
+
+    def __init__(self, redis_client=None, prefix: str = "risk_monitor", node_id: Optional[str] = None,
+                 ttl: float = settings.RISK_MONITOR_NODE_TTL):
+        if redis_client is None:
+            from .database import get_redis_client
+            redis_client = get_redis_client()
+        self.redis = redis_client
+        self.prefix = prefix
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + tuple(str(p) for p in parts))
+
+    async def join(self):
+        await self.refresh()
+
+    async def leave(self):
+        def _leave():
+            pipe = self.redis.pipeline()
+            pipe.zrem(self._key("nodes"), self.node_id)
+            pipe.hdel(self._key("metrics"), self.node_id)
+            pipe.execute()
+        await asyncio.to_thread(_leave)
+
+    async def refresh(self) -> Tuple[int, int]:
+        def _refresh():
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.zadd(self._key("nodes"), {self.node_id: now})
+            pipe.zremrangebyscore(self._key("nodes"), "-inf", now - self.ttl)
+            pipe.zrange(self._key("nodes"), 0, -1)
+            nodes = sorted(pipe.execute()[-1])
+            return nodes.index(self.node_id), len(nodes)
+        return await asyncio.to_thread(_refresh)
+
+    async def push_dirty(self, by_shard: Dict[int, Set[Any]]):
+        if not by_shard:
+            return
+
+        def _push():
+            pipe = self.redis.pipeline(transaction=False)
+            for shard, users in by_shard.items():
+                pipe.sadd(self._key("dirty", shard), *users)
+            pipe.execute()
+        await asyncio.to_thread(_push)
+
+    async def take_dirty(self, shards: Iterable[int]) -> Dict[int, List[Any]]:
+        shards = list(shards)
+
+        def _take():
+            pipe = self.redis.pipeline(transaction=True)
+            for shard in shards:
+                pipe.smembers(self._key("dirty", shard))
+                pipe.delete(self._key("dirty", shard))
+            results = pipe.execute()
+            return {
+                shard: [int(u) if str(u).isdigit() else u for u in members]
+                for shard, members in zip(shards, results[::2]) if members
+            }
+        return await asyncio.to_thread(_take)
+
+    async def backlog(self, shards: Iterable[int]) -> int:
+        shards = list(shards)
+
+        def _backlog():
+            pipe = self.redis.pipeline(transaction=False)
+            for shard in shards:
+                pipe.scard(self._key("dirty", shard))
+            return sum(pipe.execute())
+        return await asyncio.to_thread(_backlog)
+
+    async def publish_metrics(self, metrics: Dict[str, Any]):
+        await asyncio.to_thread(self.redis.hset, self._key("metrics"), self.node_id, json.dumps(metrics, default=str))
+
+
+def create_coordinator(mode: str = settings.RISK_MONITOR_COORDINATION, prefix: str = "risk_monitor"):
+    """按配置创建分片协调器"""
+    if mode == "redis":
+        return RedisShardCoordinator(prefix=prefix)
+    return LocalShardCoordinator()
+
+
+class ShardedRiskMonitor:
+    """分片风险监控
+
+    check_user(user_id) 为同步函数，在线程池中执行，需自行管理数据库会话
+    user_loader() 返回 {用户ID: 持仓合约}，用于全量检查和建立合约到用户的索引
+    prepare_cycle(user_ids) 为可选协程，在逐用户检查前对本周期全部用户做一次批量计算
+    """
+
+    def __init__(
+        self,
+        name: str,
+        check_user: Callable[[Any], Any],
+        user_loader: Optional[UserSymbolsLoader] = None,
+        interval: float = settings.RISK_MONITOR_INTERVAL,
+        shards: int = settings.RISK_MONITOR_SHARDS,
+        workers: int = settings.RISK_MONITOR_WORKERS,
+        full_scan_interval: float = settings.RISK_MONITOR_FULL_SCAN_INTERVAL,
+        coordinator=None,
+        quote_bus=None,
+        prepare_cycle: Optional[Callable[[List[Any]], Awaitable[Any]]] = None
+    ):
+        self.name = name
+        self.check_user = check_user
+        self.user_loader = user_loader
+        self.interval = interval
+        self.shards = shards
+        self.workers = workers
+        self.full_scan_interval = full_scan_interval
+        self.coordinator = coordinator or LocalShardCoordinator()
+        self.quote_bus = quote_bus
+        self.prepare_cycle = prepare_cycle
+
+        self._pending: Set[Any] = set()
+        self._user_symbols: Dict[Any, Set[str]] = {}
+        self._symbol_users: Dict[str, Set[Any]] = defaultdict(set)
+        self._symbols_changed = False
+        self._subscription = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_full_scan: Optional[float] = None
+        self.node_index, self.node_count = 0, 1
+
+        self.cycle_latency = LatencyRecorder(window=256)
+        self.cycles = 0
+        self.checked = 0
+        self.errors = 0
+        self.last_cycle_users = 0
+        self.last_backlog = 0
+        self.last_cycle_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # 变动事件
+    # ------------------------------------------------------------------
+
+    def mark_dirty(self, user_id: Any, symbol: Optional[str] = None):
+        """用户持仓或资金变动"""
+        self._pending.add(user_id)
+        if symbol and symbol not in self._user_symbols.get(user_id, ()):
+            self._user_symbols.setdefault(user_id, set()).add(symbol)
+            self._symbol_users[symbol].add(user_id)
+            self._symbols_changed = True
+
+    def mark_symbol_dirty(self, symbol: str):
+        """合约价格变动，持有该合约的用户都需要检查"""
+        users = self._symbol_users.get(symbol)
+        if users:
+            self._pending.update(users)
+
+    def set_user_symbols(self, user_id: Any, symbols: Iterable[str]):
+        """设置用户持仓合约"""
+        symbols = set(symbols)
+        for symbol in self._user_symbols.get(user_id, set()) - symbols:
+            users = self._symbol_users.get(symbol)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._symbol_users[symbol]
+        for symbol in symbols:
+            self._symbol_users[symbol].add(user_id)
+        self._user_symbols[user_id] = symbols
+        self._symbols_changed = True
+
+    def _on_quote(self, tick):
+        self.mark_symbol_dirty(tick.symbol)
+
+    # ------------------------------------------------------------------
+    # 周期执行
+    # ------------------------------------------------------------------
+
+    def owned_shards(self) -> List[int]:
+        return [shard for shard in range(self.shards) if shard % self.node_count == self.node_index]
+
+    async def run_cycle(self) -> Dict[str, Any]:
+        """执行一个监控周期"""
+        begin = time.perf_counter()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"risk-{self.name}")
+        self.node_index, self.node_count = await self.coordinator.refresh()
+
+        now = time.monotonic()
+        if self.user_loader is not None and (
+            self._last_full_scan is None
+            or (self.full_scan_interval > 0 and now - self._last_full_scan >= self.full_scan_interval)
+        ):
+            await self._full_scan()
+            self._last_full_scan = now
+
+        await self._sync_quote_symbols()
+
+        pending, self._pending = self._pending, set()
+        by_shard: Dict[int, Set[Any]] = defaultdict(set)
+        for user_id in pending:
+            by_shard[shard_of(user_id, self.shards)].add(user_id)
+        await self.coordinator.push_dirty(by_shard)
+
+        owned = self.owned_shards()
+        work = await self.coordinator.take_dirty(owned)
+
+        if self.prepare_cycle is not None and work:
+            try:
+                await self.prepare_cycle([user_id for users in work.values() for user_id in users])
+            except Exception as e:
+                logger.error(f"风险监控[{self.name}]批量预计算失败: {e}")
+
+        semaphore = asyncio.Semaphore(self.workers)
+        results = await asyncio.gather(*(self._run_shard(semaphore, users) for users in work.values()))
+        users = sum(len(u) for u in work.values())
+        errors = sum(results)
+
+        elapsed = time.perf_counter() - begin
+        self.cycle_latency.record(elapsed)
+        self.cycles += 1
+        self.checked += users
+        self.errors += errors
+        self.last_cycle_users = users
+        self.last_backlog = await self.coordinator.backlog(owned) + len(self._pending)
+        self.last_cycle_at = time.time()
+
+        if self.interval and elapsed > self.interval:
+            logger.warning(
+                f"风险监控[{self.name}]周期耗时 {elapsed:.2f}s 超过间隔 {self.interval}s，"
+                f"检查 {users} 个用户，积压 {self.last_backlog}"
+            )
+
+        stats = self.get_stats()
+        try:
+            await self.coordinator.publish_metrics(stats)
+        except Exception as e:
+            logger.error(f"风险监控[{self.name}]发布指标失败: {e}")
+        return stats
+
+    async def _run_shard(self, semaphore: asyncio.Semaphore, users: List[Any]) -> int:
+        """同一分片的用户在一个线程中依次检查，返回失败数"""
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._check_batch, users)
+
+    def _check_batch(self, users: List[Any]) -> int:
+        errors = 0
+        for user_id in users:
+            try:
+                self.check_user(user_id)
+            except Exception as e:
+                errors += 1
+                logger.error(f"风险监控[{self.name}]检查用户 {user_id} 失败: {e}")
+        return errors
+
+    async def _full_scan(self):
+        """加载全部监控用户及其持仓合约，并全部标记为待检查"""
+        users = await asyncio.to_thread(self.user_loader)
+        for user_id in set(self._user_symbols) - set(users):
+            self.set_user_symbols(user_id, ())
+            del self._user_symbols[user_id]
+        for user_id, symbols in users.items():
+            self.set_user_symbols(user_id, symbols)
+        self._pending.update(users)
+
+    async def _sync_quote_symbols(self):
+        """行情订阅与持仓合约保持一致"""
+        if self.quote_bus is None or not self._symbols_changed:
+            return
+        self._symbols_changed = False
+        wanted = set(self._symbol_users)
+        if self._subscription is None:
+            self._subscription = await self.quote_bus.subscribe(wanted, self._on_quote, name=f"risk_monitor:{self.name}")
+            return
+        current = set(self._subscription.symbols)
+        if wanted - current:
+            await self.quote_bus.add_symbols(self._subscription, wanted - current)
+        if current - wanted:
+            await self.quote_bus.remove_symbols(self._subscription, current - wanted)
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        if self._task is not None:
+            return
+        await self.coordinator.join()
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"风险监控[{self.name}]已启动: {self.shards} 个分片, {self.workers} 个线程, 间隔 {self.interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._subscription is not None and self.quote_bus is not None:
+            await self.quote_bus.unsubscribe(self._subscription)
+            self._subscription = None
+        try:
+            await self.coordinator.leave()
+        except Exception as e:
+            logger.error(f"风险监控[{self.name}]退出协调失败: {e}")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _loop(self):
+        while True:
+            try:
+                begin = time.monotonic()
+                await self.run_cycle()
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - begin)))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"风险监控[{self.name}]周期执行失败: {e}")
+                await asyncio.sleep(self.interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "node": self.coordinator.node_id,
+            "node_index": self.node_index,
+            "node_count": self.node_count,
+            "shards": len(self.owned_shards()),
+            "tracked_users": len(self._user_symbols),
+            "cycles": self.cycles,
+            "checked": self.checked,
+            "errors": self.errors,
+            "last_cycle_users": self.last_cycle_users,
+            "backlog": self.last_backlog,
+            "cycle_time": self.cycle_latency.snapshot(),
+            "last_cycle_at": self.last_cycle_at,
+        }
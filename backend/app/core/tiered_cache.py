@@ -0,0 +1,551 @@
+"""
+两级缓存
+进程内有界LRU缓存在前，异步Redis在后：
+- 同一进程内同一键的并发加载合并为一次（single-flight）
+- 条目临近过期时按概率提前在后台刷新，过期后的宽限期内先返回旧值再后台刷新，避免热点键失效时的缓存击穿
+- 条目可登记失效标签（如 user:42、symbol:rb2405），按标签失效的代价与标签下的条目数成正比
+- 显式写入和失效通过Redis发布订阅通知其他进程丢弃本地副本
+- 按命名空间统计命中率
+- Redis中的值按命名空间选择编解码器（默认settings.CACHE_CODEC），失效通知为JSON
+进程内缓存返回的是共享对象，调用方应当只读使用。
+"""
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import math
+import random
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from .cache import SCAN_BATCH_SIZE, register_cache_tags, tag_key
+from .codecs import Codec, decode, encode, json_codec
+from .config import settings
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_ASYNC_AVAILABLE = True
+except ImportError:
+    REDIS_ASYNC_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Redis出错后暂停访问的时长（秒），期间只使用进程内缓存
+REDIS_RETRY_INTERVAL = 5.0
+
+# Redis条目头：格式版本、过期时间、旧值截止时间、加载耗时、标签长度；之后是换行分隔的标签和编码后的值
+ENTRY_VERSION = 1
+_ENTRY_HEADER = struct.Struct("<BdddH")
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class CacheEntry:
+    """缓存条目，时间均为time.time()
+
+    expires_at之前为新鲜值；expires_at到stale_until之间为旧值，可返回但需刷新；
+    delta为加载耗时，用于计算提前刷新的概率；tags为失效标签
+    """
+    value: Any
+    expires_at: float
+    stale_until: float
+    delta: float = 0.0
+    tags: Tuple[str, ...] = ()
+
+
+@dataclass
+class NamespaceStats:
+    """命名空间命中统计"""
+    local_hits: int = 0
+    redis_hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    early_refreshes: int = 0
+    load_errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits + self.stale_hits
+        requests = hits + self.misses + self.coalesced
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "early_refreshes": self.early_refreshes,
+            "load_errors": self.load_errors,
+            "requests": requests,
+            "hit_ratio": hits / requests if requests else 0.0,
+            "local_hit_ratio": (self.local_hits + self.stale_hits) / requests if requests else 0.0,
+        }
+
+
+class LocalCache:
+    """进程内LRU缓存，按条目数限制容量，超出宽限期的条目在读取时删除
+
+    同时维护标签到键的索引，按标签删除时不遍历全部条目
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], CacheEntry]" = OrderedDict()
+        self._tags: Dict[str, Set[Tuple[str, str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[str, str], now: float) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now >= entry.stale_until:
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: Tuple[str, str], entry: CacheEntry):
+        self.delete(key)
+        self._entries[key] = entry
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self.delete(next(iter(self._entries)))
+
+    def delete(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def delete_tags(self, tags: Iterable[str]) -> int:
+        """删除登记在标签下的条目，返回删除数量"""
+        deleted = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self.delete(key)
+                deleted += 1
+        return deleted
+
+    def clear(self, namespace: Optional[str] = None):
+        if namespace is None:
+            self._entries.clear()
+            self._tags.clear()
+            return
+        for key in [key for key in self._entries if key[0] == namespace]:
+            self.delete(key)
+
+
+def make_cache_key(*args, **kwargs) -> str:
+    """由参数生成缓存键"""
+    key_data = f"{args}:{sorted(kwargs.items())}"
+    return hashlib.md5(key_data.encode()).hexdigest()
+
+
+class TieredCache:
+    """进程内LRU + 异步Redis两级缓存"""
+
+    def __init__(self, redis_client=None, max_entries: Optional[int] = None,
+                 default_ttl: Optional[int] = None, stale_ttl: Optional[int] = None,
+                 beta: Optional[float] = None, codec: Optional[Union[str, Codec]] = None):
+        self.local = LocalCache(max_entries or settings.CACHE_LOCAL_MAX_ENTRIES)
+        self.default_ttl = default_ttl or settings.CACHE_DEFAULT_TTL
+        self.stale_ttl = settings.CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.beta = settings.CACHE_EARLY_REFRESH_BETA if beta is None else beta
+        self.key_prefix = settings.CACHE_KEY_PREFIX
+        self.channel = settings.CACHE_INVALIDATION_CHANNEL
+        self.codec = codec or settings.CACHE_CODEC
+        self.namespace_codecs: Dict[str, Union[str, Codec]] = {}
+        self.instance_id = uuid.uuid4().hex
+        self.stats: Dict[str, NamespaceStats] = {}
+        self._redis = redis_client
+        self._redis_retry_at = 0.0
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._inflight_tags: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        # 加载期间其键被失效的加载任务，结果只返回给等待方，不写入缓存，避免旧数据覆盖失效
+        self._discarded: Set[asyncio.Task] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def redis(self):
+        """异步Redis客户端，未安装或出错暂停期间为None"""
+        if self._redis is None and REDIS_ASYNC_AVAILABLE:
+            self._redis = aioredis.Redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=False,
+                socket_connect_timeout=settings.REDIS_CONNECTION_TIMEOUT,
+                socket_timeout=settings.REDIS_CONNECTION_TIMEOUT,
+            )
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        return self._redis
+
+    def _redis_failed(self, action: str, error: Exception):
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+        logger.warning(f"两级缓存{action}Redis失败，{REDIS_RETRY_INTERVAL:.0f}秒内只使用进程内缓存: {error}")
+
+    def _stats(self, namespace: str) -> NamespaceStats:
+        stats = self.stats.get(namespace)
+        if stats is None:
+            stats = self.stats[namespace] = NamespaceStats()
+        return stats
+
+    def _redis_key(self, namespace: str, key: str) -> str:
+        return f"{self.key_prefix}{namespace}:{key}"
+
+    def set_codec(self, namespace: str, codec: Union[str, Codec]):
+        """指定命名空间写入Redis时使用的编解码器，读取时按数据中的标识解码"""
+        self.namespace_codecs[namespace] = codec
+
+    def _dump_entry(self, namespace: str, entry: CacheEntry) -> bytes:
+        tags = "\n".join(entry.tags).encode("utf-8")
+        header = _ENTRY_HEADER.pack(ENTRY_VERSION, entry.expires_at, entry.stale_until, entry.delta, len(tags))
+        return header + tags + encode(entry.value, self.namespace_codecs.get(namespace, self.codec))
+
+    @staticmethod
+    def _load_entry(data: bytes) -> Optional[CacheEntry]:
+        view = memoryview(data)
+        version, expires_at, stale_until, delta, tags_length = _ENTRY_HEADER.unpack_from(view)
+        if version != ENTRY_VERSION:
+            return None
+        offset = _ENTRY_HEADER.size
+        tags = view[offset:offset + tags_length].tobytes().decode("utf-8")
+        value = decode(view[offset + tags_length:])
+        return CacheEntry(value, expires_at, stale_until, delta, tuple(tags.split("\n")) if tags else ())
+
+    def _should_refresh_early(self, entry: CacheEntry, now: float) -> bool:
+        """概率提前刷新：加载越慢、越接近过期，越可能由本次读取触发刷新"""
+        if self.beta <= 0 or entry.delta <= 0:
+            return False
+        return now - entry.delta * self.beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+    async def get_or_load(self, namespace: str, key: str, loader: Loader,
+                          ttl: Optional[int] = None, stale_ttl: Optional[int] = None,
+                          tags: Iterable[str] = ()) -> Any:
+        """读取缓存，未命中时调用loader加载并写入两级缓存，tags为条目的失效标签"""
+        stats = self._stats(namespace)
+        now = time.time()
+        entry = self.local.get((namespace, key), now)
+        if entry is not None:
+            if now < entry.expires_at:
+                stats.local_hits += 1
+                if self._should_refresh_early(entry, now):
+                    stats.early_refreshes += 1
+                    self._refresh(namespace, key, loader, ttl, stale_ttl, tags, entry.expires_at)
+            else:
+                stats.stale_hits += 1
+                self._refresh(namespace, key, loader, ttl, stale_ttl, tags, entry.expires_at)
+            return entry.value
+
+        task = self._inflight.get((namespace, key))
+        if task is not None:
+            stats.coalesced += 1
+        else:
+            task = self._start_load(namespace, key, loader, ttl, stale_ttl, tags, 0.0)
+        # 单个调用方被取消时不影响其他等待同一加载的调用方
+        return await asyncio.shield(task)
+
+    def _refresh(self, namespace: str, key: str, loader: Loader, ttl: Optional[int],
+                 stale_ttl: Optional[int], tags: Iterable[str], newer_than: float):
+        """后台刷新，同一键已在加载时不重复发起"""
+        if (namespace, key) not in self._inflight:
+            self._start_load(namespace, key, loader, ttl, stale_ttl, tags, newer_than)
+
+    def _start_load(self, namespace: str, key: str, loader: Loader, ttl: Optional[int],
+                    stale_ttl: Optional[int], tags: Iterable[str], newer_than: float) -> asyncio.Task:
+        task = asyncio.create_task(self._load(namespace, key, loader, ttl, stale_ttl, tuple(tags), newer_than))
+        self._inflight[(namespace, key)] = task
+        self._inflight_tags[(namespace, key)] = tuple(tags)
+        task.add_done_callback(lambda done: self._load_done(namespace, key, done))
+        return task
+
+    def _load_done(self, namespace: str, key: str, task: asyncio.Task):
+        if self._inflight.get((namespace, key)) is task:
+            del self._inflight[(namespace, key)]
+            del self._inflight_tags[(namespace, key)]
+        self._discarded.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._stats(namespace).load_errors += 1
+            logger.warning(f"缓存加载失败 {namespace}:{key}: {task.exception()}")
+
+    def _discard_loads(self, match: Callable[[Tuple[str, str], Tuple[str, ...]], bool]):
+        """失效时丢弃受影响的进行中加载，之后的读取重新发起加载"""
+        for key, tags in list(self._inflight_tags.items()):
+            if match(key, tags):
+                self._discarded.add(self._inflight.pop(key))
+                del self._inflight_tags[key]
+
+    async def _load(self, namespace: str, key: str, loader: Loader, ttl: Optional[int],
+                    stale_ttl: Optional[int], tags: Tuple[str, ...], newer_than: float) -> Any:
+        """先查Redis（其他进程可能已刷新），仍需加载时调用loader
+
+        newer_than大于0表示后台刷新，只接受比本地条目更晚过期的Redis条目，且不计入命中统计
+        """
+        stats = self._stats(namespace)
+        task = asyncio.current_task()
+        entry = await self._redis_get(namespace, key)
+        now = time.time()
+        refresh = newer_than > 0
+        if entry is not None and now < entry.expires_at and entry.expires_at > newer_than:
+            if not refresh:
+                stats.redis_hits += 1
+            if task not in self._discarded:
+                self.local.set((namespace, key), entry)
+            return entry.value
+
+        if not refresh:
+            stats.misses += 1
+        begin = time.perf_counter()
+        value = await loader()
+        delta = time.perf_counter() - begin
+        if task in self._discarded:
+            return value
+        entry = self._make_entry(value, ttl, stale_ttl, tags, delta)
+        self.local.set((namespace, key), entry)
+        await self._redis_set(namespace, key, entry)
+        return value
+
+    def _make_entry(self, value: Any, ttl: Optional[int], stale_ttl: Optional[int],
+                    tags: Iterable[str] = (), delta: float = 0.0) -> CacheEntry:
+        now = time.time()
+        ttl = ttl or self.default_ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        return CacheEntry(value=value, expires_at=now + ttl, stale_until=now + ttl + stale_ttl,
+                          delta=delta, tags=tuple(tags))
+
+    async def _redis_get(self, namespace: str, key: str) -> Optional[CacheEntry]:
+        client = self.redis
+        if client is None:
+            return None
+        try:
+            data = await client.get(self._redis_key(namespace, key))
+        except Exception as e:
+            self._redis_failed("读取", e)
+            return None
+        if not data:
+            return None
+        try:
+            return self._load_entry(data)
+        except Exception as e:
+            logger.warning(f"缓存数据解析失败 {namespace}:{key}: {e}")
+            return None
+
+    async def _redis_set(self, namespace: str, key: str, entry: CacheEntry):
+        client = self.redis
+        if client is None:
+            return
+        try:
+            data = self._dump_entry(namespace, entry)
+        except Exception as e:
+            logger.warning(f"缓存数据编码失败 {namespace}: {e}")
+            return
+        expire = max(1, math.ceil(entry.stale_until - time.time()))
+        redis_key = self._redis_key(namespace, key)
+        try:
+            if entry.tags:
+                pipeline = client.pipeline(transaction=False)
+                pipeline.set(redis_key, data, ex=expire)
+                register_cache_tags(pipeline, redis_key, entry.tags, expire)
+                await pipeline.execute()
+            else:
+                await client.set(redis_key, data, ex=expire)
+        except Exception as e:
+            self._redis_failed("写入", e)
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        """只读取新鲜值，不触发加载"""
+        stats = self._stats(namespace)
+        now = time.time()
+        entry = self.local.get((namespace, key), now)
+        if entry is not None and now < entry.expires_at:
+            stats.local_hits += 1
+            return entry.value
+        entry = await self._redis_get(namespace, key)
+        if entry is not None and time.time() < entry.expires_at:
+            stats.redis_hits += 1
+            self.local.set((namespace, key), entry)
+            return entry.value
+        stats.misses += 1
+        return None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[int] = None,
+                  stale_ttl: Optional[int] = None, tags: Iterable[str] = ()):
+        """写入两级缓存，并通知其他进程丢弃旧的本地副本"""
+        entry = self._make_entry(value, ttl, stale_ttl, tags)
+        self._discard_loads(lambda k, _: k == (namespace, key))
+        self.local.set((namespace, key), entry)
+        await self._redis_set(namespace, key, entry)
+        await self._publish_invalidation(namespace, key)
+
+    async def invalidate(self, namespace: str, key: str):
+        """删除两级缓存中的键，并通知其他进程"""
+        self._discard_loads(lambda k, _: k == (namespace, key))
+        self.local.delete((namespace, key))
+        client = self.redis
+        if client is not None:
+            try:
+                await client.delete(self._redis_key(namespace, key))
+            except Exception as e:
+                self._redis_failed("删除", e)
+        await self._publish_invalidation(namespace, key)
+
+    async def invalidate_local(self, namespace: str):
+        """清空所有进程中该命名空间的本地缓存（Redis中的条目按TTL过期）"""
+        self._discard_loads(lambda k, _: k[0] == namespace)
+        self.local.clear(namespace)
+        await self._publish_invalidation(namespace, None)
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """按标签失效两级缓存中的条目并通知其他进程，返回删除的Redis键数量
+
+        Redis中取出并删除标签集合在同一事务中完成，代价与标签下的条目数成正比
+        """
+        self._discard_loads(lambda _, load_tags: not set(tags).isdisjoint(load_tags))
+        self.local.delete_tags(tags)
+        deleted = 0
+        client = self.redis
+        if client is not None:
+            try:
+                for tag in tags:
+                    pipeline = client.pipeline(transaction=True)
+                    pipeline.smembers(tag_key(tag))
+                    pipeline.unlink(tag_key(tag))
+                    members = list((await pipeline.execute())[0])
+                    for start in range(0, len(members), SCAN_BATCH_SIZE):
+                        deleted += await client.unlink(*members[start:start + SCAN_BATCH_SIZE])
+            except Exception as e:
+                self._redis_failed("按标签删除", e)
+        await self._publish_invalidation(tags=list(tags))
+        return deleted
+
+    async def _publish_invalidation(self, namespace: Optional[str] = None, key: Optional[str] = None,
+                                    tags: Optional[list] = None):
+        client = self.redis
+        if client is None:
+            return
+        message = json_codec.dumps({"origin": self.instance_id, "namespace": namespace, "key": key, "tags": tags})
+        try:
+            await client.publish(self.channel, message)
+        except Exception as e:
+            self._redis_failed("发布失效通知到", e)
+
+    def handle_invalidation(self, data: Any):
+        """处理其他进程发来的失效通知"""
+        try:
+            message = json_codec.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get("origin") == self.instance_id:
+            return
+        namespace, key, tags = message.get("namespace"), message.get("key"), message.get("tags")
+        if tags:
+            self._discard_loads(lambda _, load_tags: not set(tags).isdisjoint(load_tags))
+            self.local.delete_tags(tags)
+        elif key is None:
+            self._discard_loads(lambda k, _: k[0] == namespace)
+            self.local.clear(namespace)
+        else:
+            self._discard_loads(lambda k, _: k == (namespace, key))
+            self.local.delete((namespace, key))
+
+    async def start(self):
+        """启动失效通知订阅"""
+        if self._listener is None and REDIS_ASYNC_AVAILABLE:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """停止失效通知订阅，取消并等待进行中的加载，关闭Redis连接"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        loads = list(self._inflight.values()) + list(self._discarded)
+        for task in loads:
+            task.cancel()
+        await asyncio.gather(*loads, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen(self):
+        """订阅失效通知，连接断开后重连；重连期间可能错过通知，清空本地缓存兜底"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub() if self.redis is not None else None
+                if pubsub is None:
+                    await asyncio.sleep(REDIS_RETRY_INTERVAL)
+                    continue
+                await pubsub.subscribe(self.channel)
+                logger.info(f"两级缓存已订阅失效通知: {self.channel}")
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.handle_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._redis_failed("订阅", e)
+                self.local.clear()
+                await asyncio.sleep(REDIS_RETRY_INTERVAL)
+            finally:
+                if pubsub is not None:
+                    await asyncio.gather(pubsub.aclose(), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "local_entries": len(self.local),
+            "local_max_entries": self.local.max_entries,
+            "inflight_loads": len(self._inflight),
+            "redis_available": self.redis is not None,
+            "namespaces": {namespace: stats.to_dict() for namespace, stats in sorted(self.stats.items())},
+        }
+
+
+# 全局两级缓存实例
+tiered_cache = TieredCache()
+
+
+def cached(namespace: str, ttl: Optional[int] = None, stale_ttl: Optional[int] = None,
+           key_func: Optional[Callable[..., str]] = None,
+           tags: Optional[Callable[..., Iterable[str]]] = None, cache: Optional[TieredCache] = None,
+           codec: Optional[Union[str, Codec]] = None):
+    """异步函数缓存装饰器，使用两级缓存并合并并发加载
+
+    未指定key_func时由参数生成缓存键，方法的self/cls不参与生成；
+    tags以被装饰函数的参数调用，返回结果的失效标签；codec为命名空间写入Redis时的编解码器
+    """
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError(f"cached只能用于异步函数，同步函数请使用cache_result: {func.__qualname__}")
+        params = list(inspect.signature(func).parameters)
+        skip_first = bool(params) and params[0] in ("self", "cls")
+        if codec is not None:
+            (cache or tiered_cache).set_codec(namespace, codec)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if key_func:
+                key = key_func(*args, **kwargs)
+            else:
+                key = make_cache_key(*(args[1:] if skip_first else args), **kwargs)
+            return await (cache or tiered_cache).get_or_load(
+                namespace, key, lambda: func(*args, **kwargs), ttl, stale_ttl,
+                tags(*args, **kwargs) if tags else ()
+            )
+
+        wrapper.cache_namespace = namespace
+        return wrapper
+    return decorator
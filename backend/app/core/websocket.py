@@ -9,6 +9,8 @@ from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 from datetime import datetime
 
+from ..websocket.fanout import FanoutHub
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +22,8 @@ class ConnectionManager:
         self.active_connections: Dict[int, List[WebSocket]] = {}
         # 存储连接信息 {websocket: {'user_id': int, 'connected_at': datetime}}
         self.connection_info: Dict[WebSocket, Dict[str, Any]] = {}
+        # 发送队列：消息序列化一次后分发到各连接
+        self.fanout = FanoutHub()
     
     async def connect(self, websocket: WebSocket, user_id: int):
         """接受WebSocket连接"""
@@ -33,6 +37,7 @@ class ConnectionManager:
             'user_id': user_id,
             'connected_at': datetime.now()
         }
+        self.fanout.register(websocket, websocket, on_close=lambda: self.disconnect(websocket))
         
         logger.info(f"用户 {user_id} 建立WebSocket连接")
     
@@ -52,35 +57,22 @@ class ConnectionManager:
             
             # 移除连接信息
             del self.connection_info[websocket]
+            self.fanout.unregister(websocket)
             
             logger.info(f"用户 {user_id} 断开WebSocket连接")
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         """发送个人消息"""
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            logger.error(f"发送个人消息失败: {str(e)}")
-            self.disconnect(websocket)
+        if not self.fanout.send(websocket, message):
+            logger.error("发送个人消息失败: 连接已关闭或发送队列已满")
     
     async def send_to_user(self, user_id: int, message: Dict[str, Any]):
         """发送消息给指定用户的所有连接"""
         if user_id not in self.active_connections:
             return
         
-        message_str = json.dumps(message, ensure_ascii=False)
-        disconnected_connections = []
-        
-        for websocket in self.active_connections[user_id]:
-            try:
-                await websocket.send_text(message_str)
-            except Exception as e:
-                logger.error(f"发送用户消息失败: {str(e)}")
-                disconnected_connections.append(websocket)
-        
-        # 清理断开的连接
-        for websocket in disconnected_connections:
-            self.disconnect(websocket)
+        # 发送失败的连接由写任务断开
+        self.fanout.publish(list(self.active_connections[user_id]), message)
     
     def send_to_user_sync(self, user_id: int, message: Dict[str, Any]):
         """同步方式发送消息给用户（用于非异步环境）"""
@@ -105,19 +97,8 @@ class ConnectionManager:
     
     async def broadcast(self, message: Dict[str, Any]):
         """广播消息给所有连接"""
-        message_str = json.dumps(message, ensure_ascii=False)
-        disconnected_connections = []
-        
-        for websocket in self.connection_info.keys():
-            try:
-                await websocket.send_text(message_str)
-            except Exception as e:
-                logger.error(f"广播消息失败: {str(e)}")
-                disconnected_connections.append(websocket)
-        
-        # 清理断开的连接
-        for websocket in disconnected_connections:
-            self.disconnect(websocket)
+        # 发送失败的连接由写任务断开
+        self.fanout.publish(list(self.connection_info.keys()), message)
     
     def get_user_connections(self, user_id: int) -> List[WebSocket]:
         """获取用户的所有连接"""
@@ -140,6 +121,7 @@ class ConnectionManager:
                 user_id: len(connections) 
                 for user_id, connections in self.active_connections.items()
             },
+            'fanout': self.fanout.get_stats(),
             'timestamp': datetime.now().isoformat()
         }
     
@@ -41,6 +41,12 @@ async def lifespan(app: FastAPI):
     try:
         print("🚀 开始启动应用...")
 
+        # 启动事件循环监控，启动阶段的阻塞调用也会被记录
+        from .core.loop_monitor import loop_monitor
+
+        if settings.LOOP_MONITOR_ENABLED:
+            await loop_monitor.start()
+
         # 等待数据库就绪
         from .services.health_check_service import health_checker
 
@@ -74,6 +80,16 @@ async def lifespan(app: FastAPI):
         from .services.market_service import market_service
 
         await market_service.initialize()
+
+        # 启动行情总线，由适配器推送行情
+        from .services.quote_bus import quote_bus
+
+        await quote_bus.start()
+
+        # 启动两级缓存的跨进程失效订阅
+        from .core.tiered_cache import tiered_cache
+
+        await tiered_cache.start()
         
         # 启动简单交易服务
         print("💰 启动简单交易服务...")
@@ -87,6 +103,16 @@ async def lifespan(app: FastAPI):
 
         await realtime_service.start()
 
+        # 启动InfluxDB批量写入器
+        from .core.influxdb_writer import influx_writer
+
+        await influx_writer.start()
+
+        # 启动内存风控账本的定期对账
+        from .services.risk_book import risk_book
+
+        await risk_book.start()
+
         # 启动定时任务调度器
         print("⏰ 启动定时任务调度器...")
         from .services.scheduler_service import scheduler_service
@@ -125,10 +151,36 @@ async def lifespan(app: FastAPI):
 
         await realtime_service.stop()
 
+        # 停止行情推送
+        from .services.quote_bus import quote_bus
+
+        await quote_bus.stop()
+
+        # 停止风控账本对账
+        from .services.risk_book import risk_book
+
+        await risk_book.stop()
+
+        # 写出InfluxDB写入队列中剩余的数据
+        from .core.influxdb_writer import influx_writer
+
+        await influx_writer.stop()
+
+        # 停止两级缓存失效订阅并关闭异步Redis连接
+        from .core.tiered_cache import tiered_cache
+
+        await tiered_cache.stop()
+
+        # 停止事件循环监控
+        from .core.loop_monitor import loop_monitor
+
+        await loop_monitor.stop()
+
         # 关闭数据库连接
-        from .core.influxdb import influx_manager
+        from .core.influxdb import influx_manager, influx_query
 
         influx_manager.close()
+        await influx_query.close()
 
         print("✅ 应用关闭成功")
     except Exception as e:
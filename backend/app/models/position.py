@@ -104,6 +104,7 @@ class Position(Base):
     __table_args__ = (
         Index('idx_position_user_symbol', 'user_id', 'symbol'),
         Index('idx_position_user_status', 'user_id', 'status'),
+        Index('idx_position_symbol_status', 'symbol', 'status'),  # 按合约批量盯市
         Index('idx_position_strategy', 'strategy_id'),
     )
 
@@ -449,6 +450,41 @@ class PositionHistory(Base):
         }
 
 
+class PositionCheckpoint(Base):
+    """持仓账本检查点：截至某笔成交（含）的持仓状态，重算时只需回放之后的成交"""
+    __tablename__ = "position_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # 账本键：用户 + 标的 + 策略 + 回测
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    symbol = Column(String(20), nullable=False)
+    strategy_id = Column(Integer, ForeignKey("strategies.id"))
+    backtest_id = Column(Integer, ForeignKey("backtests.id"))
+    
+    # 已回放到的成交
+    last_fill_id = Column(Integer, ForeignKey("order_fills.id"), nullable=False)
+    fill_count = Column(Integer, nullable=False, default=0)  # 累计回放成交笔数
+    
+    # 持仓状态快照
+    position_type = Column(Enum(PositionType))
+    quantity = Column(DECIMAL(20, 8), nullable=False, default=Decimal('0'))
+    average_cost = Column(DECIMAL(20, 8), nullable=False, default=Decimal('0'))
+    total_cost = Column(DECIMAL(20, 8), nullable=False, default=Decimal('0'))
+    realized_pnl = Column(DECIMAL(20, 8), nullable=False, default=Decimal('0'))
+    
+    # 时间戳
+    created_at = Column(DateTime, server_default=func.now())
+    
+    # 索引
+    __table_args__ = (
+        Index('idx_position_checkpoint_key', 'user_id', 'symbol', 'strategy_id', 'backtest_id', 'last_fill_id'),
+    )
+
+    def __repr__(self):
+        return f"<PositionCheckpoint(user_id={self.user_id}, symbol='{self.symbol}', last_fill_id={self.last_fill_id})>"
+
+
 class PositionSummary(Base):
     """持仓汇总模型（按用户和标的汇总）"""
     __tablename__ = "position_summaries"
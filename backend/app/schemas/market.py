@@ -304,4 +304,57 @@ class CacheStats(BaseModel):
     quote_cache_keys: int
     cache_size_mb: float
     hit_rate: float
-    last_cleanup: Optional[str] = None
\ No newline at end of file
+    kline_segment_hits: int = 0
+    kline_segment_misses: int = 0
+    kline_open_segment_fetches: int = 0
+    last_cleanup: Optional[str] = None
+
+class IndicatorBatchRequest(BaseModel):
+    """多合约多指标批量计算请求模型"""
+    symbols: List[str]
+    indicators: List[Any]  # 形如 [{"ema": 12}, {"macd": [12, 26, 9]}, "rsi"]
+    period: str = "1d"
+    limit: int = 200
+    tail: Optional[int] = None  # 只返回最后N个点
+    decimals: int = 4
+    
+    @validator('symbols')
+    def validate_symbols(cls, v):
+        if not v:
+            raise ValueError('合约列表不能为空')
+        if len(v) > 100:
+            raise ValueError('单次最多请求100个合约')
+        return v
+    
+    @validator('indicators')
+    def validate_indicators(cls, v):
+        if not v:
+            raise ValueError('指标列表不能为空')
+        if len(v) > 50:
+            raise ValueError('单次最多请求50个指标')
+        return v
+    
+    @validator('period')
+    def validate_period(cls, v):
+        allowed_periods = ["1m", "5m", "15m", "30m", "1h", "4h", "1d", "1w"]
+        if v not in allowed_periods:
+            raise ValueError(f'时间周期必须是: {allowed_periods}')
+        return v
+    
+    @validator('limit')
+    def validate_limit(cls, v):
+        if v < 1 or v > 8000:
+            raise ValueError('数据长度必须在1-8000之间')
+        return v
+    
+    @validator('tail')
+    def validate_tail(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('tail必须大于0')
+        return v
+    
+    @validator('decimals')
+    def validate_decimals(cls, v):
+        if v < 0 or v > 10:
+            raise ValueError('小数位数必须在0-10之间')
+        return v
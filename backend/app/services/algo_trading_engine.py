@@ -12,6 +12,7 @@ import uuid
 from .simple_trading_service import simple_trading_service
 from .market_data_service import market_data_service
 from .technical_analysis_service import technical_analysis_service
+from .quote_bus import QuoteSubscription, QuoteTick, quote_bus
 # Mock risk monitoring service for now
 class MockRiskMonitoringService:
     async def calculate_real_time_risk_metrics(self, user_id: str = "default"):
@@ -86,7 +87,7 @@ class AlgoTradingEngine:
             "max_concurrent_strategies": 10,
             "order_timeout": 300,  # 订单超时时间(秒)
             "risk_check_interval": 30,  # 风险检查间隔(秒)
-            "signal_check_interval": 5,  # 信号检查间隔(秒)
+            "signal_check_interval": 1,  # 两次信号计算的最小间隔(秒)，期间到达的行情合并
             "max_daily_trades": 100,  # 每日最大交易次数
             "emergency_stop_loss": 0.05,  # 紧急止损比例
         }
@@ -94,6 +95,13 @@ class AlgoTradingEngine:
         # 异步任务
         self._running_tasks = []
         self._stop_event = asyncio.Event()
+        
+        # 行情驱动的信号计算：策略合约有新行情时标记策略待计算
+        self.quote_bus = quote_bus
+        self._quote_subscription: Optional[QuoteSubscription] = None
+        self._symbol_strategies: Dict[str, set] = {}  # symbol -> strategy_ids
+        self._dirty_strategies: set = set()
+        self._signal_event = asyncio.Event()
     
     async def initialize(self):
         """初始化交易引擎"""
@@ -218,6 +226,7 @@ class AlgoTradingEngine:
             
             # 添加到活跃策略
             self.active_strategies[strategy_id] = strategy_instance
+            await self._sync_strategy_symbols()
             
             # 记录事件
             await self._log_engine_event("STRATEGY_ADDED", {
@@ -248,6 +257,8 @@ class AlgoTradingEngine:
             
             # 从活跃策略中移除
             del self.active_strategies[strategy_id]
+            self._dirty_strategies.discard(strategy_id)
+            await self._sync_strategy_symbols()
             
             # 记录事件
             await self._log_engine_event("STRATEGY_REMOVED", {"strategy_id": strategy_id})
@@ -299,29 +310,64 @@ class AlgoTradingEngine:
             return {"error": str(e)}
     
     async def _signal_monitoring_loop(self):
-        """信号监控循环"""
+        """信号监控循环：策略合约有新行情时计算信号"""
         logger.info("信号监控循环已启动")
         
-        while not self._stop_event.is_set():
-            try:
-                # 检查所有活跃策略的信号
-                for strategy_id, strategy in self.active_strategies.items():
-                    if hasattr(strategy, 'generate_signals'):
-                        signals = await strategy.generate_signals()
-                        if signals:
-                            await self._process_signals(strategy_id, signals)
-                
-                # 等待下次检查
-                await asyncio.sleep(self.config["signal_check_interval"])
-                
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"信号监控循环错误: {e}")
-                await asyncio.sleep(5)
+        self._quote_subscription = await self.quote_bus.subscribe([], self._on_quote, name="algo_trading")
+        await self._sync_strategy_symbols()
+        
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    await self._signal_event.wait()
+                    self._signal_event.clear()
+                    
+                    # 取出待计算的策略，同一策略的多笔行情只计算一次
+                    dirty, self._dirty_strategies = self._dirty_strategies, set()
+                    for strategy_id in dirty:
+                        strategy = self.active_strategies.get(strategy_id)
+                        if strategy is not None and hasattr(strategy, 'generate_signals'):
+                            signals = await strategy.generate_signals()
+                            if signals:
+                                await self._process_signals(strategy_id, signals)
+                    
+                    # 限制信号计算频率
+                    await asyncio.sleep(self.config["signal_check_interval"])
+                    
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.error(f"信号监控循环错误: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            subscription, self._quote_subscription = self._quote_subscription, None
+            if subscription is not None:
+                await self.quote_bus.unsubscribe(subscription)
         
         logger.info("信号监控循环已停止")
     
+    def _on_quote(self, tick: QuoteTick):
+        """行情总线推送的行情，标记使用该合约的策略"""
+        strategy_ids = self._symbol_strategies.get(tick.symbol)
+        if strategy_ids:
+            self._dirty_strategies.update(strategy_ids)
+            self._signal_event.set()
+    
+    async def _sync_strategy_symbols(self):
+        """按活跃策略更新合约到策略的映射和行情订阅"""
+        symbol_strategies: Dict[str, set] = {}
+        for strategy_id, strategy in self.active_strategies.items():
+            for symbol in getattr(strategy, 'symbols', []):
+                symbol_strategies.setdefault(symbol, set()).add(strategy_id)
+        self._symbol_strategies = symbol_strategies
+        
+        subscription = self._quote_subscription
+        if subscription is None:
+            return
+        symbols = set(symbol_strategies)
+        await self.quote_bus.add_symbols(subscription, symbols - subscription.symbols)
+        await self.quote_bus.remove_symbols(subscription, subscription.symbols - symbols)
+    
     async def _order_management_loop(self):
         """订单管理循环"""
         logger.info("订单管理循环已启动")
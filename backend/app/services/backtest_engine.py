@@ -15,7 +15,14 @@ from ..models import Backtest, Strategy, User
 from ..models.enums import BacktestStatus
 from ..core.exceptions import ValidationError, NotFoundError
 from .history_service import HistoryService
+from .matching_engine import MatchFill, MatchingEngine
 from .tqsdk_adapter import TQSDKAdapter
+from .vectorized_backtest_engine import (
+    SIGNAL_FUNCTION_NAME,
+    VectorizedBacktester,
+    result_trades,
+    supports_vectorized,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +43,7 @@ class OrderSide(Enum):
 class OrderStatus(Enum):
     """订单状态"""
     PENDING = "pending"
+    PARTIALLY_FILLED = "partially_filled"
     FILLED = "filled"
     CANCELLED = "cancelled"
     REJECTED = "rejected"
@@ -81,6 +89,125 @@ class BacktestAccount:
     commission_paid: float = 0.0
 
 
+class ColumnarBarSeries:
+    """单个品种的列式K线数据
+
+    OHLCV以连续的NumPy数组保存，按整数位置访问，历史窗口返回零拷贝视图。
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume', 'open_interest')
+
+    def __init__(self, symbol: str, df: pd.DataFrame):
+        self.symbol = symbol
+        self.index = pd.DatetimeIndex(df.index)
+        self.timestamps = self.index.values
+        self.columns: Dict[str, np.ndarray] = {}
+        for field in self.FIELDS:
+            if field in df.columns:
+                values = df[field].to_numpy(dtype=np.float64, na_value=0.0)
+            else:
+                values = np.zeros(len(df), dtype=np.float64)
+            self.columns[field] = np.ascontiguousarray(values)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def locate(self, current_time: datetime) -> int:
+        """返回当前时间或之前最近一根K线的位置，没有则返回-1"""
+        target = pd.Timestamp(current_time).to_datetime64()
+        return int(np.searchsorted(self.timestamps, target, side='right')) - 1
+
+    def bar(self, position: int) -> Dict[str, Any]:
+        """按位置获取单根K线"""
+        columns = self.columns
+        return {
+            'symbol': self.symbol,
+            'datetime': self.index[position],
+            'open': float(columns['open'][position]),
+            'high': float(columns['high'][position]),
+            'low': float(columns['low'][position]),
+            'close': float(columns['close'][position]),
+            'volume': float(columns['volume'][position]),
+            'open_interest': float(columns['open_interest'][position])
+        }
+
+    def window(self, position: int, count: int) -> Dict[str, np.ndarray]:
+        """获取截止到position的最近count根K线（数组视图，不复制数据）"""
+        start = max(0, position - count + 1)
+        stop = position + 1
+        window = {field: values[start:stop] for field, values in self.columns.items()}
+        window['datetime'] = self.timestamps[start:stop]
+        return window
+
+    def bars(self, position: int, count: int) -> List[Dict[str, Any]]:
+        """获取截止到position的最近count根K线"""
+        start = max(0, position - count + 1)
+        return [self.bar(i) for i in range(start, position + 1)]
+
+
+class AlignedBarTimeline:
+    """多品种统一时间轴
+
+    一次性把所有品种的时间戳合并成有序时间轴，并为每个品种维护一个整数游标，
+    顺序回放时游标只前进不回退，单根K线的查找成本与历史长度无关。
+    """
+
+    def __init__(self, data: Dict[str, pd.DataFrame]):
+        self.series: Dict[str, ColumnarBarSeries] = {
+            symbol: ColumnarBarSeries(symbol, df)
+            for symbol, df in data.items()
+            if df is not None and not df.empty
+        }
+
+        if self.series:
+            self.timestamps = np.unique(
+                np.concatenate([series.timestamps for series in self.series.values()])
+            )
+        else:
+            self.timestamps = np.array([], dtype='datetime64[ns]')
+        self.index = pd.DatetimeIndex(self.timestamps)
+
+        # 每个品种的K线在统一时间轴上的位置
+        self._axis_positions = {
+            symbol: np.searchsorted(self.timestamps, series.timestamps)
+            for symbol, series in self.series.items()
+        }
+        self._cursors = {symbol: -1 for symbol in self.series}
+        self.cursor = -1
+        self.current_time = None
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def seek(self, axis_position: int) -> datetime:
+        """移动到时间轴上的指定位置，返回该位置的时间"""
+        if axis_position == self.cursor + 1:
+            # 顺序回放：每个品种的游标至多前进若干步，均摊O(1)
+            for symbol, positions in self._axis_positions.items():
+                cursor = self._cursors[symbol]
+                while cursor + 1 < len(positions) and positions[cursor + 1] <= axis_position:
+                    cursor += 1
+                self._cursors[symbol] = cursor
+        elif axis_position != self.cursor:
+            for symbol, positions in self._axis_positions.items():
+                self._cursors[symbol] = int(
+                    np.searchsorted(positions, axis_position, side='right')
+                ) - 1
+
+        self.cursor = axis_position
+        self.current_time = self.index[axis_position]
+        return self.current_time
+
+    def position(self, symbol: str, current_time: datetime) -> int:
+        """获取品种在指定时间的K线位置，没有则返回-1"""
+        series = self.series.get(symbol)
+        if series is None:
+            return -1
+        if self.current_time is not None and current_time == self.current_time:
+            return self._cursors[symbol]
+        return series.locate(current_time)
+
+
 class BacktestDataReplay:
     """历史数据回放引擎"""
     
@@ -88,41 +215,35 @@ class BacktestDataReplay:
         self.history_service = history_service
         self.current_time = None
         self.data_cache = {}
+
+    @property
+    def data_cache(self) -> Dict[str, pd.DataFrame]:
+        return self._data_cache
+
+    @data_cache.setter
+    def data_cache(self, data: Dict[str, pd.DataFrame]):
+        self._data_cache = data
+        self.timeline = None
         
     async def load_data(self, symbols: List[str], start_date: datetime, end_date: datetime, 
                        frequency: str = "1m") -> Dict[str, pd.DataFrame]:
-        """加载历史数据"""
+        """加载历史数据
+
+        通过本地列式存储按列读取，不为每根K线创建对象。
+        """
         data = {}
+        period = self._frequency_to_period(frequency)
         
         for symbol in symbols:
             try:
-                # 获取历史K线数据
-                klines = await self.history_service.get_klines(
+                df = await self.history_service.get_klines_frame(
                     symbol=symbol,
+                    period=period,
                     start_time=start_date,
-                    end_time=end_date,
-                    frequency=frequency,
-                    limit=None  # 获取所有数据
+                    end_time=end_date
                 )
                 
-                # 转换为DataFrame
-                df_data = []
-                for kline in klines:
-                    df_data.append({
-                        'datetime': kline.datetime,
-                        'open': kline.open,
-                        'high': kline.high,
-                        'low': kline.low,
-                        'close': kline.close,
-                        'volume': kline.volume,
-                        'open_interest': getattr(kline, 'open_interest', 0)
-                    })
-                
-                if df_data:
-                    df = pd.DataFrame(df_data)
-                    df['datetime'] = pd.to_datetime(df['datetime'])
-                    df.set_index('datetime', inplace=True)
-                    df.sort_index(inplace=True)
+                if df is not None and not df.empty:
                     data[symbol] = df
                 else:
                     logger.warning(f"没有获取到 {symbol} 的历史数据")
@@ -131,33 +252,50 @@ class BacktestDataReplay:
                 logger.error(f"加载 {symbol} 历史数据失败: {e}")
                 
         return data
+
+    @staticmethod
+    def _frequency_to_period(frequency: str) -> int:
+        """K线频率转换为周期秒数，如 1m -> 60、1d -> 86400"""
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+        try:
+            return int(frequency[:-1]) * units[frequency[-1].lower()]
+        except (KeyError, ValueError, IndexError):
+            raise ValidationError(f"不支持的K线频率: {frequency}")
+
+    def prepare(self) -> AlignedBarTimeline:
+        """基于当前数据构建统一时间轴"""
+        if self.timeline is None:
+            self.timeline = AlignedBarTimeline(self.data_cache)
+        return self.timeline
+
+    def advance(self, axis_position: int) -> datetime:
+        """回放到时间轴上的指定位置"""
+        self.current_time = self.prepare().seek(axis_position)
+        return self.current_time
+
+    def get_market_data(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """获取当前游标位置所有品种的K线数据"""
+        timeline = self.prepare()
+        market_data = {}
+        for symbol in symbols:
+            position = timeline.position(symbol, self.current_time)
+            if position >= 0:
+                market_data[symbol] = timeline.series[symbol].bar(position)
+        return market_data
     
     def get_bar_data(self, symbol: str, current_time: datetime) -> Optional[Dict[str, Any]]:
         """获取指定时间的K线数据"""
         if symbol not in self.data_cache:
             return None
-            
-        df = self.data_cache[symbol]
         
-        # 查找最接近当前时间的数据
         try:
+            timeline = self.prepare()
             # 获取当前时间或之前最近的数据
-            available_data = df[df.index <= current_time]
-            if available_data.empty:
+            position = timeline.position(symbol, current_time)
+            if position < 0:
                 return None
-                
-            latest_bar = available_data.iloc[-1]
             
-            return {
-                'symbol': symbol,
-                'datetime': latest_bar.name,
-                'open': float(latest_bar['open']),
-                'high': float(latest_bar['high']),
-                'low': float(latest_bar['low']),
-                'close': float(latest_bar['close']),
-                'volume': float(latest_bar['volume']),
-                'open_interest': float(latest_bar.get('open_interest', 0))
-            }
+            return timeline.series[symbol].bar(position)
             
         except Exception as e:
             logger.error(f"获取 {symbol} 在 {current_time} 的K线数据失败: {e}")
@@ -168,47 +306,53 @@ class BacktestDataReplay:
         """获取历史K线数据"""
         if symbol not in self.data_cache:
             return []
-            
-        df = self.data_cache[symbol]
         
         try:
-            # 获取当前时间或之前的数据
-            available_data = df[df.index <= current_time]
-            if available_data.empty:
+            timeline = self.prepare()
+            position = timeline.position(symbol, current_time)
+            if position < 0:
                 return []
             
             # 获取最近count条数据
-            recent_data = available_data.tail(count)
-            
-            bars = []
-            for idx, row in recent_data.iterrows():
-                bars.append({
-                    'symbol': symbol,
-                    'datetime': idx,
-                    'open': float(row['open']),
-                    'high': float(row['high']),
-                    'low': float(row['low']),
-                    'close': float(row['close']),
-                    'volume': float(row['volume']),
-                    'open_interest': float(row.get('open_interest', 0))
-                })
-            
-            return bars
+            return timeline.series[symbol].bars(position, count)
             
         except Exception as e:
             logger.error(f"获取 {symbol} 历史K线数据失败: {e}")
             return []
 
+    def get_historical_arrays(self, symbol: str, current_time: datetime,
+                              count: int = 100) -> Dict[str, np.ndarray]:
+        """获取历史K线数组（零拷贝视图）"""
+        if symbol not in self.data_cache:
+            return {}
+
+        timeline = self.prepare()
+        position = timeline.position(symbol, current_time)
+        if position < 0:
+            return {}
+
+        return timeline.series[symbol].window(position, count)
+
 
 class BacktestTradeExecutor:
-    """模拟交易执行器"""
+    """模拟交易执行器
+    
+    待成交订单保存在撮合引擎的按合约价格队列中，每根K线只撮合价格被穿越的挂单
+    """
     
-    def __init__(self, commission_rate: float = 0.0003, slippage: float = 0.0001):
+    def __init__(self, commission_rate: float = 0.0003, slippage: float = 0.0001,
+                 participation_rate: Optional[float] = None):
         self.commission_rate = commission_rate  # 手续费率
         self.slippage = slippage  # 滑点
-        self.pending_orders: List[BacktestOrder] = []
+        self.matching = MatchingEngine(participation_rate=participation_rate, slippage=slippage)
         self.filled_orders: List[BacktestOrder] = []
         self.order_id_counter = 0
+        self.fill_id_counter = 0
+    
+    @property
+    def pending_orders(self) -> List[BacktestOrder]:
+        """待成交订单（含部分成交）"""
+        return [book_order.ref for book_order in self.matching.orders()]
     
     def create_order(self, symbol: str, side: OrderSide, order_type: OrderType,
                     quantity: float, price: Optional[float] = None,
@@ -227,48 +371,68 @@ class BacktestTradeExecutor:
             created_time=datetime.utcnow()
         )
         
-        self.pending_orders.append(order)
+        self.matching.add(order.id, symbol, side, order_type, quantity, price, stop_price, ref=order)
         return order
     
-    def process_orders(self, current_time: datetime, market_data: Dict[str, Dict[str, Any]]):
-        """处理待成交订单"""
-        orders_to_remove = []
-        
-        for order in self.pending_orders:
-            if order.symbol not in market_data:
-                continue
-                
-            bar_data = market_data[order.symbol]
-            
-            # 检查订单是否可以成交
-            if self._can_fill_order(order, bar_data):
-                fill_price = self._calculate_fill_price(order, bar_data)
-                self._fill_order(order, fill_price, current_time)
-                orders_to_remove.append(order)
-        
-        # 移除已成交的订单
-        for order in orders_to_remove:
-            self.pending_orders.remove(order)
-            self.filled_orders.append(order)
+    def process_orders(self, current_time: datetime, market_data: Dict[str, Dict[str, Any]]) -> List[BacktestOrder]:
+        """用当前K线撮合待成交订单，返回本次成交记录"""
+        fills = []
+        for symbol, bar_data in market_data.items():
+            if self.matching.has_orders(symbol):
+                fills.extend(self.matching.on_bar(symbol, bar_data))
+        return self._record_fills(fills, current_time)
     
-    def _can_fill_order(self, order: BacktestOrder, bar_data: Dict[str, Any]) -> bool:
-        """检查订单是否可以成交"""
-        if order.order_type == OrderType.MARKET:
-            return True
-        
-        elif order.order_type == OrderType.LIMIT:
-            if order.side == OrderSide.BUY:
-                return bar_data['low'] <= order.price
-            else:
-                return bar_data['high'] >= order.price
-        
-        elif order.order_type == OrderType.STOP:
-            if order.side == OrderSide.BUY:
-                return bar_data['high'] >= order.stop_price
+    def fill_market_orders(self, current_time: datetime, market_data: Dict[str, Dict[str, Any]]) -> List[BacktestOrder]:
+        """按当前K线立即成交新下的市价单（不受成交量限制），返回成交记录"""
+        fills = []
+        for symbol, bar_data in market_data.items():
+            if self.matching.has_orders(symbol):
+                fills.extend(self.matching.match_market(symbol, bar_data['open']))
+        return self._record_fills(fills, current_time)
+    
+    def fill_immediately(self, order: BacktestOrder, bar_data: Dict[str, Any], fill_time: datetime):
+        """不经撮合直接按当前K线成交整笔订单"""
+        self.matching.cancel(order.id)
+        self._fill_order(order, self._calculate_fill_price(order, bar_data), fill_time)
+        self.filled_orders.append(order)
+    
+    def _record_fills(self, fills: List[MatchFill], fill_time: datetime) -> List[BacktestOrder]:
+        """把撮合成交写回订单
+        
+        一次成交完整笔订单时记录订单本身；部分成交时每次成交单独生成一条成交记录
+        """
+        records = []
+        for fill in fills:
+            order = fill.order.ref
+            if fill.order.is_filled and order.filled_quantity == 0:
+                self._fill_order(order, fill.price, fill_time)
+                record = order
             else:
-                return bar_data['low'] <= order.stop_price
-        
-        return False
+                self.fill_id_counter += 1
+                record = BacktestOrder(
+                    id=f"{order.id}_fill_{self.fill_id_counter}",
+                    symbol=order.symbol,
+                    side=order.side,
+                    order_type=order.order_type,
+                    quantity=fill.quantity,
+                    price=order.price,
+                    stop_price=order.stop_price,
+                    created_time=order.created_time
+                )
+                self._fill_order(record, fill.price, fill_time)
+                
+                filled = order.filled_quantity + fill.quantity
+                order.filled_price = (
+                    (order.filled_price or 0.0) * order.filled_quantity + fill.price * fill.quantity
+                ) / filled
+                order.filled_quantity = filled
+                order.filled_time = fill_time
+                order.commission += record.commission
+                order.status = OrderStatus.FILLED if fill.order.is_filled else OrderStatus.PARTIALLY_FILLED
+            
+            self.filled_orders.append(record)
+            records.append(record)
+        return records
     
     def _calculate_fill_price(self, order: BacktestOrder, bar_data: Dict[str, Any]) -> float:
         """计算成交价格"""
@@ -305,18 +469,15 @@ class BacktestTradeExecutor:
     
     def cancel_order(self, order_id: str) -> bool:
         """撤销订单"""
-        for order in self.pending_orders:
-            if order.id == order_id:
-                order.status = OrderStatus.CANCELLED
-                self.pending_orders.remove(order)
-                return True
-        return False
+        book_order = self.matching.cancel(order_id)
+        if book_order is None:
+            return False
+        book_order.ref.status = OrderStatus.CANCELLED
+        return True
     
     def get_pending_orders(self, symbol: Optional[str] = None) -> List[BacktestOrder]:
         """获取待成交订单"""
-        if symbol:
-            return [order for order in self.pending_orders if order.symbol == symbol]
-        return self.pending_orders.copy()
+        return [book_order.ref for book_order in self.matching.orders(symbol)]
     
     def get_filled_orders(self, symbol: Optional[str] = None) -> List[BacktestOrder]:
         """获取已成交订单"""
@@ -562,8 +723,8 @@ class BacktestEngine:
             
             self.data_replay.data_cache = data
             
-            # 计算总的K线数量用于进度跟踪
-            total_bars = max(len(df) for df in data.values()) if data else 0
+            # 计算时间轴长度用于进度跟踪
+            total_bars = len(self.data_replay.prepare())
             self.progress_tracker = BacktestProgressTracker(
                 total_bars=total_bars,
                 update_callback=lambda progress: self._update_backtest_progress(backtest_id, progress)
@@ -631,16 +792,20 @@ class BacktestEngine:
     
     async def _execute_backtest(self, backtest: Backtest, data: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
         """执行回测逻辑"""
-        # 获取所有时间点
-        all_timestamps = set()
-        for df in data.values():
-            all_timestamps.update(df.index)
+        # 提供信号数组的策略走向量化路径
+        if supports_vectorized(self.strategy_globals):
+            return self._execute_vectorized_backtest(backtest, data)
         
-        timestamps = sorted(all_timestamps)
+        # 构建统一时间轴
+        timeline = self.data_replay.prepare()
+        total_steps = len(timeline)
         
-        if not timestamps:
+        if not total_steps:
             raise ValidationError("没有有效的时间数据")
         
+        # 进度写库有开销，限制为约每千分之一进度更新一次
+        progress_step = max(1, total_steps // 1000)
+        
         # 初始化策略
         if 'initialize' in self.strategy_globals:
             self.strategy_globals['initialize'](self.strategy_globals['context'])
@@ -648,22 +813,19 @@ class BacktestEngine:
         # 逐个时间点回放
         previous_day_value = backtest.initial_capital
         
-        for i, current_time in enumerate(timestamps):
+        for i in range(total_steps):
             # 更新当前时间
-            self.data_replay.current_time = current_time
+            current_time = self.data_replay.advance(i)
             
             # 获取当前时间的市场数据
-            market_data = {}
-            for symbol in backtest.symbols:
-                bar_data = self.data_replay.get_bar_data(symbol, current_time)
-                if bar_data:
-                    market_data[symbol] = bar_data
+            market_data = self.data_replay.get_market_data(backtest.symbols)
             
             if not market_data:
                 continue
             
-            # 处理待成交订单
-            self.trade_executor.process_orders(current_time, market_data)
+            # 撮合待成交订单
+            for fill in self.trade_executor.process_orders(current_time, market_data):
+                self.portfolio_manager.update_position(fill)
             
             # 更新持仓市值
             self.portfolio_manager.update_market_value(market_data)
@@ -678,21 +840,17 @@ class BacktestEngine:
                 except Exception as e:
                     logger.error(f"策略执行错误 at {current_time}: {e}")
             
-            # 处理新产生的订单
-            for order in self.trade_executor.pending_orders:
-                if order.created_time and order.created_time >= current_time:
-                    # 立即尝试成交市价单
-                    if order.order_type == OrderType.MARKET:
-                        if order.symbol in market_data:
-                            fill_price = self.trade_executor._calculate_fill_price(order, market_data[order.symbol])
-                            self.trade_executor._fill_order(order, fill_price, current_time)
-                            self.portfolio_manager.update_position(order)
+            # 立即成交新下的市价单
+            for fill in self.trade_executor.fill_market_orders(current_time, market_data):
+                self.portfolio_manager.update_position(fill)
             
-            # 记录资金曲线
+            # 按成交后的持仓重新盯市，记录资金曲线
+            self.portfolio_manager.update_market_value(market_data)
             self.portfolio_manager.record_equity_point(current_time)
             
-            # 计算日收益率（每日收盘时）
-            if current_time.hour == 15:  # 假设15点为收盘时间
+            # 计算日收益率（每个交易日最后一根K线）
+            is_last_bar = i + 1 == total_steps
+            if is_last_bar or timeline.index[i + 1].date() != current_time.date():
                 daily_return = self.portfolio_manager.calculate_daily_return(previous_day_value)
                 self.portfolio_manager.daily_returns.append({
                     'date': current_time.date(),
@@ -701,21 +859,96 @@ class BacktestEngine:
                 previous_day_value = self.portfolio_manager.account.total_value
             
             # 更新进度
-            self.progress_tracker.update_progress(i + 1)
+            if (i + 1) % progress_step == 0 or i + 1 == total_steps:
+                self.progress_tracker.update_progress(i + 1)
         
         # 生成回测结果
         return self._generate_backtest_result()
     
+    def _execute_vectorized_backtest(self, backtest: Backtest, data: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+        """向量化执行回测
+        
+        compute_signals(df)返回每根K线的目标持仓，第t根K线的目标在第t+1根K线开盘按市价成交，
+        成交价、手续费和盯市规则与事件循环中的市价单一致。
+        """
+        if 'initialize' in self.strategy_globals:
+            self.strategy_globals['initialize'](self.strategy_globals['context'])
+        
+        symbols = set(backtest.symbols or data.keys())
+        backtester = VectorizedBacktester(
+            initial_capital=backtest.initial_capital,
+            commission_rate=self.trade_executor.commission_rate,
+            slippage=self.trade_executor.slippage,
+            execution_lag=1,
+            price_field='open'
+        )
+        result = backtester.run(
+            {symbol: df for symbol, df in data.items() if symbol in symbols},
+            self.strategy_globals[SIGNAL_FUNCTION_NAME]
+        )
+        
+        timestamps = result.index
+        equity_curve = [
+            {
+                'timestamp': timestamps[i],
+                'total_value': float(result.equity[i]),
+                'available_cash': float(backtest.initial_capital - result.commission[i]),
+                'market_value': float(result.market_value[i]),
+                'unrealized_pnl': float(result.unrealized_pnl[i]),
+                'realized_pnl': float(result.realized_pnl[i])
+            }
+            for i in range(len(timestamps))
+        ]
+        daily_returns = [
+            {'date': date.date(), 'return': float(value)}
+            for date, value in result.daily_returns.items()
+        ]
+        
+        filled_orders = []
+        for n, trade in enumerate(result_trades(result), start=1):
+            quantity = abs(trade['quantity'])
+            filled_orders.append(BacktestOrder(
+                id=f"order_{n}",
+                symbol=trade['symbol'],
+                side=OrderSide.BUY if trade['quantity'] > 0 else OrderSide.SELL,
+                order_type=OrderType.MARKET,
+                quantity=quantity,
+                status=OrderStatus.FILLED,
+                created_time=trade['datetime'],
+                filled_time=trade['datetime'],
+                filled_price=trade['price'],
+                filled_quantity=quantity,
+                commission=trade['commission']
+            ))
+        
+        if self.progress_tracker:
+            self.progress_tracker.update_progress(self.progress_tracker.total_bars)
+        
+        return self._build_backtest_result(
+            initial_capital=backtest.initial_capital,
+            final_capital=result.final_equity,
+            equity_curve=equity_curve,
+            daily_returns=daily_returns,
+            filled_orders=filled_orders
+        )
+    
     def _generate_backtest_result(self) -> Dict[str, Any]:
         """生成回测结果"""
         account = self.portfolio_manager.account
-        equity_curve = self.portfolio_manager.equity_curve
-        daily_returns = self.portfolio_manager.daily_returns
-        filled_orders = self.trade_executor.filled_orders
-        
+        return self._build_backtest_result(
+            initial_capital=account.initial_capital,
+            final_capital=account.total_value,
+            equity_curve=self.portfolio_manager.equity_curve,
+            daily_returns=self.portfolio_manager.daily_returns,
+            filled_orders=self.trade_executor.filled_orders
+        )
+    
+    def _build_backtest_result(self, initial_capital: float, final_capital: float,
+                               equity_curve: List[Dict], daily_returns: List[Dict],
+                               filled_orders: List[BacktestOrder]) -> Dict[str, Any]:
+        """根据资金曲线和成交记录计算回测指标"""
         # 基础指标
-        final_capital = account.total_value
-        total_return = (final_capital - account.initial_capital) / account.initial_capital
+        total_return = (final_capital - initial_capital) / initial_capital
         
         # 计算年化收益率
         if equity_curve:
@@ -893,7 +1126,8 @@ class BacktestEngine:
         except Exception as e:
             logger.error(f"更新回测进度失败: {e}")
     
-    def _update_backtest_results(self, backtest: Backtest, result: Dict[str, Any]):
+    @staticmethod
+    def _update_backtest_results(backtest: Backtest, result: Dict[str, Any]):
         """更新回测结果"""
         backtest.final_capital = result['final_capital']
         backtest.total_return = result['total_return']
@@ -933,6 +1167,15 @@ class BacktestContext:
             symbol, self.backtest_engine.data_replay.current_time, count
         )
     
+    def get_kline_arrays(self, symbol: str, count: int = 100) -> Dict[str, np.ndarray]:
+        """获取K线数组（open/high/low/close/volume/open_interest/datetime）"""
+        if not self.backtest_engine.data_replay.current_time:
+            return {}
+        
+        return self.backtest_engine.data_replay.get_historical_arrays(
+            symbol, self.backtest_engine.data_replay.current_time, count
+        )
+    
     def get_position(self, symbol: str) -> Dict[str, Any]:
         """获取持仓信息"""
         position = self.backtest_engine.portfolio_manager.get_position(symbol)
@@ -986,9 +1229,8 @@ class BacktestContext:
             )
             
             # 立即成交市价单
-            fill_price = self.backtest_engine.trade_executor._calculate_fill_price(order, current_bar)
-            self.backtest_engine.trade_executor._fill_order(
-                order, fill_price, self.backtest_engine.data_replay.current_time
+            self.backtest_engine.trade_executor.fill_immediately(
+                order, current_bar, self.backtest_engine.data_replay.current_time
             )
             self.backtest_engine.portfolio_manager.update_position(order)
     
@@ -0,0 +1,566 @@
+"""
+回测参数优化服务 - 多进程参数扫描
+
+同一策略的多组参数分发到按CPU核数配置的进程池并行回测。
+行情数据只加载一次并写成内存映射文件，工作进程直接映射读取，不随每个任务序列化；
+每组结果返回后立即写入一条Backtest记录并刷新排行榜。
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from ..core.database import SessionLocal
+from ..core.exceptions import NotFoundError, ValidationError
+from ..core.websocket import websocket_manager
+from ..models.backtest import Backtest
+from ..models.enums import BacktestStatus
+from ..models.strategy import Strategy
+from .backtest_engine import (
+    BacktestDataReplay,
+    BacktestEngine,
+    BacktestPortfolioManager,
+    BacktestProgressTracker,
+    BacktestTradeExecutor,
+)
+from .history_service import history_service
+
+logger = logging.getLogger(__name__)
+
+
+# 单次回测写入数据库的资金曲线最大点数
+MAX_EQUITY_POINTS = 1000
+
+# 排行榜可选的排序指标
+RANKING_METRICS = {
+    'sharpe_ratio', 'sortino_ratio', 'total_return', 'annual_return',
+    'max_drawdown', 'win_rate', 'profit_factor', 'final_capital'
+}
+
+
+class SearchMethod(Enum):
+    """参数搜索方式"""
+    GRID = "grid"
+    RANDOM = "random"
+
+
+class SweepStatus(Enum):
+    """参数扫描状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+def build_parameter_sets(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """根据搜索配置生成参数组合
+
+    网格搜索: {"method": "grid", "parameters": {"fast": [5, 10], "slow": [20, 60]}}
+    随机搜索: {"method": "random", "n_iter": 50, "seed": 1,
+              "parameters": {"fast": {"min": 2, "max": 20, "type": "int"}, "mode": ["a", "b"]}}
+    """
+    parameters = spec.get('parameters') or {}
+    if not parameters:
+        raise ValidationError("参数空间不能为空")
+
+    try:
+        method = SearchMethod(spec.get('method', SearchMethod.GRID.value))
+    except ValueError:
+        raise ValidationError(f"不支持的搜索方式: {spec.get('method')}")
+
+    fixed = spec.get('fixed_parameters') or {}
+    max_runs = int(spec.get('max_runs', 10000))
+
+    if method == SearchMethod.GRID:
+        names = list(parameters.keys())
+        values = []
+        for name in names:
+            choices = parameters[name]
+            if not isinstance(choices, (list, tuple)) or not choices:
+                raise ValidationError(f"网格搜索参数 {name} 必须是非空列表")
+            values.append(list(choices))
+
+        total = int(np.prod([len(choices) for choices in values]))
+        if total > max_runs:
+            raise ValidationError(f"参数组合数 {total} 超过上限 {max_runs}")
+
+        return [{**fixed, **dict(zip(names, combination))} for combination in itertools.product(*values)]
+
+    n_iter = int(spec.get('n_iter', 20))
+    if n_iter <= 0 or n_iter > max_runs:
+        raise ValidationError(f"随机搜索次数必须在1到{max_runs}之间")
+
+    rng = random.Random(spec.get('seed'))
+    parameter_sets = []
+    for _ in range(n_iter):
+        parameter_set = dict(fixed)
+        for name, space in parameters.items():
+            if isinstance(space, (list, tuple)):
+                parameter_set[name] = rng.choice(list(space))
+            elif isinstance(space, dict) and 'min' in space and 'max' in space:
+                if space.get('type') == 'int':
+                    parameter_set[name] = rng.randint(int(space['min']), int(space['max']))
+                else:
+                    parameter_set[name] = rng.uniform(float(space['min']), float(space['max']))
+            else:
+                raise ValidationError(f"随机搜索参数 {name} 必须是候选列表或包含min/max的区间")
+        parameter_sets.append(parameter_set)
+
+    return parameter_sets
+
+
+class SharedMarketData:
+    """以内存映射文件共享给工作进程的行情数据
+
+    每个品种的OHLCV按列连续存为一个.npy文件，时间戳另存一个文件。
+    对象本身只包含文件路径，可以廉价地传给工作进程。
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume', 'open_interest')
+
+    def __init__(self, directory: str, files: Dict[str, Dict[str, str]]):
+        self.directory = directory
+        self.files = files
+
+    @classmethod
+    def create(cls, data: Dict[str, pd.DataFrame], directory: Optional[str] = None) -> "SharedMarketData":
+        """把行情数据写入临时目录"""
+        directory = directory or tempfile.mkdtemp(prefix="backtest_sweep_")
+        files = {}
+        for n, (symbol, df) in enumerate(data.items()):
+            columns = [
+                df[name].to_numpy(dtype=np.float64) if name in df.columns else np.zeros(len(df))
+                for name in cls.FIELDS
+            ]
+            values_path = os.path.join(directory, f"{n}_values.npy")
+            index_path = os.path.join(directory, f"{n}_index.npy")
+            np.save(values_path, np.asfortranarray(np.column_stack(columns)))
+            np.save(index_path, pd.DatetimeIndex(df.index).to_numpy(dtype='datetime64[ns]'))
+            files[symbol] = {'values': values_path, 'index': index_path}
+        return cls(directory, files)
+
+    def load(self) -> Dict[str, pd.DataFrame]:
+        """以只读内存映射方式加载，不复制数据"""
+        data = {}
+        for symbol, paths in self.files.items():
+            values = np.load(paths['values'], mmap_mode='r')
+            index = pd.DatetimeIndex(np.load(paths['index'], mmap_mode='r'))
+            data[symbol] = pd.DataFrame(values, index=index, columns=list(self.FIELDS), copy=False)
+        return data
+
+    def cleanup(self):
+        """删除临时文件"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@dataclass
+class SweepRunResult:
+    """单组参数的回测结果"""
+    run_index: int
+    parameters: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    backtest_id: Optional[int] = None
+
+
+@dataclass
+class ParameterSweep:
+    """参数扫描任务"""
+    id: str
+    base_backtest_id: int
+    user_id: int
+    total_runs: int
+    metric: str = 'sharpe_ratio'
+    status: SweepStatus = SweepStatus.PENDING
+    completed_runs: int = 0
+    failed_runs: int = 0
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error_message: Optional[str] = None
+    results: List[SweepRunResult] = field(default_factory=list)
+
+    @property
+    def progress(self) -> float:
+        """整个扫描的进度"""
+        if self.total_runs == 0:
+            return 0.0
+        return (self.completed_runs + self.failed_runs) / self.total_runs * 100
+
+    def leaderboard(self, top_n: int = 20) -> List[Dict[str, Any]]:
+        """按排序指标排名的结果"""
+        finished = [run for run in self.results if run.result is not None]
+        # 最大回撤越小越好，其余指标越大越好
+        reverse = self.metric != 'max_drawdown'
+        finished.sort(key=lambda run: _metric_value(run.result, self.metric, reverse), reverse=reverse)
+
+        return [
+            {
+                'rank': rank,
+                'backtest_id': run.backtest_id,
+                'parameters': run.parameters,
+                self.metric: run.result.get(self.metric),
+                'total_return': run.result.get('total_return'),
+                'max_drawdown': run.result.get('max_drawdown'),
+                'sharpe_ratio': run.result.get('sharpe_ratio'),
+                'total_trades': run.result.get('total_trades')
+            }
+            for rank, run in enumerate(finished[:top_n], start=1)
+        ]
+
+    def to_dict(self, top_n: int = 20) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'base_backtest_id': self.base_backtest_id,
+            'status': self.status.value,
+            'metric': self.metric,
+            'total_runs': self.total_runs,
+            'completed_runs': self.completed_runs,
+            'failed_runs': self.failed_runs,
+            'progress': self.progress,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'error_message': self.error_message,
+            'leaderboard': self.leaderboard(top_n)
+        }
+
+
+def _metric_value(result: Dict[str, Any], metric: str, reverse: bool) -> float:
+    """排序用指标值，缺失或非法值排在最后"""
+    value = result.get(metric)
+    if value is None or np.isnan(value):
+        return float('-inf') if reverse else float('inf')
+    return float(value)
+
+
+# ============================================================================
+# 工作进程
+# ============================================================================
+
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(shared_data: SharedMarketData, config: Dict[str, Any]):
+    """工作进程初始化：映射行情数据，只执行一次"""
+    _worker_state['data'] = shared_data.load()
+    _worker_state['config'] = config
+
+
+def _run_parameter_set(run_index: int, parameters: Dict[str, Any]) -> SweepRunResult:
+    """在工作进程中运行一组参数的回测"""
+    config = _worker_state['config']
+    data = _worker_state['data']
+
+    backtest = SimpleNamespace(
+        symbols=config['symbols'],
+        initial_capital=config['initial_capital'],
+        parameters=parameters
+    )
+    strategy = SimpleNamespace(code=config['strategy_code'])
+
+    engine = BacktestEngine(db=None, history_service=None)
+    engine.trade_executor = BacktestTradeExecutor()
+    engine.portfolio_manager = BacktestPortfolioManager(backtest.initial_capital)
+    engine.data_replay.data_cache = data
+    engine.progress_tracker = BacktestProgressTracker(total_bars=len(engine.data_replay.prepare()))
+    engine._prepare_strategy_environment(strategy, backtest)
+
+    result = asyncio.run(engine._execute_backtest(backtest, data))
+    return SweepRunResult(run_index=run_index, parameters=parameters, result=_compact_result(result))
+
+
+def _compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """压缩回测结果：资金曲线降采样，时间转为字符串，便于回传和存库"""
+    equity_curve = result.get('equity_curve') or []
+    if len(equity_curve) > MAX_EQUITY_POINTS:
+        positions = np.linspace(0, len(equity_curve) - 1, MAX_EQUITY_POINTS).astype(int)
+        equity_curve = [equity_curve[i] for i in positions]
+
+    compact = dict(result)
+    compact['equity_curve'] = [
+        {**point, 'timestamp': point['timestamp'].isoformat()} for point in equity_curve
+    ]
+    compact['daily_returns'] = [
+        {'date': item['date'].isoformat(), 'return': item['return']}
+        for item in result.get('daily_returns') or []
+    ]
+    for key, value in compact.items():
+        if isinstance(value, np.generic):
+            compact[key] = value.item()
+    return compact
+
+
+def _process_context():
+    """进程启动方式：不直接fork带有事件循环、数据库连接和tqsdk线程的服务进程
+
+    优先forkserver，由单线程的服务进程预先导入模块（先导入app.core，避免单独导入本模块时的循环导入），
+    工作进程从它fork；不支持时使用spawn。行情通过内存映射共享，与启动方式无关。
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['app.core', __name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+# ============================================================================
+# 调度
+# ============================================================================
+
+class ParameterSweepRunner:
+    """进程池参数扫描执行器"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._cancelled: Dict[str, bool] = {}
+
+    def cancel(self, sweep_id: str):
+        """取消扫描，已开始的回测会执行完"""
+        self._cancelled[sweep_id] = True
+
+    async def run(
+        self,
+        sweep: ParameterSweep,
+        shared_data: SharedMarketData,
+        config: Dict[str, Any],
+        parameter_sets: List[Dict[str, Any]],
+        on_result: Optional[Callable[[SweepRunResult], Any]] = None
+    ):
+        """并行执行所有参数组合，每完成一组就回调一次"""
+        loop = asyncio.get_running_loop()
+        workers = max(1, min(self.max_workers, len(parameter_sets)))
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=_process_context(),
+            initializer=_init_worker,
+            initargs=(shared_data, config)
+        ) as pool:
+            futures = {
+                asyncio.wrap_future(pool.submit(_run_parameter_set, i, parameters), loop=loop): (i, parameters)
+                for i, parameters in enumerate(parameter_sets)
+            }
+            pending = set(futures)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for future in done:
+                    run_index, parameters = futures[future]
+                    try:
+                        run = future.result()
+                    except asyncio.CancelledError:
+                        continue
+                    except Exception as e:
+                        logger.error(f"参数组 {run_index} 回测失败: {e}")
+                        run = SweepRunResult(run_index=run_index, parameters=parameters, error=str(e))
+
+                    if on_result:
+                        outcome = on_result(run)
+                        if asyncio.iscoroutine(outcome):
+                            await outcome
+
+                if self._cancelled.pop(sweep.id, False):
+                    for future in pending:
+                        future.cancel()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    sweep.status = SweepStatus.CANCELLED
+                    break
+
+
+class BacktestOptimizationService:
+    """回测参数优化服务"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 max_workers: Optional[int] = None):
+        self.session_factory = session_factory
+        self.runner = ParameterSweepRunner(max_workers)
+        self.data_replay = BacktestDataReplay(history_service)
+        self.sweeps: Dict[str, ParameterSweep] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start_sweep(self, backtest_id: int, user_id: int, spec: Dict[str, Any]) -> ParameterSweep:
+        """以已有回测为模板启动参数扫描"""
+        metric = spec.get('metric', 'sharpe_ratio')
+        if metric not in RANKING_METRICS:
+            raise ValidationError(f"不支持的排序指标: {metric}")
+
+        parameter_sets = build_parameter_sets(spec)
+
+        db = self.session_factory()
+        try:
+            backtest = db.query(Backtest).filter(
+                Backtest.id == backtest_id,
+                Backtest.user_id == user_id
+            ).first()
+            if not backtest:
+                raise NotFoundError("回测不存在或无权限访问")
+
+            strategy = db.query(Strategy).filter(Strategy.id == backtest.strategy_id).first()
+            if not strategy:
+                raise NotFoundError("策略不存在")
+
+            template = {
+                'name': backtest.name,
+                'strategy_id': backtest.strategy_id,
+                'start_date': backtest.start_date,
+                'end_date': backtest.end_date,
+                'initial_capital': backtest.initial_capital,
+                'symbols': backtest.symbols or [],
+                'parameters': backtest.parameters or {}
+            }
+            strategy_code = strategy.code
+        finally:
+            db.close()
+
+        # 行情只加载一次，共享给所有工作进程
+        data = await self.data_replay.load_data(
+            symbols=template['symbols'],
+            start_date=template['start_date'],
+            end_date=template['end_date']
+        )
+        if not data:
+            raise ValidationError("没有可用的历史数据")
+
+        sweep = ParameterSweep(
+            id=f"sweep_{uuid.uuid4().hex[:12]}",
+            base_backtest_id=backtest_id,
+            user_id=user_id,
+            total_runs=len(parameter_sets),
+            metric=metric
+        )
+        # 模板参数作为默认值，扫描参数覆盖同名项
+        parameter_sets = [{**template['parameters'], **parameters} for parameters in parameter_sets]
+        self.sweeps[sweep.id] = sweep
+
+        shared_data = SharedMarketData.create(data)
+        config = {
+            'symbols': template['symbols'],
+            'initial_capital': template['initial_capital'],
+            'strategy_code': strategy_code
+        }
+        self._tasks[sweep.id] = asyncio.create_task(
+            self._run_sweep(sweep, template, shared_data, config, parameter_sets)
+        )
+
+        logger.info(f"参数扫描已启动: {sweep.id}, 共 {sweep.total_runs} 组参数")
+        return sweep
+
+    def get_sweep(self, sweep_id: str, user_id: int) -> Optional[ParameterSweep]:
+        """获取参数扫描"""
+        sweep = self.sweeps.get(sweep_id)
+        if sweep and sweep.user_id == user_id:
+            return sweep
+        return None
+
+    def cancel_sweep(self, sweep_id: str, user_id: int) -> bool:
+        """取消参数扫描"""
+        sweep = self.get_sweep(sweep_id, user_id)
+        if not sweep or sweep.status != SweepStatus.RUNNING:
+            return False
+        self.runner.cancel(sweep_id)
+        return True
+
+    async def _run_sweep(self, sweep: ParameterSweep, template: Dict[str, Any],
+                         shared_data: SharedMarketData, config: Dict[str, Any],
+                         parameter_sets: List[Dict[str, Any]]):
+        """执行参数扫描"""
+        sweep.status = SweepStatus.RUNNING
+        sweep.started_at = datetime.now()
+        db = self.session_factory()
+
+        async def on_result(run: SweepRunResult):
+            if run.result is not None:
+                run.backtest_id = self._save_run(db, sweep, template, run)
+                sweep.completed_runs += 1
+            else:
+                sweep.failed_runs += 1
+            sweep.results.append(run)
+            await self._notify_progress(sweep)
+
+        try:
+            await self.runner.run(sweep, shared_data, config, parameter_sets, on_result)
+            if sweep.status == SweepStatus.RUNNING:
+                sweep.status = SweepStatus.COMPLETED
+            logger.info(f"参数扫描完成: {sweep.id}, 成功 {sweep.completed_runs}, 失败 {sweep.failed_runs}")
+        except Exception as e:
+            logger.error(f"参数扫描失败: {sweep.id}, 错误: {e}")
+            sweep.status = SweepStatus.FAILED
+            sweep.error_message = str(e)
+        finally:
+            sweep.completed_at = datetime.now()
+            db.close()
+            shared_data.cleanup()
+            self._tasks.pop(sweep.id, None)
+            await self._notify_progress(sweep)
+
+    def _save_run(self, db: Session, sweep: ParameterSweep, template: Dict[str, Any],
+                  run: SweepRunResult) -> Optional[int]:
+        """把一组参数的结果写成一条Backtest记录"""
+        result = run.result
+        try:
+            backtest = Backtest(
+                name=f"{template['name']} [{sweep.id} #{run.run_index + 1}]",
+                description=f"参数扫描 {sweep.id}",
+                strategy_id=template['strategy_id'],
+                user_id=sweep.user_id,
+                start_date=template['start_date'],
+                end_date=template['end_date'],
+                initial_capital=template['initial_capital'],
+                symbols=template['symbols'],
+                parameters=run.parameters,
+                status=BacktestStatus.COMPLETED,
+                progress=100.0,
+                started_at=sweep.started_at,
+                completed_at=datetime.now()
+            )
+            BacktestEngine._update_backtest_results(backtest, result)
+            db.add(backtest)
+            db.commit()
+            return backtest.id
+        except Exception as e:
+            db.rollback()
+            logger.error(f"保存参数扫描结果失败: {sweep.id} #{run.run_index}, 错误: {e}")
+            return None
+
+    async def _notify_progress(self, sweep: ParameterSweep):
+        """推送整个扫描的进度和当前排行榜"""
+        try:
+            await websocket_manager.send_to_user(
+                sweep.user_id,
+                {
+                    'type': 'backtest_sweep_progress',
+                    'sweep_id': sweep.id,
+                    'status': sweep.status.value,
+                    'progress': sweep.progress,
+                    'completed_runs': sweep.completed_runs,
+                    'failed_runs': sweep.failed_runs,
+                    'total_runs': sweep.total_runs,
+                    'leaderboard': sweep.leaderboard(top_n=5),
+                    'timestamp': datetime.now().isoformat()
+                }
+            )
+        except Exception as e:
+            logger.error(f"推送参数扫描进度失败: {e}")
+
+
+# 全局参数优化服务实例
+backtest_optimization_service = BacktestOptimizationService()
@@ -2,19 +2,26 @@
 历史数据查询服务
 """
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta, timezone
 import asyncio
 import logging
-import json
+import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
 
-from ..core.database import get_redis_client
-from ..core.influxdb import influx_manager
+from ..core.codecs import STRUCTURED_CODEC, decode, encode
+from ..core.config import settings
+from ..core.database import get_binary_redis_client
+from ..core.tiered_cache import cached
+from ..core.cache import invalidate_cache_tags, register_cache_tags, scan_unlink_in_background
+from ..core.influxdb import influx_manager, influx_query
 from ..core.exceptions import ValidationError, ExternalServiceError
 from ..core.dependencies import PaginationParams
 from ..services.tqsdk_adapter import tqsdk_adapter
 from ..schemas.market import KlineData, QuoteData
+from .kline_store import (
+    KLINE_FIELDS, kline_store, empty_kline_frame, normalize_kline_frame, to_utc, utc_days, _to_datetime64
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +30,8 @@ class HistoryService:
     """历史数据查询服务"""
     
     def __init__(self):
-        self.redis_client = get_redis_client()
+        self.redis_client = get_binary_redis_client()
+        self.kline_store = kline_store
         
         # 缓存配置
         self.kline_cache_ttl = {
@@ -35,6 +43,16 @@ class HistoryService:
             86400: 14400, # 日K线缓存4小时
         }
         
+        # 分段缓存：每段固定根数，按段长对齐，1分钟K线每段一天
+        self.kline_segment_bars = 1440
+        self.closed_segment_ttl = 7 * 86400
+        self.segment_stats = {
+            "hits": 0,
+            "misses": 0,
+            "open_segment_fetches": 0,
+            "last_cleanup": None,
+        }
+        
         # 支持的时间周期（秒）
         self.supported_periods = [60, 300, 900, 1800, 3600, 86400]
         
@@ -72,31 +90,9 @@ class HistoryService:
             if not start_time:
                 start_time = end_time - timedelta(seconds=period * limit)
             
-            # 检查缓存
-            cache_key = self._get_kline_cache_key(symbol, period, start_time, end_time, limit)
-            cached_data = self.redis_client.get(cache_key)
-            
-            if cached_data:
-                logger.info(f"从缓存获取K线数据: {symbol} {self.period_names[period]}")
-                klines_data = json.loads(cached_data)
-                return [KlineData(**kline) for kline in klines_data]
-            
-            # 从InfluxDB查询历史数据
-            klines = await self._query_klines_from_influx(
-                symbol, period, start_time, end_time, limit
-            )
-            
-            # 如果InfluxDB没有数据，从tqsdk获取
-            if not klines:
-                klines = await self._query_klines_from_tqsdk(
-                    symbol, period, start_time, end_time, limit
-                )
-            
-            # 缓存数据
-            if klines:
-                cache_ttl = self.kline_cache_ttl.get(period, 300)
-                klines_data = [kline.dict() for kline in klines]
-                self.redis_client.setex(cache_key, cache_ttl, json.dumps(klines_data, default=str))
+            # 按对齐的时间分段从缓存拼接，只拉取缺失或未收盘的分段
+            frame = await self._get_klines_by_segments(symbol, period, start_time, end_time)
+            klines = self._frame_to_klines(frame.tail(limit) if limit else frame)
             
             logger.info(f"获取K线数据成功: {symbol} {self.period_names[period]} {len(klines)}条")
             return klines
@@ -105,6 +101,75 @@ class HistoryService:
             logger.error(f"获取K线数据失败: {e}")
             raise ExternalServiceError(f"获取K线数据失败: {str(e)}")
     
+    async def get_klines_frame(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """获取K线DataFrame，按列返回，不逐根创建KlineData
+
+        本地存储可用时先增量同步缺失的交易日，再内存映射读取。
+        """
+        if period not in self.supported_periods:
+            raise ValidationError(f"不支持的时间周期: {period}秒")
+        
+        if not end_time:
+            end_time = datetime.now()
+        
+        if not self.kline_store.enabled:
+            return await self._fetch_klines_frame(symbol, period, start_time, end_time)
+        
+        await self.sync_kline_store(symbol, period, start_time, end_time)
+        return self.kline_store.read(symbol, period, start_time, end_time)
+    
+    async def sync_kline_store(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: Optional[datetime] = None
+    ) -> int:
+        """把时间范围内尚未同步的日期从InfluxDB/tqsdk补齐到本地存储，返回写入的K线数
+
+        日期按UTC划分，与本地存储的索引和同步清单一致
+        """
+        if not self.kline_store.enabled:
+            return 0
+        
+        if not end_time:
+            end_time = datetime.now()
+        
+        now = datetime.now(timezone.utc)
+        synced = self.kline_store.synced_days(symbol, period)
+        missing = [day for day in utc_days(start_time, end_time) if day not in synced]
+        
+        written = 0
+        for first_day, last_day in self._contiguous_day_ranges(missing):
+            range_start = datetime.combine(first_day, time.min, tzinfo=timezone.utc)
+            range_end = min(datetime.combine(last_day, time.max, tzinfo=timezone.utc), now)
+            
+            frame = await self._fetch_klines_frame(symbol, period, range_start, range_end)
+            if frame.empty:
+                # 数据源整段都没有数据时不记录，下次重试
+                continue
+            
+            written += self.kline_store.write(symbol, period, frame)
+            
+            # 只记录取到的首末K线之间的日期：数据源可能只返回区间内最近的一部分（如tqsdk最多8000根），
+            # 之外的日期留待下次重试；当天K线还在更新，也不记为已同步
+            first_bar_day, last_bar_day = frame.index[0].date(), frame.index[-1].date()
+            closed_days = [
+                day for day in missing
+                if max(first_day, first_bar_day) <= day <= min(last_day, last_bar_day) and day < now.date()
+            ]
+            self.kline_store.mark_synced(symbol, period, closed_days)
+        
+        if written:
+            logger.info(f"同步K线到本地存储: {symbol} {self.period_names[period]} {written}条")
+        return written
+    
     async def get_quotes_history(
         self,
         symbol: str,
@@ -123,7 +188,7 @@ class HistoryService:
             
             if cached_data:
                 logger.info(f"从缓存获取历史行情: {symbol}")
-                quotes_data = json.loads(cached_data)
+                quotes_data = decode(cached_data)
                 return [QuoteData(**quote) for quote in quotes_data]
             
             # 从InfluxDB查询
@@ -132,7 +197,10 @@ class HistoryService:
             # 缓存数据（缓存10分钟）
             if quotes:
                 quotes_data = [quote.dict() for quote in quotes]
-                self.redis_client.setex(cache_key, 600, json.dumps(quotes_data, default=str))
+                pipeline = self.redis_client.pipeline()
+                pipeline.setex(cache_key, 600, encode(quotes_data, STRUCTURED_CODEC))
+                register_cache_tags(pipeline, cache_key, [self._symbol_tag(symbol)], 600)
+                pipeline.execute()
             
             logger.info(f"获取历史行情成功: {symbol} {len(quotes)}条")
             return quotes
@@ -215,6 +283,8 @@ class HistoryService:
             logger.error(f"K线周期转换失败: {e}")
             raise ExternalServiceError(f"K线周期转换失败: {str(e)}")
     
+    @cached("market_summary", ttl=5,
+            tags=lambda self, symbols, period=86400: [self._symbol_tag(symbol) for symbol in symbols])
     async def get_market_summary(
         self,
         symbols: List[str],
@@ -278,31 +348,32 @@ class HistoryService:
     ) -> List[KlineData]:
         """从InfluxDB查询K线数据"""
         try:
-            period_str = f"{period}s"
-            klines_data = influx_manager.query_klines(
-                symbol, period_str, start_time, end_time, limit
-            )
-            
-            klines = []
-            for data in klines_data:
-                if all(key in data for key in ['datetime', 'open', 'high', 'low', 'close', 'volume']):
-                    kline = KlineData(
-                        datetime=data['datetime'],
-                        open=data['open'],
-                        high=data['high'],
-                        low=data['low'],
-                        close=data['close'],
-                        volume=data['volume'],
-                        open_interest=data.get('open_interest', 0)
-                    )
-                    klines.append(kline)
-            
-            return klines
+            frame = await self._query_klines_frame_from_influx(symbol, period, start_time, end_time, limit)
+            return self._frame_to_klines(frame)
             
         except Exception as e:
             logger.warning(f"从InfluxDB查询K线数据失败: {e}")
             return []
     
+    async def _query_klines_frame_from_influx(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: datetime,
+        limit: Optional[int] = None
+    ) -> pd.DataFrame:
+        """从InfluxDB查询K线DataFrame，异步客户端不可用时在线程池中执行同步查询"""
+        period_str = f"{period}s"
+        if influx_query.available:
+            frame = await influx_query.query_klines_frame(symbol, period_str, start_time, end_time, limit)
+            return normalize_kline_frame(frame)
+        
+        records = await asyncio.to_thread(
+            influx_manager.query_klines, symbol, period_str, start_time, end_time, limit or 1000000
+        )
+        return self._records_to_frame(records)
+    
     async def _query_klines_from_tqsdk(
         self,
         symbol: str,
@@ -334,6 +405,104 @@ class HistoryService:
             logger.warning(f"从tqsdk查询K线数据失败: {e}")
             return []
     
+    async def _fetch_klines_frame(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: datetime
+    ) -> pd.DataFrame:
+        """从InfluxDB（无数据时从tqsdk）获取K线DataFrame"""
+        expected_bars = int((end_time - start_time).total_seconds() // period) + 1
+        
+        try:
+            frame = await self._query_klines_frame_from_influx(
+                symbol, period, start_time, end_time, expected_bars
+            )
+        except Exception as e:
+            logger.warning(f"从InfluxDB查询K线数据失败: {e}")
+            frame = empty_kline_frame()
+        
+        if frame.empty:
+            try:
+                records = await tqsdk_adapter.get_klines(symbol, period, min(expected_bars, 8000))
+                frame = self._records_to_frame(records).loc[_to_datetime64(start_time):_to_datetime64(end_time)]
+            except Exception as e:
+                logger.warning(f"从tqsdk查询K线数据失败: {e}")
+                frame = empty_kline_frame()
+        
+        return frame
+    
+    def _records_to_frame(self, records: List[Dict[str, Any]]) -> pd.DataFrame:
+        """把数据源返回的记录转换为K线DataFrame"""
+        if not records:
+            return empty_kline_frame()
+        
+        df = pd.DataFrame(records)
+        if 'datetime' not in df.columns:
+            return empty_kline_frame()
+        
+        df = df.drop(columns=[c for c in ('symbol', 'period') if c in df.columns])
+        return normalize_kline_frame(df.groupby('datetime').first())
+    
+    def _read_klines_from_store(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: datetime,
+        limit: int
+    ) -> List[KlineData]:
+        """区间内的日期都已同步完成时从本地存储读取"""
+        if not self.kline_store.enabled or to_utc(end_time).date() >= datetime.now(timezone.utc).date():
+            return []
+        
+        synced = self.kline_store.synced_days(symbol, period)
+        days = utc_days(start_time, end_time)
+        if not synced or any(day not in synced for day in days):
+            return []
+        
+        df = self.kline_store.read(symbol, period, start_time, end_time).tail(limit)
+        return self._frame_to_klines(df)
+    
+    @staticmethod
+    def _frame_to_klines(df: pd.DataFrame) -> List[KlineData]:
+        """K线DataFrame转换为KlineData列表，时间为带时区的UTC时间"""
+        index = df.index.tz_localize('UTC') if df.index.tz is None else df.index
+        return [
+            KlineData(
+                datetime=timestamp.isoformat(),
+                open=row.open,
+                high=row.high,
+                low=row.low,
+                close=row.close,
+                volume=int(row.volume),
+                open_interest=int(row.open_interest)
+            )
+            for timestamp, row in zip(index, df.itertuples(index=False))
+        ]
+    
+    @staticmethod
+    def _klines_to_frame(klines: List[KlineData]) -> pd.DataFrame:
+        """KlineData列表转换为K线DataFrame"""
+        if not klines:
+            return empty_kline_frame()
+        return normalize_kline_frame(pd.DataFrame(
+            {name: [getattr(kline, name) for kline in klines] for name in KLINE_FIELDS},
+            index=[kline.datetime for kline in klines]
+        ))
+    
+    @staticmethod
+    def _contiguous_day_ranges(days: List[date]) -> List[Tuple[date, date]]:
+        """把日期列表合并为连续区间"""
+        ranges = []
+        for day in sorted(days):
+            if ranges and day - ranges[-1][1] == timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+    
     async def _query_quotes_from_influx(
         self,
         symbol: str,
@@ -343,13 +512,20 @@ class HistoryService:
     ) -> List[QuoteData]:
         """从InfluxDB查询行情数据"""
         try:
-            quotes_data = influx_manager.query_quotes(symbol, start_time, end_time, limit)
+            if influx_query.available:
+                frame = await influx_query.query_quotes_frame(symbol, start_time, end_time, limit)
+                rows = [
+                    {**row, 'datetime': timestamp.isoformat()}
+                    for timestamp, row in zip(frame.index, frame.fillna(0).to_dict('records'))
+                ]
+            else:
+                rows = await asyncio.to_thread(influx_manager.query_quotes, symbol, start_time, end_time, limit)
             
             quotes = []
-            for data in quotes_data:
-                if 'symbol' in data and 'last_price' in data:
+            for data in rows:
+                if 'last_price' in data:
                     quote = QuoteData(
-                        symbol=data['symbol'],
+                        symbol=symbol,
                         last_price=data.get('last_price', 0),
                         bid_price=data.get('bid_price', 0),
                         ask_price=data.get('ask_price', 0),
@@ -363,7 +539,7 @@ class HistoryService:
                         pre_close=data.get('pre_close', 0),
                         upper_limit=data.get('upper_limit', 0),
                         lower_limit=data.get('lower_limit', 0),
-                        datetime=data.get('datetime', datetime.now().isoformat())
+                        datetime=str(data.get('datetime', datetime.now().isoformat()))
                     )
                     quotes.append(quote)
             
@@ -448,34 +624,171 @@ class HistoryService:
         
         return result
     
-    def _get_kline_cache_key(
+    async def _get_klines_by_segments(
         self,
         symbol: str,
         period: int,
         start_time: datetime,
-        end_time: datetime,
-        limit: int
-    ) -> str:
-        """生成K线缓存键"""
-        return f"klines:{symbol}:{period}:{start_time.isoformat()}:{end_time.isoformat()}:{limit}"
+        end_time: datetime
+    ) -> pd.DataFrame:
+        """从分段缓存拼接时间范围内的K线DataFrame
+
+        已收盘的分段内容不再变化，长期缓存；包含当前时间的分段只短期缓存。
+        分段结束后还要等最后一根K线收盘、批量写入器刷新落库，才算收盘。
+        缺失的相邻分段合并成一次查询。分段按列以NumPy原始内存缓存，
+        读取、拼接和按时间截取都是向量化操作，不逐根创建Python对象。
+        """
+        segment_seconds = period * self.kline_segment_bars
+        close_after = segment_seconds + period + settings.INFLUX_WRITE_FLUSH_INTERVAL
+        now_ts = datetime.now().timestamp()
+        segment_starts = list(range(
+            self._segment_start(start_time.timestamp(), segment_seconds),
+            int(end_time.timestamp()) + 1,
+            segment_seconds
+        ))
+        keys = [self._get_kline_segment_key(symbol, period, ts) for ts in segment_starts]
+        
+        cached = self.redis_client.mget(keys) if keys else []
+        segments: Dict[int, pd.DataFrame] = {}
+        missing = []
+        for segment_start, data in zip(segment_starts, cached):
+            frame = self._decode_segment(data) if data is not None else None
+            if frame is None:
+                missing.append(segment_start)
+            else:
+                segments[segment_start] = frame
+        
+        self.segment_stats["hits"] += len(segments)
+        self.segment_stats["misses"] += len(missing)
+        
+        for first, last in self._contiguous_segment_ranges(missing, segment_seconds):
+            if first > now_ts:
+                # 尚未开始的分段没有数据
+                continue
+            
+            fetch_end = min(last + segment_seconds - 1, now_ts)
+            if last + close_after > now_ts:
+                self.segment_stats["open_segment_fetches"] += 1
+            
+            fetched = self._klines_to_frame(await self._fetch_kline_range(
+                symbol, period, datetime.fromtimestamp(first), datetime.fromtimestamp(fetch_end)
+            ))
+            
+            # 按分段边界切分，边界是时间戳，与索引一样按UTC比较
+            bounds = list(range(first, last + segment_seconds + 1, segment_seconds))
+            positions = fetched.index.searchsorted(
+                np.array(bounds, dtype='datetime64[s]').astype('datetime64[ns]'), side='left'
+            )
+            
+            pipeline = self.redis_client.pipeline()
+            for i, segment_start in enumerate(bounds[:-1]):
+                frame = fetched.iloc[positions[i]:positions[i + 1]]
+                segments[segment_start] = frame
+                closed = segment_start + close_after <= now_ts
+                if closed and not frame.empty:
+                    ttl = self.closed_segment_ttl
+                elif closed:
+                    # 空的已收盘分段可能是休市也可能是数据源暂不可用，短期缓存
+                    ttl = self.kline_cache_ttl.get(period, 300)
+                else:
+                    ttl = min(period, self.kline_cache_ttl.get(period, 300))
+                segment_key = self._get_kline_segment_key(symbol, period, segment_start)
+                pipeline.setex(segment_key, ttl, encode(frame, "numpy"))
+                register_cache_tags(pipeline, segment_key, [self._symbol_tag(symbol)], ttl)
+            pipeline.execute()
+        
+        frames = [segments[ts] for ts in segment_starts if ts in segments and not segments[ts].empty]
+        if not frames:
+            return empty_kline_frame()
+        frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+        begin = frame.index.searchsorted(_to_datetime64(start_time), side='left')
+        stop = frame.index.searchsorted(_to_datetime64(end_time), side='right')
+        return frame.iloc[begin:stop]
+    
+    @staticmethod
+    def _decode_segment(data: bytes) -> Optional[pd.DataFrame]:
+        """解码K线分段，旧格式或无法解析的分段按未命中处理，重新拉取后覆盖"""
+        try:
+            frame = decode(data)
+        except Exception as e:
+            logger.warning(f"K线分段缓存解析失败: {e}")
+            return None
+        return frame if isinstance(frame, pd.DataFrame) else None
+    
+    async def _fetch_kline_range(
+        self,
+        symbol: str,
+        period: int,
+        start_time: datetime,
+        end_time: datetime
+    ) -> List[KlineData]:
+        """依次从本地存储、InfluxDB、tqsdk获取时间范围内的全部K线"""
+        expected_bars = int((end_time - start_time).total_seconds() // period) + 1
+        
+        klines = self._read_klines_from_store(symbol, period, start_time, end_time, expected_bars)
+        
+        if not klines:
+            klines = await self._query_klines_from_influx(
+                symbol, period, start_time, end_time, expected_bars
+            )
+        
+        if not klines:
+            klines = await self._query_klines_from_tqsdk(
+                symbol, period, start_time, end_time, min(expected_bars, 8000)
+            )
+        
+        return klines
+    
+    @staticmethod
+    def _segment_start(timestamp: float, segment_seconds: int) -> int:
+        """时间戳所在分段的起点"""
+        return int(timestamp // segment_seconds) * segment_seconds
+    
+    @staticmethod
+    def _contiguous_segment_ranges(segment_starts: List[int], segment_seconds: int) -> List[Tuple[int, int]]:
+        """把缺失分段合并为连续区间"""
+        ranges = []
+        for segment_start in sorted(segment_starts):
+            if ranges and segment_start - ranges[-1][1] == segment_seconds:
+                ranges[-1] = (ranges[-1][0], segment_start)
+            else:
+                ranges.append((segment_start, segment_start))
+        return ranges
+    
+    def _get_kline_segment_key(self, symbol: str, period: int, segment_start: int) -> str:
+        """生成K线分段缓存键"""
+        return f"klines:{symbol}:{period}:{segment_start}"
+    
+    @staticmethod
+    def _symbol_tag(symbol: str) -> str:
+        """合约的缓存失效标签"""
+        return f"symbol:{symbol}"
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """K线分段缓存命中统计"""
+        hits = self.segment_stats["hits"]
+        misses = self.segment_stats["misses"]
+        total = hits + misses
+        return {
+            **self.segment_stats,
+            "hit_rate": hits / total if total else 0.0,
+        }
     
     def clear_cache(self, symbol: Optional[str] = None):
-        """清理缓存"""
+        """清理缓存
+
+        指定合约时按合约标签删除其K线分段和历史行情缓存；
+        不指定时在后台线程中用SCAN/UNLINK清理全部K线缓存
+        """
         try:
             if symbol:
-                # 清理指定合约的缓存
-                pattern = f"klines:{symbol}:*"
-                keys = self.redis_client.keys(pattern)
-                if keys:
-                    self.redis_client.delete(*keys)
-                    logger.info(f"清理{symbol}的K线缓存: {len(keys)}个键")
+                deleted = invalidate_cache_tags(self.redis_client, self._symbol_tag(symbol))
+                logger.info(f"清理{symbol}的历史数据缓存: {deleted}个键")
             else:
-                # 清理所有K线缓存
-                pattern = "klines:*"
-                keys = self.redis_client.keys(pattern)
-                if keys:
-                    self.redis_client.delete(*keys)
-                    logger.info(f"清理所有K线缓存: {len(keys)}个键")
+                scan_unlink_in_background(self.redis_client, "klines:*")
+                logger.info("已开始在后台清理所有K线缓存")
+            
+            self.segment_stats["last_cleanup"] = datetime.now().isoformat()
         
         except Exception as e:
             logger.error(f"清理缓存失败: {e}")
@@ -0,0 +1,460 @@
+"""
+增量技术指标引擎
+
+批量模式：对整段收盘价数组做向量化计算（累加和求均线、滑动窗口求标准差、lfilter求EMA和Wilder平滑）。
+增量模式：按 (合约, 周期) 维护指标状态，每根新K线或每笔行情 O(1) 更新，不重算历史：
+    - MA和布林带用滑动窗口累加和（布林带方差用滑动Welford更新）
+    - RSI用Wilder平滑
+    - MACD保存快慢线和信号线的EMA状态
+最后一根K线视为未完成K线，行情只更新它的指标值；K线时间变化时才把它计入状态。
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from .quote_bus import QuoteSubscription, QuoteTick, quote_bus
+
+logger = logging.getLogger(__name__)
+
+MA_WINDOWS = (5, 10, 20)
+BOLL_WINDOW = 20
+BOLL_STD = 2.0
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+
+# 指标字段及写入K线时保留的小数位
+INDICATOR_DECIMALS = {
+    "ma5": 2, "ma10": 2, "ma20": 2,
+    "rsi": 2,
+    "macd": 4, "macd_signal": 4, "macd_histogram": 4,
+    "bb_upper": 2, "bb_middle": 2, "bb_lower": 2,
+}
+
+PERIOD_SECONDS = {
+    "1m": 60, "5m": 300, "15m": 900, "30m": 1800,
+    "1h": 3600, "4h": 14400, "1d": 86400, "1w": 604800,
+}
+
+# 按北京时间划分日线和周线
+BAR_TZ_OFFSET = 8 * 3600
+
+# 增量状态每提交这么多根K线后用窗口数据重算一次累加和，消除浮点累积误差
+_RESYNC_EVERY = 1024
+
+
+# ============================================================================
+# 批量计算
+# ============================================================================
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """简单移动平均，前window-1个值为NaN"""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.cumsum(values)
+        out[window - 1] = csum[window - 1] / window
+        out[window:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """滑动窗口总体标准差（ddof=0）"""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).std(axis=1)
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """指数移动平均，以第一个值为初值"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values.copy()
+    alpha = 2.0 / (period + 1)
+    out, _ = lfilter([alpha], [1.0, alpha - 1.0], values, zi=[(1.0 - alpha) * values[0]])
+    return out
+
+
+def _wilder_averages(values: np.ndarray, period: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilder平滑的平均涨幅和平均跌幅，按K线对齐，前period个值为NaN"""
+    values = np.asarray(values, dtype=float)
+    avg_gain = np.full(len(values), np.nan)
+    avg_loss = np.full(len(values), np.nan)
+    if len(values) <= period:
+        return avg_gain, avg_loss
+
+    deltas = np.diff(values)
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas < 0, -deltas, 0.0)
+
+    # 第一个平均值为前period个变动的算术平均，之后 avg = avg + (x - avg) / period
+    alpha = 1.0 / period
+    for source, target in ((gains, avg_gain), (losses, avg_loss)):
+        seed = source[:period].mean()
+        target[period] = seed
+        if len(source) > period:
+            target[period + 1:], _ = lfilter(
+                [alpha], [1.0, alpha - 1.0], source[period:], zi=[(1.0 - alpha) * seed]
+            )
+    return avg_gain, avg_loss
+
+
+def _rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    rsi = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), rsi)
+    return np.where(np.isnan(avg_gain), np.nan, rsi)
+
+
+def rsi(values: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """RSI（Wilder平滑）"""
+    return _rsi_from_averages(*_wilder_averages(values, period))
+
+
+def macd(
+    values: np.ndarray,
+    fast: int = MACD_FAST,
+    slow: int = MACD_SLOW,
+    signal: int = MACD_SIGNAL
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD线、信号线和柱，前slow-1个值为NaN"""
+    line = ema(values, fast) - ema(values, slow)
+    signal_line = ema(line, signal)
+    histogram = line - signal_line
+    for array in (line, signal_line, histogram):
+        array[:slow - 1] = np.nan
+    return line, signal_line, histogram
+
+
+def bollinger(
+    values: np.ndarray,
+    window: int = BOLL_WINDOW,
+    num_std: float = BOLL_STD
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """布林带上轨、中轨和下轨"""
+    middle = sma(values, window)
+    std = rolling_std(values, window)
+    return middle + num_std * std, middle, middle - num_std * std
+
+
+def compute_indicators(closes: Sequence[float]) -> Dict[str, np.ndarray]:
+    """批量计算全部标准指标，返回与收盘价等长的数组，不可用处为NaN"""
+    closes = np.asarray(closes, dtype=float)
+    result = {f"ma{window}": sma(closes, window) for window in MA_WINDOWS}
+    result["rsi"] = rsi(closes, RSI_PERIOD)
+    result["macd"], result["macd_signal"], result["macd_histogram"] = macd(closes)
+    result["bb_upper"], result["bb_middle"], result["bb_lower"] = bollinger(closes)
+    return result
+
+
+def apply_indicators(klines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """批量计算指标并写入K线字典，不可用的指标不写入"""
+    if not klines:
+        return klines
+
+    indicators = compute_indicators([float(k["close"]) for k in klines])
+    for key, decimals in INDICATOR_DECIMALS.items():
+        rounded = np.round(indicators[key], decimals)
+        valid = np.flatnonzero(~np.isnan(rounded))
+        values = rounded[valid].tolist()
+        for i, value in zip(valid.tolist(), values):
+            klines[i][key] = value
+    return klines
+
+
+# ============================================================================
+# 增量计算
+# ============================================================================
+
+class IndicatorState:
+    """单个 (合约, 周期) 的增量指标状态
+
+    已完成K线计入状态，未完成K线只用于计算当前指标值。
+    """
+
+    def __init__(self):
+        self.count = 0  # 已完成K线数
+        self.window: Deque[float] = deque(maxlen=max(max(MA_WINDOWS), BOLL_WINDOW))
+        self.sums = {window: 0.0 for window in MA_WINDOWS}
+        self.boll_mean = 0.0
+        self.boll_m2 = 0.0
+        self.prev_close: Optional[float] = None
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        self.ema_fast: Optional[float] = None
+        self.ema_slow: Optional[float] = None
+        self.ema_signal: Optional[float] = None
+
+        self.bar_time: Optional[float] = None
+        self.close: Optional[float] = None
+        self.values: Dict[str, Optional[float]] = {}
+
+    @classmethod
+    def from_history(cls, closes: Sequence[float], bar_time: Optional[float] = None) -> "IndicatorState":
+        """由历史收盘价建立状态，最后一根K线作为未完成K线"""
+        closes = np.asarray(closes, dtype=float)
+        state = cls()
+        if len(closes) == 0:
+            return state
+
+        done = closes[:-1]
+        n = len(done)
+        if n:
+            state.count = n
+            state.window.extend(done[-state.window.maxlen:].tolist())
+            for window in MA_WINDOWS:
+                state.sums[window] = float(done[-window:].sum()) if n >= window else float(done.sum())
+            state._resync_boll()
+            state.prev_close = float(done[-1])
+
+            deltas = n - 1
+            if deltas >= RSI_PERIOD:
+                avg_gain, avg_loss = _wilder_averages(done, RSI_PERIOD)
+                state.avg_gain, state.avg_loss = float(avg_gain[-1]), float(avg_loss[-1])
+            elif deltas > 0:
+                diffs = np.diff(done)
+                state.gain_sum = float(diffs[diffs > 0].sum())
+                state.loss_sum = float(-diffs[diffs < 0].sum())
+
+            ema_fast, ema_slow = ema(done, MACD_FAST), ema(done, MACD_SLOW)
+            state.ema_fast, state.ema_slow = float(ema_fast[-1]), float(ema_slow[-1])
+            state.ema_signal = float(ema(ema_fast - ema_slow, MACD_SIGNAL)[-1])
+
+        state.update(float(closes[-1]), bar_time)
+        return state
+
+    def update(self, close: float, bar_time: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """更新当前K线的收盘价
+
+        bar_time与当前K线不同时，先把当前K线计入状态，再开始新K线
+        """
+        if self.close is not None and bar_time != self.bar_time:
+            self._commit(self.close)
+        self.bar_time = bar_time
+        self.close = close
+        self.values = self._compute(close)[0]
+        return self.values
+
+    def _compute(self, close: float) -> Tuple[Dict[str, Optional[float]], Dict[str, Any]]:
+        """以close作为下一根K线的收盘价计算指标值和计入后的状态，不修改状态"""
+        n = self.count
+        window = self.window
+        values: Dict[str, Optional[float]] = {}
+        nxt: Dict[str, Any] = {}
+
+        # 均线
+        sums = {}
+        for w in MA_WINDOWS:
+            total = self.sums[w] + close - (window[-w] if n >= w else 0.0)
+            sums[w] = total
+            values[f"ma{w}"] = total / w if n + 1 >= w else None
+        nxt["sums"] = sums
+
+        # 布林带：窗口未满时Welford递增，已满时替换最早的值
+        mean, m2 = self.boll_mean, self.boll_m2
+        if n >= BOLL_WINDOW:
+            oldest = window[-BOLL_WINDOW]
+            new_mean = mean + (close - oldest) / BOLL_WINDOW
+            m2 += (close - oldest) * (close - new_mean + oldest - mean)
+        else:
+            new_mean = mean + (close - mean) / (n + 1)
+            m2 += (close - mean) * (close - new_mean)
+        nxt["boll"] = (new_mean, m2)
+        if n + 1 >= BOLL_WINDOW:
+            std = math.sqrt(max(m2, 0.0) / BOLL_WINDOW)
+            values["bb_middle"] = sums[BOLL_WINDOW] / BOLL_WINDOW
+            values["bb_upper"] = values["bb_middle"] + BOLL_STD * std
+            values["bb_lower"] = values["bb_middle"] - BOLL_STD * std
+        else:
+            values["bb_upper"] = values["bb_middle"] = values["bb_lower"] = None
+
+        # RSI（Wilder平滑）
+        avg_gain, avg_loss = self.avg_gain, self.avg_loss
+        gain_sum, loss_sum = self.gain_sum, self.loss_sum
+        values["rsi"] = None
+        if self.prev_close is not None:
+            delta = close - self.prev_close
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if avg_gain is not None:
+                avg_gain += (gain - avg_gain) / RSI_PERIOD
+                avg_loss += (loss - avg_loss) / RSI_PERIOD
+            elif n == RSI_PERIOD:
+                avg_gain = (gain_sum + gain) / RSI_PERIOD
+                avg_loss = (loss_sum + loss) / RSI_PERIOD
+            else:
+                gain_sum += gain
+                loss_sum += loss
+            if avg_gain is not None:
+                if avg_loss == 0:
+                    values["rsi"] = 50.0 if avg_gain == 0 else 100.0
+                else:
+                    values["rsi"] = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        nxt["rsi"] = (avg_gain, avg_loss, gain_sum, loss_sum)
+
+        # MACD
+        if self.ema_fast is None:
+            ema_fast = ema_slow = close
+        else:
+            alpha_fast, alpha_slow = 2.0 / (MACD_FAST + 1), 2.0 / (MACD_SLOW + 1)
+            ema_fast = self.ema_fast + alpha_fast * (close - self.ema_fast)
+            ema_slow = self.ema_slow + alpha_slow * (close - self.ema_slow)
+        line = ema_fast - ema_slow
+        if self.ema_signal is None:
+            ema_signal = line
+        else:
+            ema_signal = self.ema_signal + 2.0 / (MACD_SIGNAL + 1) * (line - self.ema_signal)
+        nxt["macd"] = (ema_fast, ema_slow, ema_signal)
+        if n + 1 >= MACD_SLOW:
+            values["macd"] = line
+            values["macd_signal"] = ema_signal
+            values["macd_histogram"] = line - ema_signal
+        else:
+            values["macd"] = values["macd_signal"] = values["macd_histogram"] = None
+
+        return values, nxt
+
+    def _commit(self, close: float):
+        """把一根已完成K线计入状态"""
+        _, nxt = self._compute(close)
+        self.sums = nxt["sums"]
+        self.boll_mean, self.boll_m2 = nxt["boll"]
+        self.avg_gain, self.avg_loss, self.gain_sum, self.loss_sum = nxt["rsi"]
+        self.ema_fast, self.ema_slow, self.ema_signal = nxt["macd"]
+        self.prev_close = close
+        self.window.append(close)
+        self.count += 1
+
+        if self.count % _RESYNC_EVERY == 0:
+            data = list(self.window)
+            for w in MA_WINDOWS:
+                self.sums[w] = math.fsum(data[-w:])
+            self._resync_boll()
+
+    def _resync_boll(self):
+        data = np.asarray(list(self.window)[-BOLL_WINDOW:], dtype=float)
+        if len(data):
+            self.boll_mean = float(data.mean())
+            self.boll_m2 = float(((data - self.boll_mean) ** 2).sum())
+
+
+def bar_start(value: Any, period: str) -> Optional[float]:
+    """K线或行情时间所在K线的开始时间（epoch秒）
+
+    支持纳秒时间戳（tqsdk）、秒时间戳、datetime和ISO格式字符串
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        seconds = value.timestamp()
+    elif isinstance(value, str):
+        try:
+            seconds = datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+    else:
+        seconds = float(value)
+        if seconds > 1e12:
+            seconds /= 1e9
+
+    duration = PERIOD_SECONDS.get(period, 86400)
+    return math.floor((seconds + BAR_TZ_OFFSET) / duration) * duration - BAR_TZ_OFFSET
+
+
+class IndicatorEngine:
+    """按 (合约, 周期) 维护增量指标，订阅行情总线随行情更新"""
+
+    def __init__(self, max_keys: int = 500):
+        self.max_keys = max_keys
+        self._states: "OrderedDict[Tuple[str, str], IndicatorState]" = OrderedDict()
+        self._periods: Dict[str, Set[str]] = {}
+        self.quote_bus = quote_bus
+        self._subscription: Optional[QuoteSubscription] = None
+
+    def seed(self, symbol: str, period: str, klines: List[Dict[str, Any]]) -> Optional[IndicatorState]:
+        """由历史K线建立状态，已有状态会被替换"""
+        if not klines:
+            return None
+        closes = [float(k["close"]) for k in klines]
+        state = IndicatorState.from_history(closes, bar_start(klines[-1].get("datetime"), period))
+
+        key = (symbol, period)
+        self._states[key] = state
+        self._states.move_to_end(key)
+        self._periods.setdefault(symbol, set()).add(period)
+        return state
+
+    async def track(self, symbol: str, period: str, klines: List[Dict[str, Any]]) -> Optional[IndicatorState]:
+        """建立状态并订阅合约行情，超过容量时淘汰最久未使用的状态"""
+        state = self.seed(symbol, period, klines)
+        if state is None:
+            return None
+
+        if self._subscription is None:
+            self._subscription = await self.quote_bus.subscribe([], self._on_quote, name="indicator_engine")
+        await self.quote_bus.add_symbols(self._subscription, [symbol])
+
+        while len(self._states) > self.max_keys:
+            (old_symbol, old_period), _ = self._states.popitem(last=False)
+            await self._forget(old_symbol, old_period)
+        return state
+
+    async def untrack(self, symbol: str, period: str):
+        if self._states.pop((symbol, period), None) is not None:
+            await self._forget(symbol, period)
+
+    def update(self, symbol: str, period: str, close: float, bar_time: Optional[float] = None
+               ) -> Optional[Dict[str, Optional[float]]]:
+        """更新当前K线收盘价，返回最新指标值；没有状态时返回None"""
+        state = self._states.get((symbol, period))
+        if state is None:
+            return None
+        return state.update(close, bar_time)
+
+    def on_price(self, symbol: str, price: float, timestamp: Optional[float] = None):
+        """一笔行情更新该合约所有周期的指标"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for period in self._periods.get(symbol, ()):
+            state = self._states.get((symbol, period))
+            if state is not None:
+                state.update(price, bar_start(timestamp, period))
+
+    def latest(self, symbol: str, period: str) -> Optional[Dict[str, Optional[float]]]:
+        """当前（含未完成K线）的指标值"""
+        state = self._states.get((symbol, period))
+        if state is None:
+            return None
+        self._states.move_to_end((symbol, period))
+        return state.values
+
+    def _on_quote(self, tick: QuoteTick):
+        price = tick.last_price
+        if price:
+            self.on_price(tick.symbol, float(price))
+
+    async def _forget(self, symbol: str, period: str):
+        periods = self._periods.get(symbol)
+        if periods is None:
+            return
+        periods.discard(period)
+        if not periods:
+            del self._periods[symbol]
+            if self._subscription is not None:
+                await self.quote_bus.remove_symbols(self._subscription, [symbol])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"keys": len(self._states), "symbols": len(self._periods), "max_keys": self.max_keys}
+
+
+# 创建全局指标引擎实例
+indicator_engine = IndicatorEngine()
@@ -0,0 +1,486 @@
+"""
+技术指标库与声明式批量计算
+
+指标以声明式格式请求，参数可省略（使用默认值）::
+
+    [{"ema": 12}, {"macd": [12, 26, 9]}, {"atr": 14}, {"boll": [20, 2]}, "rsi"]
+
+同一合约上的指标共用一个计算上下文，中间数组（EMA、均线、最高/最低价、真实波幅等）只计算一次；
+计算结果按 (合约, 周期, 指标, 参数, K线数, 最后K线时间) 缓存，新K线到来前重复请求直接复用。
+结果为列式数组：每个指标输出若干与K线等长的数组。
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from ..core.exceptions import ValidationError
+from .indicator_engine import _rsi_from_averages, ema, rolling_std, sma
+
+logger = logging.getLogger(__name__)
+
+IndicatorParams = Tuple[float, ...]
+IndicatorFunction = Callable[..., Dict[str, np.ndarray]]
+
+
+class BarArrays:
+    """K线的列式数组"""
+
+    __slots__ = ("datetime", "open", "high", "low", "close", "volume")
+
+    def __init__(self, datetime: List[Any], open: np.ndarray, high: np.ndarray,
+                 low: np.ndarray, close: np.ndarray, volume: np.ndarray):
+        self.datetime = datetime
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def from_klines(cls, klines: List[Dict[str, Any]]) -> "BarArrays":
+        def column(name, fallback="close"):
+            return np.array([float(k.get(name, k[fallback]) or 0.0) for k in klines], dtype=float)
+
+        return cls(
+            datetime=[k.get("datetime") for k in klines],
+            open=column("open"),
+            high=column("high"),
+            low=column("low"),
+            close=column("close"),
+            volume=np.array([float(k.get("volume") or 0.0) for k in klines], dtype=float),
+        )
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    @property
+    def last_bar_time(self) -> Any:
+        return self.datetime[-1] if self.datetime else None
+
+
+def wilder(values: np.ndarray, period: int) -> np.ndarray:
+    """Wilder平滑：前period个值的算术平均为初值，之后 avg += (x - avg) / period"""
+    values = np.asarray(values, dtype=float)
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    seed = values[:period].mean()
+    out[period - 1] = seed
+    if len(values) > period:
+        alpha = 1.0 / period
+        out[period:], _ = lfilter([alpha], [1.0, alpha - 1.0], values[period:], zi=[(1.0 - alpha) * seed])
+    return out
+
+
+def _shift(values: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(values), np.nan)
+    if n < len(values):
+        out[n:] = values[:-n] if n else values
+    return out
+
+
+class IndicatorContext:
+    """单个合约一组K线上的计算上下文，缓存可被多个指标共用的中间数组"""
+
+    def __init__(self, bars: BarArrays):
+        self.bars = bars
+        self._memo: Dict[Tuple, np.ndarray] = {}
+
+    def _cached(self, key: Tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo[key] = compute()
+        return value
+
+    def source(self, name: str) -> np.ndarray:
+        if name == "typical":
+            return self._cached(("typical",), lambda: (self.bars.high + self.bars.low + self.bars.close) / 3.0)
+        return getattr(self.bars, name)
+
+    def sma(self, n: int, source: str = "close") -> np.ndarray:
+        return self._cached(("sma", source, n), lambda: sma(self.source(source), n))
+
+    def ema(self, n: int, source: str = "close") -> np.ndarray:
+        return self._cached(("ema", source, n), lambda: ema(self.source(source), n))
+
+    def std(self, n: int, source: str = "close") -> np.ndarray:
+        return self._cached(("std", source, n), lambda: rolling_std(self.source(source), n))
+
+    def highest(self, n: int, source: str = "high") -> np.ndarray:
+        return self._cached(("highest", source, n), lambda: self._rolling(self.source(source), n, np.max))
+
+    def lowest(self, n: int, source: str = "low") -> np.ndarray:
+        return self._cached(("lowest", source, n), lambda: self._rolling(self.source(source), n, np.min))
+
+    def change(self) -> np.ndarray:
+        """收盘价逐根变动，第一根为NaN"""
+        return self._cached(("change",), lambda: np.concatenate(([np.nan], np.diff(self.bars.close))))
+
+    def wilder_gain_loss(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        def compute(sign):
+            change = self.change()[1:]
+            moves = np.maximum(sign * change, 0.0)
+            return np.concatenate(([np.nan], wilder(moves, n)))
+
+        return (
+            self._cached(("wilder_gain", n), lambda: compute(1.0)),
+            self._cached(("wilder_loss", n), lambda: compute(-1.0)),
+        )
+
+    def true_range(self) -> np.ndarray:
+        def compute():
+            high, low, close = self.bars.high, self.bars.low, self.bars.close
+            prev_close = np.concatenate(([close[0]], close[:-1])) if len(close) else close
+            return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+        return self._cached(("true_range",), compute)
+
+    @staticmethod
+    def _rolling(values: np.ndarray, n: int, reducer) -> np.ndarray:
+        out = np.full(len(values), np.nan)
+        if len(values) >= n:
+            out[n - 1:] = reducer(sliding_window_view(values, n), axis=1)
+        return out
+
+
+class IndicatorDefinition:
+    """指标定义：默认参数、输出列和计算函数"""
+
+    def __init__(self, name: str, defaults: IndicatorParams, outputs: Tuple[str, ...],
+                 function: IndicatorFunction, integer_params: int):
+        self.name = name
+        self.defaults = defaults
+        self.outputs = outputs
+        self.function = function
+        self.integer_params = integer_params  # 前几个参数必须为正整数（窗口长度）
+
+
+INDICATORS: Dict[str, IndicatorDefinition] = {}
+ALIASES: Dict[str, str] = {}
+
+
+def register_indicator(name: str, defaults: Sequence[float], outputs: Sequence[str] = ("value",),
+                       integer_params: Optional[int] = None, aliases: Sequence[str] = ()):
+    """注册指标计算函数，函数签名为 fn(ctx, *params) -> {输出列: 数组}"""
+    def decorator(function: IndicatorFunction) -> IndicatorFunction:
+        INDICATORS[name] = IndicatorDefinition(
+            name, tuple(defaults), tuple(outputs), function,
+            len(defaults) if integer_params is None else integer_params,
+        )
+        for alias in aliases:
+            ALIASES[alias] = name
+        return function
+    return decorator
+
+
+# ============================================================================
+# 指标
+# ============================================================================
+
+@register_indicator("ma", (5,), aliases=("sma",))
+def _ma(ctx: IndicatorContext, n):
+    return {"value": ctx.sma(n)}
+
+
+@register_indicator("ema", (12,))
+def _ema(ctx: IndicatorContext, n):
+    return {"value": ctx.ema(n)}
+
+
+@register_indicator("wma", (10,))
+def _wma(ctx: IndicatorContext, n):
+    close = ctx.bars.close
+    out = np.full(len(close), np.nan)
+    if len(close) >= n:
+        weights = np.arange(n, 0, -1, dtype=float)
+        out[n - 1:] = np.convolve(close, weights / weights.sum(), mode="valid")
+    return {"value": out}
+
+
+@register_indicator("std", (20,))
+def _std(ctx: IndicatorContext, n):
+    return {"value": ctx.std(n)}
+
+
+@register_indicator("vma", (5,))
+def _vma(ctx: IndicatorContext, n):
+    return {"value": ctx.sma(n, "volume")}
+
+
+@register_indicator("rsi", (14,))
+def _rsi(ctx: IndicatorContext, n):
+    return {"value": _rsi_from_averages(*ctx.wilder_gain_loss(n))}
+
+
+@register_indicator("macd", (12, 26, 9), outputs=("macd", "signal", "histogram"))
+def _macd(ctx: IndicatorContext, fast, slow, signal):
+    line = ctx.ema(fast) - ctx.ema(slow)
+    signal_line = ema(line, signal)
+    histogram = line - signal_line
+    warmup = max(fast, slow) - 1
+    for array in (line, signal_line, histogram):
+        array[:warmup] = np.nan
+    return {"macd": line, "signal": signal_line, "histogram": histogram}
+
+
+@register_indicator("boll", (20, 2), outputs=("upper", "middle", "lower"), integer_params=1, aliases=("bollinger",))
+def _boll(ctx: IndicatorContext, n, k):
+    middle, std = ctx.sma(n), ctx.std(n)
+    return {"upper": middle + k * std, "middle": middle, "lower": middle - k * std}
+
+
+@register_indicator("atr", (14,))
+def _atr(ctx: IndicatorContext, n):
+    return {"value": wilder(ctx.true_range(), n)}
+
+
+@register_indicator("kdj", (9, 3, 3), outputs=("k", "d", "j"))
+def _kdj(ctx: IndicatorContext, n, m1, m2):
+    close = ctx.bars.close
+    k = np.full(len(close), np.nan)
+    d = np.full(len(close), np.nan)
+    if len(close) >= n:
+        highest, lowest = ctx.highest(n)[n - 1:], ctx.lowest(n)[n - 1:]
+        span = highest - lowest
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsv = np.where(span > 0, (close[n - 1:] - lowest) / span * 100.0, 50.0)
+        # K = (m1-1)/m1 * K前值 + RSV/m1，K和D的初值为50
+        k[n - 1:], _ = lfilter([1.0 / m1], [1.0, 1.0 / m1 - 1.0], rsv, zi=[(1.0 - 1.0 / m1) * 50.0])
+        d[n - 1:], _ = lfilter([1.0 / m2], [1.0, 1.0 / m2 - 1.0], k[n - 1:], zi=[(1.0 - 1.0 / m2) * 50.0])
+    return {"k": k, "d": d, "j": 3.0 * k - 2.0 * d}
+
+
+@register_indicator("cci", (20,))
+def _cci(ctx: IndicatorContext, n):
+    typical = ctx.source("typical")
+    mean = ctx.sma(n, "typical")
+    out = np.full(len(typical), np.nan)
+    if len(typical) >= n:
+        windows = sliding_window_view(typical, n)
+        deviation = np.abs(windows - mean[n - 1:, None]).mean(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[n - 1:] = np.where(deviation > 0, (typical[n - 1:] - mean[n - 1:]) / (0.015 * deviation), 0.0)
+    return {"value": out}
+
+
+@register_indicator("wr", (14,))
+def _wr(ctx: IndicatorContext, n):
+    highest, lowest = ctx.highest(n), ctx.lowest(n)
+    span = highest - lowest
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = np.where(span > 0, (highest - ctx.bars.close) / span * 100.0, 50.0)
+    return {"value": np.where(np.isnan(span), np.nan, value)}
+
+
+@register_indicator("obv", ())
+def _obv(ctx: IndicatorContext):
+    change = np.nan_to_num(ctx.change())
+    return {"value": np.cumsum(np.sign(change) * ctx.bars.volume)}
+
+
+@register_indicator("roc", (12,))
+def _roc(ctx: IndicatorContext, n):
+    prev = _shift(ctx.bars.close, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"value": (ctx.bars.close / prev - 1.0) * 100.0}
+
+
+@register_indicator("mom", (10,))
+def _mom(ctx: IndicatorContext, n):
+    return {"value": ctx.bars.close - _shift(ctx.bars.close, n)}
+
+
+@register_indicator("bias", (6,))
+def _bias(ctx: IndicatorContext, n):
+    mean = ctx.sma(n)
+    return {"value": (ctx.bars.close - mean) / mean * 100.0}
+
+
+# ============================================================================
+# 请求解析
+# ============================================================================
+
+class IndicatorSpec:
+    """一个指标请求：名称和完整参数"""
+
+    __slots__ = ("name", "params", "key")
+
+    def __init__(self, name: str, params: IndicatorParams):
+        self.name = name
+        self.params = params
+        self.key = f"{name}({','.join(_format_param(p) for p in params)})" if params else name
+
+    @property
+    def definition(self) -> IndicatorDefinition:
+        return INDICATORS[self.name]
+
+    def __repr__(self):
+        return f"IndicatorSpec({self.key})"
+
+
+def _format_param(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def parse_indicator_spec(spec: Union[str, Dict[str, Any]]) -> IndicatorSpec:
+    """解析 "rsi"、{"ema": 12}、{"macd": [12, 26, 9]} 形式的指标请求"""
+    if isinstance(spec, str):
+        name, raw = spec, None
+    elif isinstance(spec, dict) and len(spec) == 1:
+        name, raw = next(iter(spec.items()))
+    else:
+        raise ValidationError(f"无效的指标格式: {spec}")
+
+    name = ALIASES.get(str(name).lower(), str(name).lower())
+    definition = INDICATORS.get(name)
+    if definition is None:
+        raise ValidationError(f"不支持的指标: {name}", details={"supported": sorted(INDICATORS)})
+
+    if raw is None:
+        values = []
+    elif isinstance(raw, (list, tuple)):
+        values = list(raw)
+    else:
+        values = [raw]
+    if len(values) > len(definition.defaults):
+        raise ValidationError(f"指标 {name} 最多 {len(definition.defaults)} 个参数")
+
+    params = []
+    for i, default in enumerate(definition.defaults):
+        value = values[i] if i < len(values) and values[i] is not None else default
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValidationError(f"指标 {name} 参数无效: {value}")
+        if i < definition.integer_params:
+            if not value.is_integer() or value < 1:
+                raise ValidationError(f"指标 {name} 的窗口参数必须为正整数: {value}")
+            value = int(value)
+        params.append(value)
+    return IndicatorSpec(name, tuple(params))
+
+
+def parse_indicator_specs(specs: Iterable[Union[str, Dict[str, Any]]]) -> List[IndicatorSpec]:
+    """解析指标请求列表，重复的指标只保留一个"""
+    parsed = OrderedDict()
+    for spec in specs:
+        item = parse_indicator_spec(spec)
+        parsed.setdefault(item.key, item)
+    return list(parsed.values())
+
+
+# ============================================================================
+# 计算与缓存
+# ============================================================================
+
+class IndicatorSeriesCache:
+    """指标序列的进程内LRU缓存"""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Dict[str, np.ndarray]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Dict[str, np.ndarray]]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Tuple, value: Dict[str, np.ndarray]):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+series_cache = IndicatorSeriesCache()
+
+
+def compute_series(
+    symbol: str,
+    period: str,
+    bars: BarArrays,
+    specs: Sequence[IndicatorSpec],
+    cache: Optional[IndicatorSeriesCache] = series_cache
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """计算一个合约的多个指标，返回 {指标键: {输出列: 数组}}
+
+    缓存键含K线数：EMA类指标的值与起始K线有关，同一最后K线不同长度的结果不同
+    """
+    results: Dict[str, Dict[str, np.ndarray]] = {}
+    ctx: Optional[IndicatorContext] = None
+    last_bar_time = bars.last_bar_time
+
+    for spec in specs:
+        key = (symbol, period, spec.name, spec.params, len(bars), last_bar_time)
+        columns = cache.get(key) if cache is not None else None
+        if columns is None:
+            if ctx is None:
+                ctx = IndicatorContext(bars)
+            columns = spec.definition.function(ctx, *spec.params)
+            if cache is not None:
+                cache.set(key, columns)
+        results[spec.key] = columns
+    return results
+
+
+def to_json_list(values: np.ndarray, decimals: Optional[int] = 4) -> List[Optional[float]]:
+    """数组转为JSON列表，NaN和无穷转为None"""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, decimals) if decimals is not None else values
+    invalid = ~np.isfinite(values)
+    if not invalid.any():
+        return rounded.tolist()
+    result = rounded.astype(object)
+    result[invalid] = None
+    return result.tolist()
+
+
+def columns_to_json(
+    series: Dict[str, Dict[str, np.ndarray]],
+    tail: Optional[int] = None,
+    decimals: Optional[int] = 4
+) -> Dict[str, Dict[str, List[Optional[float]]]]:
+    """指标结果转为列式JSON，tail只保留最后N个点"""
+    return {
+        key: {
+            name: to_json_list(array[-tail:] if tail else array, decimals)
+            for name, array in columns.items()
+        }
+        for key, columns in series.items()
+    }
+
+
+def list_indicators() -> List[Dict[str, Any]]:
+    """可用指标及默认参数"""
+    return [
+        {
+            "name": name,
+            "defaults": list(definition.defaults),
+            "outputs": list(definition.outputs),
+            "aliases": [alias for alias, target in ALIASES.items() if target == name],
+        }
+        for name, definition in sorted(INDICATORS.items())
+    ]
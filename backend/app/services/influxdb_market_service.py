@@ -8,6 +8,7 @@ import asyncio
 import logging
 
 from ..core.influxdb import influx_manager
+from ..core.influxdb_writer import influx_writer
 from ..core.config import settings
 from ..schemas.market import QuoteData, KlineData
 
@@ -19,11 +20,7 @@ class InfluxDBMarketService:
     
     def __init__(self):
         self.influx_manager = influx_manager
-        self.batch_size = 100
-        self.batch_timeout = 5  # 秒
-        self._quote_batch = []
-        self._kline_batch = []
-        self._last_flush_time = datetime.utcnow()
+        self.writer = influx_writer
     
     async def store_quote(self, symbol: str, quote_data: Dict[str, Any]) -> bool:
         """存储单个行情数据"""
@@ -33,17 +30,8 @@ class InfluxDBMarketService:
                 logger.warning(f"行情数据验证失败: {symbol}")
                 return False
             
-            # 添加到批处理队列
-            self._quote_batch.append({
-                'symbol': symbol,
-                'data': quote_data,
-                'timestamp': datetime.utcnow()
-            })
-            
-            # 检查是否需要刷新批处理
-            await self._check_and_flush_quotes()
-            
-            return True
+            # 进入批量写入队列，由后台任务刷新
+            return await self.writer.write_quote(symbol, quote_data)
             
         except Exception as e:
             logger.error(f"存储行情数据失败 {symbol}: {e}")
@@ -57,18 +45,8 @@ class InfluxDBMarketService:
                 logger.warning(f"K线数据验证失败: {symbol}")
                 return False
             
-            # 添加到批处理队列
-            self._kline_batch.append({
-                'symbol': symbol,
-                'period': period,
-                'data': kline_data,
-                'timestamp': datetime.utcnow()
-            })
-            
-            # 检查是否需要刷新批处理
-            await self._check_and_flush_klines()
-            
-            return True
+            # 进入批量写入队列，由后台任务刷新
+            return await self.writer.write_kline(symbol, kline_data, period)
             
         except Exception as e:
             logger.error(f"存储K线数据失败 {symbol}: {e}")
@@ -78,59 +56,20 @@ class InfluxDBMarketService:
         """批量存储行情数据"""
         success_count = 0
         
-        try:
-            from influxdb_client import Point, WritePrecision
-            
-            points = []
-            for quote in quotes:
-                try:
-                    symbol = quote.get('symbol')
-                    data = quote.get('data', {})
-                    
-                    if not symbol or not self._validate_quote_data(data):
-                        continue
-                    
-                    point = (
-                        Point("quotes")
-                        .tag("symbol", symbol)
-                        .tag("exchange", data.get("exchange", "unknown"))
-                        .field("last_price", float(data.get("last_price", 0)))
-                        .field("bid_price", float(data.get("bid_price", 0)))
-                        .field("ask_price", float(data.get("ask_price", 0)))
-                        .field("bid_volume", int(data.get("bid_volume", 0)))
-                        .field("ask_volume", int(data.get("ask_volume", 0)))
-                        .field("volume", int(data.get("volume", 0)))
-                        .field("open_interest", int(data.get("open_interest", 0)))
-                        .field("open", float(data.get("open", 0)))
-                        .field("high", float(data.get("high", 0)))
-                        .field("low", float(data.get("low", 0)))
-                        .field("pre_close", float(data.get("pre_close", 0)))
-                        .field("change", float(data.get("change", 0)))
-                        .field("change_percent", float(data.get("change_percent", 0)))
-                        .time(data.get("datetime", datetime.utcnow()), WritePrecision.MS)
-                    )
-                    
-                    points.append(point)
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.warning(f"处理行情数据失败 {quote.get('symbol')}: {e}")
+        for quote in quotes:
+            try:
+                symbol = quote.get('symbol')
+                data = quote.get('data', {})
+                
+                if not symbol or not self._validate_quote_data(data):
                     continue
-            
-            if points:
-                # 写入InfluxDB
-                await asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: self.influx_manager.write_api.write(
-                        bucket=settings.INFLUXDB_BUCKET, 
-                        record=points
-                    )
-                )
                 
-                logger.info(f"批量存储行情数据成功: {len(points)}条")
-            
-        except Exception as e:
-            logger.error(f"批量存储行情数据失败: {e}")
+                if await self.writer.write_quote(symbol, data):
+                    success_count += 1
+                    
+            except Exception as e:
+                logger.warning(f"处理行情数据失败 {quote.get('symbol')}: {e}")
+                continue
         
         return success_count
     
@@ -138,54 +77,20 @@ class InfluxDBMarketService:
         """批量存储K线数据"""
         success_count = 0
         
-        try:
-            from influxdb_client import Point, WritePrecision
-            
-            points = []
-            for kline in klines:
-                try:
-                    symbol = kline.get('symbol')
-                    period = kline.get('period', '1m')
-                    data = kline.get('data', {})
-                    
-                    if not symbol or not self._validate_kline_data(data):
-                        continue
-                    
-                    point = (
-                        Point("klines")
-                        .tag("symbol", symbol)
-                        .tag("period", period)
-                        .tag("exchange", data.get("exchange", "unknown"))
-                        .field("open", float(data.get("open", 0)))
-                        .field("high", float(data.get("high", 0)))
-                        .field("low", float(data.get("low", 0)))
-                        .field("close", float(data.get("close", 0)))
-                        .field("volume", int(data.get("volume", 0)))
-                        .field("open_interest", int(data.get("open_interest", 0)))
-                        .time(data.get("datetime", datetime.utcnow()), WritePrecision.MS)
-                    )
-                    
-                    points.append(point)
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.warning(f"处理K线数据失败 {kline.get('symbol')}: {e}")
+        for kline in klines:
+            try:
+                symbol = kline.get('symbol')
+                data = kline.get('data', {})
+                
+                if not symbol or not self._validate_kline_data(data):
                     continue
-            
-            if points:
-                # 写入InfluxDB
-                await asyncio.get_event_loop().run_in_executor(
-                    None, 
-                    lambda: self.influx_manager.write_api.write(
-                        bucket=settings.INFLUXDB_BUCKET, 
-                        record=points
-                    )
-                )
                 
-                logger.info(f"批量存储K线数据成功: {len(points)}条")
-            
-        except Exception as e:
-            logger.error(f"批量存储K线数据失败: {e}")
+                if await self.writer.write_kline(symbol, data, kline.get('period', '1m')):
+                    success_count += 1
+                    
+            except Exception as e:
+                logger.warning(f"处理K线数据失败 {kline.get('symbol')}: {e}")
+                continue
         
         return success_count
     
@@ -314,32 +219,6 @@ class InfluxDBMarketService:
             logger.error(f"获取最新行情失败 {symbol}: {e}")
             return None
     
-    async def _check_and_flush_quotes(self):
-        """检查并刷新行情批处理"""
-        now = datetime.utcnow()
-        
-        # 检查批处理大小或时间间隔
-        if (len(self._quote_batch) >= self.batch_size or 
-            (now - self._last_flush_time).seconds >= self.batch_timeout):
-            
-            if self._quote_batch:
-                await self.store_quotes_batch(self._quote_batch)
-                self._quote_batch.clear()
-                self._last_flush_time = now
-    
-    async def _check_and_flush_klines(self):
-        """检查并刷新K线批处理"""
-        now = datetime.utcnow()
-        
-        # 检查批处理大小或时间间隔
-        if (len(self._kline_batch) >= self.batch_size or 
-            (now - self._last_flush_time).seconds >= self.batch_timeout):
-            
-            if self._kline_batch:
-                await self.store_klines_batch(self._kline_batch)
-                self._kline_batch.clear()
-                self._last_flush_time = now
-    
     def _validate_quote_data(self, data: Dict[str, Any]) -> bool:
         """验证行情数据"""
         required_fields = ['last_price']
@@ -353,15 +232,7 @@ class InfluxDBMarketService:
     async def flush_all_batches(self):
         """刷新所有批处理数据"""
         try:
-            if self._quote_batch:
-                await self.store_quotes_batch(self._quote_batch)
-                self._quote_batch.clear()
-            
-            if self._kline_batch:
-                await self.store_klines_batch(self._kline_batch)
-                self._kline_batch.clear()
-            
-            self._last_flush_time = datetime.utcnow()
+            await self.writer.flush()
             logger.info("所有批处理数据已刷新")
             
         except Exception as e:
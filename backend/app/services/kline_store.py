@@ -0,0 +1,300 @@
+"""
+本地K线列式存储
+
+K线按 合约/周期/分区 存为Arrow IPC文件，读取时内存映射直接得到NumPy列，
+不为每根K线创建Python对象。分区内数据按时间排序，增量写入时只重写涉及的分区。
+
+索引为无时区的UTC时间；查询参数中无时区的时间按本地时间处理（与InfluxDB查询参数一致），
+分区和同步清单的日期都按UTC划分。
+
+目录结构::
+
+    {root}/{symbol}/{period}/2024-01.arrow   # 日内周期按月分区
+    {root}/{symbol}/86400/2024.arrow         # 日线按年分区
+    {root}/{symbol}/{period}/_manifest.json  # 已同步完成的日期（UTC）
+"""
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from ..core.config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+KLINE_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'open_interest')
+
+MANIFEST_FILE = "_manifest.json"
+
+
+def empty_kline_frame() -> pd.DataFrame:
+    """空的K线DataFrame"""
+    return pd.DataFrame(
+        {name: np.array([], dtype=np.float64) for name in KLINE_FIELDS},
+        index=pd.DatetimeIndex([], dtype='datetime64[ns]', name='datetime')
+    )
+
+
+def to_utc(value: datetime) -> datetime:
+    """转换为UTC时间，无时区的按本地时间处理"""
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    return value.astimezone(timezone.utc)
+
+
+def utc_days(start_time: datetime, end_time: datetime) -> List[date]:
+    """时间范围覆盖的UTC日期"""
+    return list(pd.date_range(to_utc(start_time).date(), to_utc(end_time).date(), freq='D').date)
+
+
+def _to_datetime64(value: datetime) -> np.datetime64:
+    """转换为与索引一致的无时区UTC纳秒时间，无时区的按本地时间处理"""
+    return pd.Timestamp(to_utc(value)).tz_convert(None).to_datetime64().astype('datetime64[ns]')
+
+
+def normalize_kline_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """统一为按时间排序、无重复、float64列、无时区UTC纳秒索引的K线DataFrame
+
+    带时区的索引转换为UTC，无时区的索引视为UTC
+    """
+    if df is None or df.empty:
+        return empty_kline_frame()
+
+    if 'datetime' in df.columns:
+        df = df.set_index('datetime')
+
+    index = pd.to_datetime(df.index)
+    if index.tz is not None:
+        index = index.tz_convert(None)
+
+    frame = pd.DataFrame(
+        {
+            name: pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+            if name in df.columns else np.zeros(len(df))
+            for name in KLINE_FIELDS
+        },
+        index=pd.DatetimeIndex(index.to_numpy(dtype='datetime64[ns]'), name='datetime')
+    )
+    frame = frame.dropna(subset=['close'])
+    frame = frame[~frame.index.duplicated(keep='last')]
+    return frame.sort_index()
+
+
+class KlineStore:
+    """本地K线列式存储"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    @property
+    def enabled(self) -> bool:
+        return PYARROW_AVAILABLE
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def write(self, symbol: str, period: int, df: pd.DataFrame) -> int:
+        """合并写入K线，已存在的同一时间K线会被覆盖，返回写入的K线数"""
+        if not self.enabled:
+            return 0
+
+        frame = normalize_kline_frame(df)
+        if frame.empty:
+            return 0
+
+        # 索引已排序，同一分区的K线连续
+        buckets = self._partition_buckets(period, frame.index)
+        bounds = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1, [len(frame)]))
+        for begin, stop in zip(bounds[:-1], bounds[1:]):
+            key = str(buckets[begin])
+            part = frame.iloc[begin:stop]
+            existing = self._read_partition(self._partition_path(symbol, period, key))
+            if existing is not None and not existing.empty:
+                part = normalize_kline_frame(pd.concat([existing, part]))
+            self._write_partition(self._partition_path(symbol, period, key), part)
+
+        return len(frame)
+
+    def mark_synced(self, symbol: str, period: int, days: Iterable[date]):
+        """记录已完整同步的日期（UTC），之后不再从数据源重新拉取"""
+        synced = self.synced_days(symbol, period)
+        synced.update(days)
+        path = os.path.join(self._directory(symbol, period), MANIFEST_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(day.isoformat() for day in synced), f)
+        os.replace(tmp_path, path)
+
+    def synced_days(self, symbol: str, period: int) -> Set[date]:
+        """已完整同步的日期（UTC）"""
+        path = os.path.join(self._directory(symbol, period), MANIFEST_FILE)
+        try:
+            with open(path) as f:
+                return {date.fromisoformat(day) for day in json.load(f)}
+        except FileNotFoundError:
+            return set()
+        except Exception as e:
+            logger.warning(f"读取K线存储清单失败 {path}: {e}")
+            return set()
+
+    def clear(self, symbol: Optional[str] = None):
+        """删除本地存储"""
+        path = os.path.join(self.root_dir, self._safe_name(symbol)) if symbol else self.root_dir
+        shutil.rmtree(path, ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def read(
+        self,
+        symbol: str,
+        period: int,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """读取时间范围内的K线（闭区间）"""
+        if not self.enabled:
+            return empty_kline_frame()
+
+        tables = []
+        for path in self._partition_paths(symbol, period, start_time, end_time):
+            table = self._map_partition(path)
+            if table is not None and table.num_rows:
+                tables.append(table)
+
+        if not tables:
+            return empty_kline_frame()
+
+        index = np.concatenate([self._column(table, 'datetime') for table in tables])
+        values = np.empty((len(index), len(KLINE_FIELDS)), dtype=np.float64, order='F')
+        for j, name in enumerate(KLINE_FIELDS):
+            np.concatenate([self._column(table, name) for table in tables], out=values[:, j])
+
+        begin = np.searchsorted(index, _to_datetime64(start_time), side='left') if start_time else 0
+        stop = np.searchsorted(index, _to_datetime64(end_time), side='right') if end_time else len(index)
+
+        return pd.DataFrame(
+            values[begin:stop],
+            index=pd.DatetimeIndex(index[begin:stop], name='datetime'),
+            columns=list(KLINE_FIELDS),
+            copy=False
+        )
+
+    def read_many(
+        self,
+        symbols: List[str],
+        period: int,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """读取多个合约，没有数据的合约不出现在结果中"""
+        data = {}
+        for symbol in symbols:
+            df = self.read(symbol, period, start_time, end_time)
+            if not df.empty:
+                data[symbol] = df
+        return data
+
+    # ------------------------------------------------------------------
+    # 分区
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _partition_format(period: int) -> str:
+        return "%Y" if period >= 86400 else "%Y-%m"
+
+    @staticmethod
+    def _partition_buckets(period: int, index: pd.DatetimeIndex) -> np.ndarray:
+        """按年或月截断的时间，字符串形式即分区名"""
+        unit = 'Y' if period >= 86400 else 'M'
+        return index.to_numpy(dtype='datetime64[ns]').astype(f'datetime64[{unit}]')
+
+    def _partition_paths(self, symbol: str, period: int, start_time: Optional[datetime],
+                         end_time: Optional[datetime]) -> List[str]:
+        """按时间范围筛选分区文件，分区名按字典序即时间顺序"""
+        directory = self._directory(symbol, period)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.arrow'))
+        except FileNotFoundError:
+            return []
+
+        fmt = self._partition_format(period)
+        first = pd.Timestamp(_to_datetime64(start_time)).strftime(fmt) if start_time else None
+        last = pd.Timestamp(_to_datetime64(end_time)).strftime(fmt) if end_time else None
+
+        return [
+            os.path.join(directory, name) for name in names
+            if (first is None or name[:-6] >= first) and (last is None or name[:-6] <= last)
+        ]
+
+    def _partition_path(self, symbol: str, period: int, key: str) -> str:
+        return os.path.join(self._directory(symbol, period), f"{key}.arrow")
+
+    def _directory(self, symbol: str, period: int) -> str:
+        return os.path.join(self.root_dir, self._safe_name(symbol), str(period))
+
+    @staticmethod
+    def _safe_name(symbol: str) -> str:
+        return re.sub(r'[^\w.\-]', '_', symbol)
+
+    @staticmethod
+    def _map_partition(path: str) -> Optional["pa.Table"]:
+        """内存映射打开分区文件"""
+        try:
+            return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取K线分区失败 {path}: {e}")
+            return None
+
+    @staticmethod
+    def _column(table: "pa.Table", name: str) -> np.ndarray:
+        column = table.column(name)
+        if column.num_chunks == 1:
+            return column.chunk(0).to_numpy()
+        return column.to_numpy()
+
+    def _read_partition(self, path: str) -> Optional[pd.DataFrame]:
+        table = self._map_partition(path)
+        if table is None:
+            return None
+        return pd.DataFrame(
+            {name: self._column(table, name) for name in KLINE_FIELDS},
+            index=pd.DatetimeIndex(self._column(table, 'datetime'), name='datetime')
+        )
+
+    @staticmethod
+    def _write_partition(path: str, frame: pd.DataFrame):
+        """先写临时文件再替换，读者不会看到写了一半的分区"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.table({
+            'datetime': pa.array(frame.index.to_numpy(dtype='datetime64[ns]')),
+            **{name: pa.array(frame[name].to_numpy(dtype=np.float64)) for name in KLINE_FIELDS}
+        })
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+
+# 全局K线存储实例
+kline_store = KlineStore(settings.KLINE_STORE_DIR)
@@ -6,9 +6,9 @@ import logging
 from typing import Dict, List, Optional, Any, Callable
 from datetime import datetime, timedelta
 import json
-import numpy as np
 
 from .tqsdk_adapter import tqsdk_adapter
+from .indicator_engine import apply_indicators, indicator_engine
 from ..core.database import get_redis_client
 
 logger = logging.getLogger(__name__)
@@ -354,6 +354,9 @@ class MarketDataService:
             if klines:
                 klines = self._add_technical_indicators(klines)
                 
+                # 建立增量指标状态，之后的行情只更新最后一根K线的指标
+                await indicator_engine.track(symbol, period, klines)
+                
                 # 缓存K线数据
                 cache_timeout = 60 if period in ["1m", "5m"] else 300  # 短周期缓存时间短
                 self.redis_client.setex(cache_key, cache_timeout, json.dumps(klines))
@@ -365,146 +368,17 @@ class MarketDataService:
             return []
     
     def _add_technical_indicators(self, klines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """添加技术指标"""
+        """添加技术指标（对整段K线向量化计算）"""
         try:
             if len(klines) < 20:
                 return klines
             
-            # 转换为numpy数组便于计算
-            closes = np.array([float(k["close"]) for k in klines])
-            highs = np.array([float(k["high"]) for k in klines])
-            lows = np.array([float(k["low"]) for k in klines])
-            volumes = np.array([float(k["volume"]) for k in klines])
-            
-            # 计算移动平均线
-            for i in range(len(klines)):
-                # MA5
-                if i >= 4:
-                    ma5 = np.mean(closes[i-4:i+1])
-                    klines[i]["ma5"] = round(float(ma5), 2)
-                
-                # MA10
-                if i >= 9:
-                    ma10 = np.mean(closes[i-9:i+1])
-                    klines[i]["ma10"] = round(float(ma10), 2)
-                
-                # MA20
-                if i >= 19:
-                    ma20 = np.mean(closes[i-19:i+1])
-                    klines[i]["ma20"] = round(float(ma20), 2)
-                
-                # 计算RSI
-                if i >= 13:
-                    rsi = self._calculate_rsi(closes[max(0, i-13):i+1])
-                    klines[i]["rsi"] = round(float(rsi), 2)
-                
-                # 计算MACD
-                if i >= 25:
-                    macd_data = self._calculate_macd(closes[:i+1])
-                    if macd_data:
-                        klines[i]["macd"] = round(float(macd_data["macd"]), 4)
-                        klines[i]["macd_signal"] = round(float(macd_data["signal"]), 4)
-                        klines[i]["macd_histogram"] = round(float(macd_data["histogram"]), 4)
-                
-                # 计算布林带
-                if i >= 19:
-                    bb_data = self._calculate_bollinger_bands(closes[i-19:i+1])
-                    if bb_data:
-                        klines[i]["bb_upper"] = round(float(bb_data["upper"]), 2)
-                        klines[i]["bb_middle"] = round(float(bb_data["middle"]), 2)
-                        klines[i]["bb_lower"] = round(float(bb_data["lower"]), 2)
-            
-            return klines
+            return apply_indicators(klines)
             
         except Exception as e:
             logger.error(f"计算技术指标失败: {e}")
             return klines
     
-    def _calculate_rsi(self, prices: np.ndarray, period: int = 14) -> float:
-        """计算RSI指标"""
-        try:
-            if len(prices) < period + 1:
-                return 50.0
-            
-            deltas = np.diff(prices)
-            gains = np.where(deltas > 0, deltas, 0)
-            losses = np.where(deltas < 0, -deltas, 0)
-            
-            avg_gain = np.mean(gains[-period:])
-            avg_loss = np.mean(losses[-period:])
-            
-            if avg_loss == 0:
-                return 100.0
-            
-            rs = avg_gain / avg_loss
-            rsi = 100 - (100 / (1 + rs))
-            
-            return rsi
-            
-        except:
-            return 50.0
-    
-    def _calculate_macd(self, prices: np.ndarray) -> Optional[Dict[str, float]]:
-        """计算MACD指标"""
-        try:
-            if len(prices) < 26:
-                return None
-            
-            # 计算EMA
-            ema12 = self._calculate_ema(prices, 12)
-            ema26 = self._calculate_ema(prices, 26)
-            
-            macd_line = ema12 - ema26
-            signal_line = self._calculate_ema(np.array([macd_line]), 9)
-            histogram = macd_line - signal_line
-            
-            return {
-                "macd": macd_line,
-                "signal": signal_line,
-                "histogram": histogram
-            }
-            
-        except:
-            return None
-    
-    def _calculate_ema(self, prices: np.ndarray, period: int) -> float:
-        """计算指数移动平均"""
-        try:
-            if len(prices) == 0:
-                return 0.0
-            
-            alpha = 2.0 / (period + 1)
-            ema = prices[0]
-            
-            for price in prices[1:]:
-                ema = alpha * price + (1 - alpha) * ema
-            
-            return ema
-            
-        except:
-            return 0.0
-    
-    def _calculate_bollinger_bands(self, prices: np.ndarray, period: int = 20, std_dev: float = 2.0) -> Optional[Dict[str, float]]:
-        """计算布林带"""
-        try:
-            if len(prices) < period:
-                return None
-            
-            middle = np.mean(prices)
-            std = np.std(prices)
-            
-            upper = middle + (std_dev * std)
-            lower = middle - (std_dev * std)
-            
-            return {
-                "upper": upper,
-                "middle": middle,
-                "lower": lower
-            }
-            
-        except:
-            return None
-    
     async def subscribe_quotes(self, symbols: List[str]) -> bool:
         """订阅行情"""
         try:
@@ -9,8 +9,10 @@ import json
 
 from ..services.tqsdk_adapter import tqsdk_adapter
 from ..core.database import get_redis_client
+from ..core.tiered_cache import tiered_cache
+from ..core.cache import count_keys
 from ..core.exceptions import ExternalServiceError, ValidationError
-from ..core.influxdb import influx_manager
+from ..core.influxdb_writer import influx_writer
 from ..schemas.market import (
     InstrumentInfo,
     QuoteData,
@@ -78,34 +80,33 @@ class MarketService:
     ) -> List[InstrumentInfo]:
         """获取合约信息列表"""
         try:
-            # 从适配器获取合约信息
-            instruments_data = await tqsdk_adapter.get_instruments(
-                exchange=filter_params.exchange if filter_params else None
+            exchange = filter_params.exchange if filter_params else None
+            instruments = await tiered_cache.get_or_load(
+                "instruments", exchange or "*",
+                lambda: self._load_instruments(exchange),
+                ttl=self._instrument_cache_ttl,
             )
-            
-            instruments = []
-            for data in instruments_data:
-                # 应用过滤条件
-                if filter_params:
-                    if filter_params.product_id and data.get("product_id") != filter_params.product_id:
-                        continue
-                    if filter_params.expired is not None and data.get("expired") != filter_params.expired:
-                        continue
-                    if filter_params.keyword:
-                        keyword = filter_params.keyword.lower()
-                        if (keyword not in data.get("symbol", "").lower() and 
-                            keyword not in data.get("name", "").lower()):
-                            continue
-                
-                instrument = InstrumentInfo(**data)
-                instruments.append(instrument)
-            
-            logger.info(f"获取到{len(instruments)}个合约信息")
+
+            if filter_params:
+                keyword = filter_params.keyword.lower() if filter_params.keyword else None
+                instruments = [
+                    instrument for instrument in instruments
+                    if (not filter_params.product_id or instrument.product_id == filter_params.product_id)
+                    and (filter_params.expired is None or instrument.expired == filter_params.expired)
+                    and (not keyword or keyword in instrument.symbol.lower() or keyword in instrument.name.lower())
+                ]
+
+            logger.debug(f"获取到{len(instruments)}个合约信息")
             return instruments
             
         except Exception as e:
             logger.error(f"获取合约信息失败: {e}")
             raise ExternalServiceError(f"获取合约信息失败: {str(e)}")
+
+    async def _load_instruments(self, exchange: Optional[str]) -> List[InstrumentInfo]:
+        """从适配器加载合约信息，结果由两级缓存保存"""
+        instruments_data = await tqsdk_adapter.get_instruments(exchange=exchange)
+        return [InstrumentInfo(**data) for data in instruments_data]
     
     async def get_instrument_by_symbol(self, symbol: str) -> Optional[InstrumentInfo]:
         """根据合约代码获取合约信息"""
@@ -345,8 +346,8 @@ class MarketService:
         """获取市场数据统计"""
         try:
             # 从Redis获取统计信息
-            quote_count = len(self.redis_client.keys("quote:*"))
-            kline_count = len(self.redis_client.keys("klines:*"))
+            quote_count = await asyncio.to_thread(count_keys, self.redis_client, "quote:*")
+            kline_count = await asyncio.to_thread(count_keys, self.redis_client, "klines:*")
             subscription_count = len(self._subscribed_symbols)
             
             # 简化的缓存命中率计算
@@ -372,8 +373,8 @@ class MarketService:
             # 验证和格式化数据
             validated_data = MarketDataValidator.validate_quote_data(quote_data)
             
-            # 存储到InfluxDB
-            influx_manager.write_quote(validated_data["symbol"], validated_data)
+            # 进入InfluxDB批量写入队列
+            await influx_writer.write_quote(validated_data["symbol"], validated_data)
             
         except Exception as e:
             logger.warning(f"存储行情数据到InfluxDB失败: {e}")
@@ -393,8 +394,8 @@ class MarketService:
             validated_data["symbol"] = symbol
             validated_data["period"] = f"{duration}s"
             
-            # 存储到InfluxDB
-            influx_manager.write_kline(symbol, validated_data)
+            # 进入InfluxDB批量写入队列
+            await influx_writer.write_kline(symbol, validated_data)
             
         except Exception as e:
             logger.warning(f"存储K线数据到InfluxDB失败: {e}")
@@ -0,0 +1,423 @@
+"""
+模拟撮合引擎
+
+按合约维护挂单的价格优先队列（堆）：买限价单按价格从高到低、卖限价单从低到高，
+止损单按触发价排序。每根K线（或每笔深度行情）只弹出价格已被穿越的挂单，
+未触及的挂单不会被扫描，10万笔挂单时每根K线的撮合开销只与成交笔数相关。
+
+部分成交模型：
+- K线：每个方向最多成交 K线成交量 × 参与率；限价单只被触及（最低价恰好等于买价）时，
+  需先消耗排在前面的队列量 queue_ahead，被穿越时不受队列影响
+- 深度行情：吃掉对手盘口可见挂量，按档位价格成交
+
+撤单采用惰性删除：订单标记失效，弹出堆顶时跳过。
+回测执行器、订单执行模拟器与模拟交易适配器共用本引擎。
+"""
+
+import heapq
+import itertools
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BUY = "buy"
+SELL = "sell"
+MARKET = "market"
+LIMIT = "limit"
+STOP = "stop"
+STOP_LIMIT = "stop_limit"
+
+# 深度行情最多读取的档位
+DEPTH_LEVELS = 5
+
+_EPSILON = 1e-9
+
+
+def _value(item: Any) -> Any:
+    """枚举取值，兼容各模块各自定义的 OrderSide / OrderType"""
+    return getattr(item, "value", item)
+
+
+class BookOrder:
+    """撮合簿中的一笔订单"""
+
+    __slots__ = (
+        "order_id", "symbol", "side", "order_type", "quantity", "filled_quantity",
+        "price", "stop_price", "queue_ahead", "seq", "ref", "active",
+    )
+
+    def __init__(self, order_id: Any, symbol: str, side: str, order_type: str, quantity: float,
+                 price: Optional[float], stop_price: Optional[float], queue_ahead: float, seq: int, ref: Any):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.filled_quantity = 0.0
+        self.price = price
+        self.stop_price = stop_price
+        self.queue_ahead = queue_ahead
+        self.seq = seq
+        self.ref = ref
+        self.active = True
+
+    @property
+    def remaining(self) -> float:
+        return self.quantity - self.filled_quantity
+
+    @property
+    def is_filled(self) -> bool:
+        return self.remaining <= _EPSILON
+
+
+class MatchFill(NamedTuple):
+    """一次成交"""
+    order: BookOrder
+    quantity: float
+    price: float
+    liquidity: str  # maker/taker
+
+
+class _SymbolBook:
+    """单个合约的撮合簿"""
+
+    __slots__ = ("markets", "bids", "asks", "buy_stops", "sell_stops", "depth")
+
+    def __init__(self):
+        self.markets: Dict[str, Deque[BookOrder]] = {BUY: deque(), SELL: deque()}
+        # 堆元素为 (排序键, 序号, 订单)，序号保证同价位时间优先
+        self.bids: List[Tuple[float, int, BookOrder]] = []        # -价格
+        self.asks: List[Tuple[float, int, BookOrder]] = []        # 价格
+        self.buy_stops: List[Tuple[float, int, BookOrder]] = []   # 触发价，最高价向上穿越时触发
+        self.sell_stops: List[Tuple[float, int, BookOrder]] = []  # -触发价，最低价向下穿越时触发
+        self.depth: Optional[Dict[str, Any]] = None
+
+    def limit_heap(self, side: str) -> List[Tuple[float, int, BookOrder]]:
+        return self.bids if side == BUY else self.asks
+
+    def push_limit(self, order: BookOrder):
+        key = -order.price if order.side == BUY else order.price
+        heapq.heappush(self.limit_heap(order.side), (key, order.seq, order))
+
+    def push_stop(self, order: BookOrder):
+        if order.side == BUY:
+            heapq.heappush(self.buy_stops, (order.stop_price, order.seq, order))
+        else:
+            heapq.heappush(self.sell_stops, (-order.stop_price, order.seq, order))
+
+
+class MatchingEngine:
+    """模拟撮合引擎"""
+
+    def __init__(self, participation_rate: Optional[float] = None, slippage: float = 0.0):
+        self.participation_rate = (
+            settings.MATCHING_PARTICIPATION_RATE if participation_rate is None else participation_rate
+        )
+        self.slippage = slippage
+        self._books: Dict[str, _SymbolBook] = {}
+        self._orders: Dict[Any, BookOrder] = {}
+        self._seq = itertools.count()
+        self.fill_count = 0
+
+    # ------------------------------------------------------------------
+    # 挂单管理
+    # ------------------------------------------------------------------
+
+    def add(self, order_id: Any, symbol: str, side: Any, order_type: Any, quantity: float,
+            price: Optional[float] = None, stop_price: Optional[float] = None,
+            ref: Any = None, queue_ahead: Optional[float] = None) -> BookOrder:
+        """挂单，queue_ahead 为空时按最近一次深度行情中同价位的挂量估计"""
+        side, order_type = _value(side), _value(order_type)
+        if order_type not in (MARKET, LIMIT, STOP, STOP_LIMIT):
+            raise ValueError(f"不支持的订单类型: {order_type}")
+        if order_type in (LIMIT, STOP_LIMIT) and price is None:
+            raise ValueError("限价单必须指定价格")
+        if order_type in (STOP, STOP_LIMIT) and stop_price is None:
+            raise ValueError("止损单必须指定触发价")
+
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = _SymbolBook()
+
+        price = None if price is None else float(price)
+        if queue_ahead is None:
+            queue_ahead = self._displayed_volume(book.depth, side, price) if order_type == LIMIT else 0.0
+
+        order = BookOrder(
+            order_id, symbol, side, order_type, float(quantity), price,
+            None if stop_price is None else float(stop_price), float(queue_ahead), next(self._seq), ref
+        )
+        self._orders[order_id] = order
+
+        if order_type == MARKET:
+            book.markets[side].append(order)
+        elif order_type == LIMIT:
+            book.push_limit(order)
+        else:
+            book.push_stop(order)
+        return order
+
+    def cancel(self, order_id: Any) -> Optional[BookOrder]:
+        """撤单，订单留在堆中直到被弹出时丢弃"""
+        order = self._orders.pop(order_id, None)
+        if order is not None:
+            order.active = False
+        return order
+
+    def get(self, order_id: Any) -> Optional[BookOrder]:
+        return self._orders.get(order_id)
+
+    def orders(self, symbol: Optional[str] = None) -> List[BookOrder]:
+        """当前挂单（按挂单顺序）"""
+        orders = self._orders.values()
+        if symbol is not None:
+            orders = [order for order in orders if order.symbol == symbol]
+        return list(orders)
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def has_orders(self, symbol: str) -> bool:
+        book = self._books.get(symbol)
+        return book is not None and bool(
+            book.markets[BUY] or book.markets[SELL] or book.bids or book.asks or book.buy_stops or book.sell_stops
+        )
+
+    # ------------------------------------------------------------------
+    # K线撮合
+    # ------------------------------------------------------------------
+
+    def on_bar(self, symbol: str, bar: Dict[str, Any]) -> List[MatchFill]:
+        """用一根K线撮合该合约的挂单"""
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+
+        open_price, high, low = float(bar["open"]), float(bar["high"]), float(bar["low"])
+        volume = bar.get("volume")
+        # 没有成交量数据时不限制成交数量
+        capacity = float(volume) * self.participation_rate if volume else float("inf")
+        budget = {BUY: capacity, SELL: capacity}
+        fills: List[MatchFill] = []
+
+        # 1. 市价单按开盘价加滑点成交
+        for side in (BUY, SELL):
+            self._fill_markets(book, side, self._slipped(open_price, side), budget, fills)
+
+        # 2. 触发止损单：止损单转为市价单按触发价成交，止损限价单转入限价队列
+        for order in self._pop_triggered_stops(book, high, low):
+            if order.order_type == STOP:
+                book.markets[order.side].append(order)
+                self._fill_markets(book, order.side, self._slipped(order.stop_price, order.side), budget, fills)
+            else:
+                book.push_limit(order)
+
+        # 3. 限价单：买单 价格>=最低价、卖单 价格<=最高价 视为被触及
+        self._fill_limits(book, BUY, lambda price: price >= low, lambda price: price > low, budget, fills)
+        self._fill_limits(book, SELL, lambda price: price <= high, lambda price: price < high, budget, fills)
+
+        self.fill_count += len(fills)
+        return fills
+
+    def on_price(self, symbol: str, price: float, volume: Optional[float] = None) -> List[MatchFill]:
+        """用一笔成交价撮合（等价于开高低收相同的K线）"""
+        return self.on_bar(symbol, {"open": price, "high": price, "low": price, "close": price, "volume": volume})
+
+    def match_market(self, symbol: str, price: float, volume: Optional[float] = None) -> List[MatchFill]:
+        """只撮合市价单，用于按当前价格即时成交新下的市价单"""
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+
+        capacity = float(volume) * self.participation_rate if volume else float("inf")
+        budget = {BUY: capacity, SELL: capacity}
+        fills: List[MatchFill] = []
+        for side in (BUY, SELL):
+            self._fill_markets(book, side, self._slipped(float(price), side), budget, fills)
+
+        self.fill_count += len(fills)
+        return fills
+
+    # ------------------------------------------------------------------
+    # 深度行情撮合
+    # ------------------------------------------------------------------
+
+    def on_depth(self, symbol: str, quote: Dict[str, Any]) -> List[MatchFill]:
+        """用盘口快照撮合：市价单与被穿越的限价单吃掉对手盘可见挂量
+
+        quote 使用 bid_price1..5 / bid_volume1..5 / ask_price1..5 / ask_volume1..5 / last_price 字段
+        """
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = _SymbolBook()
+        book.depth = quote
+
+        levels = {BUY: self._levels(quote, "ask"), SELL: self._levels(quote, "bid")}
+        last_price = quote.get("last_price")
+        fills: List[MatchFill] = []
+
+        if last_price:
+            last_price = float(last_price)
+            for order in self._pop_triggered_stops(book, last_price, last_price):
+                if order.order_type == STOP:
+                    book.markets[order.side].append(order)
+                else:
+                    book.push_limit(order)
+
+        for side in (BUY, SELL):
+            markets = book.markets[side]
+            while markets:
+                order = markets[0]
+                if order.active:
+                    self._sweep(order, levels[side], None, fills)
+                    if not order.is_filled:
+                        break
+                markets.popleft()
+
+            heap = book.limit_heap(side)
+            while heap and levels[side]:
+                order = heap[0][2]
+                if order.active:
+                    if not self._crosses(side, order.price, levels[side][0][0]):
+                        break
+                    self._sweep(order, levels[side], order.price, fills)
+                    if not order.is_filled:
+                        break
+                heapq.heappop(heap)
+
+        self.fill_count += len(fills)
+        return fills
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "resting_orders": len(self._orders),
+            "symbols": len(self._books),
+            "fills": self.fill_count,
+            "participation_rate": self.participation_rate,
+        }
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+
+    def _slipped(self, price: float, side: str) -> float:
+        return price * (1 + self.slippage) if side == BUY else price * (1 - self.slippage)
+
+    def _fill(self, order: BookOrder, quantity: float, price: float, liquidity: str, fills: List[MatchFill]):
+        order.filled_quantity += quantity
+        if order.is_filled:
+            order.filled_quantity = order.quantity
+            order.active = False
+            self._orders.pop(order.order_id, None)
+        fills.append(MatchFill(order, quantity, price, liquidity))
+
+    def _fill_markets(self, book: _SymbolBook, side: str, price: float, budget: Dict[str, float],
+                      fills: List[MatchFill]):
+        markets = book.markets[side]
+        while markets and budget[side] > _EPSILON:
+            order = markets[0]
+            if order.active:
+                quantity = min(order.remaining, budget[side])
+                budget[side] -= quantity
+                self._fill(order, quantity, price, "taker", fills)
+                if not order.is_filled:
+                    break
+            markets.popleft()
+
+    def _pop_triggered_stops(self, book: _SymbolBook, high: float, low: float) -> List[BookOrder]:
+        triggered = []
+        while book.buy_stops and book.buy_stops[0][0] <= high:
+            order = heapq.heappop(book.buy_stops)[2]
+            if order.active:
+                triggered.append(order)
+        while book.sell_stops and -book.sell_stops[0][0] >= low:
+            order = heapq.heappop(book.sell_stops)[2]
+            if order.active:
+                triggered.append(order)
+        triggered.sort(key=lambda order: order.seq)
+        return triggered
+
+    def _fill_limits(self, book: _SymbolBook, side: str, touched, traded_through,
+                     budget: Dict[str, float], fills: List[MatchFill]):
+        """按价格优先弹出被触及的限价单，成交量受参与率与队列位置限制"""
+        heap = book.limit_heap(side)
+        while heap:
+            order = heap[0][2]
+            if not order.active:
+                heapq.heappop(heap)
+                continue
+            if not touched(order.price) or budget[side] <= _EPSILON:
+                break
+
+            available = budget[side]
+            if not traded_through(order.price) and order.queue_ahead > 0:
+                # 价格只是被触及：先轮到排在前面的挂单
+                consumed = min(order.queue_ahead, available)
+                order.queue_ahead -= consumed
+                available -= consumed
+                budget[side] -= consumed
+
+            quantity = min(order.remaining, available)
+            if quantity > _EPSILON:
+                budget[side] -= quantity
+                self._fill(order, quantity, order.price, "maker", fills)
+
+            if not order.is_filled:
+                break
+            heapq.heappop(heap)
+
+    @staticmethod
+    def _levels(quote: Dict[str, Any], prefix: str) -> List[List[float]]:
+        levels = []
+        for i in range(1, DEPTH_LEVELS + 1):
+            price, volume = quote.get(f"{prefix}_price{i}"), quote.get(f"{prefix}_volume{i}")
+            if price and volume and price == price:  # 排除NaN
+                levels.append([float(price), float(volume)])
+        return levels
+
+    @staticmethod
+    def _displayed_volume(depth: Optional[Dict[str, Any]], side: str, price: Optional[float]) -> float:
+        """同方向同价位的可见挂量，作为新挂单前面的队列量"""
+        if not depth or price is None:
+            return 0.0
+        prefix = "bid" if side == BUY else "ask"
+        for level_price, volume in MatchingEngine._levels(depth, prefix):
+            if abs(level_price - price) <= _EPSILON:
+                return volume
+        return 0.0
+
+    @staticmethod
+    def _crosses(side: str, limit: Optional[float], level_price: float) -> bool:
+        if limit is None:
+            return True
+        return level_price <= limit if side == BUY else level_price >= limit
+
+    def _sweep(self, order: BookOrder, levels: List[List[float]], limit: Optional[float],
+               fills: List[MatchFill]):
+        """按档位吃掉对手盘挂量"""
+        while levels and not order.is_filled and self._crosses(order.side, limit, levels[0][0]):
+            level = levels[0]
+            quantity = min(order.remaining, level[1])
+            level[1] -= quantity
+            self._fill(order, quantity, level[0], "taker", fills)
+            if level[1] <= _EPSILON:
+                levels.pop(0)
+
+
+def depth_liquidity(quote: Optional[Dict[str, Any]], side: Any, limit: Optional[float] = None) -> Optional[float]:
+    """盘口上可供 side 方向成交的对手盘挂量（limit 内），没有深度数据时返回None"""
+    if not quote:
+        return None
+    side = _value(side)
+    levels = MatchingEngine._levels(quote, "ask" if side == BUY else "bid")
+    if not levels:
+        return None
+    return sum(volume for price, volume in levels if MatchingEngine._crosses(side, limit, price))
@@ -10,20 +10,33 @@ from datetime import datetime
 from decimal import Decimal
 
 from ..models.order import Order, OrderStatus, OrderSide
-from ..core.order_execution_engine import order_execution_engine, ExecutionResult
+from ..core.order_execution_engine import (
+    order_execution_engine, order_repository, persist_order_fill, ExecutionResult
+)
 from ..adapters.trading_system_adapter import trading_system_manager, TradingSystemType
 from ..services.order_notification_service import order_notification_service
-from ..core.database import SessionLocal
+from ..core.database import async_session_scope
 
 logger = logging.getLogger(__name__)
 
+# 交易系统侧的终结状态，收到后停止跟踪该订单
+TERMINAL_EXTERNAL_STATUSES = ('filled', 'cancelled', 'rejected')
+
+ACTIVE_ORDER_STATUSES = [
+    OrderStatus.PENDING,
+    OrderStatus.SUBMITTED,
+    OrderStatus.ACCEPTED,
+    OrderStatus.PARTIALLY_FILLED
+]
+
 
 class OrderExecutionService:
     """订单执行服务"""
     
     def __init__(self):
         self.is_running = False
-        self.execution_tasks: Dict[int, asyncio.Task] = {}
+        self.tracked_orders: Dict[str, Order] = {}  # 外部订单ID -> 订单，由交易系统状态事件驱动更新
+        self.update_tasks: List[asyncio.Task] = []
         self.execution_stats = {
             'total_submitted': 0,
             'total_executed': 0,
@@ -47,8 +60,10 @@ class OrderExecutionService:
             # 启动执行引擎工作线程
             asyncio.create_task(order_execution_engine.start_execution_worker())
             
-            # 启动订单状态监控
-            asyncio.create_task(self._start_order_status_monitor())
+            # 订阅各交易系统的订单状态事件流
+            for adapter in trading_system_manager.adapters.values():
+                if adapter.is_connected:
+                    self.update_tasks.append(asyncio.create_task(self._consume_order_updates(adapter)))
             
             # 启动执行统计更新
             asyncio.create_task(self._start_stats_updater())
@@ -68,15 +83,16 @@ class OrderExecutionService:
         try:
             logger.info("停止订单执行服务")
             
-            # 取消所有执行任务
-            for order_id, task in self.execution_tasks.items():
+            # 取消订单状态事件订阅
+            for task in self.update_tasks:
                 task.cancel()
                 try:
                     await task
                 except asyncio.CancelledError:
                     pass
             
-            self.execution_tasks.clear()
+            self.update_tasks.clear()
+            self.tracked_orders.clear()
             
             # 断开交易系统连接
             await trading_system_manager.disconnect_all()
@@ -105,34 +121,55 @@ class OrderExecutionService:
             
             # 提交订单到交易系统
             submission_result = await adapter.submit_order(order)
+            return await self._accept_submission(order, submission_result)
             
-            if not submission_result.success:
-                logger.error(f"订单提交失败: {order.id} - {submission_result.message}")
-                await self._handle_submission_failure(order, submission_result)
-                return ExecutionResult.REJECTED
-            
-            # 更新订单的外部ID
-            await self._update_order_external_id(order, submission_result.external_order_id)
-            
-            # 提交到执行引擎
-            execution_result = await order_execution_engine.submit_order(order)
-            
-            # 更新统计
-            self.execution_stats['total_submitted'] += 1
+        except Exception as e:
+            logger.error(f"提交订单执行失败: {order.id} - {str(e)}")
+            self.execution_stats['execution_errors'] += 1
+            return ExecutionResult.FAILED
+    
+    async def submit_orders_for_execution(self, orders: List[Order],
+                                          trading_system: str = None) -> List[ExecutionResult]:
+        """批量提交订单执行，交易系统侧一次请求提交全部订单"""
+        try:
+            logger.info(f"批量提交订单执行: {len(orders)}笔")
             
-            # 启动订单监控任务
-            monitor_task = asyncio.create_task(
-                self._monitor_order_execution(order, adapter)
-            )
-            self.execution_tasks[order.id] = monitor_task
+            adapter = trading_system_manager.get_adapter(trading_system)
+            if not adapter or not adapter.is_connected:
+                logger.error(f"交易系统不可用: {trading_system}")
+                return [ExecutionResult.FAILED] * len(orders)
             
-            logger.info(f"订单提交成功: {order.id} - 外部ID: {submission_result.external_order_id}")
-            return execution_result
+            submission_results = await adapter.submit_orders(orders)
+            return [
+                await self._accept_submission(order, submission_result)
+                for order, submission_result in zip(orders, submission_results)
+            ]
             
         except Exception as e:
-            logger.error(f"提交订单执行失败: {order.id} - {str(e)}")
+            logger.error(f"批量提交订单执行失败: {str(e)}")
             self.execution_stats['execution_errors'] += 1
-            return ExecutionResult.FAILED
+            return [ExecutionResult.FAILED] * len(orders)
+    
+    async def _accept_submission(self, order: Order, submission_result) -> ExecutionResult:
+        """处理交易系统的提交结果：记录外部ID、交给执行引擎并开始跟踪状态事件"""
+        if not submission_result.success:
+            logger.error(f"订单提交失败: {order.id} - {submission_result.message}")
+            await self._handle_submission_failure(order, submission_result)
+            return ExecutionResult.REJECTED
+        
+        # 更新订单的外部ID
+        await self._update_order_external_id(order, submission_result.external_order_id)
+        
+        # 提交到执行引擎
+        execution_result = await order_execution_engine.submit_order(order)
+        
+        # 更新统计
+        self.execution_stats['total_submitted'] += 1
+        
+        self.tracked_orders[submission_result.external_order_id] = order
+        
+        logger.info(f"订单提交成功: {order.id} - 外部ID: {submission_result.external_order_id}")
+        return execution_result
     
     async def cancel_order_execution(self, order: Order) -> bool:
         """取消订单执行"""
@@ -149,16 +186,6 @@ class OrderExecutionService:
                 if not system_result:
                     logger.warning(f"交易系统取消订单失败: {order.id}")
             
-            # 停止监控任务
-            if order.id in self.execution_tasks:
-                task = self.execution_tasks[order.id]
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-                del self.execution_tasks[order.id]
-            
             # 更新统计
             if engine_result == ExecutionResult.CANCELLED:
                 self.execution_stats['total_cancelled'] += 1
@@ -170,6 +197,31 @@ class OrderExecutionService:
             logger.error(f"取消订单执行失败: {order.id} - {str(e)}")
             return False
     
+    async def cancel_orders_execution(self, orders: List[Order], trading_system: str = None) -> int:
+        """批量取消订单执行（如风控事件），交易系统侧一次请求撤销全部订单，返回取消数量"""
+        try:
+            logger.info(f"批量取消订单执行: {len(orders)}笔")
+            
+            cancelled = 0
+            for order in orders:
+                if await order_execution_engine.cancel_order(order) == ExecutionResult.CANCELLED:
+                    cancelled += 1
+            
+            adapter = trading_system_manager.get_adapter(trading_system)
+            external_orders = [order for order in orders if order.order_id_external]
+            if adapter and adapter.is_connected and external_orders:
+                results = await adapter.cancel_orders(external_orders)
+                failed = [order.id for order, ok in zip(external_orders, results) if not ok]
+                if failed:
+                    logger.warning(f"交易系统取消订单失败: {failed}")
+            
+            self.execution_stats['total_cancelled'] += cancelled
+            return cancelled
+            
+        except Exception as e:
+            logger.error(f"批量取消订单执行失败: {str(e)}")
+            return 0
+    
     async def modify_order_execution(self, order: Order, 
                                    modifications: Dict[str, Any]) -> bool:
         """修改订单执行"""
@@ -218,43 +270,40 @@ class OrderExecutionService:
             logger.error(f"获取订单执行状态失败: {order.id} - {str(e)}")
             return None
     
-    async def _monitor_order_execution(self, order: Order, adapter):
-        """监控订单执行过程"""
-        try:
-            logger.info(f"开始监控订单执行: {order.id}")
-            
-            while order.is_active and order.order_id_external:
-                try:
-                    # 获取交易系统中的订单状态
-                    external_status = await adapter.get_order_status(order.order_id_external)
-                    
-                    if external_status:
-                        await self._process_external_status_update(order, external_status)
-                    
-                    # 等待一段时间后再次检查
-                    await asyncio.sleep(5)
-                    
-                    # 刷新订单状态
-                    db = SessionLocal()
-                    try:
-                        db.refresh(order)
-                    finally:
-                        db.close()
+    async def _consume_order_updates(self, adapter):
+        """消费交易系统的订单状态事件流，替代逐单轮询订单状态"""
+        logger.info("开始订阅交易系统订单状态事件")
+        
+        async for update in adapter.subscribe_order_updates():
+            try:
+                external_order_id = update.get('external_order_id')
+                order = self.tracked_orders.get(external_order_id) or await self._load_active_order(external_order_id)
+                if order is None:
+                    continue
+                
+                await self._process_external_status_update(order, update)
+                
+                if update.get('status') in TERMINAL_EXTERNAL_STATUSES:
+                    self.tracked_orders.pop(external_order_id, None)
                     
-                except asyncio.CancelledError:
-                    logger.info(f"订单监控被取消: {order.id}")
-                    break
-                except Exception as e:
-                    logger.error(f"监控订单执行异常: {order.id} - {str(e)}")
-                    await asyncio.sleep(10)  # 出错时等待更长时间
-            
-            logger.info(f"订单监控结束: {order.id}")
-            
-        except Exception as e:
-            logger.error(f"监控订单执行失败: {order.id} - {str(e)}")
-        finally:
-            # 清理监控任务
-            self.execution_tasks.pop(order.id, None)
+            except Exception as e:
+                logger.error(f"处理订单状态事件异常: {update.get('external_order_id')} - {str(e)}")
+    
+    async def _load_active_order(self, external_order_id: Optional[str]) -> Optional[Order]:
+        """按外部ID加载未被跟踪的活跃订单（服务重启前提交或经其他途径提交的订单）"""
+        if not external_order_id:
+            return None
+        
+        async with async_session_scope() as session:
+            order = await order_repository.first(
+                session,
+                Order.order_id_external == external_order_id,
+                Order.status.in_(ACTIVE_ORDER_STATUSES)
+            )
+        
+        if order is not None:
+            self.tracked_orders[external_order_id] = order
+        return order
     
     async def _process_external_status_update(self, order: Order, external_status: Dict[str, Any]):
         """处理外部状态更新"""
@@ -277,14 +326,7 @@ class OrderExecutionService:
                 }
                 
                 # 添加成交记录
-                db = SessionLocal()
-                try:
-                    from .order_service import OrderService
-                    order_service = OrderService(db)
-                    order_service.add_order_fill(order.id, fill_data)
-                    db.refresh(order)
-                finally:
-                    db.close()
+                await persist_order_fill(order, fill_data)
             
             # 检查订单状态变化
             if external_order_status == 'cancelled' and order.status != OrderStatus.CANCELLED:
@@ -297,32 +339,24 @@ class OrderExecutionService:
     
     async def _update_order_external_id(self, order: Order, external_id: str):
         """更新订单外部ID"""
-        db = SessionLocal()
-        try:
-            order.order_id_external = external_id
-            db.commit()
-            db.refresh(order)
-        finally:
-            db.close()
+        async with async_session_scope() as session:
+            await order_repository.update_where(session, Order.id == order.id, order_id_external=external_id)
+        order.order_id_external = external_id
     
     async def _update_order_status(self, order: Order, new_status: OrderStatus):
         """更新订单状态"""
-        db = SessionLocal()
-        try:
-            old_status = order.status
-            order.status = new_status
-            
-            if new_status == OrderStatus.CANCELLED:
-                order.cancelled_at = datetime.now()
-            
-            db.commit()
-            db.refresh(order)
-            
-            # 发送状态变化通知
-            order_notification_service.notify_order_status_change(order, old_status)
-            
-        finally:
-            db.close()
+        old_status = order.status
+        values = {'status': new_status}
+        if new_status == OrderStatus.CANCELLED:
+            values['cancelled_at'] = datetime.now()
+        
+        async with async_session_scope() as session:
+            await order_repository.update_where(session, Order.id == order.id, **values)
+        for field, value in values.items():
+            setattr(order, field, value)
+        
+        # 发送状态变化通知
+        order_notification_service.notify_order_status_change(order, old_status)
     
     async def _handle_submission_failure(self, order: Order, submission_result):
         """处理订单提交失败"""
@@ -341,75 +375,24 @@ class OrderExecutionService:
         except Exception as e:
             logger.error(f"处理订单提交失败异常: {order.id} - {str(e)}")
     
-    async def _start_order_status_monitor(self):
-        """启动订单状态监控"""
-        logger.info("启动订单状态监控")
-        
-        while self.is_running:
-            try:
-                # 检查所有活跃订单的状态
-                db = SessionLocal()
-                try:
-                    active_orders = db.query(Order).filter(
-                        Order.status.in_([
-                            OrderStatus.PENDING,
-                            OrderStatus.SUBMITTED,
-                            OrderStatus.ACCEPTED,
-                            OrderStatus.PARTIALLY_FILLED
-                        ])
-                    ).all()
-                    
-                    for order in active_orders:
-                        if order.id not in self.execution_tasks:
-                            # 为没有监控任务的活跃订单创建监控
-                            adapter = trading_system_manager.get_adapter()
-                            if adapter and adapter.is_connected:
-                                monitor_task = asyncio.create_task(
-                                    self._monitor_order_execution(order, adapter)
-                                )
-                                self.execution_tasks[order.id] = monitor_task
-                
-                finally:
-                    db.close()
-                
-                # 每分钟检查一次
-                await asyncio.sleep(60)
-                
-            except Exception as e:
-                logger.error(f"订单状态监控异常: {str(e)}")
-                await asyncio.sleep(60)
-    
     async def _start_stats_updater(self):
         """启动执行统计更新"""
         logger.info("启动执行统计更新")
         
         while self.is_running:
             try:
-                # 更新执行统计
-                db = SessionLocal()
-                try:
-                    # 统计各种状态的订单数量
-                    total_executed = db.query(Order).filter(
-                        Order.status == OrderStatus.FILLED
-                    ).count()
-                    
-                    total_cancelled = db.query(Order).filter(
-                        Order.status == OrderStatus.CANCELLED
-                    ).count()
-                    
-                    total_rejected = db.query(Order).filter(
-                        Order.status == OrderStatus.REJECTED
-                    ).count()
-                    
-                    self.execution_stats.update({
-                        'total_executed': total_executed,
-                        'total_cancelled': total_cancelled,
-                        'total_rejected': total_rejected,
-                        'last_updated': datetime.now().isoformat()
-                    })
+                # 统计各种状态的订单数量
+                async with async_session_scope() as session:
+                    total_executed = await order_repository.count(session, Order.status == OrderStatus.FILLED)
+                    total_cancelled = await order_repository.count(session, Order.status == OrderStatus.CANCELLED)
+                    total_rejected = await order_repository.count(session, Order.status == OrderStatus.REJECTED)
                 
-                finally:
-                    db.close()
+                self.execution_stats.update({
+                    'total_executed': total_executed,
+                    'total_cancelled': total_cancelled,
+                    'total_rejected': total_rejected,
+                    'last_updated': datetime.now().isoformat()
+                })
                 
                 # 每5分钟更新一次
                 await asyncio.sleep(300)
@@ -422,7 +405,7 @@ class OrderExecutionService:
         """获取服务状态"""
         return {
             'is_running': self.is_running,
-            'active_executions': len(self.execution_tasks),
+            'active_executions': len(self.tracked_orders),
             'execution_stats': self.execution_stats,
             'trading_systems': trading_system_manager.get_connection_status(),
             'engine_stats': order_execution_engine.get_execution_stats(),
@@ -437,7 +420,7 @@ class OrderExecutionService:
                 self.execution_stats['total_executed'] / 
                 max(self.execution_stats['total_submitted'], 1)
             ),
-            'active_orders': len(self.execution_tasks),
+            'active_orders': len(self.tracked_orders),
             'timestamp': datetime.now().isoformat()
         }
 
@@ -6,11 +6,12 @@
 import asyncio
 import logging
 import random
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-from ..models.order import Order, OrderStatus, OrderSide
+from ..models.order import Order, OrderStatus, OrderType
+from ..services.matching_engine import MatchFill, MatchingEngine
 from ..services.order_service import OrderService
 from ..services.order_notification_service import order_notification_service
 from ..core.database import SessionLocal
@@ -21,8 +22,12 @@ logger = logging.getLogger(__name__)
 class OrderExecutionSimulator:
     """订单执行模拟器"""
     
+    # 撮合引擎支持的订单类型，其余类型按市价单处理
+    MATCHABLE_TYPES = (OrderType.MARKET, OrderType.LIMIT, OrderType.STOP, OrderType.STOP_LIMIT)
+    
     def __init__(self):
         self.running_simulations: Dict[int, asyncio.Task] = {}
+        self.matching = MatchingEngine()
         self.market_prices: Dict[str, Decimal] = {
             'AAPL': Decimal('150.00'),
             'TSLA': Decimal('200.00'),
@@ -51,6 +56,7 @@ class OrderExecutionSimulator:
     
     async def stop_order_simulation(self, order_id: int):
         """停止订单执行模拟"""
+        self.matching.cancel(order_id)
         task = self.running_simulations.get(order_id)
         if task:
             task.cancel()
@@ -135,78 +141,58 @@ class OrderExecutionSimulator:
             order_notification_service.notify_order_status_change(order, old_status)
     
     async def _simulate_order_filling(self, order: Order, order_service: OrderService):
-        """模拟订单成交过程"""
+        """模拟订单成交过程：订单挂入撮合簿，之后随模拟行情撮合"""
         if order.status != OrderStatus.ACCEPTED:
             return
         
-        # 获取市场价格
-        market_price = self.market_prices.get(order.symbol, Decimal('100.00'))
-        
-        # 模拟价格波动
-        price_volatility = Decimal(str(random.uniform(0.95, 1.05)))
-        current_price = market_price * price_volatility
+        order_type = order.order_type if order.order_type in self.MATCHABLE_TYPES else OrderType.MARKET
+        self.matching.add(
+            order.id, order.symbol, order.side, order_type,
+            float(order.quantity - order.filled_quantity),
+            price=float(order.price) if order.price else None,
+            stop_price=float(order.stop_price) if order.stop_price else None,
+            ref=order.id
+        )
         
-        # 确定成交价格
-        if order.order_type == 'market':
-            fill_price = current_price
-        elif order.order_type == 'limit':
-            if order.side == OrderSide.BUY:
-                if current_price <= order.price:
-                    fill_price = min(order.price, current_price)
-                else:
-                    # 价格不满足，等待
-                    await asyncio.sleep(random.uniform(5, 15))
-                    return await self._simulate_order_filling(order, order_service)
-            else:  # SELL
-                if current_price >= order.price:
-                    fill_price = max(order.price, current_price)
-                else:
-                    # 价格不满足，等待
-                    await asyncio.sleep(random.uniform(5, 15))
-                    return await self._simulate_order_filling(order, order_service)
-        else:
-            fill_price = current_price
-        
-        # 模拟分批成交
-        remaining_quantity = order.quantity - order.filled_quantity
-        
-        while remaining_quantity > 0 and order.status in [OrderStatus.ACCEPTED, OrderStatus.PARTIALLY_FILLED]:
-            # 随机成交数量（10%-100%的剩余数量）
-            fill_ratio = random.uniform(0.1, 1.0)
-            fill_quantity = min(remaining_quantity, remaining_quantity * Decimal(str(fill_ratio)))
+        # 模拟价格波动，用当前价格立即撮合一次
+        market_price = self.market_prices.get(order.symbol, Decimal('100.00'))
+        current_price = market_price * Decimal(str(random.uniform(0.95, 1.05)))
+        fills = self.matching.on_price(order.symbol, float(current_price), self._simulated_volume())
+        self._apply_fills(fills, order_service)
+    
+    def _apply_fills(self, fills: List[MatchFill], order_service: OrderService):
+        """把撮合成交写入订单并推送执行进度"""
+        for match in fills:
+            fill_price = Decimal(str(match.price))
+            fill_quantity = Decimal(str(match.quantity))
             
-            # 创建成交记录
             fill_data = {
-                'quantity': float(fill_quantity),
-                'price': float(fill_price),
+                'quantity': match.quantity,
+                'price': match.price,
                 'commission': float(fill_quantity * fill_price * Decimal('0.001')),  # 0.1%手续费
                 'commission_asset': 'USD',
                 'fill_time': datetime.now(),
-                'liquidity': random.choice(['maker', 'taker']),
+                'liquidity': match.liquidity,
                 'counterparty': f'MM_{random.randint(1, 10)}'
             }
+            order_service.add_order_fill(match.order.ref, fill_data)
             
-            # 添加成交记录
-            fill = order_service.add_order_fill(order.id, fill_data)
-            
-            # 更新剩余数量
-            remaining_quantity = order.quantity - order.filled_quantity
+            order = order_service.db.query(Order).filter(Order.id == match.order.ref).first()
+            if order is None:
+                continue
             
-            # 发送执行进度通知
             progress = float(order.filled_quantity / order.quantity)
             order_notification_service.notify_order_execution_progress(
                 order, progress, f"已成交 {order.filled_quantity}/{order.quantity}"
             )
             
-            # 如果还有剩余数量，等待一段时间再继续成交
-            if remaining_quantity > 0:
-                await asyncio.sleep(random.uniform(2, 8))
-                
-                # 模拟价格变化
-                price_change = Decimal(str(random.uniform(0.98, 1.02)))
-                fill_price = fill_price * price_change
-        
-        logger.info(f"订单 {order.id} 模拟执行完成")
+            if match.order.is_filled:
+                logger.info(f"订单 {order.id} 模拟执行完成")
+    
+    @staticmethod
+    def _simulated_volume() -> int:
+        """模拟每次行情变动的成交量"""
+        return random.randint(100, 1000)
     
     def update_market_price(self, symbol: str, price: Decimal):
         """更新市场价格"""
@@ -221,10 +207,24 @@ class OrderExecutionSimulator:
         """模拟市场价格波动"""
         while True:
             try:
+                fills = []
                 for symbol in self.market_prices:
                     # 随机价格变化 (-2% 到 +2%)
                     change_ratio = Decimal(str(random.uniform(0.98, 1.02)))
                     self.market_prices[symbol] *= change_ratio
+                    
+                    # 撮合该合约上价格被穿越的挂单
+                    if self.matching.has_orders(symbol):
+                        fills.extend(self.matching.on_price(
+                            symbol, float(self.market_prices[symbol]), self._simulated_volume()
+                        ))
+                
+                if fills:
+                    db = SessionLocal()
+                    try:
+                        self._apply_fills(fills, OrderService(db))
+                    finally:
+                        db.close()
                 
                 # 每30秒更新一次价格
                 await asyncio.sleep(30)
@@ -239,6 +239,7 @@ class OrderExecutionSimulator:
             'running_simulations': list(self.running_simulations.keys()),
             'simulation_count': len(self.running_simulations),
             'market_prices': {k: float(v) for k, v in self.market_prices.items()},
+            'matching': self.matching.get_stats(),
             'timestamp': datetime.now().isoformat()
         }
 
@@ -19,8 +19,10 @@ from ..schemas.order import (
     OrderActionRequest, OrderRiskCheckRequest
 )
 from ..core.exceptions import ValidationError, NotFoundError, PermissionError
+from ..core.database import call_on_loop
 from ..core.websocket import websocket_manager
 from .order_notification_service import order_notification_service
+from .risk_book import risk_book
 
 logger = logging.getLogger(__name__)
 
@@ -417,10 +419,13 @@ class OrderService:
             self.db.refresh(fill)
             self.db.refresh(order)
             
+            # 增量更新内存风控账本（经异步会话在工作线程中执行时交回事件循环）
+            call_on_loop(risk_book.on_fill, order.user_id, order.symbol, order.side, fill.quantity, fill.price, fill.commission)
+            
             # 发送WebSocket通知
-            order_notification_service.notify_order_filled(order, fill)
+            call_on_loop(order_notification_service.notify_order_filled, order, fill)
             if old_status != order.status:
-                order_notification_service.notify_order_status_change(order, old_status)
+                call_on_loop(order_notification_service.notify_order_status_change, order, old_status)
             
             logger.info(f"添加订单成交记录: {order_id}, 数量: {fill.quantity}, 价格: {fill.price}")
             return fill
@@ -0,0 +1,251 @@
+"""
+持仓账本
+
+成交记录（order_fills）按成交ID追加，视为只追加的持仓账本。账本定期写入检查点
+（截至某笔成交的数量、均价、已实现盈亏），重算持仓时从最近的检查点出发，
+用关联查询加载其后的新成交并回放，耗时与新成交笔数成正比；只有还没有检查点的持仓从头回放。
+"""
+
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.order import Order, OrderFill, OrderSide
+from ..models.position import Position, PositionCheckpoint, PositionStatus, PositionType
+
+logger = logging.getLogger(__name__)
+
+# 账本键：(symbol, strategy_id, backtest_id)，均在同一用户下
+LedgerKey = Tuple[str, Optional[int], Optional[int]]
+
+
+@dataclass
+class LedgerState:
+    """账本回放状态，计算规则与 Position.add_trade 一致"""
+    quantity: Decimal = Decimal('0')
+    position_type: Optional[PositionType] = None
+    average_cost: Decimal = Decimal('0')
+    total_cost: Decimal = Decimal('0')
+    realized_pnl: Decimal = Decimal('0')
+    last_fill_id: int = 0
+    fill_count: int = 0
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint: PositionCheckpoint) -> "LedgerState":
+        return cls(
+            quantity=checkpoint.quantity,
+            position_type=checkpoint.position_type,
+            average_cost=checkpoint.average_cost,
+            total_cost=checkpoint.total_cost,
+            realized_pnl=checkpoint.realized_pnl,
+            last_fill_id=checkpoint.last_fill_id,
+            fill_count=checkpoint.fill_count,
+        )
+
+    def apply(self, fill_id: int, quantity: Decimal, price: Decimal, commission: Decimal = Decimal('0')):
+        """回放一笔成交，quantity 买入为正、卖出为负"""
+        if self.quantity == 0:
+            # 新建仓位
+            self.quantity = abs(quantity)
+            self.position_type = PositionType.LONG if quantity > 0 else PositionType.SHORT
+            self.average_cost = price
+            self.total_cost = abs(quantity) * price + commission
+        elif (self.position_type == PositionType.LONG) == (quantity > 0):
+            # 加仓
+            self.quantity += abs(quantity)
+            self.total_cost += abs(quantity) * price + commission
+            self.average_cost = self.total_cost / self.quantity
+        else:
+            # 减仓或平仓
+            trade_quantity = min(abs(quantity), self.quantity)
+            if self.position_type == PositionType.LONG:
+                self.realized_pnl += trade_quantity * (price - self.average_cost) - commission
+            else:
+                self.realized_pnl += trade_quantity * (self.average_cost - price) - commission
+            self.quantity -= trade_quantity
+
+            if self.quantity == 0:
+                self.total_cost = Decimal('0')
+                self.average_cost = Decimal('0')
+            else:
+                self.total_cost = self.quantity * self.average_cost
+
+        self.last_fill_id = fill_id
+        self.fill_count += 1
+
+    def apply_to(self, position: Position):
+        """把账本状态写回持仓记录"""
+        position.quantity = self.quantity
+        position.available_quantity = max(Decimal('0'), self.quantity - (position.frozen_quantity or Decimal('0')))
+        position.average_cost = self.average_cost
+        position.total_cost = self.total_cost
+        position.realized_pnl = self.realized_pnl
+        if self.position_type is not None:
+            position.position_type = self.position_type
+
+        if self.quantity == 0:
+            position.status = PositionStatus.CLOSED
+            position.closed_at = position.closed_at or datetime.now()
+            position.unrealized_pnl = Decimal('0')
+        else:
+            position.status = PositionStatus.OPEN
+            position.closed_at = None
+
+        position.total_pnl = self.realized_pnl + (position.unrealized_pnl or Decimal('0'))
+
+
+class PositionLedger:
+    """基于检查点的增量持仓账本"""
+
+    def __init__(self, db: Session, checkpoint_interval: Optional[int] = None,
+                 settle_seconds: Optional[float] = None):
+        self.db = db
+        self.checkpoint_interval = checkpoint_interval or settings.POSITION_LEDGER_CHECKPOINT_INTERVAL
+        self.settle_seconds = (
+            settings.POSITION_LEDGER_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        )
+
+    def rebuild(self, user_id: int, symbol: str, strategy_id: Optional[int] = None,
+                backtest_id: Optional[int] = None) -> Optional[LedgerState]:
+        """重算单个持仓，没有任何成交时返回None"""
+        key = (symbol, strategy_id, backtest_id)
+        return self.rebuild_many(user_id, [key]).get(key)
+
+    def rebuild_many(self, user_id: int, keys: Optional[Iterable[LedgerKey]] = None) -> Dict[LedgerKey, LedgerState]:
+        """重算用户的多个持仓（keys为空时为全部），新成交较多时顺带追加检查点"""
+        keys = None if keys is None else set(keys)
+        checkpoints = self._latest_checkpoints(user_id, keys)
+        states = {key: LedgerState.from_checkpoint(checkpoint) for key, checkpoint in checkpoints.items()}
+
+        # 新成交的下界为最早的检查点；没有检查点的持仓需要从头回放，只为它们补充加载下界之前的成交
+        floor = min((c.last_fill_id for c in checkpoints.values()), default=0)
+        fills = []
+        if floor and keys is None:
+            fills = self._load_fills(user_id, None, 0, floor, max(c.id for c in checkpoints.values()))
+        elif floor and len(checkpoints) < len(keys):
+            fills = self._load_fills(user_id, keys - checkpoints.keys(), 0, floor)
+        fills += self._load_fills(user_id, keys, floor)
+
+        # 只有写入时间早于最新成交 settle_seconds 的成交才进入检查点，
+        # 避免并发事务中尚未提交的较小成交ID被检查点越过
+        newest = max((fill.created_at for fill in fills if fill.created_at), default=None)
+        settled_before = newest - timedelta(seconds=self.settle_seconds) if newest else None
+        settled: Dict[LedgerKey, LedgerState] = {}
+
+        for fill in fills:
+            key = (fill.symbol, fill.strategy_id, fill.backtest_id)
+            if keys is not None and key not in keys:
+                continue
+            state = states.get(key)
+            if state is None:
+                state = states[key] = LedgerState()
+            elif fill.id <= state.last_fill_id:
+                continue
+
+            if key not in settled and fill.created_at and settled_before and fill.created_at > settled_before:
+                settled[key] = replace(state)
+
+            quantity = fill.quantity if fill.side == OrderSide.BUY else -fill.quantity
+            state.apply(fill.id, quantity, fill.price, fill.commission or Decimal('0'))
+
+        self._write_checkpoints(user_id, checkpoints, states, settled)
+        return states
+
+    def checkpoint_recent(self, since: datetime) -> int:
+        """为 since 之后有成交的用户追加检查点，返回处理的用户数"""
+        user_ids = self.db.execute(
+            select(Order.user_id).join(OrderFill, OrderFill.order_id == Order.id)
+            .where(OrderFill.created_at >= since).distinct()
+        ).scalars().all()
+
+        for user_id in user_ids:
+            self.rebuild_many(user_id)
+            self.db.commit()
+
+        return len(user_ids)
+
+    def _latest_checkpoints(self, user_id: int,
+                            keys: Optional[set]) -> Dict[LedgerKey, PositionCheckpoint]:
+        """每个账本键最近的检查点"""
+        latest = select(func.max(PositionCheckpoint.id)).where(PositionCheckpoint.user_id == user_id)
+        if keys is not None:
+            latest = latest.where(PositionCheckpoint.symbol.in_({key[0] for key in keys}))
+        latest = latest.group_by(
+            PositionCheckpoint.symbol, PositionCheckpoint.strategy_id, PositionCheckpoint.backtest_id
+        )
+
+        checkpoints = {}
+        for checkpoint in self.db.execute(
+            select(PositionCheckpoint).where(PositionCheckpoint.id.in_(latest))
+        ).scalars():
+            key = (checkpoint.symbol, checkpoint.strategy_id, checkpoint.backtest_id)
+            if keys is None or key in keys:
+                checkpoints[key] = checkpoint
+        return checkpoints
+
+    def _load_fills(self, user_id: int, keys: Optional[set], floor: int, ceiling: Optional[int] = None,
+                    without_checkpoint_upto: Optional[int] = None) -> List:
+        """一次关联查询加载 floor < 成交ID <= ceiling 的成交及其订单方向，避免逐笔懒加载 fill.order
+
+        without_checkpoint_upto 不为空时只加载在ID不超过它的检查点中没有出现的账本键
+        """
+        query = (
+            select(
+                OrderFill.id, OrderFill.quantity, OrderFill.price, OrderFill.commission, OrderFill.created_at,
+                Order.symbol, Order.strategy_id, Order.backtest_id, Order.side
+            )
+            .join(Order, OrderFill.order_id == Order.id)
+            .where(Order.user_id == user_id, OrderFill.id > floor)
+            .order_by(OrderFill.id)
+        )
+
+        if ceiling is not None:
+            query = query.where(OrderFill.id <= ceiling)
+
+        if keys is not None:
+            query = query.where(or_(*(
+                and_(Order.symbol == symbol, Order.strategy_id == strategy_id, Order.backtest_id == backtest_id)
+                for symbol, strategy_id, backtest_id in keys
+            )))
+
+        if without_checkpoint_upto is not None:
+            query = query.where(~select(PositionCheckpoint.id).where(
+                PositionCheckpoint.user_id == user_id,
+                PositionCheckpoint.id <= without_checkpoint_upto,
+                PositionCheckpoint.symbol == Order.symbol,
+                PositionCheckpoint.strategy_id.is_not_distinct_from(Order.strategy_id),
+                PositionCheckpoint.backtest_id.is_not_distinct_from(Order.backtest_id),
+            ).exists())
+
+        return self.db.execute(query).all()
+
+    def _write_checkpoints(self, user_id: int, checkpoints: Dict[LedgerKey, PositionCheckpoint],
+                           states: Dict[LedgerKey, LedgerState], settled: Dict[LedgerKey, LedgerState]):
+        """距上个检查点回放超过 checkpoint_interval 笔成交时追加新检查点"""
+        for key, state in states.items():
+            state = settled.get(key, state)
+            previous = checkpoints.get(key)
+            if state.fill_count - (previous.fill_count if previous else 0) < self.checkpoint_interval:
+                continue
+
+            symbol, strategy_id, backtest_id = key
+            self.db.add(PositionCheckpoint(
+                user_id=user_id,
+                symbol=symbol,
+                strategy_id=strategy_id,
+                backtest_id=backtest_id,
+                last_fill_id=state.last_fill_id,
+                fill_count=state.fill_count,
+                position_type=state.position_type,
+                quantity=state.quantity,
+                average_cost=state.average_cost,
+                total_cost=state.total_cost,
+                realized_pnl=state.realized_pnl,
+            ))
+            logger.debug(f"追加持仓检查点: 用户{user_id} {symbol}, 截至成交 {state.last_fill_id}")
@@ -7,309 +7,192 @@ from typing import Dict, List, Optional, Set
 from decimal import Decimal
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 
-from ..core.database import SessionLocal
+from ..core.async_repository import AsyncRepository
+from ..core.database import SessionLocal, async_session_scope
 from ..models.position import Position, PositionStatus
 from ..models.user import User
-from ..services.position_service import PositionService
-from ..core.websocket import WebSocketManager
+from ..services.position_service import MarkedPosition, PositionCalculationService, PositionService
+from ..core.websocket import websocket_manager
+from ..services.quote_bus import QuoteSubscription, QuoteTick, quote_bus
 from ..utils.position_calculator import PositionCalculator, PositionRiskAnalyzer
 
 logger = logging.getLogger(__name__)
 
+position_repository = AsyncRepository(Position)
+
 class PositionRealtimeService:
     """持仓实时更新服务"""
     
     def __init__(self):
-        self.websocket_manager = WebSocketManager()
+        self.websocket_manager = websocket_manager
         self.position_calculator = PositionCalculator()
         self.risk_analyzer = PositionRiskAnalyzer()
         self.subscribed_symbols: Set[str] = set()
         self.user_positions: Dict[int, List[Position]] = {}
         self.last_update_time = datetime.now()
-        self.update_interval = 1  # 更新间隔（秒）
+        self.update_interval = 1  # 两次批量更新的最小间隔（秒），期间到达的行情合并处理
+        self.symbol_refresh_interval = 30  # 无行情时重新加载持仓合约的间隔（秒）
+        
+        # 行情由行情总线推送，按合约只保留最新一笔待处理
+        self.quote_bus = quote_bus
+        self._quote_subscription: Optional[QuoteSubscription] = None
+        self._dirty_quotes: Dict[str, Dict] = {}
+        self._quote_event = asyncio.Event()
+        self._update_task: Optional[asyncio.Task] = None
         
     async def start_realtime_updates(self):
         """启动实时更新服务"""
-        logger.info("启动持仓实时更新服务")
+        if self._update_task is not None:
+            return
         
-        # 启动定时更新任务
-        asyncio.create_task(self._periodic_update_task())
+        logger.info("启动持仓实时更新服务")
         
-        # 启动WebSocket消息处理
-        asyncio.create_task(self._websocket_message_handler())
+        # 订阅所有开放持仓的合约，行情到达时更新对应持仓
+        self._quote_subscription = await self.quote_bus.subscribe([], self._on_quote, name="position_realtime")
+        await self._refresh_position_symbols()
         
-    async def _periodic_update_task(self):
-        """定期更新任务"""
+        self._update_task = asyncio.create_task(self._quote_update_task())
+    
+    async def stop_realtime_updates(self):
+        """停止实时更新服务"""
+        if self._update_task is not None:
+            self._update_task.cancel()
+            self._update_task = None
+        if self._quote_subscription is not None:
+            await self.quote_bus.unsubscribe(self._quote_subscription)
+            self._quote_subscription = None
+    
+    def _on_quote(self, tick: QuoteTick):
+        """行情总线推送的行情，记录后唤醒更新任务"""
+        market_info = self._market_info(tick)
+        if market_info is None:
+            return
+        self._dirty_quotes[tick.symbol] = market_info
+        self._quote_event.set()
+    
+    async def _quote_update_task(self):
+        """行情驱动的持仓更新任务"""
         while True:
             try:
-                await self._update_all_positions()
+                try:
+                    await asyncio.wait_for(self._quote_event.wait(), self.symbol_refresh_interval)
+                except asyncio.TimeoutError:
+                    # 长时间无行情时检查是否有新开仓的合约
+                    await self._refresh_position_symbols()
+                    continue
+                
+                self._quote_event.clear()
+                market_data, self._dirty_quotes = self._dirty_quotes, {}
+                if market_data:
+                    await self._update_positions(market_data)
+                
+                # 限制批量提交频率，期间到达的行情合并到下一批
                 await asyncio.sleep(self.update_interval)
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                logger.error(f"定期更新任务出错: {e}")
+                logger.error(f"持仓行情更新任务出错: {e}")
                 await asyncio.sleep(5)  # 出错后等待5秒再重试
     
-    async def _websocket_message_handler(self):
-        """WebSocket消息处理器"""
-        while True:
-            try:
-                # 这里可以处理来自市场数据源的WebSocket消息
-                # 暂时使用模拟数据
-                await asyncio.sleep(1)
-            except Exception as e:
-                logger.error(f"WebSocket消息处理出错: {e}")
-                await asyncio.sleep(1)
-    
-    async def _update_all_positions(self):
-        """更新所有持仓"""
-        db = SessionLocal()
+    async def _refresh_position_symbols(self):
+        """按当前开放持仓更新行情订阅"""
+        if self._quote_subscription is None:
+            return
+        
         try:
-            # 获取所有开放持仓
-            positions = db.query(Position).filter(
-                Position.status == PositionStatus.OPEN
-            ).all()
-            
-            if not positions:
-                return
-            
-            # 获取需要更新的标的
-            symbols = list(set(pos.symbol for pos in positions))
-            
-            # 获取市场数据（这里使用模拟数据）
-            market_data = await self._get_market_data(symbols)
-            
-            # 更新持仓数据
-            updated_positions = []
-            for position in positions:
-                if position.symbol in market_data:
-                    old_price = position.current_price
-                    new_price = market_data[position.symbol]['price']
-                    
-                    # 更新市场价格和盈亏计算
-                    await self._update_position_pnl(position, new_price, market_data[position.symbol])
-                    
-                    # 检查是否有显著变化
-                    if self._should_notify_update(position, old_price, new_price):
-                        updated_positions.append(position)
-            
-            # 批量提交更新
-            if updated_positions:
-                db.commit()
-                
-                # 发送WebSocket通知
-                await self._notify_position_updates(updated_positions)
-                
-                # 发送组合级别的盈亏更新
-                await self._notify_portfolio_updates(updated_positions)
-                
-                logger.debug(f"更新了 {len(updated_positions)} 个持仓")
-                
+            symbols = set(await self._open_position_symbols()) | self.subscribed_symbols
         except Exception as e:
-            db.rollback()
-            logger.error(f"更新持仓失败: {e}")
-        finally:
-            db.close()
+            logger.error(f"加载持仓合约失败: {e}")
+            return
+        
+        current = self._quote_subscription.symbols
+        await self.quote_bus.add_symbols(self._quote_subscription, symbols - current)
+        await self.quote_bus.remove_symbols(self._quote_subscription, current - symbols)
     
-    async def _update_position_pnl(self, position: Position, new_price: Decimal, market_info: Dict):
-        """更新持仓盈亏计算"""
-        try:
-            # 保存旧值用于比较
-            old_market_value = position.market_value
-            old_total_pnl = position.total_pnl
-            
-            # 更新市场价格
-            position.update_market_price(new_price)
-            
-            # 计算详细的盈亏指标
-            pnl_metrics = self._calculate_detailed_pnl(position, market_info)
-            
-            # 更新持仓的盈亏相关字段
-            position.unrealized_pnl = Decimal(str(pnl_metrics['unrealized_pnl']))
-            position.unrealized_pnl_percent = Decimal(str(pnl_metrics['unrealized_pnl_percent']))
-            position.daily_pnl = Decimal(str(pnl_metrics['daily_pnl']))
-            position.daily_pnl_percent = Decimal(str(pnl_metrics['daily_pnl_percent']))
-            
-            # 计算风险指标
-            risk_metrics = self._calculate_position_risk_metrics(position, market_info)
-            position.risk_metrics = risk_metrics
-            
-            # 更新时间戳
-            position.updated_at = datetime.now()
-            
-            logger.debug(f"更新持仓 {position.symbol} 盈亏: 未实现盈亏 {pnl_metrics['unrealized_pnl']:.2f}")
-            
-        except Exception as e:
-            logger.error(f"更新持仓盈亏失败 {position.id}: {e}")
+    async def _update_all_positions(self):
+        """按最新行情更新所有持仓"""
+        market_data = await self._get_market_data(await self._open_position_symbols())
+        if market_data:
+            await self._update_positions(market_data)
     
-    def _calculate_detailed_pnl(self, position: Position, market_info: Dict) -> Dict:
-        """计算详细的盈亏指标"""
+    async def _open_position_symbols(self) -> List[str]:
+        """开放持仓涉及的合约"""
+        async with async_session_scope() as session:
+            return await position_repository.distinct_values(
+                session, Position.symbol, Position.status == PositionStatus.OPEN
+            )
+    
+    async def _update_positions(self, market_data: Dict[str, Dict]):
+        """批量盯市行情有变化的合约的持仓，只推送盈亏变化显著的持仓"""
+        prices = {symbol: info['price'] for symbol, info in market_data.items()}
         try:
-            current_price = market_info['price']
-            avg_cost = position.average_cost
-            quantity = position.quantity
-            
-            # 基础计算
-            market_value = quantity * current_price
-            cost_basis = quantity * avg_cost
-            
-            # 未实现盈亏
-            if position.position_type.value == 'LONG':
-                unrealized_pnl = float(market_value - cost_basis)
-            else:  # SHORT
-                unrealized_pnl = float(cost_basis - market_value)
-            
-            # 未实现盈亏百分比
-            unrealized_pnl_percent = (unrealized_pnl / float(abs(cost_basis))) * 100 if cost_basis != 0 else 0
-            
-            # 今日盈亏（需要今日开盘价，这里使用模拟）
-            today_open_price = avg_cost * Decimal('0.99')  # 模拟今日开盘价
-            if position.position_type.value == 'LONG':
-                daily_pnl = float(quantity * (current_price - today_open_price))
-            else:
-                daily_pnl = float(quantity * (today_open_price - current_price))
+            updated_positions = await asyncio.to_thread(self._mark_to_market, prices)
+        except Exception as e:
+            logger.error(f"更新持仓失败: {e}")
+            return
+        
+        if updated_positions:
+            # 发送WebSocket通知
+            await self._notify_position_updates(updated_positions)
             
-            # 今日盈亏百分比
-            daily_cost_basis = float(quantity * today_open_price)
-            daily_pnl_percent = (daily_pnl / abs(daily_cost_basis)) * 100 if daily_cost_basis != 0 else 0
+            # 发送组合级别的盈亏更新
+            await self._notify_portfolio_updates(updated_positions)
             
-            return {
-                'market_value': float(market_value),
-                'cost_basis': float(cost_basis),
-                'unrealized_pnl': unrealized_pnl,
-                'unrealized_pnl_percent': unrealized_pnl_percent,
-                'daily_pnl': daily_pnl,
-                'daily_pnl_percent': daily_pnl_percent,
-                'current_price': float(current_price),
-                'price_change': float(market_info.get('change', 0)),
-                'price_change_percent': market_info.get('change_percent', 0) * 100
-            }
-            
-        except Exception as e:
-            logger.error(f"计算详细盈亏失败: {e}")
-            return {
-                'market_value': 0,
-                'cost_basis': 0,
-                'unrealized_pnl': 0,
-                'unrealized_pnl_percent': 0,
-                'daily_pnl': 0,
-                'daily_pnl_percent': 0,
-                'current_price': 0,
-                'price_change': 0,
-                'price_change_percent': 0
-            }
+            logger.debug(f"更新了 {len(updated_positions)} 个持仓")
     
-    def _calculate_position_risk_metrics(self, position: Position, market_info: Dict) -> Dict:
-        """计算持仓风险指标"""
+    def _mark_to_market(self, prices: Dict[str, Decimal]) -> List[MarkedPosition]:
+        """在线程中执行集合式盯市更新"""
+        db = SessionLocal()
         try:
-            current_price = float(market_info['price'])
-            avg_cost = float(position.average_cost)
-            
-            # 价格波动率（简化计算）
-            volatility = abs(market_info.get('change_percent', 0)) * 100
-            
-            # 距离止损止盈的距离
-            stop_loss_distance = 0
-            take_profit_distance = 0
-            
-            if position.stop_loss_price:
-                stop_loss_distance = abs(current_price - float(position.stop_loss_price)) / current_price * 100
-            
-            if position.take_profit_price:
-                take_profit_distance = abs(float(position.take_profit_price) - current_price) / current_price * 100
-            
-            # 持仓时间（天）
-            holding_days = (datetime.now() - position.created_at).days
-            
-            # 风险评分（简化）
-            risk_score = min(100, volatility * 10 + holding_days * 0.5)
-            
-            return {
-                'volatility': volatility,
-                'stop_loss_distance': stop_loss_distance,
-                'take_profit_distance': take_profit_distance,
-                'holding_days': holding_days,
-                'risk_score': risk_score,
-                'last_updated': datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            logger.error(f"计算持仓风险指标失败: {e}")
-            return {}
+            return PositionCalculationService(db).batch_update_market_data(prices)
+        finally:
+            db.close()
     
     async def _get_market_data(self, symbols: List[str]) -> Dict[str, Dict]:
-        """获取市场数据（模拟实现）"""
-        import random
-        
+        """从行情总线取合约的最新行情"""
         market_data = {}
         for symbol in symbols:
-            # 模拟价格波动
-            base_price = 100.0  # 基础价格
-            if symbol == 'AAPL':
-                base_price = 150.0
-            elif symbol == 'GOOGL':
-                base_price = 2500.0
-            elif symbol == 'TSLA':
-                base_price = 200.0
-            elif symbol == 'MSFT':
-                base_price = 300.0
-            
-            # 随机波动 ±2%
-            change_percent = (random.random() - 0.5) * 0.04
-            current_price = base_price * (1 + change_percent)
-            
-            market_data[symbol] = {
-                'price': Decimal(str(round(current_price, 2))),
-                'change': Decimal(str(round(current_price - base_price, 2))),
-                'change_percent': change_percent,
-                'volume': random.randint(1000000, 10000000),
-                'timestamp': datetime.now()
-            }
-        
+            tick = self.quote_bus.latest(symbol)
+            market_info = self._market_info(tick) if tick is not None else None
+            if market_info is not None:
+                market_data[symbol] = market_info
         return market_data
     
-    def _should_notify_update(self, position: Position, old_price: Optional[Decimal], new_price: Decimal) -> bool:
-        """判断是否需要通知更新"""
-        if not old_price:
-            return True
+    def _market_info(self, tick: QuoteTick) -> Optional[Dict]:
+        """行情转为持仓计算使用的市场数据"""
+        last_price = tick.data.get('last_price')
+        if not last_price:
+            return None
         
-        # 价格变化超过0.1%时通知
-        price_change_percent = abs(float(new_price - old_price) / float(old_price))
-        if price_change_percent > 0.001:
-            return True
-        
-        # 触发止损止盈时通知
-        if position.check_stop_loss_trigger() or position.check_take_profit_trigger():
-            return True
-        
-        return False
+        pre_close = tick.data.get('pre_close') or last_price
+        change = last_price - pre_close
+        return {
+            'price': Decimal(str(last_price)),
+            'change': Decimal(str(round(change, 4))),
+            'change_percent': change / pre_close if pre_close else 0.0,
+            'volume': tick.data.get('volume', 0),
+            'timestamp': datetime.now()
+        }
     
-    async def _notify_position_updates(self, positions: List[Position]):
+    async def _notify_position_updates(self, positions: List[MarkedPosition]):
         """通知持仓更新"""
         # 按用户分组
         user_updates = {}
+        last_updated = datetime.now().isoformat()
         for position in positions:
-            user_id = position.user_id
-            if user_id not in user_updates:
-                user_updates[user_id] = []
-            
-            # 构建详细的持仓更新数据
             position_data = position.to_dict()
             position_data.update({
                 'pnl_metrics': {
                     'unrealized_pnl': float(position.unrealized_pnl or 0),
                     'unrealized_pnl_percent': float(position.unrealized_pnl_percent or 0),
                     'daily_pnl': float(position.daily_pnl or 0),
-                    'daily_pnl_percent': float(position.daily_pnl_percent or 0),
                     'market_value': float(position.market_value or 0),
-                    'total_pnl': float(position.total_pnl or 0),
-                    'return_rate': float(position.return_rate or 0)
+                    'total_pnl': float(position.total_pnl or 0)
                 },
-                'risk_metrics': getattr(position, 'risk_metrics', {}),
-                'last_updated': position.updated_at.isoformat() if position.updated_at else None
+                'last_updated': last_updated
             })
-            
-            user_updates[user_id].append(position_data)
+            user_updates.setdefault(position.user_id, []).append(position_data)
         
         # 发送WebSocket通知
         for user_id, position_data in user_updates.items():
@@ -322,7 +205,7 @@ class PositionRealtimeService:
                 }
             )
     
-    async def _notify_portfolio_updates(self, positions: List[Position]):
+    async def _notify_portfolio_updates(self, positions: List[MarkedPosition]):
         """通知组合级别的盈亏更新"""
         # 按用户分组计算组合指标
         user_portfolios = {}
@@ -458,27 +341,24 @@ class PositionRealtimeService:
     
     async def subscribe_user_positions(self, user_id: int):
         """订阅用户持仓更新"""
-        db = SessionLocal()
-        try:
-            # 获取用户持仓
-            positions = db.query(Position).filter(
-                and_(
-                    Position.user_id == user_id,
-                    Position.status == PositionStatus.OPEN
-                )
-            ).all()
-            
-            # 添加到订阅列表
-            self.user_positions[user_id] = positions
-            
-            # 订阅相关标的
-            for position in positions:
-                self.subscribed_symbols.add(position.symbol)
-            
-            logger.info(f"用户 {user_id} 订阅了 {len(positions)} 个持仓更新")
-            
-        finally:
-            db.close()
+        # 获取用户持仓
+        async with async_session_scope() as session:
+            positions = await position_repository.list(
+                session, Position.user_id == user_id, Position.status == PositionStatus.OPEN
+            )
+        
+        # 添加到订阅列表
+        self.user_positions[user_id] = positions
+        
+        # 订阅相关标的
+        for position in positions:
+            self.subscribed_symbols.add(position.symbol)
+        if self._quote_subscription is not None:
+            await self.quote_bus.add_symbols(
+                self._quote_subscription, [position.symbol for position in positions]
+            )
+        
+        logger.info(f"用户 {user_id} 订阅了 {len(positions)} 个持仓更新")
     
     async def unsubscribe_user_positions(self, user_id: int):
         """取消订阅用户持仓更新"""
@@ -488,33 +368,31 @@ class PositionRealtimeService:
     
     async def calculate_portfolio_metrics(self, user_id: int) -> Dict:
         """计算投资组合实时指标"""
-        db = SessionLocal()
-        try:
-            position_service = PositionService(db)
-            
-            # 获取基础指标
-            metrics = position_service.get_portfolio_summary(user_id)
-            
-            # 添加实时计算的指标
-            positions = position_service.get_user_positions(user_id, PositionStatus.OPEN)
-            
-            if positions:
-                # 计算今日盈亏
-                today_pnl = self._calculate_today_pnl(positions)
-                metrics['today_pnl'] = today_pnl
-                
-                # 计算风险指标
-                risk_metrics = self._calculate_risk_metrics(positions)
-                metrics['risk_metrics'] = risk_metrics
-                
-                # 计算持仓分布
-                sector_distribution = self._calculate_sector_distribution(positions)
-                metrics['sector_distribution'] = sector_distribution
+        def load(session):
+            position_service = PositionService(session)
+            return (
+                position_service.get_portfolio_summary(user_id),
+                position_service.get_user_positions(user_id, PositionStatus.OPEN)
+            )
+        
+        async with async_session_scope() as session:
+            # 获取基础指标和开放持仓
+            metrics, positions = await session.run_sync(load)
+        
+        if positions:
+            # 计算今日盈亏
+            today_pnl = self._calculate_today_pnl(positions)
+            metrics['today_pnl'] = today_pnl
             
-            return metrics
+            # 计算风险指标
+            risk_metrics = self._calculate_risk_metrics(positions)
+            metrics['risk_metrics'] = risk_metrics
             
-        finally:
-            db.close()
+            # 计算持仓分布
+            sector_distribution = self._calculate_sector_distribution(positions)
+            metrics['sector_distribution'] = sector_distribution
+        
+        return metrics
     
     def _calculate_today_pnl(self, positions: List[Position]) -> float:
         """计算今日盈亏"""
@@ -604,72 +482,66 @@ class PositionRealtimeService:
     
     async def check_risk_alerts(self, user_id: int) -> List[Dict]:
         """检查风险预警"""
-        db = SessionLocal()
-        try:
-            position_service = PositionService(db)
-            positions = position_service.get_user_positions(user_id, PositionStatus.OPEN)
-            
-            alerts = []
-            
-            for position in positions:
-                # 检查止损止盈触发
-                if position.check_stop_loss_trigger():
-                    alerts.append({
-                        'type': 'stop_loss_triggered',
-                        'position_id': position.id,
-                        'symbol': position.symbol,
-                        'message': f'{position.symbol} 触发止损价格 {position.stop_loss_price}',
-                        'severity': 'high',
-                        'timestamp': datetime.now().isoformat()
-                    })
-                
-                if position.check_take_profit_trigger():
-                    alerts.append({
-                        'type': 'take_profit_triggered',
-                        'position_id': position.id,
-                        'symbol': position.symbol,
-                        'message': f'{position.symbol} 触发止盈价格 {position.take_profit_price}',
-                        'severity': 'medium',
-                        'timestamp': datetime.now().isoformat()
-                    })
-                
-                # 检查大幅亏损
-                if position.total_pnl < 0 and abs(position.return_rate) > 0.1:  # 亏损超过10%
-                    alerts.append({
-                        'type': 'large_loss',
-                        'position_id': position.id,
-                        'symbol': position.symbol,
-                        'message': f'{position.symbol} 亏损超过10%，当前亏损率 {position.return_rate:.2%}',
-                        'severity': 'medium',
-                        'timestamp': datetime.now().isoformat()
-                    })
+        async with async_session_scope() as session:
+            positions = await position_repository.list(
+                session, Position.user_id == user_id, Position.status == PositionStatus.OPEN
+            )
+        
+        alerts = []
+        
+        for position in positions:
+            # 检查止损止盈触发
+            if position.check_stop_loss_trigger():
+                alerts.append({
+                    'type': 'stop_loss_triggered',
+                    'position_id': position.id,
+                    'symbol': position.symbol,
+                    'message': f'{position.symbol} 触发止损价格 {position.stop_loss_price}',
+                    'severity': 'high',
+                    'timestamp': datetime.now().isoformat()
+                })
             
-            return alerts
+            if position.check_take_profit_trigger():
+                alerts.append({
+                    'type': 'take_profit_triggered',
+                    'position_id': position.id,
+                    'symbol': position.symbol,
+                    'message': f'{position.symbol} 触发止盈价格 {position.take_profit_price}',
+                    'severity': 'medium',
+                    'timestamp': datetime.now().isoformat()
+                })
             
-        finally:
-            db.close()
+            # 检查大幅亏损
+            if position.total_pnl < 0 and abs(position.return_rate) > 0.1:  # 亏损超过10%
+                alerts.append({
+                    'type': 'large_loss',
+                    'position_id': position.id,
+                    'symbol': position.symbol,
+                    'message': f'{position.symbol} 亏损超过10%，当前亏损率 {position.return_rate:.2%}',
+                    'severity': 'medium',
+                    'timestamp': datetime.now().isoformat()
+                })
+        
+        return alerts
     
     async def get_position_trend_data(self, position_id: int, period: str = '1d') -> Dict:
         """获取持仓趋势数据"""
-        db = SessionLocal()
-        try:
-            position = db.query(Position).filter(Position.id == position_id).first()
-            if not position:
-                return {}
-            
-            # 获取历史数据（这里使用模拟数据）
-            trend_data = await self._generate_trend_data(position, period)
-            
-            return {
-                'position_id': position_id,
-                'symbol': position.symbol,
-                'period': period,
-                'data': trend_data,
-                'generated_at': datetime.now().isoformat()
-            }
-            
-        finally:
-            db.close()
+        async with async_session_scope() as session:
+            position = await position_repository.get(session, position_id)
+        
+        if not position:
+            return {}
+        
+        # 获取历史数据（这里使用模拟数据）
+        trend_data = await self._generate_trend_data(position, period)
+        
+        return {
+            'position_id': position_id,
+            'symbol': position.symbol,
+            'period': period,
+            'data': trend_data,
+            'generated_at': datetime.now().isoformat()
+        }
     
     async def _generate_trend_data(self, position: Position, period: str) -> List[Dict]:
         """生成趋势数据（模拟实现）"""
@@ -3,47 +3,119 @@
 """
 
 import logging
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, NamedTuple, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy import (
+    and_, or_, desc, asc, func, case, select, update, values, column, bindparam, type_coerce,
+    Float, Numeric, String
+)
 from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
 
+import numpy as np
+
 from ..models.position import Position, PositionHistory, PositionSummary, PositionStatus, PositionType
-from ..models.order import Order, OrderFill, OrderSide
+from ..models.order import OrderFill, OrderSide
 from ..models.strategy import Strategy
 from ..models.backtest import Backtest
+from ..core.config import settings
 from ..core.exceptions import ValidationError, NotFoundError, PermissionError
+from .position_ledger import LedgerState, PositionLedger
+from .risk_book import risk_book
 
 logger = logging.getLogger(__name__)
 
 
+class MarkedPosition(NamedTuple):
+    """批量盯市后盈亏变化显著的持仓"""
+    id: int
+    user_id: int
+    symbol: str
+    position_type: PositionType
+    quantity: Decimal
+    average_cost: Decimal
+    current_price: Decimal
+    previous_price: Optional[Decimal]
+    market_value: Decimal
+    unrealized_pnl: Decimal
+    previous_pnl: Optional[Decimal]
+    unrealized_pnl_percent: Decimal
+    total_pnl: Decimal
+    daily_pnl: Optional[Decimal]
+    stop_loss_price: Optional[Decimal]
+    take_profit_price: Optional[Decimal]
+    
+    @property
+    def stop_loss_triggered(self) -> bool:
+        if not self.stop_loss_price:
+            return False
+        if self.position_type == PositionType.LONG:
+            return self.current_price <= self.stop_loss_price
+        return self.current_price >= self.stop_loss_price
+    
+    @property
+    def take_profit_triggered(self) -> bool:
+        if not self.take_profit_price:
+            return False
+        if self.position_type == PositionType.LONG:
+            return self.current_price >= self.take_profit_price
+        return self.current_price <= self.take_profit_price
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = {}
+        for key, value in self._asdict().items():
+            if isinstance(value, Decimal):
+                value = float(value)
+            elif isinstance(value, PositionType):
+                value = value.value
+            data[key] = value
+        data['stop_loss_triggered'] = self.stop_loss_triggered
+        data['take_profit_triggered'] = self.take_profit_triggered
+        return data
+
+
+def _mark_to_market_values(table, price) -> Dict[str, Any]:
+    """盯市更新的SET子句，price 为价格列或绑定参数"""
+    pnl = case(
+        (table.c.position_type == PositionType.LONG, table.c.quantity * (price - table.c.average_cost)),
+        else_=table.c.quantity * (table.c.average_cost - price)
+    )
+    cost_basis = table.c.quantity * table.c.average_cost
+    return {
+        'current_price': price,
+        'market_value': table.c.quantity * price,
+        'unrealized_pnl': pnl,
+        'unrealized_pnl_percent': case((cost_basis != 0, pnl * 100 / cost_basis), else_=0),
+        'total_pnl': table.c.realized_pnl + pnl,
+        # 与 Position.update_market_price 一致：首次定价不计入最大盈利/回撤
+        'max_profit': case(
+            (and_(table.c.current_price.isnot(None), pnl > table.c.max_profit), pnl),
+            else_=table.c.max_profit
+        ),
+        'max_drawdown': case(
+            (and_(table.c.current_price.isnot(None), pnl < -func.abs(table.c.max_drawdown)), func.abs(pnl)),
+            else_=table.c.max_drawdown
+        ),
+        'updated_at': func.now(),
+    }
+
+
 class PositionCalculationService:
     """持仓计算服务"""
     
     def __init__(self, db: Session):
         self.db = db
+        self.ledger = PositionLedger(db)
     
     def calculate_position_from_trades(self, user_id: int, symbol: str, 
                                      strategy_id: Optional[int] = None,
                                      backtest_id: Optional[int] = None) -> Optional[Position]:
-        """从交易记录计算持仓"""
+        """从交易记录计算持仓（从最近的账本检查点增量回放）"""
         try:
-            # 获取相关的成交记录
-            query = self.db.query(OrderFill).join(Order).filter(
-                Order.user_id == user_id,
-                Order.symbol == symbol
-            )
-            
-            if strategy_id:
-                query = query.filter(Order.strategy_id == strategy_id)
-            if backtest_id:
-                query = query.filter(Order.backtest_id == backtest_id)
+            state = self.ledger.rebuild(user_id, symbol, strategy_id, backtest_id)
             
-            fills = query.order_by(OrderFill.fill_time).all()
-            
-            if not fills:
+            if state is None:
                 return None
             
             # 查找或创建持仓记录
@@ -67,7 +139,7 @@ class PositionCalculationService:
                 self.db.add(position)
             
             # 重新计算持仓
-            self._recalculate_position_from_fills(position, fills)
+            state.apply_to(position)
             
             self.db.commit()
             self.db.refresh(position)
@@ -80,38 +152,6 @@ class PositionCalculationService:
             logger.error(f"计算持仓失败: {str(e)}")
             raise
     
-    def _recalculate_position_from_fills(self, position: Position, fills: List[OrderFill]):
-        """从成交记录重新计算持仓"""
-        # 重置持仓数据
-        position.quantity = Decimal('0')
-        position.average_cost = Decimal('0')
-        position.total_cost = Decimal('0')
-        position.realized_pnl = Decimal('0')
-        
-        for fill in fills:
-            order = fill.order
-            
-            # 确定交易数量和方向
-            if order.side == OrderSide.BUY:
-                trade_quantity = fill.quantity
-            else:  # SELL
-                trade_quantity = -fill.quantity
-            
-            # 添加交易到持仓
-            position.add_trade(trade_quantity, fill.price, fill.commission)
-        
-        # 设置持仓类型
-        if position.quantity > 0:
-            position.position_type = PositionType.LONG
-        elif position.quantity < 0:
-            position.position_type = PositionType.SHORT
-            position.quantity = abs(position.quantity)  # 持仓数量始终为正
-        
-        # 如果持仓为0，标记为已关闭
-        if position.quantity == 0:
-            position.status = PositionStatus.CLOSED
-            position.closed_at = datetime.now()
-    
     def update_position_market_data(self, position: Position, current_price: Decimal):
         """更新持仓的市场数据"""
         try:
@@ -125,29 +165,141 @@ class PositionCalculationService:
             logger.error(f"更新持仓市场数据失败: {str(e)}")
             raise
     
-    def batch_update_market_data(self, price_data: Dict[str, Decimal]):
-        """批量更新市场数据"""
+    def batch_update_market_data(self, price_data: Dict[str, Decimal],
+                                 min_pnl_change: Optional[float] = None,
+                                 min_pnl_change_ratio: Optional[float] = None) -> List[MarkedPosition]:
+        """批量盯市
+
+        按 {合约: 价格} 以集合操作更新全部开放持仓的市值和盈亏，不加载ORM对象、不记录逐笔价格历史。
+        返回未实现盈亏变化达到阈值（或首次定价、触发止损止盈）的持仓。
+        """
+        if not price_data:
+            return []
+        if min_pnl_change is None:
+            min_pnl_change = settings.POSITION_MTM_MIN_PNL_CHANGE
+        if min_pnl_change_ratio is None:
+            min_pnl_change_ratio = settings.POSITION_MTM_MIN_PNL_CHANGE_RATIO
+        
         try:
-            updated_count = 0
-            
-            for symbol, price in price_data.items():
-                positions = self.db.query(Position).filter(
-                    Position.symbol == symbol,
-                    Position.status == PositionStatus.OPEN
-                ).all()
-                
-                for position in positions:
-                    position.update_market_price(price)
-                    updated_count += 1
+            if self.db.get_bind().dialect.name == 'postgresql':
+                marked = self._mark_to_market_values(price_data, min_pnl_change, min_pnl_change_ratio)
+            else:
+                marked = self._mark_to_market_by_symbol(price_data, min_pnl_change, min_pnl_change_ratio)
             
             self.db.commit()
-            logger.info(f"批量更新市场数据完成，更新 {updated_count} 个持仓")
+            logger.debug(f"批量盯市完成: {len(price_data)} 个合约，{len(marked)} 个持仓盈亏变化显著")
+            return marked
             
         except Exception as e:
             self.db.rollback()
             logger.error(f"批量更新市场数据失败: {str(e)}")
             raise
     
+    def _mark_to_market_values(self, price_data: Dict[str, Decimal], min_pnl_change: float,
+                               min_pnl_change_ratio: float) -> List[MarkedPosition]:
+        """PostgreSQL: 单条 UPDATE ... FROM (VALUES ...) 语句，RETURNING 中按阈值筛选"""
+        table = Position.__table__
+        old = table.alias('old')
+        prices = values(
+            column('symbol', String), column('price', Numeric), name='prices'
+        ).data([(symbol, Decimal(str(price))) for symbol, price in price_data.items()])
+        
+        marked = update(table).values(**_mark_to_market_values(table, prices.c.price)).where(
+            table.c.symbol == prices.c.symbol,
+            table.c.status == PositionStatus.OPEN,
+            old.c.id == table.c.id
+        ).returning(
+            table.c.id, table.c.user_id, table.c.symbol, table.c.position_type, table.c.quantity,
+            table.c.average_cost, table.c.current_price, old.c.current_price.label('previous_price'),
+            table.c.market_value, table.c.unrealized_pnl, old.c.unrealized_pnl.label('previous_pnl'),
+            table.c.unrealized_pnl_percent, table.c.total_pnl, table.c.daily_pnl,
+            table.c.stop_loss_price, table.c.take_profit_price
+        ).cte('marked')
+        
+        is_long = marked.c.position_type == PositionType.LONG
+        threshold = func.greatest(
+            min_pnl_change, min_pnl_change_ratio * func.abs(marked.c.quantity * marked.c.average_cost)
+        )
+        material = or_(
+            marked.c.previous_price.is_(None),
+            func.abs(marked.c.unrealized_pnl - func.coalesce(marked.c.previous_pnl, 0)) >= threshold,
+            and_(marked.c.stop_loss_price.isnot(None), case(
+                (is_long, marked.c.current_price <= marked.c.stop_loss_price),
+                else_=marked.c.current_price >= marked.c.stop_loss_price
+            )),
+            and_(marked.c.take_profit_price.isnot(None), case(
+                (is_long, marked.c.current_price >= marked.c.take_profit_price),
+                else_=marked.c.current_price <= marked.c.take_profit_price
+            ))
+        )
+        rows = self.db.execute(select(marked).where(material)).all()
+        return [MarkedPosition(*row) for row in rows]
+    
+    def _mark_to_market_by_symbol(self, price_data: Dict[str, Decimal], min_pnl_change: float,
+                                  min_pnl_change_ratio: float) -> List[MarkedPosition]:
+        """其他数据库：一条按合约参数化的 UPDATE 批量执行，显著变化在内存中按列计算"""
+        table = Position.__table__
+        # 数值列按浮点读取，避免逐行构造 Decimal；只有显著变化的持仓再读取精确值
+        rows = self.db.execute(
+            select(
+                table.c.id, table.c.symbol, table.c.position_type,
+                type_coerce(table.c.quantity, Float), type_coerce(table.c.average_cost, Float),
+                type_coerce(table.c.current_price, Float), type_coerce(table.c.unrealized_pnl, Float),
+                type_coerce(table.c.stop_loss_price, Float), type_coerce(table.c.take_profit_price, Float)
+            ).where(table.c.symbol.in_(list(price_data)), table.c.status == PositionStatus.OPEN)
+        ).all()
+        
+        self.db.execute(
+            update(table)
+            .where(table.c.symbol == bindparam('_symbol'), table.c.status == PositionStatus.OPEN)
+            .values(**_mark_to_market_values(table, bindparam('_price', type_=Numeric(20, 8)))),
+            [{'_symbol': symbol, '_price': Decimal(str(price))} for symbol, price in price_data.items()]
+        )
+        
+        if not rows:
+            return []
+        
+        ids, symbols, position_types, *numeric = zip(*rows)
+        quantity, average_cost, previous_price, previous_pnl, stop_loss, take_profit = (
+            np.array(column, dtype=float) for column in numeric
+        )
+        symbol_price = {symbol: float(price) for symbol, price in price_data.items()}
+        price = np.array([symbol_price[symbol] for symbol in symbols])
+        side = np.array([1.0 if position_type == PositionType.LONG else -1.0 for position_type in position_types])
+        pnl = side * quantity * (price - average_cost)
+        threshold = np.maximum(min_pnl_change, min_pnl_change_ratio * np.abs(quantity * average_cost))
+        with np.errstate(invalid='ignore'):
+            material = np.abs(pnl - np.nan_to_num(previous_pnl)) >= threshold
+            material |= np.isnan(previous_price)
+            material |= np.where(side > 0, price <= stop_loss, price >= stop_loss)
+            material |= np.where(side > 0, price >= take_profit, price <= take_profit)
+        
+        positions = {ids[i]: i for i in np.flatnonzero(material)}
+        marked = []
+        material_ids = list(positions)
+        for start in range(0, len(material_ids), 1000):
+            updated = self.db.execute(
+                select(
+                    table.c.id, table.c.user_id, table.c.symbol, table.c.position_type, table.c.quantity,
+                    table.c.average_cost, table.c.current_price, table.c.market_value, table.c.unrealized_pnl,
+                    table.c.unrealized_pnl_percent, table.c.total_pnl, table.c.daily_pnl,
+                    table.c.stop_loss_price, table.c.take_profit_price
+                ).where(table.c.id.in_(material_ids[start:start + 1000]))
+            ).all()
+            for row in updated:
+                i = positions[row.id]
+                marked.append(MarkedPosition(
+                    id=row.id, user_id=row.user_id, symbol=row.symbol, position_type=row.position_type,
+                    quantity=row.quantity, average_cost=row.average_cost, current_price=row.current_price,
+                    previous_price=None if np.isnan(previous_price[i]) else Decimal(str(previous_price[i])),
+                    market_value=row.market_value, unrealized_pnl=row.unrealized_pnl,
+                    previous_pnl=None if np.isnan(previous_pnl[i]) else Decimal(str(previous_pnl[i])),
+                    unrealized_pnl_percent=row.unrealized_pnl_percent, total_pnl=row.total_pnl,
+                    daily_pnl=row.daily_pnl, stop_loss_price=row.stop_loss_price,
+                    take_profit_price=row.take_profit_price
+                ))
+        return marked
+    
     def calculate_portfolio_metrics(self, user_id: int) -> Dict[str, Any]:
         """计算投资组合指标"""
         try:
@@ -218,46 +370,36 @@ class PositionCalculationService:
                 Position.user_id == user_id
             ).all()
             
+            # 一次性从账本检查点增量重算该用户全部持仓
+            states = self.ledger.rebuild_many(user_id)
+            self.db.commit()
+            
             for position in positions:
-                # 重新计算持仓并比较
-                fills = self.db.query(OrderFill).join(Order).filter(
-                    Order.user_id == user_id,
-                    Order.symbol == position.symbol,
-                    Order.strategy_id == position.strategy_id,
-                    Order.backtest_id == position.backtest_id
-                ).order_by(OrderFill.fill_time).all()
-                
-                # 创建临时持仓对象进行计算
-                temp_position = Position(
-                    symbol=position.symbol,
-                    user_id=user_id,
-                    strategy_id=position.strategy_id,
-                    backtest_id=position.backtest_id
+                calculated = states.get(
+                    (position.symbol, position.strategy_id, position.backtest_id), LedgerState()
                 )
                 
-                self._recalculate_position_from_fills(temp_position, fills)
-                
                 # 比较计算结果
                 tolerance = Decimal('0.01')  # 容差
                 
-                if abs(position.quantity - temp_position.quantity) > tolerance:
+                if abs(position.quantity - calculated.quantity) > tolerance:
                     inconsistencies.append({
                         'position_id': position.id,
                         'symbol': position.symbol,
                         'field': 'quantity',
                         'current_value': float(position.quantity),
-                        'calculated_value': float(temp_position.quantity),
-                        'difference': float(position.quantity - temp_position.quantity)
+                        'calculated_value': float(calculated.quantity),
+                        'difference': float(position.quantity - calculated.quantity)
                     })
                 
-                if abs(position.average_cost - temp_position.average_cost) > tolerance:
+                if abs(position.average_cost - calculated.average_cost) > tolerance:
                     inconsistencies.append({
                         'position_id': position.id,
                         'symbol': position.symbol,
                         'field': 'average_cost',
                         'current_value': float(position.average_cost),
-                        'calculated_value': float(temp_position.average_cost),
-                        'difference': float(position.average_cost - temp_position.average_cost)
+                        'calculated_value': float(calculated.average_cost),
+                        'difference': float(position.average_cost - calculated.average_cost)
                     })
             
             return {
@@ -268,6 +410,7 @@ class PositionCalculationService:
             }
             
         except Exception as e:
+            self.db.rollback()
             logger.error(f"检查持仓一致性失败: {str(e)}")
             raise
     
@@ -281,25 +424,27 @@ class PositionCalculationService:
                 query = query.filter(Position.id == position_id)
             
             positions = query.all()
+            states = self.ledger.rebuild_many(
+                user_id, {(p.symbol, p.strategy_id, p.backtest_id) for p in positions}
+            )
             
             for position in positions:
-                # 重新计算持仓
-                result = self.calculate_position_from_trades(
-                    user_id=position.user_id,
-                    symbol=position.symbol,
-                    strategy_id=position.strategy_id,
-                    backtest_id=position.backtest_id
-                )
+                # 用账本重算结果覆盖持仓
+                state = states.get((position.symbol, position.strategy_id, position.backtest_id))
                 
-                if result:
+                if state:
+                    state.apply_to(position)
                     repaired_count += 1
             
+            self.db.commit()
+            
             return {
                 'repaired_positions': repaired_count,
                 'message': f'成功修复 {repaired_count} 个持仓记录'
             }
             
         except Exception as e:
+            self.db.rollback()
             logger.error(f"修复持仓数据失败: {str(e)}")
             raise
 
@@ -457,6 +602,8 @@ class PositionService:
             else:
                 close_pnl = position.quantity * (position.average_cost - close_price)
             
+            closed_quantity = position.quantity if position.is_long else -position.quantity
+            
             # 更新持仓状态
             position.realized_pnl += close_pnl
             position.quantity = Decimal('0')
@@ -475,6 +622,9 @@ class PositionService:
             self.db.commit()
             self.db.refresh(position)
             
+            # 增量更新内存风控账本
+            risk_book.on_position(user_id, position.symbol, -closed_quantity, close_price)
+            
             logger.info(f"平仓完成: {position.symbol}, 平仓价: {close_price}, 盈亏: {close_pnl}")
             return position
             
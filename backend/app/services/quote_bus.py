@@ -0,0 +1,326 @@
+"""
+行情总线
+进程内的推送式行情分发：适配器收到行情后发布到总线，消费者按合约注册异步回调或异步迭代器，
+不再各自定时轮询。每个订阅有自己的邮箱和处理任务，邮箱按合约只保留最新一笔行情，
+慢消费者不会阻塞发布方，也不会积压过期行情。
+
+上游订阅按引用计数管理：某合约出现第一个订阅者时向行情源订阅，最后一个订阅者离开时取消。
+行情源需提供 add_quote_callback / remove_quote_callback / subscribe_quotes / unsubscribe_quotes，
+回调形式为 callback(symbol, quote_data, received_at)。
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from ..core.metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+QuoteCallback = Callable[["QuoteTick"], Union[None, Awaitable[None]]]
+
+
+class QuoteTick:
+    """一笔行情
+
+    received_at为适配器收到行情的时间（time.perf_counter），下游据此统计端到端延迟
+    """
+
+    __slots__ = ("symbol", "data", "received_at")
+
+    def __init__(self, symbol: str, data: Dict[str, Any], received_at: float):
+        self.symbol = symbol
+        self.data = data
+        self.received_at = received_at
+
+    @property
+    def last_price(self) -> Optional[float]:
+        return self.data.get("last_price")
+
+
+class QuoteSubscription:
+    """单个消费者的订阅
+
+    有回调时由订阅自己的任务按到达顺序调用回调；没有回调时可用 async for 逐笔读取
+    """
+
+    def __init__(self, bus: "QuoteBus", callback: Optional[QuoteCallback] = None, name: str = ""):
+        self.bus = bus
+        self.callback = callback
+        self.name = name or getattr(callback, "__qualname__", "iterator")
+        self.symbols: Set[str] = set()
+        self.closed = False
+
+        # symbol -> 尚未处理的最新行情，同一合约的新行情覆盖旧行情
+        self._mailbox: Dict[str, QuoteTick] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.delivered = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._mailbox)
+
+    def start(self):
+        if self.callback is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def offer(self, tick: QuoteTick):
+        """放入邮箱，不等待处理"""
+        if self.closed:
+            return
+        if tick.symbol in self._mailbox:
+            self.coalesced += 1
+        self._mailbox[tick.symbol] = tick
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._mailbox.clear()
+        # 唤醒等待中的迭代器使其结束
+        self._wakeup.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def wait_closed(self):
+        """等待处理任务结束，在处理任务自身中调用时直接返回"""
+        task = self._task
+        if task is not None and task is not asyncio.current_task():
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def next_tick(self) -> Optional[QuoteTick]:
+        """取出下一笔行情，订阅关闭时返回None"""
+        while not self._mailbox:
+            if self.closed:
+                return None
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        if self.closed:
+            return None
+
+        symbol = next(iter(self._mailbox))
+        tick = self._mailbox.pop(symbol)
+        self.delivered += 1
+        self.bus.dispatch_latency.record(time.perf_counter() - tick.received_at)
+        return tick
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> QuoteTick:
+        tick = await self.next_tick()
+        if tick is None:
+            raise StopAsyncIteration
+        return tick
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                tick = await self.next_tick()
+                if tick is None:
+                    break
+                try:
+                    result = self.callback(tick)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"行情回调执行失败 {self.name} {tick.symbol}: {e}")
+        except asyncio.CancelledError:
+            pass
+
+
+class QuoteBus:
+    """进程内行情总线"""
+
+    def __init__(self):
+        self.source: Any = None
+        self._subscribers: Dict[str, Set[QuoteSubscription]] = defaultdict(set)
+        self._subscriptions: Set[QuoteSubscription] = set()
+        self._latest: Dict[str, QuoteTick] = {}
+        self._lock = asyncio.Lock()
+
+        self.published = 0
+        # 行情从适配器收到到消费者取出的延迟
+        self.dispatch_latency = LatencyRecorder()
+
+    async def start(self, source: Any = None):
+        """接入行情源并启动其行情推送"""
+        if source is None:
+            from .tqsdk_adapter import tqsdk_adapter
+            source = tqsdk_adapter
+
+        if self.source is source:
+            return
+        await self.stop()
+
+        self.source = source
+        source.add_quote_callback(self.publish)
+
+        # 已有订阅者的合约补订上游
+        symbols = [symbol for symbol, subscribers in self._subscribers.items() if subscribers]
+        if symbols:
+            await self._subscribe_upstream(symbols)
+        if hasattr(source, "start_quote_pump"):
+            await source.start_quote_pump()
+
+        logger.info("行情总线已启动")
+
+    async def stop(self):
+        """断开行情源，已有订阅保留"""
+        source, self.source = self.source, None
+        if source is None:
+            return
+        source.remove_quote_callback(self.publish)
+        if hasattr(source, "stop_quote_pump"):
+            await source.stop_quote_pump()
+        logger.info("行情总线已停止")
+
+    def publish(self, symbol: str, data: Dict[str, Any], received_at: Optional[float] = None) -> int:
+        """发布一笔行情，返回收到行情的订阅数
+
+        只放入各订阅的邮箱，不等待消费者处理，可在适配器回调中直接调用
+        """
+        tick = QuoteTick(symbol, data, received_at if received_at is not None else time.perf_counter())
+        self._latest[symbol] = tick
+        self.published += 1
+
+        subscribers = self._subscribers.get(symbol)
+        if not subscribers:
+            return 0
+        for subscription in subscribers:
+            subscription.offer(tick)
+        return len(subscribers)
+
+    def latest(self, symbol: str) -> Optional[QuoteTick]:
+        """合约最近一笔行情"""
+        return self._latest.get(symbol)
+
+    async def subscribe(
+        self,
+        symbols: Iterable[str],
+        callback: Optional[QuoteCallback] = None,
+        name: str = ""
+    ) -> QuoteSubscription:
+        """订阅合约行情
+
+        传入回调时每笔行情由订阅自己的任务调用回调，否则返回的订阅可用 async for 读取
+        """
+        subscription = QuoteSubscription(self, callback, name)
+        self._subscriptions.add(subscription)
+        subscription.start()
+        await self.add_symbols(subscription, symbols)
+        return subscription
+
+    async def unsubscribe(self, subscription: QuoteSubscription):
+        """取消订阅并停止其处理任务"""
+        if subscription.closed:
+            return
+        await self.remove_symbols(subscription, list(subscription.symbols))
+        subscription.close()
+        self._subscriptions.discard(subscription)
+        await subscription.wait_closed()
+
+    async def add_symbols(self, subscription: QuoteSubscription, symbols: Iterable[str]):
+        """为已有订阅增加合约"""
+        added = []
+        async with self._lock:
+            for symbol in symbols:
+                if symbol in subscription.symbols:
+                    continue
+                subscription.symbols.add(symbol)
+                subscribers = self._subscribers[symbol]
+                if not subscribers:
+                    added.append(symbol)
+                subscribers.add(subscription)
+            if added:
+                await self._subscribe_upstream(added)
+
+    async def remove_symbols(self, subscription: QuoteSubscription, symbols: Iterable[str]):
+        """为已有订阅移除合约"""
+        removed = []
+        async with self._lock:
+            for symbol in symbols:
+                if symbol not in subscription.symbols:
+                    continue
+                subscription.symbols.discard(symbol)
+                subscription._mailbox.pop(symbol, None)
+                subscribers = self._subscribers.get(symbol)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[symbol]
+                    removed.append(symbol)
+            if removed:
+                await self._unsubscribe_upstream(removed)
+
+    async def wait_for(
+        self,
+        symbol: str,
+        predicate: Callable[[QuoteTick], bool],
+        timeout: Optional[float] = None
+    ) -> Optional[QuoteTick]:
+        """等待满足条件的行情，最近一笔已满足时立即返回；超时返回None"""
+        latest = self._latest.get(symbol)
+        if latest is not None and predicate(latest):
+            return latest
+
+        subscription = await self.subscribe([symbol], name=f"wait_for:{symbol}")
+
+        async def _wait():
+            async for tick in subscription:
+                if predicate(tick):
+                    return tick
+            return None
+
+        try:
+            return await asyncio.wait_for(_wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            await self.unsubscribe(subscription)
+
+    def subscribed_symbols(self) -> List[str]:
+        return list(self._subscribers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        subscriptions = list(self._subscriptions)
+        return {
+            "source": type(self.source).__name__ if self.source is not None else None,
+            "symbols": len(self._subscribers),
+            "subscriptions": len(subscriptions),
+            "published": self.published,
+            "delivered": sum(s.delivered for s in subscriptions),
+            "coalesced": sum(s.coalesced for s in subscriptions),
+            "pending": sum(s.pending for s in subscriptions),
+            "callback_errors": sum(s.errors for s in subscriptions),
+            "dispatch_latency": self.dispatch_latency.snapshot(),
+        }
+
+    async def _subscribe_upstream(self, symbols: List[str]):
+        if self.source is None:
+            return
+        try:
+            await self.source.subscribe_quotes(symbols)
+        except Exception as e:
+            logger.warning(f"行情源订阅失败 {symbols}: {e}")
+
+    async def _unsubscribe_upstream(self, symbols: List[str]):
+        if self.source is None:
+            return
+        try:
+            await self.source.unsubscribe_quotes(symbols)
+        except Exception as e:
+            logger.warning(f"行情源取消订阅失败 {symbols}: {e}")
+
+
+# 创建全局行情总线实例
+quote_bus = QuoteBus()
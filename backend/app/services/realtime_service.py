@@ -4,7 +4,8 @@
 import asyncio
 import json
 import logging
-from typing import Dict, List, Set, Optional, Callable, Any
+import time
+from typing import Dict, List, Set, Optional, Callable, Any, Union
 from datetime import datetime
 from fastapi import WebSocket
 from collections import defaultdict
@@ -13,8 +14,15 @@ import weakref
 from ..core.exceptions import ValidationError
 from ..services.tqsdk_adapter import tqsdk_adapter
 from ..services.market_service import market_service
+from ..services.quote_bus import QuoteSubscription, QuoteTick, quote_bus
 from ..core.database import get_redis_client
 from ..schemas.market import QuoteData, KlineData
+from ..websocket.fanout import ConnectionSender, FanoutHub, encode_message
+from ..websocket.quote_stream import ENCODING_JSON, QuoteDeltaStream
+
+# 行情推送模式
+STREAM_MODE_FULL = "full"        # 每次推送完整行情
+STREAM_MODE_COMPACT = "compact"  # 快照 + 增量字段
 
 logger = logging.getLogger(__name__)
 
@@ -22,17 +30,36 @@ logger = logging.getLogger(__name__)
 class WebSocketConnection:
     """WebSocket连接封装"""
     
-    def __init__(self, websocket: WebSocket, user_id: int, connection_id: str):
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        connection_id: str,
+        sender: Optional[ConnectionSender] = None
+    ):
         self.websocket = websocket
         self.user_id = user_id
         self.connection_id = connection_id
+        self.sender = sender
         self.subscribed_symbols: Set[str] = set()
         self.is_active = True
         self.created_at = datetime.now()
         self.last_ping = datetime.now()
+        
+        # 增量推送状态
+        self.stream_mode = STREAM_MODE_FULL
+        self.encoding = ENCODING_JSON
+        self.delta_interval = 0.0
+        self.next_delta_at = 0.0
+        self.quote_versions: Dict[str, int] = {}  # symbol -> 已推送的版本
+        self.stream_version = 0  # 上次推送时行情流的全局序号
     
     async def send_message(self, message: Dict[str, Any]):
         """发送消息"""
+        if self.sender is not None:
+            # 放入发送队列，发送失败时由写任务移除连接
+            return self.is_active and self.sender.offer(encode_message(message))
+        
         try:
             if self.is_active:
                 await self.websocket.send_text(json.dumps(message, default=str))
@@ -65,12 +92,22 @@ class RealtimeDataService:
         self.data_push_task: Optional[asyncio.Task] = None
         self.heartbeat_task: Optional[asyncio.Task] = None
         
+        # 行情由行情总线推送，到达即转发给订阅的连接
+        self.quote_bus = quote_bus
+        self._quote_subscription: Optional[QuoteSubscription] = None
+        
+        # 发送队列：行情只序列化一次，慢连接按合约合并
+        self.fanout = FanoutHub()
+        
+        # 增量行情流
+        self.quote_stream = QuoteDeltaStream()
+        self.compact_connections: Set[str] = set()
+        self.max_delta_updates_per_sec = 10  # 单个连接每秒最多推送的增量帧数
+        
         # 数据缓存
         self._quote_cache: Dict[str, QuoteData] = {}
-        self._last_push_time: Dict[str, datetime] = {}
         
         # 推送频率控制
-        self.quote_push_interval = 0.5  # 500ms推送一次行情
         self.heartbeat_interval = 30  # 30秒心跳检测
         
         # 统计信息
@@ -89,8 +126,11 @@ class RealtimeDataService:
         
         self.is_running = True
         
-        # 启动数据推送任务
-        self.data_push_task = asyncio.create_task(self._data_push_loop())
+        # 订阅行情总线
+        await self._ensure_quote_subscription()
+        
+        # 启动增量帧补发任务
+        self.data_push_task = asyncio.create_task(self._delta_flush_loop())
         
         # 启动心跳检测任务
         self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
@@ -107,7 +147,12 @@ class RealtimeDataService:
         if self.heartbeat_task:
             self.heartbeat_task.cancel()
         
+        if self._quote_subscription is not None:
+            await self.quote_bus.unsubscribe(self._quote_subscription)
+            self._quote_subscription = None
+        
         # 关闭所有连接
+        await self.fanout.close()
         for connection in list(self.connections.values()):
             await connection.close()
         
@@ -127,7 +172,10 @@ class RealtimeDataService:
         try:
             await websocket.accept()
             
-            connection = WebSocketConnection(websocket, user_id, connection_id)
+            sender = self.fanout.register(
+                connection_id, websocket, on_close=lambda: self.remove_connection(connection_id)
+            )
+            connection = WebSocketConnection(websocket, user_id, connection_id, sender)
             
             self.connections[connection_id] = connection
             self.user_connections[user_id].add(connection_id)
@@ -167,6 +215,8 @@ class RealtimeDataService:
             del self.user_connections[connection.user_id]
         
         # 关闭连接
+        await self.fanout.remove(connection_id)
+        self.compact_connections.discard(connection_id)
         await connection.close()
         
         # 从连接列表中移除
@@ -206,14 +256,15 @@ class RealtimeDataService:
                 return False
             
             # 添加订阅
+            new_symbols = [s for s in valid_symbols if not self.symbol_subscribers.get(s)]
             for symbol in valid_symbols:
                 connection.subscribed_symbols.add(symbol)
                 self.symbol_subscribers[symbol].add(connection_id)
             
-            # 通过市场服务订阅行情
-            from ..schemas.market import QuoteSubscription
-            subscription = QuoteSubscription(symbols=valid_symbols)
-            await market_service.subscribe_quotes(subscription)
+            # 首次订阅的合约向行情总线订阅
+            if new_symbols:
+                subscription = await self._ensure_quote_subscription()
+                await self.quote_bus.add_symbols(subscription, new_symbols)
             
             self.stats["total_subscriptions"] += len(valid_symbols)
             
@@ -225,7 +276,10 @@ class RealtimeDataService:
             })
             
             # 立即推送当前行情
-            await self._push_current_quotes(connection_id, valid_symbols)
+            if connection.stream_mode == STREAM_MODE_COMPACT:
+                await self._push_quote_snapshot(connection_id, valid_symbols)
+            else:
+                await self._push_current_quotes(connection_id, valid_symbols)
             
             logger.info(f"连接 {connection_id} 订阅行情: {valid_symbols}")
             return True
@@ -278,13 +332,134 @@ class RealtimeDataService:
         """取消单个合约订阅"""
         if connection_id in self.connections:
             self.connections[connection_id].subscribed_symbols.discard(symbol)
+            self.connections[connection_id].quote_versions.pop(symbol, None)
         
         self.symbol_subscribers[symbol].discard(connection_id)
         
-        # 如果没有其他连接订阅此合约，取消市场服务订阅
+        # 如果没有其他连接订阅此合约，取消行情总线订阅
         if not self.symbol_subscribers[symbol]:
-            await market_service.unsubscribe_quotes([symbol])
+            if self._quote_subscription is not None:
+                await self.quote_bus.remove_symbols(self._quote_subscription, [symbol])
             del self.symbol_subscribers[symbol]
+            self.quote_stream.discard(symbol)
+    
+    async def set_stream_mode(
+        self,
+        connection_id: str,
+        mode: str,
+        encoding: str = ENCODING_JSON,
+        max_updates_per_sec: Optional[float] = None
+    ) -> bool:
+        """设置连接的行情推送模式
+        
+        compact模式下先推送快照，之后只推送变化的字段，并限制每秒推送次数；
+        encoding为msgpack时增量帧以二进制帧发送
+        """
+        if connection_id not in self.connections:
+            return False
+        
+        connection = self.connections[connection_id]
+        
+        if mode not in (STREAM_MODE_FULL, STREAM_MODE_COMPACT):
+            await connection.send_message({
+                "type": "error",
+                "message": f"不支持的推送模式: {mode}",
+                "timestamp": datetime.now().isoformat(),
+            })
+            return False
+        
+        if encoding not in self.quote_stream.encodings:
+            await connection.send_message({
+                "type": "error",
+                "message": f"不支持的编码: {encoding}",
+                "timestamp": datetime.now().isoformat(),
+            })
+            return False
+        
+        rate = self.max_delta_updates_per_sec
+        if max_updates_per_sec:
+            rate = min(max(float(max_updates_per_sec), 0.1), rate)
+        
+        connection.stream_mode = mode
+        connection.encoding = encoding
+        connection.delta_interval = 1.0 / rate
+        
+        if mode == STREAM_MODE_COMPACT:
+            self.compact_connections.add(connection_id)
+            # 已订阅的合约重新发快照
+            if connection.subscribed_symbols:
+                await self._push_quote_snapshot(connection_id, list(connection.subscribed_symbols))
+        else:
+            self.compact_connections.discard(connection_id)
+            connection.quote_versions.clear()
+        
+        return True
+    
+    async def resync_quotes(self, connection_id: str, symbols: Optional[List[str]] = None) -> bool:
+        """客户端发现版本不连续时重新推送快照"""
+        if connection_id not in self.connections:
+            return False
+        
+        connection = self.connections[connection_id]
+        targets = [s for s in (symbols or connection.subscribed_symbols) if s in connection.subscribed_symbols]
+        if not targets:
+            return False
+        
+        await self._push_quote_snapshot(connection_id, targets)
+        return True
+    
+    async def handle_client_message(self, connection_id: str, message: str):
+        """处理客户端消息"""
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return
+        
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            await connection.send_message({
+                "type": "error",
+                "message": "无效的JSON消息",
+                "timestamp": datetime.now().isoformat(),
+            })
+            return
+        
+        message_type = data.get("type")
+        symbols = data.get("symbols") or []
+        
+        if message_type == "subscribe":
+            if data.get("mode"):
+                if not await self.set_stream_mode(
+                    connection_id,
+                    data["mode"],
+                    data.get("encoding", ENCODING_JSON),
+                    data.get("max_updates_per_sec"),
+                ):
+                    return
+            await self.subscribe_quotes(connection_id, symbols)
+        elif message_type == "unsubscribe":
+            await self.unsubscribe_quotes(connection_id, symbols)
+        elif message_type == "set_mode":
+            await self.set_stream_mode(
+                connection_id,
+                data.get("mode", STREAM_MODE_FULL),
+                data.get("encoding", ENCODING_JSON),
+                data.get("max_updates_per_sec"),
+            )
+        elif message_type == "resync":
+            await self.resync_quotes(connection_id, symbols)
+        elif message_type == "ping":
+            connection.last_ping = datetime.now()
+            await connection.send_message({
+                "type": "pong",
+                "timestamp": datetime.now().isoformat(),
+            })
+        else:
+            await connection.send_message({
+                "type": "error",
+                "message": f"未知消息类型: {message_type}",
+                "timestamp": datetime.now().isoformat(),
+            })
     
     async def _push_current_quotes(self, connection_id: str, symbols: List[str]):
         """推送当前行情"""
@@ -309,70 +484,145 @@ class RealtimeDataService:
             logger.error(f"推送当前行情失败: {e}")
             self.stats["errors"] += 1
     
-    async def _data_push_loop(self):
-        """数据推送循环"""
-        while self.is_running:
-            try:
-                await asyncio.sleep(self.quote_push_interval)
-                
-                if not self.symbol_subscribers:
-                    continue
-                
-                # 获取所有订阅的合约行情
-                all_symbols = list(self.symbol_subscribers.keys())
-                if not all_symbols:
+    async def _push_quote_snapshot(self, connection_id: str, symbols: List[str]):
+        """推送增量模式的快照，并记录各合约版本"""
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return
+        
+        try:
+            # 尚未进入行情流的合约先取总线上的最新行情，仍没有的再查询一次
+            missing = []
+            for symbol in symbols:
+                if self.quote_stream.seq(symbol):
                     continue
+                tick = self.quote_bus.latest(symbol)
+                if tick is not None:
+                    self.quote_stream.update(symbol, tick.data)
+                else:
+                    missing.append(symbol)
+            if missing:
+                quotes = await market_service.get_quotes(missing)
+                for symbol, quote in (quotes or {}).items():
+                    self.quote_stream.update(symbol, quote.dict())
+            
+            frame, versions = self.quote_stream.snapshot_frame(symbols, connection.encoding)
+            if self.fanout.send(connection_id, frame):
+                # 暂无行情的合约从版本0开始，出现行情时推送完整字段
+                for symbol in symbols:
+                    connection.quote_versions[symbol] = versions.get(symbol, 0)
+                self.stats["messages_sent"] += 1
                 
-                quotes = await market_service.get_quotes(all_symbols)
-                
-                if not quotes:
-                    continue
+        except Exception as e:
+            logger.error(f"推送行情快照失败: {e}")
+            self.stats["errors"] += 1
+    
+    def _push_quote_deltas(self):
+        """向增量模式的连接推送自上次推送以来变化的字段"""
+        now = time.monotonic()
+        stream = self.quote_stream
+        
+        for connection_id in list(self.compact_connections):
+            connection = self.connections.get(connection_id)
+            if connection is None or now < connection.next_delta_at:
+                continue
+            
+            # 只检查上次推送后有变化的合约
+            versions = connection.quote_versions
+            changed = stream.changed_symbols(connection.stream_version)
+            symbols = versions.keys() if changed is None else [s for s in changed if s in versions]
+            
+            entries = []
+            advanced = []
+            for symbol in symbols:
+                entry = stream.encode_entry(symbol, versions[symbol], connection.encoding)
+                if entry is not None:
+                    entries.append(entry)
+                    advanced.append(symbol)
+            
+            if not entries:
+                connection.stream_version = stream.version
+                continue
+            
+            # 进入发送队列后才推进版本，丢弃的帧下次按旧版本重新计算
+            if self.fanout.send(connection_id, stream.frame(entries, connection.encoding)):
+                for symbol in advanced:
+                    versions[symbol] = stream.seq(symbol)
+                connection.stream_version = stream.version
+                connection.next_delta_at = now + connection.delta_interval
+                self.stats["messages_sent"] += 1
+    
+    async def _ensure_quote_subscription(self) -> QuoteSubscription:
+        """创建行情总线订阅"""
+        if self._quote_subscription is None:
+            self._quote_subscription = await self.quote_bus.subscribe(
+                list(self.symbol_subscribers), self._on_quote, name="realtime"
+            )
+        return self._quote_subscription
+    
+    async def _on_quote(self, tick: QuoteTick):
+        """行情总线推送的行情，立即转发给订阅的连接"""
+        symbol = tick.symbol
+        if not self.symbol_subscribers.get(symbol):
+            return
+        
+        try:
+            self.quote_stream.update(symbol, tick.data)
+            await self._broadcast_quote(symbol, tick.data, origin=tick.received_at)
+            
+            if self.compact_connections:
+                self._push_quote_deltas()
+        except Exception as e:
+            logger.error(f"推送行情失败 {symbol}: {e}")
+            self.stats["errors"] += 1
+    
+    async def _delta_flush_loop(self):
+        """增量帧补发循环
+        
+        行情到达时已立即推送增量，受限频未推送的连接在到期后由此补发
+        """
+        while self.is_running:
+            try:
+                await asyncio.sleep(1.0 / self.max_delta_updates_per_sec)
                 
-                # 按合约推送行情
-                for symbol, quote in quotes.items():
-                    await self._broadcast_quote(symbol, quote)
+                if self.compact_connections:
+                    self._push_quote_deltas()
                 
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                logger.error(f"数据推送循环异常: {e}")
+                logger.error(f"增量帧补发异常: {e}")
                 self.stats["errors"] += 1
                 await asyncio.sleep(1)
     
-    async def _broadcast_quote(self, symbol: str, quote: QuoteData):
-        """广播行情数据"""
+    async def _broadcast_quote(
+        self,
+        symbol: str,
+        quote: Union[QuoteData, Dict[str, Any]],
+        origin: Optional[float] = None
+    ):
+        """广播行情数据，origin为行情到达适配器的时间，用于统计推送延迟"""
         if symbol not in self.symbol_subscribers:
             return
         
-        # 检查是否需要推送（避免重复推送相同数据）
-        current_time = datetime.now()
-        last_push = self._last_push_time.get(symbol)
-        
-        if (last_push and 
-            (current_time - last_push).total_seconds() < self.quote_push_interval):
-            return
-        
         message = {
             "type": "quote_update",
             "symbol": symbol,
-            "data": quote.dict(),
-            "timestamp": current_time.isoformat(),
+            "data": quote.dict() if isinstance(quote, QuoteData) else quote,
+            "timestamp": datetime.now().isoformat(),
         }
         
-        # 向所有订阅此合约的连接推送
-        connection_ids = list(self.symbol_subscribers[symbol])
-        
-        for connection_id in connection_ids:
-            if connection_id in self.connections:
-                connection = self.connections[connection_id]
-                success = await connection.send_message(message)
-                
-                if success:
-                    self.stats["messages_sent"] += 1
-                else:
-                    # 连接已断开，移除
-                    await self.remove_connection(connection_id)
-                    self.stats["errors"] += 1
-        
-        self._last_push_time[symbol] = current_time
+        # 向所有订阅此合约的连接推送，消息只序列化一次；
+        # 慢连接按合约合并为最新行情，发送失败的连接由写任务移除
+        connection_ids = [
+            connection_id for connection_id in self.symbol_subscribers[symbol]
+            if connection_id not in self.compact_connections
+        ]
+        delivered = self.fanout.publish(
+            connection_ids, message, conflate_key=f"quote:{symbol}", origin=origin
+        )
+        
+        self.stats["messages_sent"] += delivered
     
     async def _heartbeat_loop(self):
         """心跳检测循环"""
@@ -418,14 +668,17 @@ class RealtimeDataService:
             # 向所有连接广播
             target_connections = list(self.connections.values())
         
-        for connection in target_connections:
-            await connection.send_message(message)
-            self.stats["messages_sent"] += 1
+        delivered = self.fanout.publish(
+            [connection.connection_id for connection in target_connections], message
+        )
+        self.stats["messages_sent"] += delivered
     
     def get_connection_stats(self) -> Dict[str, Any]:
         """获取连接统计信息"""
         return {
             **self.stats,
+            "fanout": self.fanout.get_stats(),
+            "quote_bus": self.quote_bus.get_stats(),
             "subscribed_symbols": len(self.symbol_subscribers),
             "active_symbols": len([s for s in self.symbol_subscribers if self.symbol_subscribers[s]]),
         }
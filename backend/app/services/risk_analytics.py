@@ -0,0 +1,578 @@
+"""
+组合风险分析引擎
+
+按合约宇宙维护滚动日收益率矩阵（环形缓冲），并增量维护收益率之和与叉积，
+协方差/相关系数矩阵按版本缓存；日终只追加一行收益率并移出最旧一行。
+全部用户组合的历史法、参数法、蒙特卡洛 VaR/CVaR 以及成分 VaR 通过一次矩阵运算得到，
+每小时风险指标任务的开销随合约数量而不是用户数量增长。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 历史收盘价加载函数: (合约, 根数) -> [(交易日, 收盘价), ...]
+HistoryLoader = Callable[[str, int], Awaitable[List[Tuple[date, float]]]]
+
+DEFAULT_CONFIDENCES = (0.95, 0.99)
+METHODS = ("historical", "parametric", "monte_carlo")
+
+# 单批组合情景矩阵的元素上限，避免用户数很多时一次性分配过大内存
+MAX_BATCH_ELEMENTS = 4_000_000
+
+
+def to_trading_day(value: Any) -> date:
+    """K线时间转换为交易日（纳秒/毫秒/秒时间戳按北京时间，或 datetime、字符串）"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        number = float(value)
+        unit = "ns" if number > 1e15 else "ms" if number > 1e11 else "s"
+        return pd.Timestamp(int(number), unit=unit, tz="UTC").tz_convert("Asia/Shanghai").date()
+    return pd.Timestamp(value).date()
+
+
+async def load_daily_closes(symbol: str, limit: int) -> List[Tuple[date, float]]:
+    """从行情服务加载日K线收盘价"""
+    from .market_data_service import market_data_service
+
+    klines = await market_data_service.get_klines(symbol, "1d", limit)
+    return [
+        (to_trading_day(k["datetime"]), float(k["close"]))
+        for k in klines or []
+        if k.get("close") is not None
+    ]
+
+
+class ReturnsUniverse:
+    """合约宇宙的滚动日收益率矩阵
+
+    收益率存放在 window × 合约数 的环形缓冲中，同时维护各列之和与叉积矩阵，
+    追加一天的代价为 O(合约数²)，无需按窗口重算协方差。
+    """
+
+    def __init__(self, window: int = 252):
+        self.window = window
+        self.symbols: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.last_close = np.zeros(0)
+        self.last_day: Optional[date] = None
+        self.version = 0
+
+        self._returns = np.zeros((window, 0))
+        self._days: List[Optional[date]] = [None] * window
+        self._count = 0
+        self._head = 0  # 下一行写入位置
+        self._sum = np.zeros(0)
+        self._cross = np.zeros((0, 0))
+        self._rolls = 0  # 距上次全量重算的追加次数
+        self._cov: Optional[np.ndarray] = None
+        self._corr: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def size(self) -> int:
+        return len(self.symbols)
+
+    def _order(self) -> np.ndarray:
+        """按时间顺序排列的缓冲行号"""
+        if self._count < self.window:
+            return np.arange(self._count)
+        return (np.arange(self.window) + self._head) % self.window
+
+    def rows(self) -> np.ndarray:
+        """窗口内收益率（行顺序不保证按时间，供与顺序无关的统计使用）"""
+        return self._returns[:self._count]
+
+    def returns(self) -> np.ndarray:
+        """按时间顺序的收益率矩阵 (交易日 × 合约)"""
+        return self._returns[self._order()]
+
+    def days(self) -> List[date]:
+        return [self._days[i] for i in self._order()]
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def add_symbols(self, history: Dict[str, Sequence[Tuple[date, float]]]) -> List[str]:
+        """加入新合约
+
+        历史收盘价与已有交易日对齐后计算收益率，缺失的交易日收益率记0。
+        宇宙为空时以全部新合约的交易日并集建立窗口。返回实际加入的合约。
+        """
+        history = {s: h for s, h in history.items() if s not in self.index and h}
+        if not history:
+            return []
+
+        if self._count == 0:
+            all_days = sorted({day for bars in history.values() for day, _ in bars})
+            days = all_days[1:][-self.window:]  # 首个交易日没有收益率
+            self._count = len(days)
+            self._head = self._count % self.window
+            self._days = list(days) + [None] * (self.window - self._count)
+            self.last_day = all_days[-1]
+
+        days = pd.Index(self.days())
+        order = self._order()
+        added = list(history)
+        columns = np.zeros((self.window, len(added)))
+        closes = np.zeros(len(added))
+        for j, symbol in enumerate(added):
+            series = pd.Series(
+                [float(close) for _, close in history[symbol]],
+                index=pd.Index([day for day, _ in history[symbol]])
+            )
+            series = series[~series.index.duplicated(keep="last")].sort_index()
+            series = series[series > 0]
+            if series.empty:
+                continue
+            aligned = series.reindex(series.index.union(days)).ffill()
+            rets = aligned.pct_change().reindex(days).replace([np.inf, -np.inf], np.nan).fillna(0.0)
+            columns[order, j] = rets.to_numpy()
+            closes[j] = series.iloc[-1]
+
+        offset = len(self.symbols)
+        self.symbols.extend(added)
+        self.index.update({symbol: offset + j for j, symbol in enumerate(added)})
+        self._returns = np.hstack([self._returns, columns])
+        self.last_close = np.concatenate([self.last_close, closes])
+        self._recompute()
+        return added
+
+    def roll_day(self, day: date, closes: Dict[str, float]) -> bool:
+        """日终追加一个交易日的收益率，未报价的合约收益率记0"""
+        if self.last_day is not None and day <= self.last_day:
+            return False
+        prices = self.last_close.copy()
+        for symbol, close in closes.items():
+            i = self.index.get(symbol)
+            if i is not None and close is not None and close > 0:
+                prices[i] = close
+        with np.errstate(divide="ignore", invalid="ignore"):
+            row = np.where(self.last_close > 0, prices / self.last_close - 1.0, 0.0)
+        self.append(day, row)
+        self.last_close = np.where(prices > 0, prices, self.last_close)
+        return True
+
+    def append(self, day: date, row: np.ndarray):
+        """追加一行收益率，窗口已满时移出最旧一行"""
+        if self._count == self.window:
+            oldest = self._returns[self._head].copy()
+            self._sum -= oldest
+            self._cross -= np.outer(oldest, oldest)
+        else:
+            self._count += 1
+        self._returns[self._head] = row
+        self._days[self._head] = day
+        self._head = (self._head + 1) % self.window
+        self._sum += row
+        self._cross += np.outer(row, row)
+        self.last_day = day
+        self._rolls += 1
+        if self._rolls >= self.window:
+            # 每滚动一个窗口全量重算一次，消除增减累积的舍入误差
+            self._recompute()
+        else:
+            self._invalidate()
+
+    def _recompute(self):
+        rows = self.rows()
+        self._sum = rows.sum(axis=0)
+        self._cross = rows.T @ rows
+        self._rolls = 0
+        self._invalidate()
+
+    def _invalidate(self):
+        self._cov = None
+        self._corr = None
+        self.version += 1
+
+    # ------------------------------------------------------------------
+    # 统计量
+    # ------------------------------------------------------------------
+
+    def mean(self) -> np.ndarray:
+        if self._count == 0:
+            return np.zeros(self.size)
+        return self._sum / self._count
+
+    def covariance(self) -> np.ndarray:
+        """样本协方差矩阵（按版本缓存）"""
+        if self._cov is None:
+            n = self._count
+            if n < 2:
+                cov = np.zeros((self.size, self.size))
+            else:
+                cov = (self._cross - np.outer(self._sum, self._sum) / n) / (n - 1)
+                cov = (cov + cov.T) / 2
+            self._cov = cov
+        return self._cov
+
+    def correlation(self) -> np.ndarray:
+        if self._corr is None:
+            cov = self.covariance()
+            std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                corr = cov / np.outer(std, std)
+            corr[~np.isfinite(corr)] = 0.0
+            np.fill_diagonal(corr, 1.0)
+            self._corr = corr
+        return self._corr
+
+
+def _cholesky(cov: np.ndarray) -> np.ndarray:
+    """协方差矩阵分解；半正定（如存在零波动合约）时退回特征分解"""
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(cov)
+        return vectors * np.sqrt(np.clip(values, 0.0, None))
+
+
+def _tail_risk(pnl: np.ndarray, confidences: Sequence[float]) -> Dict[float, Tuple[np.ndarray, np.ndarray]]:
+    """按行计算情景损益的 VaR 与 CVaR（损失为正）
+
+    分位数与 np.percentile 的线性插值一致，但只对左尾做一次部分排序，所有置信度共用。
+    """
+    n = pnl.shape[1]
+    positions = {c: (1 - c) * (n - 1) for c in confidences}
+    kth = min(n - 1, int(np.floor(max(positions.values()))) + 1)
+    lowest = np.sort(np.partition(pnl, kth, axis=1)[:, :kth + 1], axis=1)
+    result = {}
+    for c, position in positions.items():
+        lo = int(np.floor(position))
+        hi = min(lo + 1, n - 1)
+        threshold = lowest[:, lo] + (position - lo) * (lowest[:, hi] - lowest[:, lo])
+        # 与阈值相等的情景可能落在部分排序范围之外，按阈值补足
+        in_slice = lowest <= threshold[:, None]
+        count = (pnl <= threshold[:, None]).sum(axis=1)
+        total = (lowest * in_slice).sum(axis=1) + (count - in_slice.sum(axis=1)) * threshold
+        cvar = total / np.maximum(count, 1)
+        result[c] = (np.maximum(-threshold, 0.0), np.maximum(-cvar, 0.0))
+    return result
+
+
+class PortfolioRiskReport:
+    """批量组合风险结果，数组第一维为组合，金额单位与敞口一致"""
+
+    def __init__(self, keys: List[Hashable], symbols: List[str], exposures: np.ndarray,
+                 confidences: Sequence[float]):
+        count = len(keys)
+        self.keys = keys
+        self.symbols = symbols
+        self.exposures = exposures
+        self.confidences = tuple(confidences)
+        self.volatility = np.zeros(count)
+        self.var = {m: {c: np.zeros(count) for c in confidences} for m in METHODS}
+        self.cvar = {m: {c: np.zeros(count) for c in confidences} for m in METHODS}
+        self.component_var = {c: np.zeros(exposures.shape) for c in confidences}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        held = np.flatnonzero(self.exposures[i])
+        return {
+            "exposure": float(np.abs(self.exposures[i]).sum()),
+            "net_exposure": float(self.exposures[i].sum()),
+            "volatility": float(self.volatility[i]),
+            "var": {m: {c: float(v[i]) for c, v in by_conf.items()} for m, by_conf in self.var.items()},
+            "cvar": {m: {c: float(v[i]) for c, v in by_conf.items()} for m, by_conf in self.cvar.items()},
+            "component_var": {
+                c: {self.symbols[j]: float(comp[i, j]) for j in held}
+                for c, comp in self.component_var.items()
+            },
+        }
+
+    def to_dict(self) -> Dict[Hashable, Dict[str, Any]]:
+        return {key: self.row(i) for i, key in enumerate(self.keys)}
+
+
+def batch_portfolio_risk(
+    keys: List[Hashable],
+    symbols: List[str],
+    exposures: np.ndarray,
+    returns: np.ndarray,
+    mean: np.ndarray,
+    cov: np.ndarray,
+    scenarios: Optional[np.ndarray] = None,
+    confidences: Sequence[float] = DEFAULT_CONFIDENCES,
+    holding_period: int = 1
+) -> PortfolioRiskReport:
+    """批量计算组合风险
+
+    exposures 为 组合 × 合约 的金额敞口矩阵（空头为负）；returns 为 交易日 × 合约 的历史收益率，
+    scenarios 为 情景 × 合约 的蒙特卡洛收益率（为空则跳过蒙特卡洛法）。
+    """
+    report = PortfolioRiskReport(keys, symbols, exposures, confidences)
+    if len(keys) == 0 or exposures.shape[1] == 0:
+        return report
+
+    scale = np.sqrt(holding_period)
+    marginal = exposures @ cov
+    sigma = np.sqrt(np.clip(np.einsum("ij,ij->i", marginal, exposures), 0.0, None))
+    mu = exposures @ mean
+    report.volatility = sigma
+
+    for c in confidences:
+        z = stats.norm.ppf(1 - c)
+        report.var["parametric"][c] = np.maximum(-(mu + z * sigma), 0.0) * scale
+        report.cvar["parametric"][c] = np.maximum(-(mu - sigma * stats.norm.pdf(z) / (1 - c)), 0.0) * scale
+        # 欧拉分解：各合约成分VaR之和等于组合参数VaR（不含均值项）
+        with np.errstate(divide="ignore", invalid="ignore"):
+            component = exposures * marginal / sigma[:, None] * -z * scale
+        report.component_var[c] = np.nan_to_num(component)
+
+    # 情景损益矩阵 组合 × 情景 分批计算，控制内存
+    scenario_sets = [("historical", returns)]
+    if scenarios is not None and len(scenarios):
+        scenario_sets.append(("monte_carlo", scenarios))
+    for method, matrix in scenario_sets:
+        if len(matrix) == 0:
+            continue
+        batch = max(1, MAX_BATCH_ELEMENTS // len(matrix))
+        for start in range(0, len(keys), batch):
+            stop = start + batch
+            pnl = exposures[start:stop] @ matrix.T
+            for c, (var, cvar) in _tail_risk(pnl, confidences).items():
+                report.var[method][c][start:stop] = var * scale
+                report.cvar[method][c][start:stop] = cvar * scale
+    return report
+
+
+class RiskAnalyticsEngine:
+    """组合风险分析引擎
+
+    universe 的变更（加入合约、日终滚动）在事件循环中进行，读取在任意线程，
+    两者通过锁取快照隔离；小时任务调用 compute() 一次性计算全部用户并缓存结果。
+    """
+
+    def __init__(
+        self,
+        window: int = settings.RISK_ANALYTICS_WINDOW,
+        simulations: int = settings.RISK_ANALYTICS_SIMULATIONS,
+        confidences: Sequence[float] = DEFAULT_CONFIDENCES,
+        history_loader: Optional[HistoryLoader] = None,
+        seed: Optional[int] = None
+    ):
+        self.universe = ReturnsUniverse(window)
+        self.simulations = simulations
+        self.confidences = tuple(confidences)
+        self.history_loader = history_loader or load_daily_closes
+        self.seed = seed
+
+        self._mutex = threading.Lock()
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._requested: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._scenarios: Optional[np.ndarray] = None
+        self._scenarios_version = -1
+
+        # 最近一次批量计算中各组合所在的结果及行号，按需展开为字典
+        self._results: Dict[Hashable, Tuple[PortfolioRiskReport, int]] = {}
+        self.computed_at: Optional[float] = None
+        self.last_compute_ms = 0.0
+        self.last_portfolios = 0
+        self.rolls = 0
+
+    # ------------------------------------------------------------------
+    # 收益率数据
+    # ------------------------------------------------------------------
+
+    def request_symbols(self, symbols: Iterable[str]):
+        """同步调用方遇到未加载的合约时登记，下次 ensure_symbols 时一并加载"""
+        with self._mutex:
+            self._requested.update(s for s in symbols if s not in self.universe.index)
+
+    async def ensure_symbols(self, symbols: Iterable[str]) -> List[str]:
+        """加载尚未进入宇宙的合约历史，返回新加入的合约"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            with self._mutex:
+                wanted = (set(symbols) | self._requested) - set(self.universe.index) - self._failed
+                self._requested.clear()
+            if not wanted:
+                return []
+            wanted = sorted(wanted)
+            loaded = await asyncio.gather(
+                *(self.history_loader(symbol, self.universe.window + 1) for symbol in wanted),
+                return_exceptions=True
+            )
+            history = {}
+            for symbol, bars in zip(wanted, loaded):
+                if isinstance(bars, Exception) or not bars:
+                    # 加载失败的合约不再重复请求，日终时重试
+                    self._failed.add(symbol)
+                    logger.warning(f"加载合约 {symbol} 历史收益率失败: {bars if isinstance(bars, Exception) else '无数据'}")
+                    continue
+                history[symbol] = bars
+            with self._mutex:
+                added = self.universe.add_symbols(history)
+            if added:
+                logger.info(f"风险分析收益率矩阵加入 {len(added)} 个合约，共 {self.universe.size} 个")
+            return added
+
+    async def end_of_day(self, day: Optional[date] = None, closes: Optional[Dict[str, float]] = None) -> bool:
+        """日终滚动收益率窗口：追加当日收益率并增量更新协方差
+
+        closes 为空时从行情服务获取各合约最新日K线。
+        """
+        if closes is None:
+            symbols = list(self.universe.symbols)
+            bars = await asyncio.gather(*(self.history_loader(s, 2) for s in symbols), return_exceptions=True)
+            closes = {}
+            days = []
+            for symbol, rows in zip(symbols, bars):
+                if isinstance(rows, Exception) or not rows:
+                    continue
+                bar_day, close = rows[-1]
+                closes[symbol] = close
+                days.append(bar_day)
+            if day is None and days:
+                day = max(days)
+        if day is None:
+            return False
+        with self._mutex:
+            rolled = self.universe.roll_day(day, closes)
+            self._failed.clear()
+        if rolled:
+            self.rolls += 1
+            logger.info(f"风险分析收益率窗口滚动至 {day}，{len(closes)}/{self.universe.size} 个合约有收盘价")
+        return rolled
+
+    def _snapshot(self) -> Tuple[List[str], Dict[str, int], np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """在锁内取出计算所需数据，之后的矩阵运算不持锁"""
+        with self._mutex:
+            universe = self.universe
+            if self.simulations and self._scenarios_version != universe.version:
+                self._scenarios = self._simulate(universe.mean(), universe.covariance())
+                self._scenarios_version = universe.version
+            return (
+                list(universe.symbols),
+                dict(universe.index),
+                universe.rows().copy(),
+                universe.mean(),
+                universe.covariance(),
+                self._scenarios if self.simulations else None,
+            )
+
+    def _simulate(self, mean: np.ndarray, cov: np.ndarray) -> Optional[np.ndarray]:
+        """多元正态情景，同一协方差版本内所有组合共用"""
+        if len(mean) == 0:
+            return None
+        rng = np.random.default_rng(self.seed)
+        factor = _cholesky(cov)
+        return mean + rng.standard_normal((self.simulations, len(mean))) @ factor.T
+
+    # ------------------------------------------------------------------
+    # 计算
+    # ------------------------------------------------------------------
+
+    def _exposure_matrix(self, portfolios: Dict[Hashable, Dict[str, float]],
+                         index: Dict[str, int]) -> Tuple[List[Hashable], np.ndarray, Set[str]]:
+        keys = list(portfolios)
+        exposures = np.zeros((len(keys), len(index)))
+        missing: Set[str] = set()
+        for i, key in enumerate(keys):
+            for symbol, value in portfolios[key].items():
+                j = index.get(symbol)
+                if j is None:
+                    missing.add(symbol)
+                else:
+                    exposures[i, j] += float(value)
+        return keys, exposures, missing
+
+    def evaluate(self, portfolios: Dict[Hashable, Dict[str, float]],
+                 holding_period: int = 1) -> PortfolioRiskReport:
+        """计算一批组合的风险，portfolios 为 {组合键: {合约: 金额敞口}}"""
+        symbols, index, returns, mean, cov, scenarios = self._snapshot()
+        keys, exposures, missing = self._exposure_matrix(portfolios, index)
+        if missing:
+            self.request_symbols(missing)
+        return batch_portfolio_risk(
+            keys, symbols, exposures, returns, mean, cov, scenarios,
+            confidences=self.confidences, holding_period=holding_period
+        )
+
+    def compute(self, portfolios: Dict[Hashable, Dict[str, float]]) -> PortfolioRiskReport:
+        """小时任务：一次矩阵运算计算全部用户组合风险并缓存"""
+        begin = time.perf_counter()
+        report = self.evaluate(portfolios)
+        self._results.update((key, (report, i)) for i, key in enumerate(report.keys))
+        self.computed_at = time.time()
+        self.last_compute_ms = (time.perf_counter() - begin) * 1000
+        self.last_portfolios = len(report)
+        logger.info(
+            f"批量计算 {len(report)} 个组合风险，合约 {len(report.symbols)} 个，"
+            f"耗时 {self.last_compute_ms:.1f}ms"
+        )
+        return report
+
+    def portfolio_risk(self, exposures: Dict[str, float], holding_period: int = 1) -> Optional[Dict[str, Any]]:
+        """单个组合的风险；持仓合约均未进入宇宙时返回 None"""
+        report = self.evaluate({None: exposures}, holding_period=holding_period)
+        if not report.exposures.any():
+            return None
+        return report.row(0)
+
+    def get_result(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """最近一次批量计算的组合风险"""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        report, i = entry
+        return report.row(i)
+
+    def correlation(self, symbols: Sequence[str]) -> Optional[pd.DataFrame]:
+        """已加载合约的相关系数子矩阵"""
+        with self._mutex:
+            known = [s for s in dict.fromkeys(symbols) if s in self.universe.index]
+            if not known:
+                return None
+            idx = [self.universe.index[s] for s in known]
+            corr = self.universe.correlation()[np.ix_(idx, idx)]
+        return pd.DataFrame(corr, index=known, columns=known)
+
+    def covariance(self, symbols: Sequence[str]) -> Optional[pd.DataFrame]:
+        with self._mutex:
+            known = [s for s in dict.fromkeys(symbols) if s in self.universe.index]
+            if not known:
+                return None
+            idx = [self.universe.index[s] for s in known]
+            cov = self.universe.covariance()[np.ix_(idx, idx)]
+        return pd.DataFrame(cov, index=known, columns=known)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "symbols": self.universe.size,
+            "days": len(self.universe),
+            "window": self.universe.window,
+            "last_day": self.universe.last_day.isoformat() if self.universe.last_day else None,
+            "version": self.universe.version,
+            "rolls": self.rolls,
+            "portfolios": len(self._results),
+            "last_portfolios": self.last_portfolios,
+            "last_compute_ms": round(self.last_compute_ms, 3),
+            "computed_at": self.computed_at,
+        }
+
+
+# 创建全局风险分析引擎实例
+risk_analytics = RiskAnalyticsEngine()
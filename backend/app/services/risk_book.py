@@ -0,0 +1,601 @@
+"""
+内存风控账本
+
+每个用户的风控状态（风险规则、当日成交额、各合约持仓敞口、可用资金）只从数据库加载一次，
+之后由成交、持仓和账户事件增量更新，并定期与数据库对账。
+交易前风险检查只读取内存状态，不做任何I/O。
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from ..core.config import settings
+from ..core.metrics import LatencyRecorder
+from .quote_bus import quote_bus
+
+logger = logging.getLogger(__name__)
+
+# 账户级风控参数（与规则无关，所有用户适用）
+DEFAULT_RISK_CONFIG = {
+    "max_position_size_ratio": 0.1,  # 单个持仓最大占比（无集中度规则时使用）
+    "max_order_value_ratio": 0.2,    # 单笔订单最大价值比例
+    "daily_turnover_ratio": 2.0,     # 日交易限额为账户总额的倍数
+}
+
+# 对账时允许的浮点误差
+RECONCILE_TOLERANCE = 1e-6
+
+
+class RiskSnapshot:
+    """从数据库加载的用户风控状态"""
+
+    def __init__(
+        self,
+        total_balance: float = 0.0,
+        available_balance: float = 0.0,
+        used_margin: float = 0.0,
+        positions: Optional[Dict[str, float]] = None,
+        marks: Optional[Dict[str, float]] = None,
+        costs: Optional[Dict[str, float]] = None,
+        daily_notional: float = 0.0,
+        daily_pnl: float = 0.0,
+        rules: Optional[List[Dict[str, Any]]] = None,
+        has_account: bool = True
+    ):
+        self.total_balance = total_balance
+        self.available_balance = available_balance
+        self.used_margin = used_margin
+        self.positions = positions or {}  # 合约 -> 带方向的持仓数量（空头为负）
+        self.marks = marks or {}          # 合约 -> 估值价格
+        self.costs = costs or {}          # 合约 -> 持仓均价
+        self.daily_notional = daily_notional
+        self.daily_pnl = daily_pnl
+        self.rules = rules or []          # [{"rule_type", "symbol", "rule_value"}]
+        self.has_account = has_account
+
+
+def _next_midnight(now: Optional[float] = None) -> float:
+    today = datetime.fromtimestamp(now if now is not None else time.time()).date()
+    return datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+def _side_sign(side: Any) -> int:
+    """订单方向转为符号，兼容枚举和大小写字符串"""
+    value = getattr(side, "value", side)
+    return 1 if str(value).lower() == "buy" else -1
+
+
+def _failed(message: str, risk_level: str, action: str, rule_type: Optional[str] = None, **extra) -> Dict[str, Any]:
+    result = {"passed": False, "message": message, "risk_level": risk_level, "action": action}
+    if rule_type:
+        result["rule_type"] = rule_type
+    result.update(extra)
+    return result
+
+
+class UserRiskBook:
+    """单个用户的内存风控状态"""
+
+    def __init__(self, user_id: int, config: Optional[Dict[str, float]] = None):
+        self.user_id = user_id
+        self.config = dict(DEFAULT_RISK_CONFIG, **(config or {}))
+
+        self.has_account = False
+        self.total_balance = 0.0
+        self.available_balance = 0.0
+        self.used_margin = 0.0
+        self.positions: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.costs: Dict[str, float] = {}
+        self.daily_notional = 0.0
+        self.daily_pnl = 0.0
+
+        # 规则
+        self.order_size_limit: Optional[float] = None
+        self.order_value_limit: Optional[float] = None
+        self.position_limits: Dict[Optional[str], float] = {}  # None为全局限制
+        self.daily_loss_limit: Optional[float] = None
+        self.concentration_limit: Optional[float] = None
+        self.blacklist: FrozenSet[str] = frozenset()
+
+        self.events = 0  # 增量事件计数，对账时判断加载期间是否有新事件
+        self.loaded_at = 0.0
+        self._day_end = _next_midnight()
+
+    # ------------------------------------------------------------------
+    # 加载与增量更新
+    # ------------------------------------------------------------------
+
+    def load(self, snapshot: RiskSnapshot):
+        """用数据库快照替换全部状态"""
+        self.has_account = snapshot.has_account
+        self.total_balance = float(snapshot.total_balance)
+        self.available_balance = float(snapshot.available_balance)
+        self.used_margin = float(snapshot.used_margin)
+        self.positions = {symbol: float(qty) for symbol, qty in snapshot.positions.items() if qty}
+        self.marks.update({symbol: float(price) for symbol, price in snapshot.marks.items() if price})
+        self.costs = {
+            symbol: float(snapshot.costs.get(symbol) or self.marks.get(symbol, 0.0)) for symbol in self.positions
+        }
+        self.daily_notional = float(snapshot.daily_notional)
+        self.daily_pnl = float(snapshot.daily_pnl)
+        self.set_rules(snapshot.rules)
+        self.loaded_at = time.time()
+        self._day_end = _next_midnight()
+
+    def set_rules(self, rules: List[Dict[str, Any]]):
+        """按规则类型展开为检查用的限额"""
+        self.order_size_limit = None
+        self.order_value_limit = None
+        self.position_limits = {}
+        self.daily_loss_limit = None
+        self.concentration_limit = None
+        blacklist = set()
+
+        for rule in rules:
+            rule_type = getattr(rule["rule_type"], "value", rule["rule_type"])
+            value = rule.get("rule_value")
+            if rule_type == "order_size_limit":
+                self.order_size_limit = self._tighter(self.order_size_limit, value)
+            elif rule_type == "max_position_value":
+                self.order_value_limit = self._tighter(self.order_value_limit, value)
+            elif rule_type == "position_limit":
+                symbol = rule.get("symbol")
+                self.position_limits[symbol] = self._tighter(self.position_limits.get(symbol), value)
+            elif rule_type == "daily_loss_limit":
+                self.daily_loss_limit = self._tighter(self.daily_loss_limit, value)
+            elif rule_type == "concentration_limit":
+                self.concentration_limit = self._tighter(self.concentration_limit, value)
+            elif rule_type == "symbol_blacklist":
+                blacklist.update(rule.get("symbols") or ([rule["symbol"]] if rule.get("symbol") else []))
+        self.blacklist = frozenset(blacklist)
+
+    @staticmethod
+    def _tighter(current: Optional[float], value: Any) -> Optional[float]:
+        if value is None:
+            return current
+        value = float(value)
+        return value if current is None else min(current, value)
+
+    def apply_fill(self, symbol: str, side: Any, quantity: float, price: float, commission: float = 0.0):
+        """成交：更新持仓、持仓均价、当日成交额、资金占用和当日盈亏（平仓部分按持仓均价计算已实现盈亏）"""
+        self._roll_day()
+        quantity, price = float(quantity), float(price)
+        old = self.positions.get(symbol, 0.0)
+        new = old + _side_sign(side) * quantity
+        cost = self.costs.get(symbol, price)
+        realized_pnl = 0.0
+        if old and abs(new) < abs(old) + quantity:
+            # 减仓或反手：平掉的部分按持仓均价结算
+            closed = min(quantity, abs(old))
+            realized_pnl = closed * (price - cost) * (1 if old > 0 else -1)
+        if new:
+            self.positions[symbol] = new
+            if not old or old * new < 0:
+                self.costs[symbol] = price
+            elif abs(new) > abs(old):
+                self.costs[symbol] = (abs(old) * cost + quantity * price) / abs(new)
+        else:
+            self.positions.pop(symbol, None)
+            self.costs.pop(symbol, None)
+        self.marks[symbol] = price
+
+        # 开仓占用资金，平仓释放资金
+        margin_change = (abs(new) - abs(old)) * price
+        self.used_margin += margin_change
+        self.available_balance -= margin_change + float(commission)
+        self.daily_notional += quantity * price
+        self.daily_pnl += realized_pnl - float(commission)
+        self.events += 1
+
+    def adjust_position(self, symbol: str, change: float, price: Optional[float] = None):
+        """非成交引起的持仓变动（直接平仓、调整等），change为带方向的数量变化"""
+        old = self.positions.get(symbol, 0.0)
+        new = old + float(change)
+        if price:
+            self.marks[symbol] = float(price)
+        if new:
+            self.positions[symbol] = new
+            if not old or old * new < 0:
+                self.costs[symbol] = self.marks.get(symbol, 0.0)
+        else:
+            self.positions.pop(symbol, None)
+            self.costs.pop(symbol, None)
+
+        margin_change = (abs(new) - abs(old)) * self.marks.get(symbol, 0.0)
+        self.used_margin += margin_change
+        self.available_balance -= margin_change
+        self.events += 1
+
+    def set_account(self, total_balance: Optional[float] = None, available_balance: Optional[float] = None,
+                    used_margin: Optional[float] = None):
+        """账户资金变动（出入金、结算等）"""
+        if total_balance is not None:
+            self.total_balance = float(total_balance)
+        if available_balance is not None:
+            self.available_balance = float(available_balance)
+        if used_margin is not None:
+            self.used_margin = float(used_margin)
+        self.has_account = True
+        self.events += 1
+
+    def _roll_day(self):
+        now = time.time()
+        if now >= self._day_end:
+            self.daily_notional = 0.0
+            self.daily_pnl = 0.0
+            self._day_end = _next_midnight(now)
+
+    def exposure(self, symbol: str) -> float:
+        """合约持仓敞口（按估值价格）"""
+        return abs(self.positions.get(symbol, 0.0)) * self.marks.get(symbol, 0.0)
+
+    # ------------------------------------------------------------------
+    # 交易前检查
+    # ------------------------------------------------------------------
+
+    def check(self, symbol: str, side: Any, quantity: float, price: float) -> List[Dict[str, Any]]:
+        """交易前风险检查，返回未通过的检查项（为空表示通过）"""
+        self._roll_day()
+        failed = []
+        if not self.has_account:
+            failed.append(_failed("账户不存在", "critical", "reject_order"))
+            return failed
+
+        if symbol in self.blacklist:
+            failed.append(_failed(f"标的 {symbol} 在黑名单中", "high", "reject_order", "symbol_blacklist"))
+
+        if self.order_size_limit is not None and quantity > self.order_size_limit:
+            failed.append(_failed(
+                f"订单数量 {quantity} 超过单笔限制 {self.order_size_limit}",
+                "medium", "reduce_order_size", "order_size_limit", suggested_size=self.order_size_limit
+            ))
+
+        new_quantity = self.positions.get(symbol, 0.0) + _side_sign(side) * quantity
+        position_limit = self.position_limits.get(symbol, self.position_limits.get(None))
+        if position_limit is not None and abs(new_quantity) > position_limit:
+            failed.append(_failed(
+                f"{symbol} 超过最大持仓限制 {position_limit}，当前将达到 {abs(new_quantity)}",
+                "high", "reject_order", "position_limit"
+            ))
+
+        if self.daily_loss_limit is not None and self.daily_pnl < -self.daily_loss_limit:
+            failed.append(_failed(
+                f"今日亏损 {abs(self.daily_pnl)} 已达到限制 {self.daily_loss_limit}",
+                "high", "suspend_trading", "daily_loss_limit"
+            ))
+
+        order_value = quantity * price
+        total = self.total_balance
+        if order_value > 0:
+            # 只有增加敞口的部分占用资金
+            opening_value = max(abs(new_quantity) - abs(self.positions.get(symbol, 0.0)), 0.0) * price
+            if opening_value > self.available_balance:
+                failed.append(_failed(
+                    f"资金不足，需要 {opening_value}，可用 {self.available_balance}", "high", "reject_order"
+                ))
+
+            if self.order_value_limit is not None and order_value > self.order_value_limit:
+                failed.append(_failed(
+                    f"违反最大持仓价值规则，当前 {order_value}，限制 {self.order_value_limit}",
+                    "medium", "reduce_order_size", "max_position_value"
+                ))
+
+            max_order_value = total * self.config["max_order_value_ratio"]
+            if order_value > max_order_value:
+                failed.append(_failed(
+                    f"单笔订单金额过大，当前 {order_value}，限额 {max_order_value}",
+                    "medium", "reduce_order_size", suggested_size=max_order_value / price
+                ))
+
+            daily_limit = total * self.config["daily_turnover_ratio"]
+            if self.daily_notional + order_value > daily_limit:
+                failed.append(_failed(
+                    f"超过日交易限额，今日已交易 {self.daily_notional}，限额 {daily_limit}", "medium", "reject_order"
+                ))
+
+            max_concentration = self.concentration_limit
+            if max_concentration is None:
+                max_concentration = self.config["max_position_size_ratio"]
+            concentration = abs(new_quantity) * price / total if total > 0 else 0.0
+            if concentration > max_concentration:
+                failed.append(_failed(
+                    f"{symbol} 集中度 {concentration:.2%} 超过限制 {max_concentration:.2%}",
+                    "high", "reduce_order_size", "concentration_limit",
+                    suggested_size=max_concentration * total / price
+                ))
+
+        return failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "total_balance": self.total_balance,
+            "available_balance": self.available_balance,
+            "used_margin": self.used_margin,
+            "daily_notional": self.daily_notional,
+            "daily_pnl": self.daily_pnl,
+            "positions": dict(self.positions),
+            "exposure": {symbol: self.exposure(symbol) for symbol in self.positions},
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat() if self.loaded_at else None,
+        }
+
+
+def load_risk_snapshot(user_id: int) -> RiskSnapshot:
+    """从数据库加载用户风控状态（同步，在线程池中执行）"""
+    from sqlalchemy import func
+
+    from ..core.database import SessionLocal
+    from ..models.order import Order, OrderFill
+    from ..models.position import Position, PositionStatus, PositionType
+    from ..models.risk import RiskRule
+    from ..models.trading import TradingAccount
+
+    db = SessionLocal()
+    try:
+        rules = [
+            {"rule_type": rule.rule_type, "symbol": rule.symbol, "rule_value": rule.rule_value}
+            for rule in db.query(RiskRule).filter(RiskRule.user_id == user_id, RiskRule.is_active == True).all()
+        ]
+
+        account = db.query(TradingAccount).filter(
+            TradingAccount.user_id == user_id, TradingAccount.is_active == True
+        ).first()
+
+        positions: Dict[str, float] = {}
+        marks: Dict[str, float] = {}
+        cost_values: Dict[str, float] = {}
+        quantities: Dict[str, float] = {}
+        daily_pnl = 0.0
+        open_positions = db.query(Position).filter(
+            Position.user_id == user_id, Position.status == PositionStatus.OPEN
+        ).all()
+        for position in open_positions:
+            sign = -1.0 if position.position_type == PositionType.SHORT else 1.0
+            positions[position.symbol] = positions.get(position.symbol, 0.0) + sign * float(position.quantity or 0)
+            marks[position.symbol] = float(position.current_price or position.average_cost or 0)
+            # 同一合约多笔持仓按数量加权平均成本
+            quantity = abs(float(position.quantity or 0))
+            quantities[position.symbol] = quantities.get(position.symbol, 0.0) + quantity
+            cost_values[position.symbol] = cost_values.get(position.symbol, 0.0) + quantity * float(position.average_cost or 0)
+            daily_pnl += float(position.daily_pnl or 0)
+
+        # 当日成交额在数据库中汇总
+        today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+        daily_notional = db.query(func.coalesce(func.sum(OrderFill.value), 0)).join(
+            Order, OrderFill.order_id == Order.id
+        ).filter(Order.user_id == user_id, OrderFill.fill_time >= today_start).scalar()
+
+        return RiskSnapshot(
+            total_balance=float(account.total_balance or 0) if account else 0.0,
+            available_balance=float(account.available_balance or 0) if account else 0.0,
+            used_margin=float(account.used_margin or 0) if account else 0.0,
+            positions=positions,
+            marks=marks,
+            costs={symbol: cost_values[symbol] / quantity for symbol, quantity in quantities.items() if quantity},
+            daily_notional=float(daily_notional or 0),
+            daily_pnl=daily_pnl,
+            rules=rules,
+            has_account=account is not None,
+        )
+    finally:
+        db.close()
+
+
+class RiskBookManager:
+    """按用户管理内存风控账本"""
+
+    def __init__(
+        self,
+        loader: Callable[[int], RiskSnapshot] = load_risk_snapshot,
+        reconcile_interval: float = settings.RISK_BOOK_RECONCILE_INTERVAL,
+        config: Optional[Dict[str, float]] = None
+    ):
+        self.loader = loader
+        self.reconcile_interval = reconcile_interval
+        self.config = config
+        self._books: Dict[int, UserRiskBook] = {}
+        self._loading: Dict[int, asyncio.Task] = {}
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[int, Optional[str]], None]] = []
+
+        self.check_latency = LatencyRecorder()
+        self.checks = 0
+        self.rejected = 0
+        self.reconciled = 0
+        self.reconcile_skipped = 0
+        self.drift_corrections = 0
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+
+    async def get_book(self, user_id: int) -> UserRiskBook:
+        """获取用户账本，首次访问时从数据库加载（并发请求只加载一次）"""
+        book = self._books.get(user_id)
+        if book is not None:
+            return book
+
+        task = self._loading.get(user_id)
+        if task is None:
+            task = self._loading[user_id] = asyncio.create_task(self._load(user_id))
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._loading.pop(user_id, None)
+
+    async def _load(self, user_id: int) -> UserRiskBook:
+        snapshot = await asyncio.to_thread(self.loader, user_id)
+        book = UserRiskBook(user_id, self.config)
+        book.load(snapshot)
+        self._books[user_id] = book
+        logger.info(f"加载用户 {user_id} 风控账本: {len(book.positions)} 个持仓")
+        return book
+
+    def peek(self, user_id: int) -> Optional[UserRiskBook]:
+        """已加载的账本，不触发加载"""
+        return self._books.get(user_id)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """丢弃账本（如风险规则变更），下次检查时重新加载；user_id为空时丢弃全部"""
+        if user_id is None:
+            self._books.clear()
+        else:
+            self._books.pop(user_id, None)
+
+    # ------------------------------------------------------------------
+    # 检查
+    # ------------------------------------------------------------------
+
+    async def check_order(self, user_id: int, order_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """交易前风险检查，返回未通过的检查项；账本已加载时不做I/O"""
+        book = self._books.get(user_id)
+        if book is None:
+            book = await self.get_book(user_id)
+        return self.check_loaded(book, order_data)
+
+    def check_loaded(self, book: UserRiskBook, order_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        begin = time.perf_counter()
+        symbol = order_data["symbol"]
+        price = float(order_data.get("price") or 0) or self._mark_price(book, symbol)
+        failed = book.check(symbol, order_data.get("side"), float(order_data.get("quantity", 0)), price)
+
+        self.checks += 1
+        if failed:
+            self.rejected += 1
+        self.check_latency.record(time.perf_counter() - begin)
+        return failed
+
+    @staticmethod
+    def _mark_price(book: UserRiskBook, symbol: str) -> float:
+        """市价单按最新行情估值，没有行情时使用持仓估值价"""
+        tick = quote_bus.latest(symbol)
+        if tick is not None and tick.last_price:
+            return float(tick.last_price)
+        return book.marks.get(symbol, 0.0)
+
+    # ------------------------------------------------------------------
+    # 事件
+    # ------------------------------------------------------------------
+
+    def add_listener(self, listener: Callable[[int, Optional[str]], None]):
+        """注册持仓/资金变动监听器，参数为 (用户ID, 合约或None)"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[int, Optional[str]], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, user_id: int, symbol: Optional[str]):
+        for listener in self._listeners:
+            try:
+                listener(user_id, symbol)
+            except Exception as e:
+                logger.error(f"风控账本监听器出错: {e}")
+
+    def on_fill(self, user_id: int, symbol: str, side: Any, quantity: float, price: float, commission: float = 0.0):
+        """成交事件；账本未加载时忽略（加载时会从数据库读到这笔成交）"""
+        book = self._books.get(user_id)
+        if book is not None:
+            book.apply_fill(symbol, side, quantity, price, commission)
+        self._notify(user_id, symbol)
+
+    def on_position(self, user_id: int, symbol: str, change: float, price: Optional[float] = None):
+        """持仓事件，change为带方向的持仓数量变化"""
+        book = self._books.get(user_id)
+        if book is not None:
+            book.adjust_position(symbol, change, price)
+        self._notify(user_id, symbol)
+
+    def on_account(self, user_id: int, **balances):
+        """账户资金事件"""
+        book = self._books.get(user_id)
+        if book is not None:
+            book.set_account(**balances)
+        self._notify(user_id, None)
+
+    # ------------------------------------------------------------------
+    # 对账
+    # ------------------------------------------------------------------
+
+    async def reconcile(self, user_id: int) -> Dict[str, Any]:
+        """与数据库对账，纠正增量更新的偏差
+
+        加载期间如有新事件，快照可能已过期，本轮跳过，下轮再对
+        """
+        book = self._books.get(user_id)
+        if book is None:
+            return {}
+
+        events = book.events
+        snapshot = await asyncio.to_thread(self.loader, user_id)
+        if book.events != events or self._books.get(user_id) is not book:
+            self.reconcile_skipped += 1
+            return {}
+
+        drift = self._drift(book, snapshot)
+        if drift:
+            self.drift_corrections += 1
+            logger.warning(f"用户 {user_id} 风控账本与数据库不一致，已纠正: {drift}")
+        book.load(snapshot)
+        self.reconciled += 1
+        return drift
+
+    @staticmethod
+    def _drift(book: UserRiskBook, snapshot: RiskSnapshot) -> Dict[str, Any]:
+        drift = {}
+        for field in ("total_balance", "available_balance", "daily_notional"):
+            old, new = getattr(book, field), float(getattr(snapshot, field))
+            if abs(old - new) > RECONCILE_TOLERANCE * max(1.0, abs(new)):
+                drift[field] = (old, new)
+        for symbol in set(book.positions) | set(snapshot.positions):
+            old, new = book.positions.get(symbol, 0.0), float(snapshot.positions.get(symbol, 0.0))
+            if abs(old - new) > RECONCILE_TOLERANCE:
+                drift[f"position:{symbol}"] = (old, new)
+        return drift
+
+    async def start(self):
+        """启动定期对账"""
+        if self._reconcile_task is None and self.reconcile_interval > 0:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+            logger.info(f"风控账本对账任务已启动，间隔 {self.reconcile_interval}s")
+
+    async def stop(self):
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            try:
+                await self._reconcile_task
+            except asyncio.CancelledError:
+                pass
+            self._reconcile_task = None
+
+    async def _reconcile_loop(self):
+        while True:
+            try:
+                await asyncio.sleep(self.reconcile_interval)
+                for user_id in list(self._books):
+                    try:
+                        await self.reconcile(user_id)
+                    except Exception as e:
+                        logger.error(f"用户 {user_id} 风控账本对账失败: {e}")
+            except asyncio.CancelledError:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._books),
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "check_latency": self.check_latency.snapshot(),
+            "reconciled": self.reconciled,
+            "reconcile_skipped": self.reconcile_skipped,
+            "drift_corrections": self.drift_corrections,
+        }
+
+
+# 创建全局风控账本实例
+risk_book = RiskBookManager()
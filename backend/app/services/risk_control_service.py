@@ -5,10 +5,10 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import or_
 from enum import Enum
 
-from app.models.risk import RiskRule, RiskEvent
+from app.models.risk import RiskEvent
 from app.models.order import Order, OrderStatus, OrderSide
 from app.models.position import Position
 from app.models.account import Account
@@ -18,7 +18,10 @@ from app.services.order_service import OrderService
 from app.services.position_service import PositionService
 from app.services.account_service import AccountService
 from app.services.notification_service import NotificationService
+from app.services.risk_book import risk_book
 from app.core.websocket import WebSocketManager
+from app.core.async_repository import AsyncRepository
+from app.core.database import async_session_scope
 from app.utils.risk_calculator import RiskCalculator
 from app.core.logging import get_logger
 
@@ -43,6 +46,10 @@ class RiskControlSeverity(str, Enum):
     CRITICAL = "critical"
 
 
+order_repository = AsyncRepository(Order)
+user_repository = AsyncRepository(User)
+
+
 class RiskControlService:
     """风险控制自动化执行服务"""
     
@@ -67,49 +74,17 @@ class RiskControlService:
     async def check_order_risk(self, user_id: int, order_data: Dict[str, Any]) -> RiskCheckResult:
         """订单提交前风险检查"""
         try:
-            logger.info(f"开始订单风险检查 - 用户: {user_id}, 订单: {order_data}")
-            
-            # 获取用户账户信息
-            account = self.account_service.get_account_by_user_id(user_id)
-            if not account:
-                return RiskCheckResult(
-                    passed=False,
-                    risk_level="critical",
-                    message="账户不存在",
-                    actions=[]
-                )
-            
-            # 获取活跃风险规则
-            risk_rules = self._get_active_risk_rules(user_id)
-            
-            # 执行各项风险检查
-            check_results = []
-            
-            # 1. 资金充足性检查
-            funding_result = await self._check_funding_adequacy(account, order_data)
-            check_results.append(funding_result)
-            
-            # 2. 持仓集中度检查
-            concentration_result = await self._check_position_concentration(user_id, order_data)
-            check_results.append(concentration_result)
-            
-            # 3. 单笔订单限额检查
-            order_limit_result = await self._check_order_limits(account, order_data)
-            check_results.append(order_limit_result)
-            
-            # 4. 日内交易限制检查
-            daily_limit_result = await self._check_daily_limits(user_id, order_data)
-            check_results.append(daily_limit_result)
+            logger.debug(f"开始订单风险检查 - 用户: {user_id}, 订单: {order_data}")
             
-            # 5. 自定义风险规则检查
-            custom_rules_result = await self._check_custom_risk_rules(user_id, risk_rules, order_data)
-            check_results.append(custom_rules_result)
+            # 账户、风险规则、持仓和当日成交额均在内存风控账本中，检查过程不访问数据库
+            failed_checks = await risk_book.check_order(user_id, order_data)
             
             # 综合评估风险检查结果
-            final_result = self._evaluate_risk_results(check_results)
+            final_result = self._evaluate_risk_results(failed_checks)
             
-            # 记录风险检查事件
-            await self._log_risk_check_event(user_id, order_data, final_result)
+            # 只记录未通过的检查，通过的订单不产生数据库写入
+            if not final_result.passed:
+                await self._log_risk_check_event(user_id, order_data, final_result)
             
             return final_result
             
@@ -218,254 +193,6 @@ class RiskControlService:
             logger.error(f"紧急风险控制失败: {str(e)}")
             return False
     
-    def _get_active_risk_rules(self, user_id: int) -> List[RiskRule]:
-        """获取活跃的风险规则"""
-        return self.db.query(RiskRule).filter(
-            and_(
-                RiskRule.user_id == user_id,
-                RiskRule.is_active == True
-            )
-        ).all()
-    
-    async def _check_funding_adequacy(self, account: Account, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查资金充足性"""
-        try:
-            order_value = float(order_data.get("quantity", 0)) * float(order_data.get("price", 0))
-            available_balance = account.available_balance
-            
-            if order_value > available_balance:
-                return {
-                    "passed": False,
-                    "risk_level": "high",
-                    "message": f"资金不足，需要 {order_value}，可用 {available_balance}",
-                    "action": RiskControlAction.REJECT_ORDER
-                }
-            
-            # 检查是否超过单笔订单限额
-            max_order_value = account.total_balance * self.config["max_order_value_ratio"]
-            if order_value > max_order_value:
-                return {
-                    "passed": False,
-                    "risk_level": "medium",
-                    "message": f"单笔订单金额过大，限额 {max_order_value}",
-                    "action": RiskControlAction.REDUCE_ORDER_SIZE,
-                    "suggested_size": max_order_value / float(order_data.get("price", 1))
-                }
-            
-            return {
-                "passed": True,
-                "risk_level": "low",
-                "message": "资金充足性检查通过"
-            }
-            
-        except Exception as e:
-            return {
-                "passed": False,
-                "risk_level": "critical",
-                "message": f"资金检查错误: {str(e)}"
-            }
-    
-    async def _check_position_concentration(self, user_id: int, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查持仓集中度"""
-        try:
-            symbol = order_data.get("symbol")
-            order_quantity = float(order_data.get("quantity", 0))
-            
-            # 获取当前持仓
-            current_position = self.position_service.get_position_by_symbol(user_id, symbol)
-            current_quantity = current_position.quantity if current_position else 0
-            
-            # 计算新的持仓数量
-            if order_data.get("side") == OrderSide.BUY:
-                new_quantity = current_quantity + order_quantity
-            else:
-                new_quantity = current_quantity - order_quantity
-            
-            # 获取账户总价值
-            account = self.account_service.get_account_by_user_id(user_id)
-            total_value = account.total_balance if account else 0
-            
-            # 计算持仓价值占比
-            position_value = abs(new_quantity) * float(order_data.get("price", 0))
-            concentration_ratio = position_value / total_value if total_value > 0 else 0
-            
-            max_concentration = self.config["max_position_size_ratio"]
-            
-            if concentration_ratio > max_concentration:
-                return {
-                    "passed": False,
-                    "risk_level": "high",
-                    "message": f"持仓集中度过高 {concentration_ratio:.2%}，限制 {max_concentration:.2%}",
-                    "action": RiskControlAction.REDUCE_ORDER_SIZE,
-                    "suggested_size": (max_concentration * total_value) / float(order_data.get("price", 1))
-                }
-            
-            return {
-                "passed": True,
-                "risk_level": "low",
-                "message": "持仓集中度检查通过"
-            }
-            
-        except Exception as e:
-            return {
-                "passed": False,
-                "risk_level": "critical",
-                "message": f"持仓集中度检查错误: {str(e)}"
-            }
-    
-    async def _check_order_limits(self, account: Account, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查订单限额"""
-        try:
-            order_value = float(order_data.get("quantity", 0)) * float(order_data.get("price", 0))
-            max_order_value = account.total_balance * self.config["max_order_value_ratio"]
-            
-            if order_value > max_order_value:
-                return {
-                    "passed": False,
-                    "risk_level": "medium",
-                    "message": f"订单金额超限，当前 {order_value}，限额 {max_order_value}",
-                    "action": RiskControlAction.REDUCE_ORDER_SIZE
-                }
-            
-            return {
-                "passed": True,
-                "risk_level": "low",
-                "message": "订单限额检查通过"
-            }
-            
-        except Exception as e:
-            return {
-                "passed": False,
-                "risk_level": "critical",
-                "message": f"订单限额检查错误: {str(e)}"
-            }
-    
-    async def _check_daily_limits(self, user_id: int, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查日内交易限制"""
-        try:
-            today = datetime.now().date()
-            
-            # 获取今日订单
-            today_orders = self.db.query(Order).filter(
-                and_(
-                    Order.user_id == user_id,
-                    Order.created_at >= today,
-                    Order.status.in_([OrderStatus.FILLED, OrderStatus.PARTIALLY_FILLED])
-                )
-            ).all()
-            
-            # 计算今日交易金额
-            today_volume = sum(
-                order.filled_quantity * order.avg_price 
-                for order in today_orders 
-                if order.filled_quantity and order.avg_price
-            )
-            
-            # 获取账户信息计算限额
-            account = self.account_service.get_account_by_user_id(user_id)
-            daily_limit = account.total_balance * 2.0  # 日交易限额为账户总额的2倍
-            
-            order_value = float(order_data.get("quantity", 0)) * float(order_data.get("price", 0))
-            
-            if today_volume + order_value > daily_limit:
-                return {
-                    "passed": False,
-                    "risk_level": "medium",
-                    "message": f"超过日交易限额，今日已交易 {today_volume}，限额 {daily_limit}",
-                    "action": RiskControlAction.REJECT_ORDER
-                }
-            
-            return {
-                "passed": True,
-                "risk_level": "low",
-                "message": "日内交易限制检查通过"
-            }
-            
-        except Exception as e:
-            return {
-                "passed": False,
-                "risk_level": "critical",
-                "message": f"日内交易限制检查错误: {str(e)}"
-            }
-    
-    async def _check_custom_risk_rules(self, user_id: int, risk_rules: List[RiskRule], 
-                                     order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查自定义风险规则"""
-        try:
-            for rule in risk_rules:
-                # 根据规则类型执行检查
-                if rule.rule_type == "max_position_value":
-                    result = await self._check_max_position_value_rule(rule, order_data)
-                elif rule.rule_type == "max_daily_loss":
-                    result = await self._check_max_daily_loss_rule(user_id, rule, order_data)
-                elif rule.rule_type == "symbol_blacklist":
-                    result = await self._check_symbol_blacklist_rule(rule, order_data)
-                else:
-                    continue
-                
-                if not result["passed"]:
-                    return result
-            
-            return {
-                "passed": True,
-                "risk_level": "low",
-                "message": "自定义风险规则检查通过"
-            }
-            
-        except Exception as e:
-            return {
-                "passed": False,
-                "risk_level": "critical",
-                "message": f"自定义风险规则检查错误: {str(e)}"
-            }
-    
-    async def _check_max_position_value_rule(self, rule: RiskRule, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查最大持仓价值规则"""
-        max_value = rule.parameters.get("max_value", 0)
-        order_value = float(order_data.get("quantity", 0)) * float(order_data.get("price", 0))
-        
-        if order_value > max_value:
-            return {
-                "passed": False,
-                "risk_level": rule.severity,
-                "message": f"违反最大持仓价值规则，当前 {order_value}，限制 {max_value}",
-                "action": RiskControlAction.REDUCE_ORDER_SIZE
-            }
-        
-        return {"passed": True, "risk_level": "low", "message": "最大持仓价值规则检查通过"}
-    
-    async def _check_max_daily_loss_rule(self, user_id: int, rule: RiskRule, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查最大日亏损规则"""
-        max_loss = rule.parameters.get("max_loss", 0)
-        
-        # 计算今日盈亏
-        today_pnl = await self._calculate_daily_pnl(user_id)
-        
-        if today_pnl < -max_loss:
-            return {
-                "passed": False,
-                "risk_level": rule.severity,
-                "message": f"违反最大日亏损规则，当前亏损 {abs(today_pnl)}，限制 {max_loss}",
-                "action": RiskControlAction.SUSPEND_TRADING
-            }
-        
-        return {"passed": True, "risk_level": "low", "message": "最大日亏损规则检查通过"}
-    
-    async def _check_symbol_blacklist_rule(self, rule: RiskRule, order_data: Dict[str, Any]) -> Dict[str, Any]:
-        """检查标的黑名单规则"""
-        blacklist = rule.parameters.get("symbols", [])
-        symbol = order_data.get("symbol")
-        
-        if symbol in blacklist:
-            return {
-                "passed": False,
-                "risk_level": rule.severity,
-                "message": f"标的 {symbol} 在黑名单中",
-                "action": RiskControlAction.REJECT_ORDER
-            }
-        
-        return {"passed": True, "risk_level": "low", "message": "标的黑名单规则检查通过"}
-    
     def _evaluate_risk_results(self, check_results: List[Dict[str, Any]]) -> RiskCheckResult:
         """综合评估风险检查结果"""
         failed_checks = [result for result in check_results if not result.get("passed", True)]
@@ -511,11 +238,11 @@ class RiskControlService:
             order_id = context.get("order_id")
             if order_id:
                 # 更新订单状态为拒绝
-                order = self.db.query(Order).filter(Order.id == order_id).first()
-                if order:
-                    order.status = OrderStatus.REJECTED
-                    order.reject_reason = context.get("reason", "风险控制拒绝")
-                    self.db.commit()
+                async with async_session_scope() as session:
+                    order = await order_repository.get(session, order_id)
+                    if order:
+                        order.status = OrderStatus.REJECTED
+                        order.reject_reason = context.get("reason", "风险控制拒绝")
             
             return True
         except Exception as e:
@@ -529,11 +256,11 @@ class RiskControlService:
             suggested_size = context.get("suggested_size")
             
             if order_id and suggested_size:
-                order = self.db.query(Order).filter(Order.id == order_id).first()
-                if order and order.status == OrderStatus.PENDING:
-                    order.quantity = suggested_size
-                    self.db.commit()
-                    return True
+                async with async_session_scope() as session:
+                    order = await order_repository.get(session, order_id)
+                    if order and order.status == OrderStatus.PENDING:
+                        order.quantity = suggested_size
+                        return True
             
             return False
         except Exception as e:
@@ -573,13 +300,13 @@ class RiskControlService:
         """暂停交易"""
         try:
             # 更新用户交易状态
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.trading_suspended = True
-                user.suspension_reason = context.get("reason", "风险控制暂停交易")
-                user.suspended_at = datetime.utcnow()
-                self.db.commit()
-                return True
+            async with async_session_scope() as session:
+                user = await user_repository.get(session, user_id)
+                if user:
+                    user.trading_suspended = True
+                    user.suspension_reason = context.get("reason", "风险控制暂停交易")
+                    user.suspended_at = datetime.utcnow()
+                    return True
             
             return False
         except Exception as e:
@@ -606,8 +333,8 @@ class RiskControlService:
                 description=context.get("reason", "保证金追缴"),
                 data=context
             )
-            self.db.add(risk_event)
-            self.db.commit()
+            async with async_session_scope() as session:
+                session.add(risk_event)
             
             return True
         except Exception as e:
@@ -646,19 +373,16 @@ class RiskControlService:
     async def _cancel_all_pending_orders(self, user_id: int) -> bool:
         """取消所有未成交订单"""
         try:
-            pending_orders = self.db.query(Order).filter(
-                and_(
-                    Order.user_id == user_id,
-                    Order.status == OrderStatus.PENDING
+            async with async_session_scope() as session:
+                pending_orders = await order_repository.list(
+                    session, Order.user_id == user_id, Order.status == OrderStatus.PENDING
                 )
-            ).all()
-            
-            for order in pending_orders:
-                order.status = OrderStatus.CANCELLED
-                order.cancel_reason = "紧急风险控制"
-                order.cancelled_at = datetime.utcnow()
+                
+                for order in pending_orders:
+                    order.status = OrderStatus.CANCELLED
+                    order.cancel_reason = "紧急风险控制"
+                    order.cancelled_at = datetime.utcnow()
             
-            self.db.commit()
             return True
         except Exception as e:
             logger.error(f"取消所有未成交订单失败: {str(e)}")
@@ -749,13 +473,13 @@ class RiskControlService:
             today = datetime.now().date()
             
             # 获取今日交易记录
-            today_orders = self.db.query(Order).filter(
-                and_(
+            async with async_session_scope() as session:
+                today_orders = await order_repository.list(
+                    session,
                     Order.user_id == user_id,
                     Order.created_at >= today,
                     Order.status == OrderStatus.FILLED
                 )
-            ).all()
             
             # 计算已实现盈亏
             realized_pnl = sum(
@@ -794,8 +518,8 @@ class RiskControlService:
                     }
                 }
             )
-            self.db.add(risk_event)
-            self.db.commit()
+            async with async_session_scope() as session:
+                session.add(risk_event)
         except Exception as e:
             logger.error(f"记录风险检查事件失败: {str(e)}")
     
@@ -815,8 +539,8 @@ class RiskControlService:
                     "error": error
                 }
             )
-            self.db.add(risk_event)
-            self.db.commit()
+            async with async_session_scope() as session:
+                session.add(risk_event)
         except Exception as e:
             logger.error(f"记录风险控制动作失败: {str(e)}")
     
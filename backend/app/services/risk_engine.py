@@ -10,12 +10,12 @@ import logging
 import asyncio
 from dataclasses import dataclass
 
-from ..models import User, TradingAccount, Position, Order, RiskRule, RiskEvent
-from ..models.enums import OrderSide, OrderType, RiskRuleType, RiskEventType
-from ..core.exceptions import RiskControlError
+from ..models import User, Position, Order, RiskEvent
+from ..models.enums import OrderType, RiskRuleType, RiskEventType
 from .risk_service import RiskService
 from .account_service import AccountService
 from .position_service import PositionService
+from .risk_book import risk_book
 
 logger = logging.getLogger(__name__)
 
@@ -38,14 +38,6 @@ class RiskEngine:
         self.account_service = AccountService(db)
         self.position_service = PositionService(db)
         
-        # 风险检查器注册表
-        self.risk_checkers = {
-            RiskRuleType.POSITION_LIMIT: self._check_position_limit,
-            RiskRuleType.ORDER_SIZE_LIMIT: self._check_order_size_limit,
-            RiskRuleType.DAILY_LOSS_LIMIT: self._check_daily_loss_limit,
-            RiskRuleType.CONCENTRATION_LIMIT: self._check_concentration_limit,
-        }
-        
         # 自动处理动作注册表
         self.auto_actions = {
             "cancel_orders": self._cancel_all_orders,
@@ -57,23 +49,11 @@ class RiskEngine:
     async def check_pre_trade_risk(self, user_id: int, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """交易前风险检查"""
         try:
-            logger.info(f"开始交易前风险检查: 用户{user_id}, 订单{order_data}")
-            
-            # 获取用户的风险规则
-            risk_rules = self.risk_service.get_user_risk_rules(user_id)
-            active_rules = [rule for rule in risk_rules if rule.is_active]
-            
-            # 执行各项风险检查
-            check_results = []
-            
-            for rule in active_rules:
-                if rule.rule_type in self.risk_checkers:
-                    checker = self.risk_checkers[rule.rule_type]
-                    result = await checker(user_id, order_data, rule)
-                    check_results.append(result)
-            
-            # 汇总检查结果
-            failed_checks = [result for result in check_results if not result['passed']]
+            # 风险规则、持仓和资金均在内存风控账本中，检查过程不访问数据库
+            failed_checks = [
+                dict(check, risk_level=check['risk_level'].upper())
+                for check in await risk_book.check_order(user_id, order_data)
+            ]
             
             if failed_checks:
                 # 记录风险事件
@@ -171,144 +151,6 @@ class RiskEngine:
             logger.error(f"实时风险监控失败: {e}")
             return {'status': 'error', 'message': str(e)}
     
-    async def _check_position_limit(self, user_id: int, order_data: Dict[str, Any], rule: RiskRule) -> Dict[str, Any]:
-        """检查持仓限制"""
-        try:
-            symbol = order_data['symbol']
-            side = order_data['side']
-            quantity = order_data['quantity']
-            
-            # 获取当前持仓
-            position = self.position_service.get_position(user_id, symbol)
-            current_quantity = float(position.quantity) if position else 0
-            
-            # 计算新的持仓数量
-            if side == OrderSide.BUY.value:
-                new_quantity = current_quantity + quantity
-            else:
-                new_quantity = current_quantity - quantity
-            
-            max_position = float(rule.rule_value)
-            
-            if abs(new_quantity) > max_position:
-                return {
-                    'passed': False,
-                    'message': f'{symbol} 超过最大持仓限制 {max_position}，当前将达到 {abs(new_quantity)}',
-                    'risk_level': 'HIGH',
-                    'rule_type': rule.rule_type.value
-                }
-            
-            return {'passed': True, 'message': '持仓限制检查通过'}
-            
-        except Exception as e:
-            logger.error(f"持仓限制检查失败: {e}")
-            return {
-                'passed': False,
-                'message': f'持仓限制检查异常: {str(e)}',
-                'risk_level': 'HIGH'
-            }
-    
-    async def _check_order_size_limit(self, user_id: int, order_data: Dict[str, Any], rule: RiskRule) -> Dict[str, Any]:
-        """检查订单大小限制"""
-        try:
-            quantity = order_data['quantity']
-            max_order_size = float(rule.rule_value)
-            
-            if quantity > max_order_size:
-                return {
-                    'passed': False,
-                    'message': f'订单数量 {quantity} 超过单笔限制 {max_order_size}',
-                    'risk_level': 'MEDIUM',
-                    'rule_type': rule.rule_type.value
-                }
-            
-            return {'passed': True, 'message': '订单大小检查通过'}
-            
-        except Exception as e:
-            logger.error(f"订单大小检查失败: {e}")
-            return {
-                'passed': False,
-                'message': f'订单大小检查异常: {str(e)}',
-                'risk_level': 'MEDIUM'
-            }
-    
-    async def _check_daily_loss_limit(self, user_id: int, order_data: Dict[str, Any], rule: RiskRule) -> Dict[str, Any]:
-        """检查日亏损限制"""
-        try:
-            # 获取今日已实现盈亏
-            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            account = self.account_service.get_account(user_id)
-            if not account:
-                return {'passed': False, 'message': '账户不存在', 'risk_level': 'HIGH'}
-            
-            # 计算今日盈亏（简化实现）
-            today_pnl = 0  # 这里需要从交易记录中计算
-            
-            daily_loss_limit = float(rule.rule_value)
-            
-            if today_pnl < -daily_loss_limit:
-                return {
-                    'passed': False,
-                    'message': f'今日亏损 {abs(today_pnl)} 已达到限制 {daily_loss_limit}',
-                    'risk_level': 'HIGH',
-                    'rule_type': rule.rule_type.value
-                }
-            
-            return {'passed': True, 'message': '日亏损限制检查通过'}
-            
-        except Exception as e:
-            logger.error(f"日亏损限制检查失败: {e}")
-            return {
-                'passed': False,
-                'message': f'日亏损限制检查异常: {str(e)}',
-                'risk_level': 'HIGH'
-            }
-    
-    async def _check_concentration_limit(self, user_id: int, order_data: Dict[str, Any], rule: RiskRule) -> Dict[str, Any]:
-        """检查集中度限制"""
-        try:
-            symbol = order_data['symbol']
-            quantity = order_data['quantity']
-            price = order_data.get('price', 50000)  # 使用估算价格
-            
-            # 获取账户总资产
-            metrics = self.account_service.calculate_account_metrics(user_id)
-            total_assets = metrics.get('total_assets', 0)
-            
-            if total_assets <= 0:
-                return {'passed': True, 'message': '无法计算集中度，跳过检查'}
-            
-            # 计算该品种的市值变化
-            position_value_change = quantity * price
-            
-            # 获取当前该品种的持仓市值
-            position = self.position_service.get_position(user_id, symbol)
-            current_value = float(position.market_value or 0) if position else 0
-            
-            new_total_value = current_value + position_value_change
-            concentration_ratio = new_total_value / total_assets
-            
-            max_concentration = float(rule.rule_value)
-            
-            if concentration_ratio > max_concentration:
-                return {
-                    'passed': False,
-                    'message': f'{symbol} 集中度 {concentration_ratio:.2%} 超过限制 {max_concentration:.2%}',
-                    'risk_level': 'MEDIUM',
-                    'rule_type': rule.rule_type.value
-                }
-            
-            return {'passed': True, 'message': '集中度限制检查通过'}
-            
-        except Exception as e:
-            logger.error(f"集中度限制检查失败: {e}")
-            return {
-                'passed': False,
-                'message': f'集中度限制检查异常: {str(e)}',
-                'risk_level': 'MEDIUM'
-            }
-    
     async def _record_risk_event(self, user_id: int, event_type: RiskEventType, 
                                 title: str, description: str, event_data: Dict[str, Any]):
         """记录风险事件"""
@@ -5,7 +5,7 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import or_, func, desc
 from enum import Enum
 import pandas as pd
 import numpy as np
@@ -19,10 +19,21 @@ from app.models.user import User
 from app.schemas.risk import RiskReportRequest, RiskReport, RiskAnalysis
 from app.services.notification_service import NotificationService
 from app.utils.risk_calculator import RiskCalculator
+from app.core.async_repository import AsyncRepository
+from app.core.database import async_session_scope
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
+user_repository = AsyncRepository(User)
+account_repository = AsyncRepository(Account)
+risk_event_repository = AsyncRepository(RiskEvent)
+risk_metrics_repository = AsyncRepository(RiskMetrics)
+position_repository = AsyncRepository(Position)
+order_repository = AsyncRepository(Order)
+risk_rule_repository = AsyncRepository(RiskRule)
+risk_limit_repository = AsyncRepository(RiskLimit)
+
 
 class ReportType(str, Enum):
     """报告类型枚举"""
@@ -99,54 +110,44 @@ class RiskReportService:
                                end_date: datetime) -> Dict[str, Any]:
         """收集基础数据"""
         try:
-            # 获取用户信息
-            user = self.db.query(User).filter(User.id == user_id).first()
-            account = self.db.query(Account).filter(Account.user_id == user_id).first()
-            
-            # 获取时间范围内的风险事件
-            risk_events = self.db.query(RiskEvent).filter(
-                and_(
+            async with async_session_scope() as session:
+                # 获取用户信息
+                user = await user_repository.get(session, user_id)
+                account = await account_repository.first(session, Account.user_id == user_id)
+                
+                # 获取时间范围内的风险事件
+                risk_events = await risk_event_repository.list(
+                    session,
                     RiskEvent.user_id == user_id,
                     RiskEvent.created_at >= start_date,
                     RiskEvent.created_at <= end_date
                 )
-            ).all()
-            
-            # 获取风险指标
-            risk_metrics = self.db.query(RiskMetrics).filter(
-                and_(
+                
+                # 获取风险指标
+                risk_metrics = await risk_metrics_repository.list(
+                    session,
                     RiskMetrics.user_id == user_id,
                     RiskMetrics.date >= start_date.date(),
-                    RiskMetrics.date <= end_date.date()
+                    RiskMetrics.date <= end_date.date(),
+                    order_by=RiskMetrics.date
                 )
-            ).order_by(RiskMetrics.date).all()
-            
-            # 获取持仓数据
-            positions = self.db.query(Position).filter(
-                and_(
-                    Position.user_id == user_id,
-                    Position.created_at <= end_date
+                
+                # 获取持仓数据
+                positions = await position_repository.list(
+                    session, Position.user_id == user_id, Position.created_at <= end_date
                 )
-            ).all()
-            
-            # 获取订单数据
-            orders = self.db.query(Order).filter(
-                and_(
+                
+                # 获取订单数据
+                orders = await order_repository.list(
+                    session,
                     Order.user_id == user_id,
                     Order.created_at >= start_date,
                     Order.created_at <= end_date
                 )
-            ).all()
-            
-            # 获取风险规则
-            risk_rules = self.db.query(RiskRule).filter(
-                RiskRule.user_id == user_id
-            ).all()
-            
-            # 获取风险限额
-            risk_limits = self.db.query(RiskLimit).filter(
-                RiskLimit.user_id == user_id
-            ).all()
+                
+                # 获取风险规则和风险限额
+                risk_rules = await risk_rule_repository.list(session, RiskRule.user_id == user_id)
+                risk_limits = await risk_limit_repository.list(session, RiskLimit.user_id == user_id)
             
             return {
                 "user": user,
@@ -815,7 +816,8 @@ class RiskReportService:
         """调度定期报告"""
         try:
             # 获取需要生成报告的用户
-            users = self.db.query(User).filter(User.is_active == True).all()
+            async with async_session_scope() as session:
+                users = await user_repository.list(session, User.is_active == True)
             
             for user in users:
                 # 生成日报
@@ -19,6 +19,8 @@ from ..models.strategy import Strategy
 from ..core.database import get_db
 from ..utils.risk_calculator import RiskCalculator
 from ..services.notification_service import NotificationService
+from .risk_analytics import risk_analytics
+from .risk_book import risk_book
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +59,7 @@ class RiskService:
             self.db.add(rule)
             self.db.commit()
             self.db.refresh(rule)
+            risk_book.invalidate(rule.user_id)
             
             logger.info(f"Created risk rule: {rule.name} (ID: {rule.id})")
             return rule
@@ -107,6 +110,7 @@ class RiskService:
             
             self.db.commit()
             self.db.refresh(rule)
+            risk_book.invalidate(rule.user_id)
             
             logger.info(f"Updated risk rule: {rule.name} (ID: {rule.id})")
             return rule
@@ -125,6 +129,7 @@ class RiskService:
             
             self.db.delete(rule)
             self.db.commit()
+            risk_book.invalidate(rule.user_id)
             
             logger.info(f"Deleted risk rule: {rule.name} (ID: {rule.id})")
             return True
@@ -433,9 +438,17 @@ class RiskService:
             volatility = self.risk_calculator.calculate_volatility(user_id, date)
             max_drawdown = self.risk_calculator.calculate_max_drawdown(user_id, date)
             current_drawdown = self.risk_calculator.calculate_current_drawdown(user_id, date)
-            var_95 = self.risk_calculator.calculate_var(positions, price_data, confidence=0.95)
-            var_99 = self.risk_calculator.calculate_var(positions, price_data, confidence=0.99)
-            cvar_95 = self.risk_calculator.calculate_cvar(positions, price_data, confidence=0.95)
+            
+            # 优先使用小时任务批量计算的组合风险，否则单独计算
+            portfolio_risk = risk_analytics.get_result(user_id) if strategy_id is None else None
+            if portfolio_risk is not None:
+                var_95 = Decimal(str(portfolio_risk['var']['historical'][0.95]))
+                var_99 = Decimal(str(portfolio_risk['var']['historical'][0.99]))
+                cvar_95 = Decimal(str(portfolio_risk['cvar']['historical'][0.95]))
+            else:
+                var_95 = self.risk_calculator.calculate_var(positions, price_data, confidence=0.95)
+                var_99 = self.risk_calculator.calculate_var(positions, price_data, confidence=0.99)
+                cvar_95 = self.risk_calculator.calculate_cvar(positions, price_data, confidence=0.95)
             
             # 计算杠杆和集中度
             leverage_ratio = self.risk_calculator.calculate_leverage_ratio(total_exposure, portfolio_value)
@@ -1,6 +1,7 @@
 """
 定时任务调度服务
 """
+import asyncio
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
@@ -9,7 +10,7 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.orm import Session
 
-from ..core.database import get_db
+from ..core.database import get_db, SessionLocal
 from ..core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -169,6 +170,13 @@ class SchedulerService:
         try:
             logger.info("开始执行日终清算任务")
             
+            # 风险分析收益率窗口滚动一天，增量更新协方差矩阵
+            from .risk_analytics import risk_analytics
+            await risk_analytics.end_of_day()
+            
+            # 为当日有成交的用户追加持仓账本检查点
+            await asyncio.to_thread(self._checkpoint_position_ledger)
+            
             # 这里应该执行日终清算逻辑
             # 简化实现：记录日志
             logger.info("日终清算任务执行完成")
@@ -176,6 +184,18 @@ class SchedulerService:
         except Exception as e:
             logger.error(f"日终清算任务执行失败: {e}")
     
+    def _checkpoint_position_ledger(self):
+        """持仓账本检查点（同步数据库操作，在线程中执行）"""
+        from .position_ledger import PositionLedger
+        
+        db = SessionLocal()
+        try:
+            since = datetime.now() - timedelta(days=1)
+            users = PositionLedger(db).checkpoint_recent(since)
+            logger.info(f"持仓账本检查点完成，涉及 {users} 个用户")
+        finally:
+            db.close()
+    
     async def _system_health_check(self):
         """系统健康检查任务"""
         try:
@@ -46,25 +46,30 @@ class SimpleTradingService:
                 return self._get_mock_account_info()
             
             # 从 tqsdk 获取真实账户信息
-            account = tqsdk_adapter.api.get_account()
-            
-            return {
-                "account_id": getattr(account, 'account_id', 'SIM_ACCOUNT'),
-                "balance": getattr(account, 'balance', 1000000.0),
-                "available": getattr(account, 'available', 1000000.0),
-                "margin": getattr(account, 'margin', 0.0),
-                "profit": getattr(account, 'float_profit', 0.0),
-                "commission": getattr(account, 'commission', 0.0),
-                "total_asset": getattr(account, 'balance', 1000000.0) + getattr(account, 'float_profit', 0.0),
-                "risk_ratio": getattr(account, 'risk_ratio', 0.0),
-                "currency": "CNY",
-                "update_time": datetime.now().isoformat()
-            }
+            return await tqsdk_adapter.call_api(self._read_account)
             
         except Exception as e:
             logger.error(f"获取账户信息失败: {e}")
             return self._get_mock_account_info()
     
+    @staticmethod
+    def _read_account(api) -> Dict[str, Any]:
+        """读取账户信息（在tqsdk线程中执行，TqApi不能跨线程使用）"""
+        account = api.get_account()
+            
+        return {
+            "account_id": getattr(account, 'account_id', 'SIM_ACCOUNT'),
+            "balance": getattr(account, 'balance', 1000000.0),
+            "available": getattr(account, 'available', 1000000.0),
+            "margin": getattr(account, 'margin', 0.0),
+            "profit": getattr(account, 'float_profit', 0.0),
+            "commission": getattr(account, 'commission', 0.0),
+            "total_asset": getattr(account, 'balance', 1000000.0) + getattr(account, 'float_profit', 0.0),
+            "risk_ratio": getattr(account, 'risk_ratio', 0.0),
+            "currency": "CNY",
+            "update_time": datetime.now().isoformat()
+        }
+    
     def _get_mock_account_info(self) -> Dict[str, Any]:
         """获取模拟账户信息"""
         return {
@@ -133,19 +138,24 @@ class SimpleTradingService:
                     order_price = price or quote["last_price"]
                 
                 # 下单
-                order = tqsdk_adapter.api.insert_order(
+                order = await tqsdk_adapter.call_api(lambda api: api.insert_order(
                     symbol=symbol,
                     direction=tq_direction,
                     offset="OPEN",  # 开仓
                     volume=volume,
                     limit_price=order_price if order_type == "LIMIT" else None
-                )
+                ))
                 
                 # 等待订单状态更新
                 await asyncio.sleep(0.1)
                 
-                order_id = order.order_id
-                order_status = order.status
+                # 订单对象由tqsdk线程更新，在该线程中读取
+                order_id, order_status, filled_volume, filled_price = await tqsdk_adapter.call_api(lambda api: (
+                    order.order_id,
+                    order.status,
+                    getattr(order, 'volume_orign', 0) - getattr(order, 'volume_left', volume),
+                    getattr(order, 'trade_price', order_price),
+                ))
                 
                 # 计算手续费
                 commission = volume * order_price * instrument.get("commission_rate", 0.0001)
@@ -158,8 +168,8 @@ class SimpleTradingService:
                     "volume": volume,
                     "price": order_price,
                     "order_type": order_type,
-                    "filled_volume": getattr(order, 'volume_orign', 0) - getattr(order, 'volume_left', volume),
-                    "filled_price": getattr(order, 'trade_price', order_price),
+                    "filled_volume": filled_volume,
+                    "filled_price": filled_price,
                     "commission": commission,
                     "create_time": datetime.now().isoformat(),
                     "message": "订单已提交"
@@ -238,26 +248,31 @@ class SimpleTradingService:
             orders = []
             
             try:
-                # 获取所有订单
-                for order_id, order in tqsdk_adapter.api.get_order().items():
-                    if status and order.status != status:
-                        continue
+                # 获取所有订单，订单对象在tqsdk线程中读取
+                def read_orders(api):
+                    orders = []
+                    for order_id, order in api.get_order().items():
+                        if status and order.status != status:
+                            continue
                     
-                    order_info = {
-                        "order_id": order_id,
-                        "symbol": order.instrument_id,
-                        "direction": order.direction,
-                        "volume": order.volume_orign,
-                        "price": order.limit_price,
-                        "order_type": "LIMIT" if order.limit_price else "MARKET",
-                        "status": order.status,
-                        "filled_volume": order.volume_orign - order.volume_left,
-                        "filled_price": order.trade_price,
-                        "commission": getattr(order, 'commission', 0.0),
-                        "create_time": datetime.fromtimestamp(order.insert_date_time / 1e9).isoformat(),
-                        "update_time": datetime.now().isoformat()
-                    }
-                    orders.append(order_info)
+                        order_info = {
+                            "order_id": order_id,
+                            "symbol": order.instrument_id,
+                            "direction": order.direction,
+                            "volume": order.volume_orign,
+                            "price": order.limit_price,
+                            "order_type": "LIMIT" if order.limit_price else "MARKET",
+                            "status": order.status,
+                            "filled_volume": order.volume_orign - order.volume_left,
+                            "filled_price": order.trade_price,
+                            "commission": getattr(order, 'commission', 0.0),
+                            "create_time": datetime.fromtimestamp(order.insert_date_time / 1e9).isoformat(),
+                            "update_time": datetime.now().isoformat()
+                        }
+                        orders.append(order_info)
+                    return orders
+                
+                orders = await tqsdk_adapter.call_api(read_orders)
                 
                 # 按时间倒序排列
                 orders.sort(key=lambda x: x["create_time"], reverse=True)
@@ -324,20 +339,16 @@ class SimpleTradingService:
             positions = []
             
             try:
-                # 获取所有持仓
-                for symbol, position in tqsdk_adapter.api.get_position().items():
-                    if position.pos_long > 0 or position.pos_short > 0:
-                        # 获取当前行情计算盈亏
-                        quote = await tqsdk_adapter.get_quote(symbol)
-                        current_price = quote["last_price"] if quote else 0
-                        
+                # 获取所有持仓，持仓对象在tqsdk线程中读取
+                def read_positions(api):
+                    positions = []
+                    for symbol, position in api.get_position().items():
                         if position.pos_long > 0:
                             positions.append({
                                 "symbol": symbol,
                                 "direction": "LONG",
                                 "volume": position.pos_long,
                                 "avg_price": position.pos_long_price,
-                                "current_price": current_price,
                                 "profit": position.float_profit_long,
                                 "margin": position.margin_long,
                                 "volume_multiple": getattr(position, 'volume_multiple', 1),
@@ -351,13 +362,24 @@ class SimpleTradingService:
                                 "direction": "SHORT",
                                 "volume": position.pos_short,
                                 "avg_price": position.pos_short_price,
-                                "current_price": current_price,
                                 "profit": position.float_profit_short,
                                 "margin": position.margin_short,
                                 "volume_multiple": getattr(position, 'volume_multiple', 1),
                                 "create_time": datetime.now().isoformat(),
                                 "update_time": datetime.now().isoformat()
                             })
+                    return positions
+                
+                positions = await tqsdk_adapter.call_api(read_positions)
+                
+                # 获取当前行情计算盈亏
+                current_prices = {}
+                for position in positions:
+                    symbol = position["symbol"]
+                    if symbol not in current_prices:
+                        quote = await tqsdk_adapter.get_quote(symbol)
+                        current_prices[symbol] = quote["last_price"] if quote else 0
+                    position["current_price"] = current_prices[symbol]
                 
                 return positions
                 
@@ -412,19 +434,24 @@ class SimpleTradingService:
             trades = []
             
             try:
-                # 获取所有成交记录
-                for trade_id, trade in tqsdk_adapter.api.get_trade().items():
-                    trade_info = {
-                        "trade_id": trade_id,
-                        "order_id": trade.order_id,
-                        "symbol": trade.instrument_id,
-                        "direction": trade.direction,
-                        "volume": trade.volume,
-                        "price": trade.price,
-                        "commission": getattr(trade, 'commission', 0.0),
-                        "trade_time": datetime.fromtimestamp(trade.trade_date_time / 1e9).isoformat()
-                    }
-                    trades.append(trade_info)
+                # 获取所有成交记录，成交对象在tqsdk线程中读取
+                def read_trades(api):
+                    trades = []
+                    for trade_id, trade in api.get_trade().items():
+                        trade_info = {
+                            "trade_id": trade_id,
+                            "order_id": trade.order_id,
+                            "symbol": trade.instrument_id,
+                            "direction": trade.direction,
+                            "volume": trade.volume,
+                            "price": trade.price,
+                            "commission": getattr(trade, 'commission', 0.0),
+                            "trade_time": datetime.fromtimestamp(trade.trade_date_time / 1e9).isoformat()
+                        }
+                        trades.append(trade_info)
+                    return trades
+                
+                trades = await tqsdk_adapter.call_api(read_trades)
                 
                 # 按时间倒序排列
                 trades.sort(key=lambda x: x["trade_time"], reverse=True)
@@ -482,12 +509,15 @@ class SimpleTradingService:
             
             # 使用 tqsdk 真实撤单
             try:
-                order = tqsdk_adapter.api.get_order(order_id)
-                if not order:
-                    raise ValueError(f"订单不存在: {order_id}")
+                def cancel(api):
+                    order = api.get_order(order_id)
+                    if not order:
+                        raise ValueError(f"订单不存在: {order_id}")
+                    
+                    # 撤销订单
+                    api.cancel_order(order)
                 
-                # 撤销订单
-                tqsdk_adapter.api.cancel_order(order)
+                await tqsdk_adapter.call_api(cancel)
                 
                 # 等待状态更新
                 await asyncio.sleep(0.1)
@@ -1,18 +1,29 @@
 """
 技术分析服务 - 基于 tqsdk 的真实技术分析功能
 """
+import asyncio
 import logging
-import numpy as np
-import pandas as pd
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 import json
 
 from .market_data_service import market_data_service
+from .indicator_engine import indicator_engine
+from .indicator_library import (
+    BarArrays, IndicatorSpec, columns_to_json, compute_series, parse_indicator_specs, to_json_list,
+)
 from ..core.database import get_redis_client
 
 logger = logging.getLogger(__name__)
 
+# 单指标接口的默认指标：输出键 -> 指标请求
+DEFAULT_INDICATORS = {
+    "ma5": {"ma": 5},
+    "ma10": {"ma": 10},
+    "ma20": {"ma": 20},
+    "rsi": {"rsi": 14},
+}
+
 
 class TechnicalAnalysisService:
     """技术分析服务 - 基于 tqsdk 实现真实技术分析功能"""
@@ -53,7 +64,7 @@ class TechnicalAnalysisService:
             
             if cached_data:
                 try:
-                    return json.loads(cached_data)
+                    return self._with_live_values(json.loads(cached_data))
                 except:
                     pass
             
@@ -63,23 +74,13 @@ class TechnicalAnalysisService:
             if not klines or len(klines) < 20:
                 return {"error": "数据不足，无法计算技术指标"}
             
-            # 转换为DataFrame
-            df = pd.DataFrame(klines)
-            df['close'] = pd.to_numeric(df['close'])
-            df['high'] = pd.to_numeric(df['high'])
-            df['low'] = pd.to_numeric(df['low'])
-            df['volume'] = pd.to_numeric(df['volume'])
-            
-            # 计算各种技术指标
-            indicators = {}
-            
-            # 移动平均线
-            indicators['ma5'] = self._calculate_ma(df['close'], 5)
-            indicators['ma10'] = self._calculate_ma(df['close'], 10)
-            indicators['ma20'] = self._calculate_ma(df['close'], 20)
-            
-            # RSI
-            indicators['rsi'] = self._calculate_rsi(df['close'])
+            # 计算默认技术指标（共用指标库的缓存）
+            specs = parse_indicator_specs(DEFAULT_INDICATORS.values())
+            series = compute_series(symbol, period, BarArrays.from_klines(klines), specs)
+            indicators = {
+                name: to_json_list(series[spec.key]["value"], decimals=2)
+                for name, spec in zip(DEFAULT_INDICATORS, specs)
+            }
             
             # 添加时间戳和基本信息
             result = {
@@ -96,35 +97,89 @@ class TechnicalAnalysisService:
             cache_timeout = 60 if period in ["1m", "5m"] else 300
             self.redis_client.setex(cache_key, cache_timeout, json.dumps(result))
             
-            return result
+            return self._with_live_values(result)
             
         except Exception as e:
             logger.error(f"获取技术指标失败 {symbol}: {e}")
             return {"error": str(e)}
     
-    def _calculate_ma(self, prices: pd.Series, period: int) -> List[float]:
-        """计算移动平均线"""
-        try:
-            ma = prices.rolling(window=period).mean()
-            return [round(float(x), 2) if not pd.isna(x) else None for x in ma]
-        except Exception as e:
-            logger.error(f"计算MA失败: {e}")
-            return []
+    async def get_indicator_batch(
+        self,
+        symbols: List[str],
+        indicators: List[Union[str, Dict[str, Any]]],
+        period: str = "1d",
+        limit: int = 200,
+        tail: Optional[int] = None,
+        decimals: Optional[int] = 4
+    ) -> Dict[str, Any]:
+        """批量计算多个合约的多个指标，返回列式数组
+        
+        indicators 形如 [{"ema": 12}, {"macd": [12, 26, 9]}, "rsi"]，格式错误时抛出 ValidationError
+        """
+        specs = parse_indicator_specs(indicators)
+        
+        if not self.is_initialized:
+            await self.initialize()
+        
+        symbols = list(dict.fromkeys(symbols))
+        klines_list = await asyncio.gather(
+            *(market_data_service.get_klines(symbol, period, limit) for symbol in symbols),
+            return_exceptions=True
+        )
+        
+        data: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for symbol, klines in zip(symbols, klines_list):
+            if isinstance(klines, Exception):
+                errors[symbol] = str(klines)
+                continue
+            if not klines:
+                errors[symbol] = "无K线数据"
+                continue
+            
+            data[symbol] = self._columnar_result(symbol, period, klines, specs, tail, decimals)
+        
+        return {
+            "period": period,
+            "indicators": [spec.key for spec in specs],
+            "timestamp": datetime.now().isoformat(),
+            "data": data,
+            "errors": errors,
+        }
     
-    def _calculate_rsi(self, prices: pd.Series, period: int = 14) -> List[float]:
-        """计算RSI指标"""
-        try:
-            delta = prices.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-            
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
-            
-            return [round(float(x), 2) if not pd.isna(x) else None for x in rsi]
-        except Exception as e:
-            logger.error(f"计算RSI失败: {e}")
-            return []
+    @staticmethod
+    def _columnar_result(
+        symbol: str,
+        period: str,
+        klines: List[Dict[str, Any]],
+        specs: List[IndicatorSpec],
+        tail: Optional[int],
+        decimals: Optional[int]
+    ) -> Dict[str, Any]:
+        """单个合约的列式指标结果"""
+        bars = BarArrays.from_klines(klines)
+        series = compute_series(symbol, period, bars, specs)
+        datetimes = bars.datetime[-tail:] if tail else bars.datetime
+        return {
+            "datetime": datetimes,
+            "close": to_json_list(bars.close[-tail:] if tail else bars.close, decimals),
+            "indicators": columns_to_json(series, tail, decimals),
+        }
+    
+    def _with_live_values(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """用增量指标引擎中随行情更新的数值覆盖最新值"""
+        live = indicator_engine.latest(result.get("symbol"), result.get("period"))
+        if not live:
+            return result
+        
+        latest = dict(result.get("latest_values") or {})
+        for key in latest:
+            if live.get(key) is not None:
+                latest[key] = round(float(live[key]), 2)
+        
+        result = dict(result, latest_values=latest)
+        result["signals"] = self._generate_signals({key: [value] for key, value in latest.items()})
+        return result
     
     def _get_latest_values(self, indicators: Dict[str, Any]) -> Dict[str, float]:
         """获取最新的指标值"""
@@ -2,10 +2,14 @@
 tqsdk适配器服务
 """
 import asyncio
-from typing import Dict, List, Optional, Any, Callable
+import concurrent.futures
+import queue
+from typing import Dict, List, Optional, Any, Callable, Set, Tuple, TypeVar
 from datetime import datetime, timedelta
 import logging
 import json
+import threading
+import time
 from contextlib import asynccontextmanager
 
 try:
@@ -41,12 +45,22 @@ except ImportError:
 from ..core.config import settings
 from ..core.exceptions import ExternalServiceError, SystemError
 from ..core.database import get_redis_client
+from .matching_engine import DEPTH_LEVELS
 
 logger = logging.getLogger(__name__)
 
+# tqsdk线程每轮等待行情更新的最长时间（秒），也是排队中的API调用最长的等待时间
+TQSDK_WAIT_INTERVAL = 0.2
+
+T = TypeVar("T")
+
 
 class TQSDKAdapter:
-    """tqsdk适配器类"""
+    """tqsdk适配器类
+
+    TqApi不是线程安全的：由专门的tqsdk线程创建、调用wait_update并关闭，
+    其他线程对TqApi的访问都通过call_api排队到该线程执行。
+    """
     
     def __init__(self):
         self.api: Optional[TqApi] = None
@@ -64,6 +78,19 @@ class TQSDKAdapter:
         self._max_reconnect_attempts = 5
         self._reconnect_delay = 5  # 秒
         
+        # tqsdk线程及排队到该线程执行的API调用
+        self._api_thread: Optional[threading.Thread] = None
+        self._api_stop = threading.Event()
+        self._api_requests: "queue.Queue[Tuple[Callable[[TqApi], Any], concurrent.futures.Future]]" = queue.Queue()
+        self._api_lock = threading.Lock()
+        self._api_running = False
+        
+        # 行情推送：订阅的合约有更新时调用quote_callbacks
+        self._pump_symbols: Set[str] = set()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._pump_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.mock_quote_interval = settings.TQSDK_MOCK_QUOTE_INTERVAL
+        
         if not TQSDK_AVAILABLE:
             logger.warning("tqsdk未安装，使用模拟模式")
     
@@ -97,13 +124,13 @@ class TQSDKAdapter:
                 else:
                     raise SystemError("实盘交易需要提供账户ID")
             
-            # 创建API实例
-            self.api = TqApi(
+            # 在tqsdk线程中创建API实例
+            await self._start_api_thread(lambda: TqApi(
                 account=self.account,
                 auth=self.auth,
                 web_gui=False,  # 不启用web界面
                 debug=settings.DEBUG,
-            )
+            ))
             
             # 等待连接建立
             await asyncio.sleep(1)
@@ -126,11 +153,10 @@ class TQSDKAdapter:
     async def close(self):
         """关闭连接"""
         try:
-            if self.api and TQSDK_AVAILABLE:
-                self.api.close()
+            await self.stop_quote_pump()
+            await self._stop_api_thread()
             
             self.is_connected = False
-            self.api = None
             
             logger.info("tqsdk连接已关闭")
             
@@ -161,7 +187,7 @@ class TQSDKAdapter:
                 return self.is_connected
             
             # 尝试获取一个简单的数据来测试连接
-            quote = self.api.get_quote("SHFE.cu2401")
+            quote = await self.call_api(lambda api: api.get_quote("SHFE.cu2401"))
             return quote is not None
             
         except Exception:
@@ -179,8 +205,7 @@ class TQSDKAdapter:
             logger.info(f"尝试重连 ({self._reconnect_attempts}/{self._max_reconnect_attempts})")
             
             # 关闭现有连接
-            if self.api:
-                self.api.close()
+            await self._stop_api_thread()
             
             # 等待一段时间后重连
             await asyncio.sleep(self._reconnect_delay)
@@ -199,6 +224,88 @@ class TQSDKAdapter:
             # 指数退避
             self._reconnect_delay = min(self._reconnect_delay * 2, 300)
     
+    async def _start_api_thread(self, factory: Callable[[], TqApi]):
+        """启动tqsdk线程，在该线程中创建TqApi，创建完成后返回"""
+        ready: concurrent.futures.Future = concurrent.futures.Future()
+        self._api_stop.clear()
+        self._api_thread = threading.Thread(
+            target=self._api_thread_main, args=(factory, ready), name="tqsdk-api", daemon=True
+        )
+        self._api_thread.start()
+        await asyncio.wrap_future(ready)
+    
+    async def _stop_api_thread(self):
+        """停止tqsdk线程，TqApi在该线程中关闭"""
+        if self._api_thread is None:
+            return
+        self._api_stop.set()
+        await asyncio.get_running_loop().run_in_executor(None, self._api_thread.join, 5)
+        self._api_thread = None
+    
+    def _api_thread_main(self, factory: Callable[[], TqApi], ready: concurrent.futures.Future):
+        """tqsdk线程：执行排队的API调用，等待行情更新并把订阅合约的变化转交事件循环"""
+        try:
+            api = factory()
+        except Exception as e:
+            ready.set_exception(e)
+            return
+        with self._api_lock:
+            self.api = api
+            self._api_running = True
+        ready.set_result(None)
+        
+        try:
+            while not self._api_stop.is_set():
+                try:
+                    self._run_api_requests(api)
+                    api.wait_update(deadline=time.time() + TQSDK_WAIT_INTERVAL)
+                    if self._pump_loop is not None:
+                        self._pump_changed_quotes(api, self._pump_loop)
+                except Exception as e:
+                    logger.error(f"tqsdk线程异常: {e}")
+                    self._api_stop.wait(1)
+        finally:
+            with self._api_lock:
+                self._api_running = False
+                self.api = None
+            # 停止后不再执行的调用直接失败
+            while True:
+                try:
+                    _, future = self._api_requests.get_nowait()
+                except queue.Empty:
+                    break
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(ExternalServiceError("tqsdk连接已关闭"))
+            try:
+                api.close()
+            except Exception as e:
+                logger.error(f"关闭TqApi失败: {e}")
+    
+    def _run_api_requests(self, api: TqApi):
+        while True:
+            try:
+                func, future = self._api_requests.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(api))
+            except Exception as e:
+                future.set_exception(e)
+    
+    async def call_api(self, func: Callable[[TqApi], T]) -> T:
+        """在tqsdk线程中执行func(api)并返回结果
+
+        func返回的tqsdk对象会被后续的wait_update原地更新，需要的字段应在func内读出
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._api_lock:
+            if not self._api_running:
+                raise ExternalServiceError("tqsdk未连接")
+            self._api_requests.put((func, future))
+        return await asyncio.wrap_future(future)
+    
     def get_connection_status(self) -> Dict[str, Any]:
         """获取连接状态"""
         return {
@@ -235,28 +342,9 @@ class TQSDKAdapter:
             
             for exch in exchanges:
                 try:
-                    # 获取交易所的所有合约
-                    exch_instruments = self.api.query_quotes(
-                        ins_class="FUTURE",
-                        exchange_id=exch
-                    )
-                    
-                    for symbol in exch_instruments:
-                        quote = self.api.get_quote(symbol)
-                        if quote:
-                            instrument_info = {
-                                "symbol": symbol,
-                                "exchange": exch,
-                                "name": getattr(quote, 'instrument_name', symbol),
-                                "product_id": getattr(quote, 'product_id', ''),
-                                "volume_multiple": getattr(quote, 'volume_multiple', 1),
-                                "price_tick": getattr(quote, 'price_tick', 0.01),
-                                "margin_rate": getattr(quote, 'margin_rate', 0.1),
-                                "commission_rate": getattr(quote, 'commission_rate', 0.0001),
-                                "expired": getattr(quote, 'expired', False),
-                                "trading_time": getattr(quote, 'trading_time', {}),
-                            }
-                            instruments.append(instrument_info)
+                    instruments.extend(await self.call_api(
+                        lambda api, exch=exch: self._query_exchange_instruments(api, exch)
+                    ))
                 
                 except Exception as e:
                     logger.warning(f"获取{exch}合约信息失败: {e}")
@@ -272,6 +360,27 @@ class TQSDKAdapter:
             logger.error(f"获取合约信息失败: {e}")
             raise ExternalServiceError(f"获取合约信息失败: {str(e)}")
     
+    @staticmethod
+    def _query_exchange_instruments(api: TqApi, exchange: str) -> List[Dict[str, Any]]:
+        """查询交易所的全部期货合约信息（在tqsdk线程中执行）"""
+        instruments = []
+        for symbol in api.query_quotes(ins_class="FUTURE", exchange_id=exchange):
+            quote = api.get_quote(symbol)
+            if quote:
+                instruments.append({
+                    "symbol": symbol,
+                    "exchange": exchange,
+                    "name": getattr(quote, 'instrument_name', symbol),
+                    "product_id": getattr(quote, 'product_id', ''),
+                    "volume_multiple": getattr(quote, 'volume_multiple', 1),
+                    "price_tick": getattr(quote, 'price_tick', 0.01),
+                    "margin_rate": getattr(quote, 'margin_rate', 0.1),
+                    "commission_rate": getattr(quote, 'commission_rate', 0.0001),
+                    "expired": getattr(quote, 'expired', False),
+                    "trading_time": getattr(quote, 'trading_time', {}),
+                })
+        return instruments
+    
     def _get_mock_instruments(self, exchange: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取模拟合约信息"""
         mock_data = [
@@ -325,37 +434,59 @@ class TQSDKAdapter:
                 # 返回模拟行情数据
                 return self._get_mock_quote(symbol)
             
-            quote = self.api.get_quote(symbol)
-            if not quote:
-                return None
-            
-            quote_data = {
-                "symbol": symbol,
-                "last_price": getattr(quote, 'last_price', 0),
-                "bid_price": getattr(quote, 'bid_price1', 0),
-                "ask_price": getattr(quote, 'ask_price1', 0),
-                "bid_volume": getattr(quote, 'bid_volume1', 0),
-                "ask_volume": getattr(quote, 'ask_volume1', 0),
-                "volume": getattr(quote, 'volume', 0),
-                "open_interest": getattr(quote, 'open_interest', 0),
-                "open": getattr(quote, 'open', 0),
-                "high": getattr(quote, 'highest', 0),
-                "low": getattr(quote, 'lowest', 0),
-                "pre_close": getattr(quote, 'pre_close', 0),
-                "upper_limit": getattr(quote, 'upper_limit', 0),
-                "lower_limit": getattr(quote, 'lower_limit', 0),
-                "datetime": getattr(quote, 'datetime', datetime.now().isoformat()),
-            }
-            
-            # 缓存行情数据
-            self._quotes_cache[symbol] = quote
-            
-            return quote_data
+            return await self.call_api(lambda api: self._load_quote(api, symbol))
             
         except Exception as e:
             logger.error(f"获取行情失败 {symbol}: {e}")
             return None
     
+    def _load_quote(self, api: TqApi, symbol: str) -> Optional[Dict[str, Any]]:
+        """获取并缓存行情对象，返回行情字典（在tqsdk线程中执行）"""
+        quote = api.get_quote(symbol)
+        if not quote:
+            return None
+        self._quotes_cache[symbol] = quote
+        return self._quote_to_dict(symbol, quote)
+    
+    def _quote_to_dict(self, symbol: str, quote: Quote) -> Dict[str, Any]:
+        """tqsdk行情对象转为行情字典
+
+        bid_price/ask_price为一档价格，另带 bid_price1..5 / bid_volume1..5 / ask_price1..5 / ask_volume1..5
+        盘口字段，供订单执行引擎按对手价触发和撮合引擎按挂量成交
+        """
+        data = {
+            "symbol": symbol,
+            "last_price": getattr(quote, 'last_price', 0),
+            "bid_price": getattr(quote, 'bid_price1', 0),
+            "ask_price": getattr(quote, 'ask_price1', 0),
+            "bid_volume": getattr(quote, 'bid_volume1', 0),
+            "ask_volume": getattr(quote, 'ask_volume1', 0),
+            "volume": getattr(quote, 'volume', 0),
+            "open_interest": getattr(quote, 'open_interest', 0),
+            "open": getattr(quote, 'open', 0),
+            "high": getattr(quote, 'highest', 0),
+            "low": getattr(quote, 'lowest', 0),
+            "pre_close": getattr(quote, 'pre_close', 0),
+            "upper_limit": getattr(quote, 'upper_limit', 0),
+            "lower_limit": getattr(quote, 'lower_limit', 0),
+            "datetime": getattr(quote, 'datetime', datetime.now().isoformat()),
+        }
+        data.update(self._depth_fields(quote))
+        return data
+    
+    @staticmethod
+    def _depth_fields(quote: Quote) -> Dict[str, Any]:
+        """盘口各档价格和挂量，交易所未提供的档位（NaN）不输出"""
+        fields = {}
+        for side in ("bid", "ask"):
+            for level in range(1, DEPTH_LEVELS + 1):
+                price = getattr(quote, f"{side}_price{level}", None)
+                volume = getattr(quote, f"{side}_volume{level}", None)
+                if price and volume and price == price and volume == volume:
+                    fields[f"{side}_price{level}"] = price
+                    fields[f"{side}_volume{level}"] = volume
+        return fields
+    
     def _get_mock_quote(self, symbol: str) -> Dict[str, Any]:
         """获取模拟行情数据"""
         import random
@@ -376,7 +507,7 @@ class TQSDKAdapter:
             
         price = base_price + random.uniform(-base_price * 0.05, base_price * 0.05)
         
-        return {
+        quote = {
             "symbol": symbol,
             "last_price": round(price, 2),
             "bid_price": round(price - 1, 2),
@@ -393,6 +524,13 @@ class TQSDKAdapter:
             "lower_limit": round(price * 0.9, 2),
             "datetime": datetime.now().isoformat(),
         }
+        # 与真实行情相同的五档盘口，一档与bid_price/ask_price一致
+        for level in range(1, DEPTH_LEVELS + 1):
+            quote[f"bid_price{level}"] = round(price - level, 2)
+            quote[f"ask_price{level}"] = round(price + level, 2)
+            quote[f"bid_volume{level}"] = quote["bid_volume"] if level == 1 else random.randint(1, 100)
+            quote[f"ask_volume{level}"] = quote["ask_volume"] if level == 1 else random.randint(1, 100)
+        return quote
     
     async def get_klines(
         self,
@@ -406,33 +544,34 @@ class TQSDKAdapter:
                 # 返回模拟K线数据
                 return self._get_mock_klines(symbol, duration, data_length)
             
-            klines = self.api.get_kline_serial(
-                symbol,
-                duration_seconds=duration,
-                data_length=data_length
-            )
-            
-            if klines is None:
-                return []
-            
-            kline_data = []
-            for i in range(len(klines)):
-                kline_data.append({
-                    "datetime": klines.iloc[i]['datetime'],
-                    "open": klines.iloc[i]['open'],
-                    "high": klines.iloc[i]['high'],
-                    "low": klines.iloc[i]['low'],
-                    "close": klines.iloc[i]['close'],
-                    "volume": klines.iloc[i]['volume'],
-                    "open_interest": klines.iloc[i].get('open_oi', 0),
-                })
-            
-            return kline_data
+            return await self.call_api(lambda api: self._load_klines(api, symbol, duration, data_length))
             
         except Exception as e:
             logger.error(f"获取K线数据失败 {symbol}: {e}")
             return []
     
+    @staticmethod
+    def _load_klines(api: TqApi, symbol: str, duration: int, data_length: int) -> List[Dict[str, Any]]:
+        """获取K线序列并转为字典列表（在tqsdk线程中执行，K线序列会被wait_update原地更新）"""
+        klines = api.get_kline_serial(symbol, duration_seconds=duration, data_length=data_length)
+        
+        if klines is None:
+            return []
+        
+        kline_data = []
+        for i in range(len(klines)):
+            kline_data.append({
+                "datetime": klines.iloc[i]['datetime'],
+                "open": klines.iloc[i]['open'],
+                "high": klines.iloc[i]['high'],
+                "low": klines.iloc[i]['low'],
+                "close": klines.iloc[i]['close'],
+                "volume": klines.iloc[i]['volume'],
+                "open_interest": klines.iloc[i].get('open_oi', 0),
+            })
+        
+        return kline_data
+    
     def _get_mock_klines(
         self,
         symbol: str,
@@ -486,7 +625,7 @@ class TQSDKAdapter:
         return klines
     
     def add_quote_callback(self, callback: Callable):
-        """添加行情回调函数"""
+        """添加行情回调函数，回调形式为 callback(symbol, quote_data, received_at)"""
         self.quote_callbacks.append(callback)
     
     def remove_quote_callback(self, callback: Callable):
@@ -494,17 +633,67 @@ class TQSDKAdapter:
         if callback in self.quote_callbacks:
             self.quote_callbacks.remove(callback)
     
+    def _dispatch_quote(self, quote_data: Dict[str, Any], received_at: Optional[float] = None):
+        """把一笔行情交给所有行情回调（在事件循环线程中调用）"""
+        if received_at is None:
+            received_at = time.perf_counter()
+        symbol = quote_data["symbol"]
+        for callback in list(self.quote_callbacks):
+            try:
+                callback(symbol, quote_data, received_at)
+            except Exception as e:
+                logger.error(f"行情回调执行失败 {symbol}: {e}")
+    
+    async def start_quote_pump(self):
+        """启动行情推送
+        
+        tqsdk可用时由tqsdk线程在每次wait_update后推送有变化的行情；否则按固定间隔推送模拟行情
+        """
+        if self._pump_task is not None or self._pump_loop is not None:
+            return
+        
+        if self.is_connected and TQSDK_AVAILABLE and self._api_running:
+            self._pump_loop = asyncio.get_running_loop()
+        else:
+            self._pump_task = asyncio.create_task(self._mock_quote_pump())
+        
+        logger.info("行情推送已启动")
+    
+    async def stop_quote_pump(self):
+        """停止行情推送"""
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        self._pump_loop = None
+    
+    def _pump_changed_quotes(self, api: TqApi, loop: asyncio.AbstractEventLoop):
+        """把订阅合约中有变化的行情转交事件循环分发（在tqsdk线程中执行）"""
+        received_at = time.perf_counter()
+        for symbol in list(self._pump_symbols):
+            quote = self._quotes_cache.get(symbol)
+            if quote is not None and api.is_changing(quote):
+                loop.call_soon_threadsafe(self._dispatch_quote, self._quote_to_dict(symbol, quote), received_at)
+    
+    async def _mock_quote_pump(self):
+        """按固定间隔推送订阅合约的模拟行情"""
+        try:
+            while True:
+                await asyncio.sleep(self.mock_quote_interval)
+                for symbol in list(self._pump_symbols):
+                    self._dispatch_quote(self._get_mock_quote(symbol))
+        except asyncio.CancelledError:
+            pass
+    
     async def subscribe_quotes(self, symbols: List[str]):
         """订阅行情"""
         try:
+            self._pump_symbols.update(symbols)
+            
             if not self.is_connected or not TQSDK_AVAILABLE:
                 logger.info(f"模拟订阅行情: {symbols}")
                 return
             
-            for symbol in symbols:
-                quote = self.api.get_quote(symbol)
-                if quote:
-                    self._quotes_cache[symbol] = quote
+            await self.call_api(lambda api: [self._load_quote(api, symbol) for symbol in symbols])
             
             logger.info(f"订阅行情成功: {symbols}")
             
@@ -515,9 +704,17 @@ class TQSDKAdapter:
     async def unsubscribe_quotes(self, symbols: List[str]):
         """取消订阅行情"""
         try:
-            for symbol in symbols:
-                if symbol in self._quotes_cache:
-                    del self._quotes_cache[symbol]
+            self._pump_symbols.difference_update(symbols)
+            
+            def forget(api=None):
+                for symbol in symbols:
+                    self._quotes_cache.pop(symbol, None)
+            
+            # 行情对象缓存由tqsdk线程读取，连接时在该线程中移除
+            if self._api_running:
+                await self.call_api(forget)
+            else:
+                forget()
             
             logger.info(f"取消订阅行情: {symbols}")
             
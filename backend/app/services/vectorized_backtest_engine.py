@@ -0,0 +1,283 @@
+"""
+向量化回测引擎 - 面向输出目标持仓数组的策略
+
+策略只要定义 ``compute_signals(df) -> target_position_array``，即可跳过逐K线事件循环：
+持仓、成交（含手续费和滑点）、资金曲线和日收益率全部用NumPy数组运算得到。
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..core.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+SIGNAL_FUNCTION_NAME = "compute_signals"
+
+
+def supports_vectorized(namespace: Optional[Dict[str, Any]]) -> bool:
+    """策略命名空间中是否定义了向量化信号函数"""
+    return bool(namespace) and callable(namespace.get(SIGNAL_FUNCTION_NAME))
+
+
+def load_signal_function(code: Optional[str], namespace: Optional[Dict[str, Any]] = None
+                         ) -> Optional[Callable[[pd.DataFrame], Any]]:
+    """执行策略代码并返回其中的信号函数，未定义或执行失败时返回None"""
+    if not code or SIGNAL_FUNCTION_NAME not in code:
+        return None
+
+    namespace = {'np': np, 'pd': pd, **(namespace or {})}
+    try:
+        exec(code, namespace)
+    except Exception as e:
+        logger.warning(f"加载策略信号函数失败，使用事件循环回测: {e}")
+        return None
+
+    return namespace[SIGNAL_FUNCTION_NAME] if supports_vectorized(namespace) else None
+
+
+@dataclass
+class VectorizedSymbolResult:
+    """单品种向量化回测结果（逐K线数组）"""
+    symbol: str
+    index: pd.DatetimeIndex
+    close: np.ndarray
+    position: np.ndarray  # K线收盘时持仓
+    trade_quantity: np.ndarray  # 当根K线成交数量，正数买入、负数卖出
+    fill_price: np.ndarray  # 成交价，无成交时为NaN
+    commission: np.ndarray  # 当根K线手续费
+    pnl: np.ndarray  # 按收盘价盯市的累计盈亏（不含手续费）
+    realized_pnl: np.ndarray  # 累计已实现盈亏（平均成本法）
+
+    @property
+    def trade_indices(self) -> np.ndarray:
+        """有成交的K线位置"""
+        return np.flatnonzero(self.trade_quantity)
+
+
+@dataclass
+class VectorizedBacktestResult:
+    """组合向量化回测结果"""
+    index: pd.DatetimeIndex
+    symbols: Dict[str, VectorizedSymbolResult]
+    equity: np.ndarray
+    cash: np.ndarray  # 初始资金 - 成交金额 - 手续费
+    market_value: np.ndarray
+    realized_pnl: np.ndarray
+    unrealized_pnl: np.ndarray
+    commission: np.ndarray  # 累计手续费
+    returns: np.ndarray  # 逐K线收益率
+    daily_returns: pd.Series
+    max_drawdown: float
+
+    @property
+    def final_equity(self) -> float:
+        return float(self.equity[-1]) if len(self.equity) else 0.0
+
+
+class VectorizedBacktester:
+    """向量化回测器
+
+    ``execution_lag`` 和 ``price_field`` 决定信号的成交时点：
+    lag=1/open 表示第t根K线给出的目标持仓在第t+1根K线开盘成交；
+    lag=0/close 表示在当根K线收盘价成交。
+    """
+
+    def __init__(
+        self,
+        initial_capital: float,
+        commission_rate: float = 0.0003,
+        slippage: float = 0.0001,
+        min_commission: float = 0.0,
+        execution_lag: int = 1,
+        price_field: str = "open"
+    ):
+        if execution_lag < 0:
+            raise ValidationError("execution_lag不能为负数")
+
+        self.initial_capital = float(initial_capital)
+        self.commission_rate = commission_rate
+        self.slippage = slippage
+        self.min_commission = min_commission
+        self.execution_lag = execution_lag
+        self.price_field = price_field
+
+    def run(
+        self,
+        data: Dict[str, pd.DataFrame],
+        compute_signals: Callable[[pd.DataFrame], Any]
+    ) -> VectorizedBacktestResult:
+        """对每个品种调用信号函数并合成组合结果"""
+        results = {}
+        for symbol, df in data.items():
+            if df is None or df.empty:
+                continue
+            target = compute_signals(df)
+            results[symbol] = self.run_symbol(symbol, df, target)
+
+        if not results:
+            raise ValidationError("没有可用的历史数据")
+
+        return self.combine(results)
+
+    def run_symbol(self, symbol: str, df: pd.DataFrame, target: Any) -> VectorizedSymbolResult:
+        """根据目标持仓数组计算单品种的成交和盈亏"""
+        target = np.nan_to_num(np.asarray(target, dtype=np.float64).reshape(-1))
+        if len(target) != len(df):
+            raise ValidationError(
+                f"{symbol} 的目标持仓长度({len(target)})与K线数量({len(df)})不一致"
+            )
+
+        lag = self.execution_lag
+        if lag:
+            position = np.zeros_like(target)
+            position[lag:] = target[:-lag]
+        else:
+            position = target.copy()
+
+        trade_quantity = np.diff(position, prepend=0.0)
+        traded = trade_quantity != 0
+
+        price = df[self.price_field].to_numpy(dtype=np.float64)
+        close = df["close"].to_numpy(dtype=np.float64)
+
+        fill_price = np.where(traded, price * (1 + np.sign(trade_quantity) * self.slippage), np.nan)
+        notional = np.abs(trade_quantity) * np.nan_to_num(fill_price)
+        commission = notional * self.commission_rate
+        if self.min_commission:
+            commission = np.where(traded, np.maximum(commission, self.min_commission), 0.0)
+
+        cash_flow = -np.cumsum(trade_quantity * np.nan_to_num(fill_price))
+        pnl = cash_flow + position * close
+
+        return VectorizedSymbolResult(
+            symbol=symbol,
+            index=pd.DatetimeIndex(df.index),
+            close=close,
+            position=position,
+            trade_quantity=trade_quantity,
+            fill_price=fill_price,
+            commission=commission,
+            pnl=pnl,
+            realized_pnl=self._realized_pnl(position, trade_quantity, fill_price)
+        )
+
+    def combine(self, results: Dict[str, VectorizedSymbolResult]) -> VectorizedBacktestResult:
+        """把各品种结果对齐到统一时间轴后汇总"""
+        index = results[next(iter(results))].index
+        for result in list(results.values())[1:]:
+            index = index.union(result.index)
+
+        def aligned(result: VectorizedSymbolResult, values: np.ndarray) -> np.ndarray:
+            if result.index.equals(index):
+                return values
+            series = pd.Series(values, index=result.index)
+            return series.reindex(index, method="ffill").fillna(0.0).to_numpy()
+
+        pnl = np.zeros(len(index))
+        realized = np.zeros(len(index))
+        market_value = np.zeros(len(index))
+        commission = np.zeros(len(index))
+        cash_flow = np.zeros(len(index))
+
+        for result in results.values():
+            pnl += aligned(result, result.pnl)
+            realized += aligned(result, result.realized_pnl)
+            market_value += aligned(result, np.abs(result.position) * result.close)
+            commission += aligned(result, np.cumsum(result.commission))
+            cash_flow += aligned(result, result.pnl - result.position * result.close)
+
+        equity = self.initial_capital + pnl - commission
+        previous = np.concatenate(([self.initial_capital], equity[:-1]))
+        returns = np.divide(
+            equity - previous, previous, out=np.zeros_like(equity), where=previous > 0
+        )
+
+        peak = np.maximum.accumulate(equity)
+        drawdown = np.divide(peak - equity, peak, out=np.zeros_like(equity), where=peak > 0)
+
+        return VectorizedBacktestResult(
+            index=index,
+            symbols=results,
+            equity=equity,
+            cash=self.initial_capital + cash_flow - commission,
+            market_value=market_value,
+            realized_pnl=realized,
+            unrealized_pnl=pnl - realized,
+            commission=commission,
+            returns=returns,
+            daily_returns=self._daily_returns(index, equity),
+            max_drawdown=float(drawdown.max()) if len(drawdown) else 0.0
+        )
+
+    def _daily_returns(self, index: pd.DatetimeIndex, equity: np.ndarray) -> pd.Series:
+        """按交易日最后一根K线的权益计算日收益率"""
+        daily_equity = pd.Series(equity, index=index).groupby(index.normalize()).last()
+        previous = daily_equity.shift(1)
+        previous.iloc[0] = self.initial_capital
+        return (daily_equity - previous) / previous
+
+    @staticmethod
+    def _realized_pnl(position: np.ndarray, trade_quantity: np.ndarray,
+                      fill_price: np.ndarray) -> np.ndarray:
+        """平均成本法的累计已实现盈亏
+
+        只在有成交的K线上推进成本状态，复杂度与成交笔数成正比。
+        """
+        realized = np.zeros(len(position))
+        trade_indices = np.flatnonzero(trade_quantity)
+        if not len(trade_indices):
+            return realized
+
+        quantity = 0.0
+        avg_price = 0.0
+        total = 0.0
+        realized_at_trades = np.empty(len(trade_indices))
+
+        for n, i in enumerate(trade_indices):
+            delta = trade_quantity[i]
+            price = fill_price[i]
+            if quantity == 0 or np.sign(quantity) == np.sign(delta):
+                # 开仓或加仓
+                new_quantity = quantity + delta
+                avg_price = (abs(quantity) * avg_price + abs(delta) * price) / abs(new_quantity)
+                quantity = new_quantity
+            else:
+                close_quantity = min(abs(delta), abs(quantity))
+                total += close_quantity * (price - avg_price) * np.sign(quantity)
+                quantity += delta
+                if quantity == 0:
+                    avg_price = 0.0
+                elif np.sign(quantity) == np.sign(delta):
+                    # 平仓后反向开仓
+                    avg_price = price
+            realized_at_trades[n] = total
+
+        # 把成交点的已实现盈亏向后填充到每根K线
+        slots = np.searchsorted(trade_indices, np.arange(len(position)), side="right") - 1
+        realized = np.where(slots >= 0, realized_at_trades[np.maximum(slots, 0)], 0.0)
+        return realized
+
+
+def result_trades(result: VectorizedBacktestResult) -> List[Dict[str, Any]]:
+    """按时间顺序列出所有成交"""
+    trades = []
+    for symbol, symbol_result in result.symbols.items():
+        for i in symbol_result.trade_indices:
+            trades.append({
+                "symbol": symbol,
+                "datetime": symbol_result.index[i],
+                "quantity": float(symbol_result.trade_quantity[i]),
+                "price": float(symbol_result.fill_price[i]),
+                "commission": float(symbol_result.commission[i]),
+                "position_after": float(symbol_result.position[i]),
+                "pnl": float(
+                    symbol_result.realized_pnl[i] - (symbol_result.realized_pnl[i - 1] if i else 0.0)
+                )
+            })
+    trades.sort(key=lambda trade: trade["datetime"])
+    return trades
@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from scipy import stats
 import logging
 
+from ..services.risk_analytics import risk_analytics
+
 logger = logging.getLogger(__name__)
 
 
@@ -182,80 +184,19 @@ class RiskCalculator:
             return None
     
     def calculate_var(self, positions: List[Any], price_data: Dict[str, float], 
-                     confidence: float = 0.95, holding_period: int = 1) -> Optional[Decimal]:
-        """计算VaR (Value at Risk)"""
-        try:
-            if not positions:
-                return None
-            
-            # 获取历史价格数据和计算收益率
-            returns_data = self._get_returns_data(positions, price_data)
-            
-            if not returns_data:
-                return None
-            
-            # 计算组合收益率
-            portfolio_returns = self._calculate_portfolio_returns(positions, returns_data, price_data)
-            
-            if len(portfolio_returns) == 0:
-                return None
-            
-            # 计算VaR
-            var_percentile = (1 - confidence) * 100
-            var_value = np.percentile(portfolio_returns, var_percentile)
-            
-            # 调整持有期
-            if holding_period > 1:
-                var_value *= np.sqrt(holding_period)
-            
-            # 转换为货币金额
-            portfolio_value = self.calculate_portfolio_value(positions, price_data)
-            var_amount = abs(var_value) * portfolio_value
-            
-            return Decimal(str(var_amount))
-        except Exception as e:
-            logger.error(f"Error calculating VaR: {e}")
-            return None
+                     confidence: float = 0.95, holding_period: int = 1,
+                     method: str = "historical") -> Optional[Decimal]:
+        """计算VaR (Value at Risk)
+
+        method: historical / parametric / monte_carlo，收益率与协方差取自风险分析引擎的缓存
+        """
+        return self._portfolio_tail_risk("var", positions, price_data, confidence, holding_period, method)
     
     def calculate_cvar(self, positions: List[Any], price_data: Dict[str, float], 
-                      confidence: float = 0.95) -> Optional[Decimal]:
+                      confidence: float = 0.95, holding_period: int = 1,
+                      method: str = "historical") -> Optional[Decimal]:
         """计算CVaR (Conditional Value at Risk)"""
-        try:
-            if not positions:
-                return None
-            
-            # 获取历史价格数据和计算收益率
-            returns_data = self._get_returns_data(positions, price_data)
-            
-            if not returns_data:
-                return None
-            
-            # 计算组合收益率
-            portfolio_returns = self._calculate_portfolio_returns(positions, returns_data, price_data)
-            
-            if len(portfolio_returns) == 0:
-                return None
-            
-            # 计算CVaR
-            var_percentile = (1 - confidence) * 100
-            var_threshold = np.percentile(portfolio_returns, var_percentile)
-            
-            # 计算超过VaR阈值的平均损失
-            tail_losses = portfolio_returns[portfolio_returns <= var_threshold]
-            
-            if len(tail_losses) == 0:
-                return None
-            
-            cvar_value = np.mean(tail_losses)
-            
-            # 转换为货币金额
-            portfolio_value = self.calculate_portfolio_value(positions, price_data)
-            cvar_amount = abs(cvar_value) * portfolio_value
-            
-            return Decimal(str(cvar_amount))
-        except Exception as e:
-            logger.error(f"Error calculating CVaR: {e}")
-            return None
+        return self._portfolio_tail_risk("cvar", positions, price_data, confidence, holding_period, method)
     
     # ==================== 风险调整收益指标 ====================
     
@@ -358,25 +299,14 @@ class RiskCalculator:
     
     def calculate_correlation_matrix(self, positions: List[Any], 
                                    price_data: Dict[str, float]) -> Optional[pd.DataFrame]:
-        """计算相关性矩阵"""
+        """计算相关性矩阵（取自风险分析引擎缓存的相关系数矩阵）"""
         try:
             if not positions:
                 return None
             
-            # 获取所有标的的收益率数据
             symbols = [pos.symbol for pos in positions]
-            returns_data = {}
-            
-            for symbol in symbols:
-                # 这里应该从数据库获取历史价格数据
-                # 暂时生成模拟数据
-                returns_data[symbol] = np.random.normal(0.001, 0.02, 252)
-            
-            # 创建DataFrame并计算相关性
-            df = pd.DataFrame(returns_data)
-            correlation_matrix = df.corr()
-            
-            return correlation_matrix
+            risk_analytics.request_symbols(symbols)
+            return risk_analytics.correlation(symbols)
         except Exception as e:
             logger.error(f"Error calculating correlation matrix: {e}")
             return None
@@ -403,101 +333,61 @@ class RiskCalculator:
     
     # ==================== 辅助方法 ====================
     
-    def _get_returns_data(self, positions: List[Any], 
-                         price_data: Dict[str, float]) -> Dict[str, List[float]]:
-        """获取收益率数据"""
-        returns_data = {}
-        
+    def _position_exposures(self, positions: List[Any], price_data: Dict[str, float]) -> Dict[str, float]:
+        """各合约金额敞口"""
+        exposures: Dict[str, float] = {}
         for position in positions:
             symbol = position.symbol
-            # 这里应该从数据库获取历史价格数据并计算收益率
-            # 暂时生成模拟数据
-            returns_data[symbol] = np.random.normal(0.001, 0.02, 252).tolist()
-        
-        return returns_data
+            value = float(position.quantity) * float(price_data.get(symbol, 0))
+            exposures[symbol] = exposures.get(symbol, 0.0) + value
+        return exposures
     
-    def _calculate_portfolio_returns(self, positions: List[Any], 
-                                   returns_data: Dict[str, List[float]], 
-                                   price_data: Dict[str, float]) -> np.ndarray:
-        """计算组合收益率"""
+    def _portfolio_tail_risk(self, measure: str, positions: List[Any], price_data: Dict[str, float],
+                             confidence: float, holding_period: int, method: str) -> Optional[Decimal]:
+        """从风险分析引擎取组合VaR/CVaR"""
         try:
-            # 计算权重
-            total_value = self.calculate_portfolio_value(positions, price_data)
-            weights = {}
-            
-            for position in positions:
-                symbol = position.symbol
-                quantity = Decimal(str(position.quantity))
-                price = Decimal(str(price_data.get(symbol, 0)))
-                position_value = quantity * price
-                
-                if total_value > 0:
-                    weights[symbol] = float(position_value / total_value)
-                else:
-                    weights[symbol] = 0
-            
-            # 计算组合收益率
-            portfolio_returns = []
-            max_length = max(len(returns) for returns in returns_data.values()) if returns_data else 0
-            
-            for i in range(max_length):
-                portfolio_return = 0
-                for symbol, weight in weights.items():
-                    if symbol in returns_data and i < len(returns_data[symbol]):
-                        portfolio_return += weight * returns_data[symbol][i]
-                portfolio_returns.append(portfolio_return)
-            
-            return np.array(portfolio_returns)
+            if not positions:
+                return None
+            
+            risk = risk_analytics.portfolio_risk(
+                self._position_exposures(positions, price_data), holding_period=holding_period
+            )
+            if risk is None:
+                return None
+            
+            value = risk[measure][method].get(confidence)
+            if value is None:
+                return None
+            return Decimal(str(value))
         except Exception as e:
-            logger.error(f"Error calculating portfolio returns: {e}")
-            return np.array([])
+            logger.error(f"Error calculating {measure.upper()}: {e}")
+            return None
     
     def calculate_risk_contribution(self, positions: List[Any], 
                                   price_data: Dict[str, float]) -> Dict[str, float]:
-        """计算风险贡献度"""
+        """计算风险贡献度
+
+        按组合权重与协方差矩阵做欧拉分解，各合约贡献之和等于组合收益率标准差
+        """
         try:
-            # 获取相关性矩阵
-            correlation_matrix = self.calculate_correlation_matrix(positions, price_data)
+            exposures = self._position_exposures(positions, price_data)
+            total_value = sum(exposures.values())
+            if not exposures or total_value <= 0:
+                return {}
             
-            if correlation_matrix is None:
+            cov = risk_analytics.covariance(list(exposures))
+            if cov is None:
                 return {}
             
-            # 计算权重向量
-            total_value = self.calculate_portfolio_value(positions, price_data)
-            weights = []
-            symbols = []
-            
-            for position in positions:
-                symbol = position.symbol
-                quantity = Decimal(str(position.quantity))
-                price = Decimal(str(price_data.get(symbol, 0)))
-                position_value = quantity * price
-                
-                if total_value > 0:
-                    weight = float(position_value / total_value)
-                else:
-                    weight = 0
-                
-                weights.append(weight)
-                symbols.append(symbol)
-            
-            weights = np.array(weights)
-            
-            # 计算组合方差
-            portfolio_variance = np.dot(weights, np.dot(correlation_matrix.values, weights))
+            weights = np.array([exposures[symbol] / total_value for symbol in cov.index])
+            marginal = cov.values @ weights
+            portfolio_variance = float(weights @ marginal)
             
             if portfolio_variance <= 0:
                 return {}
             
-            # 计算边际风险贡献
-            marginal_contributions = np.dot(correlation_matrix.values, weights) / np.sqrt(portfolio_variance)
-            
-            # 计算风险贡献度
-            risk_contributions = {}
-            for i, symbol in enumerate(symbols):
-                risk_contributions[symbol] = weights[i] * marginal_contributions[i]
-            
-            return risk_contributions
+            contributions = weights * marginal / np.sqrt(portfolio_variance)
+            return {symbol: float(value) for symbol, value in zip(cov.index, contributions)}
         except Exception as e:
             logger.error(f"Error calculating risk contribution: {e}")
             return {}
@@ -11,6 +11,8 @@ from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 import uuid
 
+from .fanout import FanoutHub
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +35,9 @@ class ConnectionManager:
         # 心跳管理
         self.heartbeat_interval = 30  # 30秒心跳间隔
         self.heartbeat_tasks: Dict[str, asyncio.Task] = {}
+        
+        # 发送队列：消息序列化一次后分发到各连接
+        self.fanout = FanoutHub()
     
     async def connect(self, websocket: WebSocket, user_id: Optional[int] = None) -> str:
         """建立WebSocket连接"""
@@ -43,6 +48,7 @@ class ConnectionManager:
         
         # 存储连接
         self.active_connections[connection_id] = websocket
+        self.fanout.register(connection_id, websocket, on_close=lambda: self.disconnect(connection_id))
         
         # 存储连接信息
         self.connection_info[connection_id] = {
@@ -102,6 +108,7 @@ class ConnectionManager:
         # 移除连接
         del self.active_connections[connection_id]
         del self.connection_info[connection_id]
+        await self.fanout.remove(connection_id)
         
         logger.info(f"WebSocket连接断开: {connection_id}, 用户: {user_id}")
     
@@ -110,56 +117,41 @@ class ConnectionManager:
         if connection_id not in self.active_connections:
             return False
         
-        try:
-            websocket = self.active_connections[connection_id]
-            await websocket.send_text(json.dumps(message, ensure_ascii=False))
-            return True
-        except Exception as e:
-            logger.error(f"发送个人消息失败: {connection_id}, 错误: {e}")
-            await self.disconnect(connection_id)
-            return False
+        # 发送失败时由写任务断开连接
+        return self.fanout.send(connection_id, message)
     
     async def send_user_message(self, user_id: int, message: Dict[str, Any]):
         """发送用户消息（所有连接）"""
         if user_id not in self.user_connections:
             return 0
         
-        sent_count = 0
-        connection_ids = list(self.user_connections[user_id])
-        
-        for connection_id in connection_ids:
-            if await self.send_personal_message(connection_id, message):
-                sent_count += 1
-        
-        return sent_count
+        return self.fanout.publish(list(self.user_connections[user_id]), message)
     
     async def broadcast_message(self, message: Dict[str, Any]):
         """广播消息给所有连接"""
-        sent_count = 0
-        connection_ids = list(self.active_connections.keys())
-        
-        for connection_id in connection_ids:
-            if await self.send_personal_message(connection_id, message):
-                sent_count += 1
-        
-        return sent_count
+        return self.fanout.publish(list(self.active_connections.keys()), message)
     
-    async def send_topic_message(self, topic: str, message: Dict[str, Any]):
-        """发送主题消息给订阅者"""
+    async def send_topic_message(
+        self,
+        topic: str,
+        message: Dict[str, Any],
+        conflate_key: Optional[str] = None
+    ):
+        """发送主题消息给订阅者
+        
+        conflate_key不为空时，慢连接队列中同一键的旧消息会被新消息替换
+        """
         if topic not in self.subscriptions:
             return 0
         
-        sent_count = 0
-        connection_ids = list(self.subscriptions[topic])
-        
         # 添加主题信息到消息
-        message['topic'] = topic
-        
-        for connection_id in connection_ids:
-            if await self.send_personal_message(connection_id, message):
-                sent_count += 1
+        message = {**message, 'topic': topic}
         
-        return sent_count
+        return self.fanout.publish(
+            list(self.subscriptions[topic]),
+            message,
+            conflate_key=f"{topic}:{conflate_key}" if conflate_key else None
+        )
     
     async def subscribe(self, connection_id: str, topic: str) -> bool:
         """订阅主题"""
@@ -295,7 +287,8 @@ class ConnectionManager:
             'connections_per_user': {
                 user_id: len(connections) 
                 for user_id, connections in self.user_connections.items()
-            }
+            },
+            'fanout': self.fanout.get_stats()
         }
     
     def get_topic_stats(self) -> Dict[str, int]:
@@ -0,0 +1,278 @@
+"""
+WebSocket消息扇出
+每条消息只序列化一次，放入各连接的有界发送队列，由连接自己的写任务发送。
+慢连接的行情按合约合并为最新一条，队列满时丢弃，不阻塞发布方。
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Union
+
+from ..core.codecs import json_codec
+from ..core.metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedMessage:
+    """序列化后的消息，所有连接共享同一份数据
+
+    binary为True时以二进制帧发送（如MessagePack），否则以文本帧发送；
+    origin为行情到达适配器的时间（time.perf_counter），用于统计行情到发送的延迟
+    """
+
+    __slots__ = ("_data", "_text", "binary", "origin")
+
+    def __init__(self, data: Optional[bytes] = None, text: Optional[str] = None, binary: bool = False):
+        self._data = data
+        self._text = text
+        self.binary = binary
+        self.origin: Optional[float] = None
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self._text.encode("utf-8")
+        return self._data
+
+    @property
+    def text(self) -> str:
+        # 文本帧只解码一次
+        if self._text is None:
+            self._text = self._data.decode("utf-8")
+        return self._text
+
+
+def encode_message(message: Union[Dict[str, Any], str, EncodedMessage]) -> EncodedMessage:
+    """序列化消息"""
+    if isinstance(message, EncodedMessage):
+        return message
+    if isinstance(message, str):
+        return EncodedMessage(text=message)
+    return EncodedMessage(data=json_codec.dumps(message))
+
+
+class ConnectionSender:
+    """单个连接的发送队列和写任务"""
+
+    def __init__(
+        self,
+        websocket: Any,
+        max_pending: int = 256,
+        on_close: Optional[Callable[[], Optional[Awaitable]]] = None,
+        latency: Optional[LatencyRecorder] = None
+    ):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.on_close = on_close
+        self.latency = latency
+        self.closed = False
+
+        # 可合并消息以合并键为键，其他消息以递增序号为键
+        self._pending: "OrderedDict[Hashable, EncodedMessage]" = OrderedDict()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def offer(self, message: EncodedMessage, conflate_key: Optional[str] = None, wake: bool = True) -> bool:
+        """放入发送队列，不等待发送
+
+        wake为False时由调用方稍后调用wake唤醒写任务
+        """
+        if self.closed:
+            return False
+
+        pending = self._pending
+        if conflate_key is not None and conflate_key in pending:
+            # 尚未发出的旧行情直接替换为最新的
+            pending[conflate_key] = message
+            self.coalesced += 1
+            return True
+
+        if len(pending) >= self.max_pending and not self._evict_conflatable():
+            self.dropped += 1
+            return False
+
+        pending[conflate_key if conflate_key is not None else next(self._seq)] = message
+        if wake:
+            self._wakeup.set()
+        return True
+
+    def wake(self):
+        self._wakeup.set()
+
+    def close(self):
+        """停止写任务，未发送的消息丢弃"""
+        self.closed = True
+        self._pending.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def wait_closed(self):
+        """等待写任务结束，在写任务自身中调用时直接返回"""
+        task = self._task
+        if task is not None and task is not asyncio.current_task():
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _evict_conflatable(self) -> bool:
+        """队列满时丢弃最早的一条可合并消息"""
+        for key in self._pending:
+            if isinstance(key, str):
+                del self._pending[key]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    _, message = self._pending.popitem(last=False)
+                    if message.binary:
+                        await self.websocket.send_bytes(message.data)
+                    else:
+                        await self.websocket.send_text(message.text)
+                    self.sent += 1
+                    if message.origin is not None and self.latency is not None:
+                        self.latency.record(time.perf_counter() - message.origin)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"WebSocket发送失败，关闭连接: {e}")
+            self.closed = True
+            self._pending.clear()
+            if self.on_close is not None:
+                try:
+                    result = self.on_close()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as close_error:
+                    logger.error(f"关闭WebSocket连接失败: {close_error}")
+
+
+def _wake_all(senders):
+    for sender in senders:
+        sender.wake()
+
+
+class FanoutHub:
+    """按连接管理发送队列，负责一次序列化、多路分发"""
+
+    def __init__(self, max_pending: int = 256):
+        self.max_pending = max_pending
+        self.senders: Dict[Hashable, ConnectionSender] = {}
+
+        self.messages_published = 0
+        self.deliveries = 0
+        self.last_publish_ms = 0.0
+        self.max_publish_ms = 0.0
+        self._total_publish_ms = 0.0
+        # 行情从适配器收到到写入连接的延迟
+        self.tick_latency = LatencyRecorder()
+        # 已关闭连接的计数
+        self._retired = {"sent": 0, "coalesced": 0, "dropped": 0}
+
+    def register(
+        self,
+        key: Hashable,
+        websocket: Any,
+        on_close: Optional[Callable[[], Optional[Awaitable]]] = None
+    ) -> ConnectionSender:
+        """为连接创建发送队列并启动写任务"""
+        self.unregister(key)
+        sender = ConnectionSender(websocket, self.max_pending, on_close, self.tick_latency)
+        sender.start()
+        self.senders[key] = sender
+        return sender
+
+    def unregister(self, key: Hashable):
+        sender = self.senders.pop(key, None)
+        if sender is None:
+            return
+        sender.close()
+        self._retired["sent"] += sender.sent
+        self._retired["coalesced"] += sender.coalesced
+        self._retired["dropped"] += sender.dropped
+
+    async def remove(self, key: Hashable):
+        """移除连接的发送队列并等待写任务结束"""
+        sender = self.senders.get(key)
+        self.unregister(key)
+        if sender is not None:
+            await sender.wait_closed()
+
+    async def close(self):
+        """移除所有连接的发送队列，服务停止时调用"""
+        for key in list(self.senders):
+            await self.remove(key)
+
+    def send(self, key: Hashable, message: Any, conflate_key: Optional[str] = None) -> bool:
+        """发送给单个连接"""
+        sender = self.senders.get(key)
+        if sender is None:
+            return False
+        return sender.offer(encode_message(message), conflate_key)
+
+    def publish(
+        self,
+        keys: Iterable[Hashable],
+        message: Any,
+        conflate_key: Optional[str] = None,
+        origin: Optional[float] = None
+    ) -> int:
+        """发送给多个连接，返回进入队列的连接数"""
+        started = time.perf_counter()
+        encoded = encode_message(message)
+        if origin is not None:
+            encoded.origin = origin
+        senders = self.senders
+        delivered = []
+        for key in keys:
+            sender = senders.get(key)
+            if sender is not None and sender.offer(encoded, conflate_key, wake=False):
+                delivered.append(sender)
+
+        # 写任务在发布返回后统一唤醒，发布方不承担调度开销
+        if delivered:
+            asyncio.get_running_loop().call_soon(_wake_all, delivered)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.messages_published += 1
+        self.deliveries += len(delivered)
+        self.last_publish_ms = elapsed
+        self.max_publish_ms = max(self.max_publish_ms, elapsed)
+        self._total_publish_ms += elapsed
+        return len(delivered)
+
+    def get_stats(self) -> Dict[str, Any]:
+        senders = list(self.senders.values())
+        return {
+            "connections": len(senders),
+            "messages_published": self.messages_published,
+            "deliveries": self.deliveries,
+            "sent": self._retired["sent"] + sum(s.sent for s in senders),
+            "coalesced": self._retired["coalesced"] + sum(s.coalesced for s in senders),
+            "dropped": self._retired["dropped"] + sum(s.dropped for s in senders),
+            "pending": sum(s.pending for s in senders),
+            "last_publish_ms": self.last_publish_ms,
+            "max_publish_ms": self.max_publish_ms,
+            "avg_publish_ms": self._total_publish_ms / self.messages_published if self.messages_published else 0.0,
+            "tick_to_send": self.tick_latency.snapshot(),
+        }
@@ -68,10 +68,10 @@ class WebSocketPublisher:
         
         # 发送到市场数据主题
         topic = f"market_data.{symbol}"
-        await self.manager.send_topic_message(topic, message)
+        await self.manager.send_topic_message(topic, message, conflate_key=symbol)
         
         # 发送到通用市场数据主题
-        await self.manager.send_topic_message("market_data", message)
+        await self.manager.send_topic_message("market_data", message, conflate_key=symbol)
     
     async def publish_price_update(self, symbol: str, price: float, change: float = None):
         """发布价格更新"""
@@ -84,7 +84,7 @@ class WebSocketPublisher:
         }
         
         topic = f"price.{symbol}"
-        await self.manager.send_topic_message(topic, message)
+        await self.manager.send_topic_message(topic, message, conflate_key=symbol)
     
     async def publish_depth_update(self, symbol: str, bids: List[List[float]], asks: List[List[float]]):
         """发布深度数据更新"""
@@ -97,7 +97,7 @@ class WebSocketPublisher:
         }
         
         topic = f"depth.{symbol}"
-        await self.manager.send_topic_message(topic, message)
+        await self.manager.send_topic_message(topic, message, conflate_key=symbol)
     
     async def publish_order_update(self, user_id: int, order_data: Dict[str, Any]):
         """发布订单更新"""
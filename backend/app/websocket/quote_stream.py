@@ -0,0 +1,195 @@
+"""
+增量行情流
+每个合约维护最新行情和递增序号，客户端先收快照，之后只收相对于其已确认版本变化的字段。
+增量条目按 (合约, 基准版本, 编码) 编码一次，由同一基准的客户端共享，再拼接成帧。
+
+帧格式（JSON或MessagePack）:
+    {"type": "quote_delta", "updates": [[symbol, base, seq, {field: value}], ...]}
+base为0表示完整行情；客户端本地版本不等于base时应发送resync重新获取快照。
+"""
+
+import logging
+import struct
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..core.codecs import MSGPACK_AVAILABLE, Codec, MsgpackCodec, json_codec
+from .fanout import EncodedMessage
+
+logger = logging.getLogger(__name__)
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+_MISSING = object()
+
+
+# 对外消息的编解码器，MessagePack不使用NumPy扩展类型，客户端按标准格式解析
+_WIRE_CODECS: Dict[str, Codec] = {ENCODING_JSON: json_codec}
+if MSGPACK_AVAILABLE:
+    _WIRE_CODECS[ENCODING_MSGPACK] = MsgpackCodec(wire=True)
+
+
+def _dumps(obj: Any, encoding: str) -> bytes:
+    return _WIRE_CODECS[encoding].dumps(obj)
+
+
+def _msgpack_array_header(length: int) -> bytes:
+    if length < 16:
+        return bytes([0x90 | length])
+    if length < 1 << 16:
+        return b"\xdc" + struct.pack(">H", length)
+    return b"\xdd" + struct.pack(">I", length)
+
+
+def encode_frame(obj: Dict[str, Any], encoding: str = ENCODING_JSON) -> EncodedMessage:
+    """编码一条完整消息"""
+    return EncodedMessage(data=_dumps(obj, encoding), binary=encoding == ENCODING_MSGPACK)
+
+
+class _SymbolState:
+    __slots__ = ("seq", "fields", "history", "entries")
+
+    def __init__(self, history_size: int):
+        self.seq = 0
+        self.fields: Dict[str, Any] = {}
+        # (seq, 本次变化的字段)
+        self.history: Deque[Tuple[int, Tuple[str, ...]]] = deque(maxlen=history_size)
+        # (base, encoding) -> 已编码条目，版本更新时清空
+        self.entries: Dict[Tuple[int, str], bytes] = {}
+
+
+class QuoteDeltaStream:
+    """按合约维护行情版本和增量"""
+
+    def __init__(self, history_size: int = 64, log_size: int = 65536):
+        self.history_size = history_size
+        self._states: Dict[str, _SymbolState] = {}
+        # 全局更新序号和更新日志，用于找出某一时刻之后变化的合约
+        self.version = 0
+        self._log: Deque[Tuple[int, str]] = deque(maxlen=log_size)
+        self._changed_cache: Dict[int, Set[str]] = {}
+        self._frame_prefix = {
+            ENCODING_JSON: b'{"type":"quote_delta","updates":[',
+        }
+        if MSGPACK_AVAILABLE:
+            self._frame_prefix[ENCODING_MSGPACK] = (
+                b"\x82" + _dumps("type", ENCODING_MSGPACK) + _dumps("quote_delta", ENCODING_MSGPACK)
+                + _dumps("updates", ENCODING_MSGPACK)
+            )
+
+    @property
+    def encodings(self) -> List[str]:
+        return list(self._frame_prefix)
+
+    def update(self, symbol: str, data: Dict[str, Any]) -> bool:
+        """合入最新行情，有字段变化时序号加一"""
+        state = self._states.get(symbol)
+        if state is None:
+            state = self._states[symbol] = _SymbolState(self.history_size)
+
+        fields = state.fields
+        changed = {key: value for key, value in data.items() if fields.get(key, _MISSING) != value}
+        if not changed:
+            return False
+
+        fields.update(changed)
+        state.seq += 1
+        state.history.append((state.seq, tuple(changed)))
+        state.entries.clear()
+
+        self.version += 1
+        self._log.append((self.version, symbol))
+        if self._changed_cache:
+            self._changed_cache.clear()
+        return True
+
+    def changed_symbols(self, since: int) -> Optional[Set[str]]:
+        """全局序号since之后有变化的合约，超出日志窗口时返回None（调用方需全量检查）"""
+        if since >= self.version:
+            return set()
+        if not self._log or since < self._log[0][0] - 1:
+            return None
+
+        changed = self._changed_cache.get(since)
+        if changed is None:
+            changed = set()
+            for version, symbol in reversed(self._log):
+                if version <= since:
+                    break
+                changed.add(symbol)
+            self._changed_cache[since] = changed
+        return changed
+
+    def seq(self, symbol: str) -> int:
+        state = self._states.get(symbol)
+        return state.seq if state else 0
+
+    def snapshot(self, symbol: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """合约当前版本和完整行情"""
+        state = self._states.get(symbol)
+        if state is None or state.seq == 0:
+            return None
+        return state.seq, dict(state.fields)
+
+    def delta(self, symbol: str, base: int) -> Optional[Tuple[int, int, Dict[str, Any]]]:
+        """从base版本到最新版本的增量，返回 (base, seq, fields)
+
+        base过旧（超出历史窗口）或为0时返回完整行情，此时返回的base为0
+        """
+        state = self._states.get(symbol)
+        if state is None or base >= state.seq:
+            return None
+
+        history = state.history
+        if base <= 0 or base < history[0][0] - 1:
+            return 0, state.seq, dict(state.fields)
+
+        keys = set()
+        for seq, changed in reversed(history):
+            if seq <= base:
+                break
+            keys.update(changed)
+        return base, state.seq, {key: state.fields[key] for key in keys}
+
+    def encode_entry(self, symbol: str, base: int, encoding: str = ENCODING_JSON) -> Optional[bytes]:
+        """编码单个合约的增量条目，同一基准版本只编码一次"""
+        state = self._states.get(symbol)
+        if state is None:
+            return None
+        entry = state.entries.get((base, encoding))
+        if entry is not None:
+            return entry
+
+        delta = self.delta(symbol, base)
+        if delta is None:
+            return None
+        entry_base, seq, fields = delta
+        entry = _dumps([symbol, entry_base, seq, fields], encoding)
+        state.entries[(base, encoding)] = entry
+        return entry
+
+    def frame(self, entries: List[bytes], encoding: str = ENCODING_JSON) -> EncodedMessage:
+        """把已编码条目拼成一帧"""
+        prefix = self._frame_prefix[encoding]
+        if encoding == ENCODING_MSGPACK:
+            data = prefix + _msgpack_array_header(len(entries)) + b"".join(entries)
+            return EncodedMessage(data=data, binary=True)
+        return EncodedMessage(data=prefix + b",".join(entries) + b"]}")
+
+    def snapshot_frame(self, symbols: Iterable[str], encoding: str = ENCODING_JSON) -> Tuple[EncodedMessage, Dict[str, int]]:
+        """生成快照消息，返回消息和各合约版本"""
+        quotes = {}
+        versions = {}
+        for symbol in symbols:
+            snapshot = self.snapshot(symbol)
+            if snapshot is None:
+                continue
+            seq, fields = snapshot
+            quotes[symbol] = {"seq": seq, "data": fields}
+            versions[symbol] = seq
+        return encode_frame({"type": "quote_snapshot", "quotes": quotes}, encoding), versions
+
+    def discard(self, symbol: str):
+        """合约无人订阅时释放状态"""
+        self._states.pop(symbol, None)
@@ -0,0 +1,79 @@
+"""
+事件循环延迟基准：async 处理函数中直接使用同步会话 vs 异步会话层
+慢查询期间用每毫秒唤醒一次的探针协程测量事件循环的最大调度延迟。
+未安装 asyncpg 时异步会话层为线程执行的 ThreadedAsyncSession，本基准测的即是该实现。
+
+运行: pytest tests/performance/test_async_db_loop_lag_benchmark.py -m performance -s
+"""
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import ThreadedAsyncSession
+
+
+QUERY_SECONDS = 0.02
+REQUESTS = 20
+SLOW_QUERY = text("SELECT pg_sleep(:seconds)")
+
+
+def make_factory(path):
+    """SQLite 上注册 pg_sleep 模拟慢查询"""
+    engine = create_engine(f"sqlite:///{path}", pool_size=REQUESTS)
+    event.listen(engine, "connect", lambda conn, _: conn.create_function("pg_sleep", 1, time.sleep))
+    return sessionmaker(bind=engine, expire_on_commit=False)
+
+
+async def measure(workload):
+    """返回负载运行期间的最大事件循环延迟和负载耗时"""
+    lags = []
+    running = True
+
+    async def probe():
+        while running:
+            begin = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - begin - 0.001)
+
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(0.01)
+    begin = time.perf_counter()
+    await workload()
+    elapsed = time.perf_counter() - begin
+    running = False
+    await task
+    return max(lags), elapsed
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_slow_queries_do_not_stall_event_loop(tmp_path):
+    """20个并发请求各执行一次20ms慢查询：异步会话层下事件循环延迟保持在毫秒级"""
+    factory = make_factory(tmp_path / "lag.db")
+
+    async def sync_request():
+        db = factory()
+        try:
+            db.execute(SLOW_QUERY, {"seconds": QUERY_SECONDS})
+        finally:
+            db.close()
+
+    async def async_request():
+        async with ThreadedAsyncSession(factory()) as session:
+            await session.execute(SLOW_QUERY, {"seconds": QUERY_SECONDS})
+
+    sync_lag, sync_elapsed = await measure(lambda: asyncio.gather(*(sync_request() for _ in range(REQUESTS))))
+    async_lag, async_elapsed = await measure(lambda: asyncio.gather(*(async_request() for _ in range(REQUESTS))))
+
+    print(
+        f"\n{REQUESTS} concurrent {QUERY_SECONDS * 1000:.0f}ms queries: "
+        f"sync session max loop lag {sync_lag * 1000:.1f}ms ({sync_elapsed * 1000:.0f}ms total), "
+        f"async session max loop lag {async_lag * 1000:.1f}ms ({async_elapsed * 1000:.0f}ms total)"
+    )
+
+    assert sync_lag >= QUERY_SECONDS
+    assert async_lag < QUERY_SECONDS / 2
+    assert async_elapsed < sync_elapsed
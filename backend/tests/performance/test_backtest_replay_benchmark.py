@@ -0,0 +1,76 @@
+"""
+回测数据回放性能基准
+
+运行: pytest tests/performance/test_backtest_replay_benchmark.py -m performance -s
+"""
+import time
+from unittest.mock import Mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.backtest_engine import BacktestDataReplay
+from app.services.history_service import HistoryService
+
+
+BARS_PER_SYMBOL = 20000
+WINDOW = 60
+
+
+def _make_data(symbol_count: int, bars: int) -> dict:
+    """生成多品种1分钟K线数据"""
+    rng = np.random.default_rng(42)
+    index = pd.date_range("2024-01-02 09:00", periods=bars, freq="1min")
+    data = {}
+    for i in range(symbol_count):
+        close = 1000 + np.cumsum(rng.normal(0, 1, bars))
+        data[f"SHFE.sym{i:03d}"] = pd.DataFrame({
+            'open': close,
+            'high': close + 1,
+            'low': close - 1,
+            'close': close,
+            'volume': rng.integers(1, 1000, bars).astype(float),
+        }, index=index)
+    return data
+
+
+def _replay(data_replay: BacktestDataReplay, symbols: list, start: int, stop: int) -> float:
+    """回放[start, stop)区间，返回耗时"""
+    begin = time.perf_counter()
+    for i in range(start, stop):
+        data_replay.advance(i)
+        data_replay.get_market_data(symbols)
+        data_replay.get_historical_arrays(symbols[0], data_replay.current_time, WINDOW)
+    return time.perf_counter() - begin
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize("symbol_count", [1, 10, 100])
+def test_replay_throughput(symbol_count):
+    """统计1/10/100个品种的回放吞吐量（bars/second）"""
+    bars = BARS_PER_SYMBOL if symbol_count < 100 else BARS_PER_SYMBOL // 4
+    data = _make_data(symbol_count, bars)
+    symbols = list(data.keys())
+
+    data_replay = BacktestDataReplay(Mock(spec=HistoryService))
+    data_replay.data_cache = data
+
+    begin = time.perf_counter()
+    data_replay.prepare()
+    prepare_time = time.perf_counter() - begin
+
+    segment = bars // 10
+    head_time = _replay(data_replay, symbols, 0, segment)
+    _replay(data_replay, symbols, segment, bars - segment)
+    tail_time = _replay(data_replay, symbols, bars - segment, bars)
+
+    total_time = head_time + tail_time
+    bars_per_second = 2 * segment * symbol_count / total_time
+    print(
+        f"\n{symbol_count:>3} symbols: {bars_per_second:,.0f} bars/s "
+        f"(prepare {prepare_time * 1000:.1f} ms, head {head_time:.3f}s, tail {tail_time:.3f}s)"
+    )
+
+    # 单根K线成本不应随历史长度增长
+    assert tail_time < head_time * 3
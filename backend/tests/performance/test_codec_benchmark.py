@@ -0,0 +1,86 @@
+"""
+编解码器吞吐基准：结构化行情消息和K线数值序列在各编解码器下的编码/解码吞吐
+
+运行: pytest tests/performance/test_codec_benchmark.py -m performance -s
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.codecs import available_codecs, get_codec
+
+
+BARS = 100_000
+MESSAGES = 2_000
+ROUNDS = 5
+
+
+def kline_frame():
+    rng = np.random.default_rng(0)
+    close = 70000 + rng.standard_normal(BARS).cumsum()
+    return pd.DataFrame(
+        {
+            "open": close, "high": close + 5, "low": close - 5, "close": close,
+            "volume": rng.integers(1, 500, BARS).astype(np.float64),
+            "open_interest": np.full(BARS, 120000.0),
+        },
+        index=pd.date_range("2024-01-02 09:00", periods=BARS, freq="min", name="datetime"),
+    )
+
+
+def quote_messages():
+    return [
+        {
+            "type": "quote_update", "symbol": f"SHFE.cu{2401 + i % 12}", "last_price": 70000.0 + i,
+            "bid_price1": 69990.0 + i, "ask_price1": 70010.0 + i, "volume": 1000 + i,
+            "datetime": "2024-01-02T09:30:00.500000",
+        }
+        for i in range(MESSAGES)
+    ]
+
+
+def throughput(codec, value):
+    """返回 (编码后字节数, 编码MB/s, 解码MB/s)，取多轮最快"""
+    data = codec.encode(value)
+    encode_s = min(timed(codec.encode, value) for _ in range(ROUNDS))
+    decode_s = min(timed(codec.decode, data) for _ in range(ROUNDS))
+    mb = len(data) / 1e6
+    return len(data), mb / encode_s, mb / decode_s
+
+
+def timed(func, value):
+    begin = time.perf_counter()
+    func(value)
+    return time.perf_counter() - begin
+
+
+@pytest.mark.performance
+def test_codec_throughput():
+    """各编解码器的吞吐；10万根K线用numpy列式编码解码比逐根记录的编码至少快10倍"""
+    frame = kline_frame()
+    records = frame.reset_index().assign(datetime=lambda df: df["datetime"].astype(str)).to_dict("records")
+    messages = quote_messages()
+
+    print()
+    decode_seconds = {}
+    for name in available_codecs():
+        codec = get_codec(name)
+        if name == "numpy":
+            payloads = {"kline frame": frame}
+        else:
+            payloads = {"quote messages": messages, "kline records": records}
+        for label, value in payloads.items():
+            size, encode_mbps, decode_mbps = throughput(codec, value)
+            if label != "quote messages":
+                decode_seconds[name] = size / 1e6 / decode_mbps
+            print(f"[{name:>7}] {label:<14} {size / 1e6:7.2f}MB  encode {encode_mbps:8.1f}MB/s  "
+                  f"decode {decode_mbps:8.1f}MB/s")
+
+    fastest_record_decode = min(seconds for name, seconds in decode_seconds.items() if name != "numpy")
+    speedup = fastest_record_decode / decode_seconds["numpy"]
+    print(f"numpy frame decode {decode_seconds['numpy'] * 1000:.2f}ms vs best record codec "
+          f"{fastest_record_decode * 1000:.1f}ms ({speedup:.0f}x)")
+
+    assert speedup > 10
@@ -0,0 +1,62 @@
+"""
+本地K线存储读取性能基准
+
+运行: pytest tests/performance/test_kline_store_benchmark.py -m performance -s
+"""
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.services.kline_store import KlineStore
+
+
+SYMBOLS = 50
+# 日盘加夜盘约555根1分钟K线，一年约365个自然日
+BARS_PER_DAY = 555
+
+
+def _year_of_bars(rng) -> pd.DataFrame:
+    days = pd.date_range("2023-01-01", periods=365, freq="D")
+    offsets = pd.to_timedelta(np.arange(BARS_PER_DAY), unit="min") + pd.Timedelta(hours=9)
+    index = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel())
+    close = 5000 + np.cumsum(rng.normal(0, 2, len(index)))
+    return pd.DataFrame({
+        'open': close,
+        'high': close + 3,
+        'low': close - 3,
+        'close': close,
+        'volume': np.full(len(index), 100.0),
+    }, index=index)
+
+
+@pytest.mark.performance
+def test_load_one_year_for_fifty_contracts():
+    """50个合约一年的1分钟K线在一秒内读入"""
+    root = tempfile.mkdtemp(prefix="kline_store_bench_")
+    store = KlineStore(root)
+    rng = np.random.default_rng(42)
+    symbols = [f"SHFE.sym{i:03d}" for i in range(SYMBOLS)]
+
+    try:
+        for symbol in symbols:
+            store.write(symbol, 60, _year_of_bars(rng))
+
+        begin = time.perf_counter()
+        data = store.read_many(symbols, 60, datetime(2023, 1, 1), datetime(2023, 12, 31, 23, 59))
+        elapsed = time.perf_counter() - begin
+
+        total = sum(len(df) for df in data.values())
+        print(f"\n{SYMBOLS} symbols, {total:,} bars: {elapsed:.3f}s ({total / elapsed:,.0f} bars/s)")
+
+        assert len(data) == SYMBOLS
+        assert total == SYMBOLS * 365 * BARS_PER_DAY
+        assert elapsed < 1.0
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
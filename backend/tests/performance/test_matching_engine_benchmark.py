@@ -0,0 +1,90 @@
+"""
+模拟撮合基准：原逐K线扫描全部待成交订单 vs 按价格队列只弹出被穿越的挂单
+
+运行: pytest tests/performance/test_matching_engine_benchmark.py -m performance -s
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.services.backtest_engine import BacktestTradeExecutor, OrderSide, OrderType
+
+
+RESTING_ORDERS = 100_000
+SYMBOLS = 10
+BARS = 500
+LEGACY_BARS = 20
+
+
+def legacy_process_orders(executor, pending, current_time, market_data):
+    """原 process_orders：每根K线遍历全部待成交订单，成交后 list.remove"""
+    orders_to_remove = []
+    for order in pending:
+        if order.symbol not in market_data:
+            continue
+        if _can_fill(order, market_data[order.symbol]):
+            executor._fill_order(order, executor._calculate_fill_price(order, market_data[order.symbol]), current_time)
+            orders_to_remove.append(order)
+    for order in orders_to_remove:
+        pending.remove(order)
+
+
+def _can_fill(order, bar_data):
+    """原 _can_fill_order 的限价单分支"""
+    if order.side == OrderSide.BUY:
+        return bar_data['low'] <= order.price
+    return bar_data['high'] >= order.price
+
+
+def make_orders(executor, rng):
+    """挂单价格分布在 ±20% 区间内，绝大多数不会在基准的K线内成交"""
+    sides = rng.random(RESTING_ORDERS) < 0.5
+    offsets = rng.uniform(0.002, 0.2, RESTING_ORDERS)
+    orders = []
+    for i in range(RESTING_ORDERS):
+        buy = bool(sides[i])
+        price = 1000 * (1 - offsets[i]) if buy else 1000 * (1 + offsets[i])
+        orders.append(executor.create_order(
+            f"SYM{i % SYMBOLS}", OrderSide.BUY if buy else OrderSide.SELL, OrderType.LIMIT, 1.0, price=round(price, 2)
+        ))
+    return orders
+
+
+def make_bars(rng, count):
+    closes = 1000 * np.cumprod(1 + rng.normal(0, 0.0005, (count, SYMBOLS)), axis=0)
+    return [
+        {f"SYM{j}": {'open': c, 'high': c * 1.0005, 'low': c * 0.9995, 'close': c, 'volume': 1e6}
+         for j, c in enumerate(row)}
+        for row in closes
+    ]
+
+
+@pytest.mark.performance
+def test_match_100k_resting_orders():
+    """10万笔挂单：每根K线的撮合耗时与挂单总数无关，比逐单扫描快100倍以上"""
+    rng = np.random.default_rng(5)
+    bars = make_bars(rng, BARS)
+    now = datetime(2024, 1, 2)
+
+    executor = BacktestTradeExecutor()
+    make_orders(executor, np.random.default_rng(9))
+    begin = time.perf_counter()
+    fills = sum(len(executor.process_orders(now, market_data)) for market_data in bars)
+    book_per_bar = (time.perf_counter() - begin) / BARS
+
+    legacy = BacktestTradeExecutor()
+    pending = make_orders(legacy, np.random.default_rng(9))
+    begin = time.perf_counter()
+    for market_data in bars[:LEGACY_BARS]:
+        legacy_process_orders(legacy, pending, now, market_data)
+    legacy_per_bar = (time.perf_counter() - begin) / LEGACY_BARS
+
+    print(
+        f"\n{RESTING_ORDERS} resting orders x {SYMBOLS} symbols: legacy scan {legacy_per_bar * 1000:.1f}ms/bar, "
+        f"price queues {book_per_bar * 1000:.3f}ms/bar ({legacy_per_bar / book_per_bar:.0f}x), {fills} fills"
+    )
+
+    assert len(executor.pending_orders) == RESTING_ORDERS - fills
+    assert legacy_per_bar / book_per_bar > 100
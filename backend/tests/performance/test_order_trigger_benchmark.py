@@ -0,0 +1,101 @@
+"""
+挂单触发基准：原每个挂单一个等待协程（行情总线 wait_for）vs 价格触发索引
+
+运行: pytest tests/performance/test_order_trigger_benchmark.py -m performance -s
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app.services.quote_bus import QuoteBus
+from tests.test_order_execution_engine import make_engine, make_order
+
+
+RESTING_ORDERS = 10_000
+TICKS = 50
+
+
+def prices():
+    """挂单价格在 69000~70000，行情从 70000 逐笔下跌穿越"""
+    rng = np.random.default_rng(1)
+    return [round(float(p), 1) for p in rng.uniform(69000, 70000, RESTING_ORDERS)]
+
+
+async def run_ticks(bus, done):
+    begin = time.perf_counter()
+    for i in range(TICKS):
+        price = 70000.0 - (i + 1) * 1000.0 / TICKS
+        bus.publish("SHFE.cu2401", {"last_price": price, "ask_price1": price})
+        await asyncio.sleep(0)
+        while not done():
+            await asyncio.sleep(0)
+    return time.perf_counter() - begin
+
+
+async def legacy(limit_prices):
+    """每个挂单一个协程，行情到达时所有协程各自检查条件"""
+    bus = QuoteBus()
+    bus.publish("SHFE.cu2401", {"last_price": 70100.0})
+    fills = []
+
+    async def wait(order_id, limit):
+        await bus.wait_for("SHFE.cu2401", lambda tick: tick.last_price <= limit)
+        fills.append(order_id)
+
+    tasks = [asyncio.create_task(wait(i, p)) for i, p in enumerate(limit_prices)]
+    await asyncio.sleep(0.05)
+    expected = iter([sum(p >= 70000.0 - (i + 1) * 1000.0 / TICKS for p in limit_prices) for i in range(TICKS)])
+    target = [next(expected)]
+
+    def done():
+        if len(fills) >= target[0]:
+            target[0] = next(expected, RESTING_ORDERS)
+            return True
+        return False
+
+    seconds = await run_ticks(bus, done)
+    await asyncio.gather(*tasks)
+    return seconds
+
+
+async def indexed(limit_prices):
+    engine, fills = make_engine(workers=8)
+    engine.quote_bus.publish("SHFE.cu2401", {"last_price": 70100.0, "ask_price1": 70100.0})
+    for i, price in enumerate(limit_prices):
+        await engine.submit_order(make_order(i, price=price))
+    await engine.execution_queue.join()
+    assert len(engine.trigger_index) == RESTING_ORDERS
+
+    expected = iter([sum(p >= 70000.0 - (i + 1) * 1000.0 / TICKS for p in limit_prices) for i in range(TICKS)])
+    target = [next(expected)]
+
+    def done():
+        if len(fills) >= target[0] and engine.execution_queue.empty():
+            target[0] = next(expected, RESTING_ORDERS)
+            return True
+        return False
+
+    seconds = await run_ticks(engine.quote_bus, done)
+    stats = engine.get_execution_stats()
+    await engine.stop_execution_workers()
+    assert len(fills) == RESTING_ORDERS
+    return seconds, stats
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_trigger_10k_resting_orders():
+    """1万笔挂单、50笔行情逐步穿越全部挂单：触发索引至少快10倍"""
+    limit_prices = prices()
+    legacy_seconds = await legacy(limit_prices)
+    indexed_seconds, stats = await indexed(limit_prices)
+
+    print(
+        f"\n{RESTING_ORDERS} resting orders, {TICKS} ticks: wait_for coroutines {legacy_seconds * 1000:.0f}ms, "
+        f"trigger index {indexed_seconds * 1000:.0f}ms ({legacy_seconds / indexed_seconds:.0f}x), "
+        f"queue depth max {stats['queue_depth']['max']}"
+    )
+
+    assert legacy_seconds / indexed_seconds > 10
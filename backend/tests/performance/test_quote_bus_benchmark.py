@@ -0,0 +1,77 @@
+"""
+行情总线端到端延迟基准
+从适配器收到行情到写入WebSocket连接的延迟
+
+运行: pytest tests/performance/test_quote_bus_benchmark.py -m performance -s
+"""
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.services.quote_bus import QuoteBus
+from app.services.realtime_service import RealtimeDataService
+
+
+SYMBOLS = 50
+CONNECTIONS = 1000
+SYMBOLS_PER_CONNECTION = 5
+TICKS = 2000
+
+
+class NullWebSocket:
+    def __init__(self):
+        self.count = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.count += 1
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_tick_to_send_latency():
+    """1000个连接订阅50个合约，行情逐笔推送，端到端p99低于50ms"""
+    bus = QuoteBus()
+    service = RealtimeDataService()
+    service.quote_bus = bus
+    symbols = [f"SHFE.sym{i:02d}" for i in range(SYMBOLS)]
+
+    market = Mock()
+    market.get_instrument_by_symbol = AsyncMock(return_value=object())
+    market.get_quotes = AsyncMock(return_value={})
+    with patch("app.services.realtime_service.market_service", market):
+        for c in range(CONNECTIONS):
+            await service.add_connection(NullWebSocket(), c, f"c{c}")
+            subscribed = [symbols[(c + k) % SYMBOLS] for k in range(SYMBOLS_PER_CONNECTION)]
+            await service.subscribe_quotes(f"c{c}", subscribed)
+
+    try:
+        begin = time.perf_counter()
+        for tick in range(TICKS):
+            symbol = symbols[tick % SYMBOLS]
+            bus.publish(symbol, {"symbol": symbol, "last_price": 5000.0 + tick, "volume": tick})
+            # 每轮所有合约各一笔行情后让出事件循环
+            if tick % SYMBOLS == SYMBOLS - 1:
+                await asyncio.sleep(0.001)
+        await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - begin
+
+        stats = service.get_connection_stats()
+    finally:
+        await service.stop()
+
+    dispatch = stats["quote_bus"]["dispatch_latency"]
+    send = stats["fanout"]["tick_to_send"]
+    print(
+        f"\n{TICKS} ticks over {SYMBOLS} symbols to {CONNECTIONS} connections in {elapsed:.2f}s: "
+        f"bus dispatch p50 {dispatch['p50_ms']:.2f}ms p99 {dispatch['p99_ms']:.2f}ms; "
+        f"tick->send p50 {send['p50_ms']:.2f}ms p99 {send['p99_ms']:.2f}ms max {send['max_ms']:.2f}ms; "
+        f"sent {stats['fanout']['sent']:,}, coalesced {stats['fanout']['coalesced']:,}"
+    )
+
+    assert send["count"] > 0
+    assert send["p99_ms"] < 50
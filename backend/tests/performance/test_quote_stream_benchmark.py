@@ -0,0 +1,108 @@
+"""
+增量行情流带宽基准
+
+运行: pytest tests/performance/test_quote_stream_benchmark.py -m performance -s
+"""
+import time
+from unittest.mock import Mock
+
+import numpy as np
+import pytest
+
+from app.services.realtime_service import RealtimeDataService, WebSocketConnection
+from app.websocket.fanout import encode_message
+from app.websocket.quote_stream import ENCODING_JSON, ENCODING_MSGPACK, MSGPACK_AVAILABLE
+
+
+SYMBOLS = 300
+CLIENTS = 200
+TICKS = 50
+# 每个推送周期约20%的合约有变化，通常只变动价格和成交量
+CHANGED_RATIO = 0.2
+
+
+class ByteCounter:
+    """代替发送队列，只统计字节数"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def send(self, key, message):
+        self.bytes += len(message.data)
+        return True
+
+
+def _base_quote(i):
+    return {
+        "symbol": f"SHFE.sym{i:03d}", "last_price": 5000.0 + i, "bid_price": 4999.0 + i, "ask_price": 5001.0 + i,
+        "bid_volume": 10, "ask_volume": 12, "volume": 1000, "open_interest": 50000, "open": 4990.0,
+        "high": 5010.0, "low": 4980.0, "pre_close": 4995.0, "upper_limit": 5500.0, "lower_limit": 4500.0,
+        "datetime": "2024-01-02 09:00:00.000000",
+    }
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize("encoding", [ENCODING_JSON, ENCODING_MSGPACK])
+def test_compact_stream_bandwidth(encoding):
+    """宽自选列表下增量模式相对完整推送的字节数和CPU开销"""
+    if encoding == ENCODING_MSGPACK and not MSGPACK_AVAILABLE:
+        pytest.skip("msgpack未安装")
+
+    rng = np.random.default_rng(7)
+    quotes = [_base_quote(i) for i in range(SYMBOLS)]
+
+    service = RealtimeDataService()
+    service.fanout = ByteCounter()
+    for q in quotes:
+        service.quote_stream.update(q["symbol"], q)
+    for c in range(CLIENTS):
+        connection = WebSocketConnection(Mock(), c, f"c{c}")
+        connection.stream_mode = "compact"
+        connection.encoding = encoding
+        connection.quote_versions = {q["symbol"]: 1 for q in quotes}
+        connection.stream_version = service.quote_stream.version
+        service.connections[connection.connection_id] = connection
+        service.compact_connections.add(connection.connection_id)
+
+    full_bytes = 0
+    full_seconds = compact_seconds = 0.0
+
+    for tick in range(TICKS):
+        changed = rng.choice(SYMBOLS, int(SYMBOLS * CHANGED_RATIO), replace=False)
+        for i in changed:
+            q = quotes[i]
+            q["last_price"] += 1.0
+            q["volume"] += 3
+            q["datetime"] = f"2024-01-02 09:{tick // 60:02d}:{tick % 60:02d}.500000"
+
+        # 完整模式：每个合约每周期向每个客户端推送一条完整行情（序列化已共享）
+        begin = time.perf_counter()
+        messages = [
+            encode_message({"type": "quote_update", "symbol": q["symbol"], "data": q}).data for q in quotes
+        ]
+        full_seconds += time.perf_counter() - begin
+        full_bytes += sum(len(m) for m in messages) * CLIENTS
+
+        # 增量模式：每个客户端每周期一帧，只含变化字段
+        begin = time.perf_counter()
+        for i in changed:
+            service.quote_stream.update(quotes[i]["symbol"], quotes[i])
+        service._push_quote_deltas()
+        compact_seconds += time.perf_counter() - begin
+        for connection in service.connections.values():
+            connection.next_delta_at = 0
+
+    compact_bytes = service.fanout.bytes
+    ratio = full_bytes / compact_bytes
+    frames_full = SYMBOLS * CLIENTS * TICKS
+    frames_compact = CLIENTS * TICKS
+    print(
+        f"\n[{encoding}] {SYMBOLS} symbols x {CLIENTS} clients x {TICKS} ticks: "
+        f"bytes full {full_bytes / 1e6:.1f}MB, compact {compact_bytes / 1e6:.1f}MB ({ratio:.1f}x); "
+        f"frames full {frames_full:,}, compact {frames_compact:,}; "
+        f"cpu full(encode only) {full_seconds * 1000:.0f}ms, compact {compact_seconds * 1000:.0f}ms "
+        f"({compact_seconds / frames_compact * 1e6:.1f}us per client tick)"
+    )
+
+    assert ratio > 5
+    assert service.stats["messages_sent"] == frames_compact
@@ -0,0 +1,76 @@
+"""
+WebSocket行情扇出负载基准
+
+运行: pytest tests/performance/test_websocket_fanout_benchmark.py -m performance -s
+"""
+import asyncio
+import statistics
+import time
+
+import pytest
+
+from app.websocket.fanout import FanoutHub
+
+
+SUBSCRIBERS = 10000
+PUBLISHES = 200
+# 每100个连接中有1个慢连接
+SLOW_EVERY = 100
+
+
+class NullWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.count = 0
+
+    async def send_text(self, text):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.count += 1
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+async def test_publish_to_ten_thousand_subscribers():
+    """单合约1万订阅者，发布延迟低于10ms，慢连接不拖累发布"""
+    hub = FanoutHub()
+    sockets = [
+        NullWebSocket(delay=0.5 if i % SLOW_EVERY == 0 else 0.0)
+        for i in range(SUBSCRIBERS)
+    ]
+    for i, ws in enumerate(sockets):
+        hub.register(i, ws)
+    subscribers = list(range(SUBSCRIBERS))
+
+    latencies = []
+    try:
+        for seq in range(PUBLISHES):
+            message = {
+                "type": "quote_update",
+                "symbol": "SHFE.cu2401",
+                "data": {"last_price": 68000.0 + seq, "volume": seq, "bid_price": 67990.0, "ask_price": 68010.0},
+                "timestamp": "2024-01-02T09:00:00",
+            }
+            begin = time.perf_counter()
+            hub.publish(subscribers, message, conflate_key="quote:SHFE.cu2401")
+            latencies.append((time.perf_counter() - begin) * 1000)
+            # 让写任务在下一条行情前发送
+            await asyncio.sleep(0.001)
+
+        await asyncio.sleep(0.1)
+        stats = hub.get_stats()
+    finally:
+        for i in range(SUBSCRIBERS):
+            hub.unregister(i)
+
+    p50 = statistics.median(latencies)
+    p99 = sorted(latencies)[int(len(latencies) * 0.99) - 1]
+    fast_received = min(ws.count for i, ws in enumerate(sockets) if i % SLOW_EVERY)
+    print(
+        f"\n{SUBSCRIBERS} subscribers x {PUBLISHES} quotes: publish p50 {p50:.2f}ms, p99 {p99:.2f}ms, "
+        f"sent {stats['sent']:,}, coalesced {stats['coalesced']:,}"
+    )
+
+    assert p50 < 10
+    assert fast_received == PUBLISHES
+    assert stats["coalesced"] > 0
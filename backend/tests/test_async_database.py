@@ -0,0 +1,101 @@
+"""
+异步数据库会话与异步仓储测试用例
+"""
+import threading
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core import database
+from app.core.async_repository import AsyncRepository
+from app.core.database import ThreadedAsyncSession, async_session_scope, call_on_loop
+from app.models.order import Order, OrderSide, OrderStatus, OrderType
+
+
+orders = AsyncRepository(Order)
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """文件型SQLite：异步会话在线程中访问数据库"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'async.db'}")
+    Order.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Order.__table__), [
+            {"id": i, "uuid": f"o{i}", "symbol": symbol, "user_id": user_id, "order_type": OrderType.LIMIT,
+             "side": OrderSide.BUY, "quantity": Decimal("1"), "status": status}
+            for i, (symbol, user_id, status) in enumerate([
+                ("SHFE.cu2401", 1, OrderStatus.PENDING),
+                ("SHFE.cu2401", 1, OrderStatus.FILLED),
+                ("DCE.m2405", 1, OrderStatus.PENDING),
+                ("DCE.m2405", 2, OrderStatus.PENDING),
+            ], start=1)
+        ])
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(database, "AsyncSessionLocal", lambda: ThreadedAsyncSession(factory()))
+    return factory
+
+
+class TestAsyncRepository:
+    """异步仓储测试"""
+
+    @pytest.mark.asyncio
+    async def test_queries(self, session_factory):
+        async with async_session_scope() as session:
+            pending = await orders.list(session, Order.status == OrderStatus.PENDING, order_by=Order.id.desc())
+            assert [order.id for order in pending] == [4, 3, 1]
+            assert (await orders.first(session, Order.user_id == 2)).symbol == "DCE.m2405"
+            assert await orders.first(session, Order.user_id == 3) is None
+            assert (await orders.get(session, 2)).status == OrderStatus.FILLED
+            assert await orders.count(session, Order.user_id == 1) == 3
+            assert sorted(await orders.distinct_values(session, Order.symbol)) == ["DCE.m2405", "SHFE.cu2401"]
+
+    @pytest.mark.asyncio
+    async def test_scope_commits_and_rolls_back(self, session_factory):
+        async with async_session_scope() as session:
+            assert await orders.update_where(session, Order.user_id == 1, Order.status == OrderStatus.PENDING,
+                                             status=OrderStatus.CANCELLED) == 2
+
+        with pytest.raises(RuntimeError):
+            async with async_session_scope() as session:
+                order = await orders.get(session, 4)
+                order.status = OrderStatus.CANCELLED
+                await session.flush()
+                raise RuntimeError("回滚")
+
+        db = session_factory()
+        assert {o.id: o.status for o in db.query(Order)} == {
+            1: OrderStatus.CANCELLED, 2: OrderStatus.FILLED, 3: OrderStatus.CANCELLED, 4: OrderStatus.PENDING
+        }
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_get_async_db_closes_session(self, session_factory):
+        dependency = database.get_async_db()
+        session = await dependency.__anext__()
+        assert await orders.count(session) == 4
+        with pytest.raises(StopAsyncIteration):
+            await dependency.__anext__()
+        assert not session.sync_session.in_transaction()
+
+    @pytest.mark.asyncio
+    async def test_run_sync_runs_off_loop(self, session_factory):
+        """run_sync 在工作线程中执行，call_on_loop 的回调回到事件循环线程执行"""
+        loop_thread = threading.get_ident()
+        calls = []
+
+        def load(session):
+            call_on_loop(lambda: calls.append(threading.get_ident()))
+            return threading.get_ident(), session.query(Order).count()
+
+        async with async_session_scope() as session:
+            worker_thread, count = await session.run_sync(load)
+        assert count == 4
+        assert worker_thread != loop_thread
+        assert calls == [loop_thread]
+
+        # 不在工作线程中时直接执行
+        call_on_loop(calls.append, 0)
+        assert calls == [loop_thread, 0]
@@ -35,22 +35,29 @@ class TestBacktestDataReplay:
     async def test_load_data(self):
         """测试数据加载"""
         # 模拟历史数据
-        mock_klines = [
-            Mock(datetime=datetime(2024, 1, 1, 9, 0), open=70000, high=70100, low=69900, close=70050, volume=1000),
-            Mock(datetime=datetime(2024, 1, 1, 9, 1), open=70050, high=70150, low=70000, close=70100, volume=1200),
-        ]
-        
-        self.history_service_mock.get_klines = AsyncMock(return_value=mock_klines)
-        
+        mock_frame = pd.DataFrame({
+            'open': [70000.0, 70050.0],
+            'high': [70100.0, 70150.0],
+            'low': [69900.0, 70000.0],
+            'close': [70050.0, 70100.0],
+            'volume': [1000.0, 1200.0],
+            'open_interest': [0.0, 0.0]
+        }, index=pd.DatetimeIndex([datetime(2024, 1, 1, 9, 0), datetime(2024, 1, 1, 9, 1)]))
+
+        self.history_service_mock.get_klines_frame = AsyncMock(return_value=mock_frame)
+
         symbols = ["SHFE.cu2401"]
         start_date = datetime(2024, 1, 1)
         end_date = datetime(2024, 1, 2)
-        
+
         data = await self.data_replay.load_data(symbols, start_date, end_date)
-        
+
         assert "SHFE.cu2401" in data
         assert len(data["SHFE.cu2401"]) == 2
         assert data["SHFE.cu2401"].iloc[0]['open'] == 70000
+        self.history_service_mock.get_klines_frame.assert_awaited_once_with(
+            symbol="SHFE.cu2401", period=60, start_time=start_date, end_time=end_date
+        )
     
     def test_get_bar_data(self):
         """测试获取K线数据"""
@@ -100,6 +107,82 @@ class TestBacktestDataReplay:
         assert len(bars) == 2
         assert bars[-1]['close'] == 70150
 
+    def test_aligned_replay(self):
+        """测试统一时间轴回放"""
+        cu = pd.DataFrame({
+            'open': [70000, 70050, 70100],
+            'high': [70100, 70150, 70200],
+            'low': [69900, 70000, 70050],
+            'close': [70050, 70100, 70150],
+            'volume': [1000, 1200, 1100]
+        }, index=[
+            datetime(2024, 1, 1, 9, 0),
+            datetime(2024, 1, 1, 9, 1),
+            datetime(2024, 1, 1, 9, 3)
+        ])
+        al = pd.DataFrame({
+            'open': [19000, 19010],
+            'high': [19020, 19030],
+            'low': [18990, 19000],
+            'close': [19010, 19020],
+            'volume': [500, 600]
+        }, index=[
+            datetime(2024, 1, 1, 9, 1),
+            datetime(2024, 1, 1, 9, 2)
+        ])
+
+        self.data_replay.data_cache = {"SHFE.cu2401": cu, "SHFE.al2401": al}
+        timeline = self.data_replay.prepare()
+
+        assert len(timeline) == 4
+
+        closes = []
+        for i in range(len(timeline)):
+            self.data_replay.advance(i)
+            market_data = self.data_replay.get_market_data(["SHFE.cu2401", "SHFE.al2401"])
+            closes.append((
+                market_data.get("SHFE.cu2401", {}).get('close'),
+                market_data.get("SHFE.al2401", {}).get('close')
+            ))
+
+        # 没有新K线的品种沿用最近一根K线
+        assert closes == [
+            (70050, None),
+            (70100, 19010),
+            (70100, 19020),
+            (70150, 19020)
+        ]
+
+        # 回放中按任意时间查询与游标结果一致
+        bar_data = self.data_replay.get_bar_data("SHFE.cu2401", datetime(2024, 1, 1, 9, 2))
+        assert bar_data['close'] == 70100
+        assert bar_data['open_interest'] == 0
+
+    def test_get_historical_arrays(self):
+        """测试获取K线数组视图"""
+        df = pd.DataFrame({
+            'open': [70000.0, 70050.0, 70100.0],
+            'high': [70100.0, 70150.0, 70200.0],
+            'low': [69900.0, 70000.0, 70050.0],
+            'close': [70050.0, 70100.0, 70150.0],
+            'volume': [1000.0, 1200.0, 1100.0]
+        }, index=[
+            datetime(2024, 1, 1, 9, 0),
+            datetime(2024, 1, 1, 9, 1),
+            datetime(2024, 1, 1, 9, 2)
+        ])
+
+        self.data_replay.data_cache = {"SHFE.cu2401": df}
+        self.data_replay.advance(2)
+
+        arrays = self.data_replay.get_historical_arrays(
+            "SHFE.cu2401", self.data_replay.current_time, 2
+        )
+        series = self.data_replay.timeline.series["SHFE.cu2401"]
+
+        assert arrays['close'].tolist() == [70100.0, 70150.0]
+        assert np.shares_memory(arrays['close'], series.columns['close'])
+
 
 class TestBacktestTradeExecutor:
     """交易执行器测试"""
@@ -469,6 +552,105 @@ class TestBacktestContext:
         assert call_args[1]['order_type'] == OrderType.MARKET
 
 
+class TestVectorizedBacktest:
+    """向量化回测测试"""
+    
+    SIGNAL_CODE = '''
+def compute_signals(df):
+    close = df['close']
+    ma = close.rolling(5, min_periods=1).mean()
+    return np.where(close > ma, 2.0, -1.0)
+'''
+    
+    EVENT_CODE = '''
+def handle_bar(context, bar_dict):
+    now = context.backtest_engine.data_replay.current_time
+    for symbol, bar in bar_dict.items():
+        if bar['datetime'] != now:
+            continue
+        position = TARGETS[symbol]['index'].get_loc(now)
+        target = TARGETS[symbol]['target'][position - 1] if position > 0 else 0.0
+        diff = target - context.get_position(symbol)['quantity']
+        if diff > 0:
+            context.buy(symbol, diff)
+        elif diff < 0:
+            context.sell(symbol, -diff)
+'''
+    
+    def _make_data(self):
+        rng = np.random.default_rng(7)
+        data = {}
+        for symbol, freq in [("SHFE.cu2401", "1min"), ("SHFE.al2401", "2min")]:
+            index = pd.date_range("2024-01-02 09:00", periods=600, freq=freq)
+            index = index[index.hour < 15]
+            close = 70000 + np.cumsum(rng.normal(0, 20, len(index)))
+            data[symbol] = pd.DataFrame({
+                'open': close + rng.normal(0, 5, len(index)),
+                'high': close + 30,
+                'low': close - 30,
+                'close': close,
+                'volume': np.full(len(index), 100.0)
+            }, index=index)
+        return data
+    
+    def _make_engine(self, code, data, extra_globals=None):
+        engine = BacktestEngine(Mock(), Mock(spec=HistoryService))
+        backtest = Mock(symbols=list(data.keys()), initial_capital=1000000.0, parameters={})
+        
+        engine.trade_executor = BacktestTradeExecutor()
+        engine.portfolio_manager = BacktestPortfolioManager(backtest.initial_capital)
+        engine.data_replay.data_cache = data
+        engine.progress_tracker = BacktestProgressTracker(len(engine.data_replay.prepare()))
+        engine.strategy_globals = {
+            'context': BacktestContext(engine, backtest.symbols, {}),
+            'np': np,
+            'pd': pd,
+            **(extra_globals or {})
+        }
+        exec(code, engine.strategy_globals)
+        return engine, backtest
+    
+    @pytest.mark.asyncio
+    async def test_vectorized_matches_event_loop(self):
+        """向量化结果与事件循环一致"""
+        data = self._make_data()
+        
+        vector_engine, backtest = self._make_engine(self.SIGNAL_CODE, data)
+        vector_result = await vector_engine._execute_backtest(backtest, data)
+        
+        compute_signals = vector_engine.strategy_globals['compute_signals']
+        targets = {
+            symbol: {'index': df.index, 'target': compute_signals(df)}
+            for symbol, df in data.items()
+        }
+        event_engine, backtest = self._make_engine(self.EVENT_CODE, data, {'TARGETS': targets})
+        event_result = await event_engine._execute_backtest(backtest, data)
+        
+        assert vector_result['total_trades'] == event_result['total_trades'] > 0
+        assert vector_result['final_capital'] == pytest.approx(event_result['final_capital'])
+        assert vector_result['max_drawdown'] == pytest.approx(event_result['max_drawdown'])
+        assert vector_result['sharpe_ratio'] == pytest.approx(event_result['sharpe_ratio'])
+        
+        vector_equity = [point['total_value'] for point in vector_result['equity_curve']]
+        event_equity = [point['total_value'] for point in event_result['equity_curve']]
+        assert vector_equity == pytest.approx(event_equity)
+        
+        vector_realized = [point['realized_pnl'] for point in vector_result['equity_curve']]
+        event_realized = [point['realized_pnl'] for point in event_result['equity_curve']]
+        assert vector_realized == pytest.approx(event_realized)
+        
+        assert [r['return'] for r in vector_result['daily_returns']] == pytest.approx(
+            [r['return'] for r in event_result['daily_returns']]
+        )
+        
+        vector_fills = [(t['symbol'], t['side']) for t in vector_result['trade_records']]
+        event_fills = [(t['symbol'], t['side']) for t in event_result['trade_records']]
+        assert vector_fills == event_fills
+        assert [t['filled_price'] for t in vector_result['trade_records']] == pytest.approx(
+            [t['filled_price'] for t in event_result['trade_records']]
+        )
+
+
 # 集成测试
 class TestBacktestEngineIntegration:
     """回测引擎集成测试"""
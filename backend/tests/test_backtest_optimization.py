@@ -0,0 +1,179 @@
+"""
+回测参数优化服务测试用例
+"""
+from datetime import datetime
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from app.core.exceptions import ValidationError
+from app.services.backtest_optimization_service import (
+    BacktestOptimizationService,
+    ParameterSweep,
+    ParameterSweepRunner,
+    SharedMarketData,
+    SweepRunResult,
+    SweepStatus,
+    build_parameter_sets,
+)
+
+
+STRATEGY_CODE = '''
+def compute_signals(df):
+    fast = df['close'].rolling(context.params['fast']).mean()
+    slow = df['close'].rolling(context.params['slow']).mean()
+    return np.where(fast > slow, 1.0, 0.0)
+'''
+
+
+def make_data():
+    rng = np.random.default_rng(3)
+    index = pd.date_range("2024-01-02 09:00", periods=300, freq="1min")
+    close = 70000 + np.cumsum(rng.normal(0, 20, len(index)))
+    return {
+        "SHFE.cu2401": pd.DataFrame({
+            'open': close + rng.normal(0, 5, len(index)),
+            'high': close + 30,
+            'low': close - 30,
+            'close': close,
+            'volume': np.full(len(index), 100.0)
+        }, index=index)
+    }
+
+
+class TestBuildParameterSets:
+    """参数组合生成测试"""
+
+    def test_grid(self):
+        """网格搜索生成笛卡尔积"""
+        sets = build_parameter_sets({
+            'method': 'grid',
+            'parameters': {'fast': [5, 10], 'slow': [20, 40, 60]},
+            'fixed_parameters': {'size': 1}
+        })
+
+        assert len(sets) == 6
+        assert {'fast': 5, 'slow': 20, 'size': 1} in sets
+        assert {'fast': 10, 'slow': 60, 'size': 1} in sets
+
+    def test_random_is_reproducible(self):
+        """随机搜索按种子复现"""
+        spec = {
+            'method': 'random',
+            'n_iter': 10,
+            'seed': 42,
+            'parameters': {'fast': {'min': 2, 'max': 20, 'type': 'int'}, 'mode': ['a', 'b']}
+        }
+
+        sets = build_parameter_sets(spec)
+
+        assert sets == build_parameter_sets(spec)
+        assert len(sets) == 10
+        assert all(2 <= s['fast'] <= 20 and s['mode'] in ('a', 'b') for s in sets)
+
+    def test_invalid_spec(self):
+        """非法配置抛出验证错误"""
+        with pytest.raises(ValidationError):
+            build_parameter_sets({'parameters': {}})
+        with pytest.raises(ValidationError):
+            build_parameter_sets({'method': 'bayes', 'parameters': {'fast': [1]}})
+        with pytest.raises(ValidationError):
+            build_parameter_sets({'parameters': {'fast': list(range(100))}, 'max_runs': 10})
+
+
+class TestSharedMarketData:
+    """共享行情数据测试"""
+
+    def test_round_trip(self):
+        """写入后以内存映射方式读回"""
+        data = make_data()
+        shared = SharedMarketData.create(data)
+        try:
+            loaded = shared.load()
+            df = loaded["SHFE.cu2401"]
+
+            assert df.index.equals(data["SHFE.cu2401"].index)
+            np.testing.assert_array_equal(df['close'].to_numpy(), data["SHFE.cu2401"]['close'].to_numpy())
+            assert (df['open_interest'] == 0).all()
+        finally:
+            shared.cleanup()
+
+
+class TestParameterSweep:
+    """参数扫描测试"""
+
+    def test_leaderboard_order(self):
+        """排行榜按指标排序，最大回撤升序"""
+        sweep = ParameterSweep(id="s", base_backtest_id=1, user_id=1, total_runs=3)
+        sweep.results = [
+            SweepRunResult(0, {'fast': 1}, {'sharpe_ratio': 0.5, 'max_drawdown': 0.1}),
+            SweepRunResult(1, {'fast': 2}, {'sharpe_ratio': 1.5, 'max_drawdown': 0.3}),
+            SweepRunResult(2, {'fast': 3}, error="boom"),
+        ]
+
+        assert [row['parameters']['fast'] for row in sweep.leaderboard()] == [2, 1]
+
+        sweep.metric = 'max_drawdown'
+        assert [row['parameters']['fast'] for row in sweep.leaderboard()] == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_runner_executes_in_process_pool(self):
+        """进程池执行所有参数组合"""
+        data = make_data()
+        shared = SharedMarketData.create(data)
+        parameter_sets = build_parameter_sets({'parameters': {'fast': [3, 5], 'slow': [10, 20]}})
+        sweep = ParameterSweep(id="s", base_backtest_id=1, user_id=1, total_runs=len(parameter_sets))
+        config = {
+            'symbols': list(data.keys()),
+            'initial_capital': 1000000.0,
+            'strategy_code': STRATEGY_CODE
+        }
+        results = []
+
+        try:
+            await ParameterSweepRunner(max_workers=2).run(
+                sweep, shared, config, parameter_sets, results.append
+            )
+        finally:
+            shared.cleanup()
+
+        assert sweep.status == SweepStatus.PENDING
+        assert sorted(run.run_index for run in results) == [0, 1, 2, 3]
+        assert all(run.error is None for run in results)
+        assert all(run.result['total_trades'] > 0 for run in results)
+        assert isinstance(results[0].result['equity_curve'][0]['timestamp'], str)
+
+    def test_save_run_writes_backtest_results(self):
+        """每组参数的结果写成一条带指标的回测记录"""
+        class FakeSession:
+            def __init__(self):
+                self.added = []
+                self.committed = False
+
+            def add(self, obj):
+                self.added.append(obj)
+
+            def commit(self):
+                self.committed = True
+
+            def rollback(self):
+                pass
+
+        metrics = ('final_capital', 'total_return', 'annual_return', 'max_drawdown', 'sharpe_ratio',
+                   'sortino_ratio', 'total_trades', 'winning_trades', 'losing_trades', 'win_rate',
+                   'avg_win', 'avg_loss', 'profit_factor')
+        result = {key: 1.0 for key in metrics}
+        result.update(equity_curve=[], trade_records=[], daily_returns=[], sharpe_ratio=1.5)
+        template = {
+            'name': 'base', 'strategy_id': 1, 'start_date': datetime(2024, 1, 1),
+            'end_date': datetime(2024, 2, 1), 'initial_capital': 1000000.0, 'symbols': ['SHFE.cu2401']
+        }
+        sweep = ParameterSweep(id="s", base_backtest_id=1, user_id=1, total_runs=1)
+        db = FakeSession()
+
+        BacktestOptimizationService()._save_run(db, sweep, template, SweepRunResult(0, {'fast': 3}, result))
+
+        assert db.committed
+        assert db.added[0].sharpe_ratio == 1.5
+        assert db.added[0].parameters == {'fast': 3}
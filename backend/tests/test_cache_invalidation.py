@@ -0,0 +1,133 @@
+"""
+缓存标签失效测试用例：按标签删除、SCAN/UNLINK批量清理
+"""
+import fnmatch
+
+from app.core.cache import CacheManager, QueryCache, count_keys, scan_unlink, scan_unlink_in_background, tag_key
+
+
+class FakeRedis:
+    """内存版Redis，只实现标签失效和SCAN清理用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.commands = []
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def expire(self, key, ttl, nx=False, gt=False):
+        pass
+
+    def unlink(self, *keys):
+        self.commands.append(("unlink", len(keys)))
+        return sum((self.data.pop(key, None) or self.sets.pop(key, None)) is not None for key in keys)
+
+    def keys(self, pattern):
+        raise AssertionError("KEYS会阻塞Redis，不应调用")
+
+    def scan_iter(self, match=None, count=None):
+        self.commands.append(("scan", count))
+        return [key for key in list(self.data) + list(self.sets) if fnmatch.fnmatchcase(key, match)]
+
+    def pipeline(self, transaction=True):
+        redis = self
+        commands = []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: commands.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+        return Pipeline()
+
+
+def make_manager():
+    manager = CacheManager()
+    manager.redis_client = FakeRedis()
+    return manager
+
+
+class TestTagInvalidation:
+    """按标签失效测试"""
+
+    def test_user_invalidation_only_touches_tagged_entries(self):
+        manager = make_manager()
+        queries = QueryCache(manager)
+        queries.cache_query("orders:user:42:open", lambda: [1], tags=["user:42"])
+        queries.cache_query("strategies:user:42:list", lambda: [2], tags=["user:42", "strategies:user:42"])
+        queries.cache_query("orders:user:7:open", lambda: [3], tags=["user:7"])
+        queries.cache_query("kline:rb2405:60", lambda: [4], tags=["symbol:rb2405"])
+
+        queries.invalidate_user_cache("42")
+
+        redis = manager.redis_client
+        assert sorted(redis.data) == ["kline:rb2405:60", "orders:user:7:open"]
+        assert tag_key("user:42") not in redis.sets
+        assert redis.commands == [("unlink", 1), ("unlink", 2)]
+
+    def test_strategy_and_market_invalidation(self):
+        manager = make_manager()
+        queries = QueryCache(manager)
+        queries.cache_query("strategy:5:detail", lambda: {}, tags=["strategy:5", "user:42"])
+        queries.cache_query("strategies:user:42:list", lambda: [], tags=["user:42", "strategies:user:42"])
+        queries.cache_query("positions:user:42", lambda: [], tags=["user:42"])
+        queries.cache_query("quote:rb2405", lambda: {}, tags=["symbol:rb2405"])
+
+        queries.invalidate_strategy_cache("5", "42")
+        assert sorted(manager.redis_client.data) == ["positions:user:42", "quote:rb2405"]
+
+        queries.invalidate_market_cache("rb2405")
+        assert sorted(manager.redis_client.data) == ["positions:user:42"]
+
+    def test_cached_value_is_reused_until_invalidated(self):
+        manager = make_manager()
+        queries = QueryCache(manager)
+        calls = []
+
+        def query():
+            calls.append(1)
+            return len(calls)
+
+        assert queries.cache_query("user:42:profile", query, tags=["user:42"]) == 1
+        assert queries.cache_query("user:42:profile", query, tags=["user:42"]) == 1
+        queries.invalidate_user_cache("42")
+        assert queries.cache_query("user:42:profile", query, tags=["user:42"]) == 2
+
+
+class TestScanUnlink:
+    """批量清理测试"""
+
+    def test_clear_pattern_scans_and_unlinks_in_batches(self):
+        manager = make_manager()
+        redis = manager.redis_client
+        for i in range(1200):
+            redis.setex(f"klines:cu:{i}", 60, b"x")
+        redis.setex("session:user:1", 60, b"x")
+
+        assert count_keys(redis, "klines:*") == 1200
+        assert manager.clear_pattern("klines:*") == 1200
+        assert list(redis.data) == ["session:user:1"]
+        assert [n for op, n in redis.commands if op == "unlink"] == [500, 500, 200]
+
+    def test_background_clear(self):
+        redis = FakeRedis()
+        redis.setex("klines:cu:1", 60, b"x")
+
+        scan_unlink_in_background(redis, "klines:*").join(timeout=1)
+
+        assert redis.data == {}
+        assert scan_unlink(redis, "klines:*") == 0
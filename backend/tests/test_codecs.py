@@ -0,0 +1,110 @@
+"""
+编解码器测试用例：各编解码器往返、列式数值序列零拷贝解码、旧数据兼容、缓存接入
+"""
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core import codecs
+from app.core.codecs import MSGPACK_AVAILABLE, MsgpackCodec, decode, encode, get_codec
+from app.core.tiered_cache import CacheEntry
+from tests.test_cache_invalidation import make_manager
+from tests.test_tiered_cache import make_cache
+
+
+def kline_frame(count=100):
+    index = pd.date_range("2024-01-02 09:00", periods=count, freq="min", name="datetime")
+    return pd.DataFrame(
+        {name: np.arange(count, dtype=np.float64) + i for i, name in enumerate(("open", "high", "low", "close"))},
+        index=index,
+    )
+
+
+class TestCodecs:
+    """编解码器测试"""
+
+    @pytest.mark.parametrize("name", codecs.available_codecs())
+    def test_round_trip_with_codec_id(self, name):
+        value = np.arange(5.0) if name == "numpy" else {"symbol": "SHFE.cu2401", "bids": [1.5, 2.5], "volume": 10}
+        data = encode(value, name)
+
+        assert data[0] == get_codec(name).codec_id
+        result = decode(data)
+        if name == "numpy":
+            np.testing.assert_array_equal(result, value)
+        else:
+            assert result == value
+
+    def test_numpy_frame_round_trip(self):
+        frame = kline_frame()
+        aware = frame.tz_localize("Asia/Shanghai")
+
+        pd.testing.assert_frame_equal(decode(encode(frame, "numpy")), frame, check_freq=False)
+        pd.testing.assert_frame_equal(decode(encode(aware, "numpy")), aware, check_freq=False)
+        assert decode(encode(frame.iloc[:0], "numpy")).empty
+
+    def test_numpy_columns_decode_without_copy(self):
+        columns = {"close": np.linspace(1, 2, 1000), "volume": np.arange(1000, dtype=np.int64)}
+        data = encode(columns, "numpy")
+
+        result = decode(data)
+        for name, values in columns.items():
+            np.testing.assert_array_equal(result[name], values)
+            assert np.shares_memory(result[name], np.frombuffer(data, dtype=np.uint8))
+            assert result[name].ctypes.data % codecs.COLUMN_ALIGNMENT == 0
+        assert not result["close"].flags.writeable
+
+        with pytest.raises(TypeError):
+            encode({"symbol": np.array(["cu", "al"], dtype=object)}, "numpy")
+
+    @pytest.mark.skipif(not MSGPACK_AVAILABLE, reason="msgpack未安装")
+    def test_msgpack_embeds_arrays_and_wire_mode_stays_portable(self):
+        value = {"symbol": "cu", "close": np.arange(3.0), "at": datetime(2024, 1, 2, 9, 0)}
+
+        result = decode(encode(value, "msgpack"))
+        np.testing.assert_array_equal(result["close"], value["close"])
+        assert result["at"] == "2024-01-02T09:00:00"
+        with pytest.raises(TypeError):
+            encode({"value": object()}, "msgpack")
+
+        wire = MsgpackCodec(wire=True)
+        assert get_codec("msgpack").loads(wire.dumps(value))["close"] == [0.0, 1.0, 2.0]
+
+    def test_legacy_payloads_and_unknown_codec(self):
+        assert decode(pickle.dumps({"a": 1})) == {"a": 1}
+        assert decode(b'[{"close": 1.5}]') == [{"close": 1.5}]
+        assert decode('{"a": 1}') == {"a": 1}
+        with pytest.raises(ValueError):
+            get_codec("protobuf")
+
+
+class TestCacheCodecs:
+    """缓存接入测试"""
+
+    def test_cache_manager_codec_per_value(self):
+        manager = make_manager()
+
+        manager.set("session:user:1", {"user_id": 1}, 60, codec="json")
+        manager.set("query:1", {"rows": (1, 2)}, 60)
+
+        data = manager.redis_client.data
+        assert data["session:user:1"][:1] == get_codec("json").prefix
+        assert manager.get("session:user:1") == {"user_id": 1}
+        assert manager.get("query:1") == {"rows": (1, 2)}
+
+    @pytest.mark.asyncio
+    async def test_tiered_cache_namespace_codec(self):
+        cache = make_cache()
+        cache.set_codec("klines", "numpy")
+        frame = kline_frame()
+
+        await cache.set("klines", "cu", frame, tags=["symbol:cu"])
+        entry = cache._load_entry(cache._redis.data["tc:klines:cu"])
+
+        assert isinstance(entry, CacheEntry) and entry.tags == ("symbol:cu",)
+        pd.testing.assert_frame_equal(entry.value, frame, check_freq=False)
+        cache.local.clear()
+        pd.testing.assert_frame_equal(await cache.get("klines", "cu"), frame, check_freq=False)
@@ -0,0 +1,227 @@
+"""
+历史数据服务测试用例
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import AsyncMock, Mock
+
+from app.schemas.market import KlineData
+from app.services.history_service import HistoryService
+from app.services.kline_store import normalize_kline_frame
+from tests.test_kline_store import shanghai_tz  # noqa: F401
+
+
+class FakeRedis:
+    """只实现分段缓存和标签失效用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.sets = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+        self.ttl[key] = ttl
+
+    def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def expire(self, key, ttl, nx=False, gt=False):
+        pass
+
+    def unlink(self, *keys):
+        return sum((self.data.pop(key, None) or self.sets.pop(key, None)) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        redis = self
+        commands = []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: commands.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+        return Pipeline()
+
+
+def make_klines(start: datetime, count: int):
+    """InfluxDB返回的K线时间带时区，start为本地时间"""
+    return [
+        KlineData(
+            datetime=(start + timedelta(minutes=i)).astimezone(timezone.utc).isoformat(),
+            open=100 + i, high=101 + i, low=99 + i, close=100 + i,
+            volume=10, open_interest=0
+        )
+        for i in range(count)
+    ]
+
+
+class TestKlineSegmentCache:
+    """K线分段缓存测试"""
+
+    def setup_method(self):
+        self.service = HistoryService()
+        self.service.redis_client = FakeRedis()
+        self.service._read_klines_from_store = Mock(return_value=[])
+        self.service._query_klines_from_tqsdk = AsyncMock(return_value=[])
+
+        # 两个已收盘的自然日（1分钟K线每段一天）
+        self.day = datetime.fromtimestamp(
+            HistoryService._segment_start((datetime.now() - timedelta(days=5)).timestamp(), 86400)
+        )
+        self.klines = make_klines(self.day + timedelta(hours=9), 120) + \
+            make_klines(self.day + timedelta(days=1, hours=9), 120)
+
+        async def query_influx(symbol, period, start_time, end_time, limit):
+            return [
+                k for k in self.klines
+                if start_time.astimezone() <= datetime.fromisoformat(k.datetime) <= end_time.astimezone()
+            ]
+
+        self.service._query_klines_from_influx = AsyncMock(side_effect=query_influx)
+
+    @pytest.mark.asyncio
+    async def test_overlapping_ranges_reuse_segments(self):
+        """不同的查询区间复用同一批分段"""
+        first = await self.service.get_klines(
+            "SHFE.cu2401", 60,
+            self.day + timedelta(hours=9, minutes=30), self.day + timedelta(days=1, hours=9, minutes=59)
+        )
+        assert self.service._query_klines_from_influx.await_count == 1
+        assert len(first) == 90 + 60
+
+        second = await self.service.get_klines(
+            "SHFE.cu2401", 60,
+            self.day + timedelta(hours=10), self.day + timedelta(days=1, hours=10, minutes=30)
+        )
+        assert self.service._query_klines_from_influx.await_count == 1
+        assert len(second) == 60 + 91
+        assert second[0].datetime == (self.day + timedelta(hours=10)).astimezone(timezone.utc).isoformat()
+
+        stats = self.service.get_cache_stats()
+        assert stats["misses"] == 2
+        assert stats["hits"] == 2
+        assert stats["hit_rate"] == 0.5
+        assert stats["open_segment_fetches"] == 0
+
+        # 已收盘的分段长期缓存
+        assert set(self.service.redis_client.ttl.values()) == {self.service.closed_segment_ttl}
+
+    @pytest.mark.asyncio
+    async def test_limit_keeps_latest_bars(self):
+        """limit保留区间内最新的K线"""
+        klines = await self.service.get_klines(
+            "SHFE.cu2401", 60, self.day, self.day + timedelta(days=2) - timedelta(seconds=1), limit=10
+        )
+        assert len(klines) == 10
+        assert klines[-1].datetime == self.klines[-1].datetime
+
+    @pytest.mark.asyncio
+    async def test_open_segment_is_short_lived(self):
+        """包含当前时间的分段只短期缓存"""
+        end_time = datetime.now()
+        await self.service.get_klines("SHFE.cu2401", 60, end_time - timedelta(minutes=30), end_time)
+
+        stats = self.service.get_cache_stats()
+        assert stats["open_segment_fetches"] == 1
+        assert max(self.service.redis_client.ttl.values()) <= 60
+
+    @pytest.mark.asyncio
+    async def test_segment_just_ended_is_not_closed(self):
+        """分段刚结束时最后的K线可能还未落库，不长期缓存"""
+        from unittest.mock import patch
+
+        boundary = self.day + timedelta(days=1)
+        frozen = boundary + timedelta(seconds=30)
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return frozen.astimezone(tz) if tz else frozen
+
+        with patch("app.services.history_service.datetime", FrozenDatetime):
+            await self.service.get_klines(
+                "SHFE.cu2401", 60, boundary - timedelta(hours=1), boundary - timedelta(seconds=1)
+            )
+
+        assert self.service.get_cache_stats()["open_segment_fetches"] == 1
+        assert max(self.service.redis_client.ttl.values()) <= 60
+
+    @pytest.mark.asyncio
+    async def test_clear_cache_by_symbol_tag(self):
+        """按合约清理只删除该合约登记的分段"""
+        await self.service.get_klines("SHFE.cu2401", 60, self.day, self.day + timedelta(days=2) - timedelta(seconds=1))
+        await self.service.get_klines("SHFE.al2401", 60, self.day, self.day + timedelta(days=2) - timedelta(seconds=1))
+        redis = self.service.redis_client
+        assert len(redis.data) == 4
+
+        self.service.clear_cache("SHFE.cu2401")
+
+        assert sorted(redis.data) == sorted(k for k in redis.ttl if k.startswith("klines:SHFE.al2401:"))
+        assert "cache:tag:symbol:SHFE.cu2401" not in redis.sets
+        assert len(redis.sets["cache:tag:symbol:SHFE.al2401"]) == 2
+
+
+class TestKlineSegmentTimezone:
+    """非UTC时区下的分段缓存测试"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.usefixtures("shanghai_tz")
+    async def test_segments_in_non_utc_zone(self):
+        """InfluxDB返回带时区的K线，分段切分和区间截取不丢K线"""
+        from unittest.mock import patch
+
+        service = HistoryService()
+        service.redis_client = FakeRedis()
+        service._read_klines_from_store = Mock(return_value=[])
+        day = datetime.combine((datetime.now() - timedelta(days=5)).date(), datetime.min.time())
+        index = pd.date_range(day + timedelta(hours=9), periods=120, freq="1min", tz="Asia/Shanghai")
+        frame = pd.DataFrame({"close": 100.0 + np.arange(120)}, index=index.tz_convert("UTC"))
+
+        with patch("app.services.history_service.influx_query") as influx:
+            influx.available = True
+            influx.query_klines_frame = AsyncMock(return_value=frame)
+            klines = await service.get_klines(
+                "SHFE.cu2401", 60, day + timedelta(hours=9), day + timedelta(hours=10, minutes=59)
+            )
+            cached = await service.get_klines(
+                "SHFE.cu2401", 60, day + timedelta(hours=10), day + timedelta(hours=10, minutes=59)
+            )
+
+        assert len(klines) == 120
+        assert datetime.fromisoformat(klines[0].datetime) == (day + timedelta(hours=9)).astimezone()
+        assert len(cached) == 60
+        assert influx.query_klines_frame.await_count == 1
+
+
+class TestKlineStoreSync:
+    """本地存储同步测试"""
+
+    @pytest.mark.asyncio
+    async def test_days_outside_fetched_bars_stay_missing(self):
+        """数据源只返回区间内最近一部分K线时，前面的交易日不记为已同步"""
+        service = HistoryService()
+        service.kline_store = Mock(enabled=True)
+        service.kline_store.synced_days.return_value = set()
+        service.kline_store.write.return_value = 2
+        # 请求1月2日至1月5日，数据源只覆盖1月4日、1月5日
+        bars = [datetime(2024, 1, 4, 9), datetime(2024, 1, 5, 14, 59)]
+        service._fetch_klines_frame = AsyncMock(return_value=normalize_kline_frame(
+            pd.DataFrame({"datetime": bars, "close": [100.0, 101.0]})
+        ))
+
+        await service.sync_kline_store("SHFE.cu2401", 60, datetime(2024, 1, 2), datetime(2024, 1, 5, 23))
+
+        service.kline_store.mark_synced.assert_called_once_with(
+            "SHFE.cu2401", 60, [date(2024, 1, 4), date(2024, 1, 5)]
+        )
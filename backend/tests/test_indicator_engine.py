@@ -0,0 +1,117 @@
+"""
+增量技术指标引擎测试用例
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.indicator_engine import (
+    IndicatorEngine, IndicatorState, apply_indicators, bar_start, bollinger, compute_indicators, ema, macd, rsi, sma,
+)
+
+
+def random_walk(n, seed=3):
+    rng = np.random.default_rng(seed)
+    return 5000.0 + np.cumsum(rng.normal(0, 10, n))
+
+
+def wilder_rsi_reference(closes, period=14):
+    """逐根计算的Wilder RSI"""
+    out = [None] * len(closes)
+    deltas = np.diff(closes)
+    gains, losses = np.maximum(deltas, 0), np.maximum(-deltas, 0)
+    avg_gain, avg_loss = gains[:period].mean(), losses[:period].mean()
+    for i in range(period, len(closes)):
+        if i > period:
+            avg_gain = (avg_gain * (period - 1) + gains[i - 1]) / period
+            avg_loss = (avg_loss * (period - 1) + losses[i - 1]) / period
+        out[i] = 100 - 100 / (1 + avg_gain / avg_loss)
+    return out
+
+
+class TestBatchIndicators:
+    """批量计算测试"""
+
+    def test_matches_reference_implementations(self):
+        closes = random_walk(300)
+        series = pd.Series(closes)
+
+        np.testing.assert_allclose(sma(closes, 20), series.rolling(20).mean(), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(ema(closes, 12), series.ewm(span=12, adjust=False).mean(), rtol=1e-12)
+
+        upper, middle, lower = bollinger(closes, 20, 2.0)
+        np.testing.assert_allclose(upper - middle, 2 * series.rolling(20).std(ddof=0), rtol=1e-6, equal_nan=True)
+
+        expected_rsi = np.array([np.nan if v is None else v for v in wilder_rsi_reference(closes)])
+        np.testing.assert_allclose(rsi(closes), expected_rsi, rtol=1e-9, equal_nan=True)
+
+        line, signal, histogram = macd(closes)
+        expected_line = series.ewm(span=12, adjust=False).mean() - series.ewm(span=26, adjust=False).mean()
+        expected_signal = expected_line.ewm(span=9, adjust=False).mean()
+        assert np.isnan(line[24]) and not np.isnan(line[25])
+        np.testing.assert_allclose(line[25:], expected_line[25:], rtol=1e-9)
+        np.testing.assert_allclose(histogram[25:], (expected_line - expected_signal)[25:], rtol=1e-6, atol=1e-9)
+
+    def test_apply_indicators_skips_unavailable(self):
+        """不足窗口的K线不写入对应指标"""
+        klines = [{"close": float(c)} for c in random_walk(30)]
+        apply_indicators(klines)
+
+        assert "ma5" not in klines[3] and "ma5" in klines[4]
+        assert "rsi" not in klines[13] and "rsi" in klines[14]
+        assert "macd" not in klines[24] and "macd" in klines[25]
+        assert isinstance(klines[-1]["bb_upper"], float)
+
+
+class TestIndicatorState:
+    """增量更新测试"""
+
+    def test_incremental_matches_batch(self):
+        """逐根更新的结果与整段批量计算一致"""
+        closes = random_walk(400)
+        expected = compute_indicators(closes)
+
+        state = IndicatorState.from_history(closes[:5], bar_time=4)
+        for i in range(5, len(closes)):
+            values = state.update(float(closes[i]), bar_time=i)
+            for key, array in expected.items():
+                if np.isnan(array[i]):
+                    assert values[key] is None, (key, i)
+                else:
+                    assert values[key] == pytest.approx(array[i], rel=1e-7, abs=1e-7), (key, i)
+
+    def test_ticks_update_forming_bar_only(self):
+        """同一根K线内的行情不推进状态"""
+        closes = random_walk(100)
+        state = IndicatorState.from_history(closes, bar_time=99)
+        count = state.count
+
+        for price in (closes[-1] + 50, closes[-1] - 30, closes[-1]):
+            state.update(float(price), bar_time=99)
+        assert state.count == count
+
+        expected = compute_indicators(closes)
+        assert state.values["rsi"] == pytest.approx(expected["rsi"][-1])
+        assert state.values["ma20"] == pytest.approx(expected["ma20"][-1])
+
+
+class TestIndicatorEngine:
+    """按合约和周期管理状态"""
+
+    def test_live_price_updates_by_bar(self):
+        engine = IndicatorEngine()
+        closes = random_walk(60)
+        start = bar_start(1_700_000_040, "1m")
+        klines = [{"datetime": (start - 60 * (59 - i)) * 1_000_000_000, "close": float(c)} for i, c in enumerate(closes)]
+        engine.seed("SHFE.cu2401", "1m", klines)
+
+        # 当前K线内的行情
+        engine.on_price("SHFE.cu2401", 6000.0, timestamp=start + 30)
+        assert engine._states[("SHFE.cu2401", "1m")].count == 59
+        assert engine.latest("SHFE.cu2401", "1m")["ma5"] == pytest.approx((sum(closes[-5:-1]) + 6000.0) / 5)
+
+        # 下一根K线的行情
+        engine.on_price("SHFE.cu2401", 6010.0, timestamp=start + 60)
+        assert engine._states[("SHFE.cu2401", "1m")].count == 60
+        assert engine.latest("SHFE.cu2401", "1m")["ma5"] == pytest.approx((sum(closes[-4:-1]) + 6000.0 + 6010.0) / 5)
+        assert engine.latest("SHFE.cu2401", "5m") is None
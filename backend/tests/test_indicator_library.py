@@ -0,0 +1,135 @@
+"""
+技术指标库与批量计算测试用例
+"""
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core.exceptions import ValidationError
+from app.services.indicator_library import (
+    BarArrays, IndicatorSeriesCache, compute_series, parse_indicator_specs, to_json_list,
+)
+from app.services.technical_analysis_service import TechnicalAnalysisService
+
+
+def make_klines(n, seed=5):
+    rng = np.random.default_rng(seed)
+    closes = 3000.0 + np.cumsum(rng.normal(0, 5, n))
+    return [
+        {
+            "datetime": 1_700_000_000 + 60 * i,
+            "open": c - 1.0,
+            "high": c + abs(rng.normal(0, 3)),
+            "low": c - abs(rng.normal(0, 3)),
+            "close": c,
+            "volume": float(rng.integers(100, 1000)),
+        }
+        for i, c in enumerate(closes)
+    ]
+
+
+class TestIndicatorSpecs:
+    """指标请求解析测试"""
+
+    def test_parse_formats_and_defaults(self):
+        specs = parse_indicator_specs(["rsi", {"ema": 12}, {"macd": [12, 26, 9]}, {"boll": [20, 2]}, {"kdj": [9]}])
+        assert [s.key for s in specs] == ["rsi(14)", "ema(12)", "macd(12,26,9)", "boll(20,2)", "kdj(9,3,3)"]
+
+        # 别名和重复请求
+        assert [s.key for s in parse_indicator_specs([{"sma": 5}, {"ma": 5}, {"boll": [20, 2.5]}])] == ["ma(5)", "boll(20,2.5)"]
+
+    @pytest.mark.parametrize("spec", [{"foo": 1}, {"ema": 0}, {"ema": 2.5}, {"macd": [1, 2, 3, 4]}, {"ema": "x"}, 42])
+    def test_invalid_specs(self, spec):
+        with pytest.raises(ValidationError):
+            parse_indicator_specs([spec])
+
+
+class TestIndicatorSeries:
+    """指标数值与缓存测试"""
+
+    def test_matches_pandas_reference(self):
+        klines = make_klines(200)
+        frame = pd.DataFrame(klines)
+        specs = parse_indicator_specs([
+            {"ma": 10}, {"ema": 12}, {"boll": [20, 2]}, {"atr": 14}, {"wr": 14}, {"cci": 20}, "obv", {"roc": 12},
+        ])
+        series = compute_series("SHFE.cu2401", "1m", BarArrays.from_klines(klines), specs, cache=None)
+
+        np.testing.assert_allclose(series["ma(10)"]["value"], frame.close.rolling(10).mean(), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(series["ema(12)"]["value"], frame.close.ewm(span=12, adjust=False).mean(), rtol=1e-12)
+        boll = series["boll(20,2)"]
+        np.testing.assert_allclose(boll["upper"] - boll["middle"], 2 * frame.close.rolling(20).std(ddof=0), rtol=1e-6, equal_nan=True)
+
+        prev_close = frame.close.shift(1).fillna(frame.close)
+        tr = pd.concat([frame.high - frame.low, (frame.high - prev_close).abs(), (frame.low - prev_close).abs()], axis=1).max(axis=1)
+        expected_atr = [np.nan] * 13 + [tr[:14].mean()]
+        for value in tr[14:]:
+            expected_atr.append((expected_atr[-1] * 13 + value) / 14)
+        np.testing.assert_allclose(series["atr(14)"]["value"], expected_atr, rtol=1e-9, equal_nan=True)
+
+        highest, lowest = frame.high.rolling(14).max(), frame.low.rolling(14).min()
+        np.testing.assert_allclose(series["wr(14)"]["value"], (highest - frame.close) / (highest - lowest) * 100, rtol=1e-9, equal_nan=True)
+
+        typical = (frame.high + frame.low + frame.close) / 3
+        mean_dev = typical.rolling(20).apply(lambda w: np.abs(w - w.mean()).mean(), raw=True)
+        expected_cci = (typical - typical.rolling(20).mean()) / (0.015 * mean_dev)
+        np.testing.assert_allclose(series["cci(20)"]["value"], expected_cci, rtol=1e-6, equal_nan=True)
+
+        expected_obv = (np.sign(frame.close.diff().fillna(0)) * frame.volume).cumsum()
+        np.testing.assert_allclose(series["obv"]["value"], expected_obv, rtol=1e-12)
+        np.testing.assert_allclose(series["roc(12)"]["value"], frame.close.pct_change(12) * 100, rtol=1e-9, equal_nan=True)
+
+    def test_cache_by_last_bar(self):
+        """同一最后K线命中缓存，新K线重新计算"""
+        cache = IndicatorSeriesCache()
+        klines = make_klines(100)
+        specs = parse_indicator_specs([{"ema": 12}, {"macd": [12, 26, 9]}])
+
+        first = compute_series("SHFE.cu2401", "1m", BarArrays.from_klines(klines), specs, cache)
+        again = compute_series("SHFE.cu2401", "1m", BarArrays.from_klines(klines), specs, cache)
+        assert again["ema(12)"] is first["ema(12)"]
+        assert cache.get_stats()["hits"] == 2
+
+        newer = compute_series("SHFE.cu2401", "1m", BarArrays.from_klines(klines[1:] + make_klines(1, seed=9)), specs, cache)
+        assert newer["ema(12)"] is not first["ema(12)"]
+        assert cache.get_stats()["misses"] == 4
+
+    def test_to_json_list(self):
+        assert to_json_list(np.array([np.nan, 1.23456, np.inf]), decimals=2) == [None, 1.23, None]
+
+
+class TestIndicatorBatch:
+    """多合约批量计算测试"""
+
+    @pytest.mark.asyncio
+    async def test_batch_returns_columns_per_symbol(self):
+        service = TechnicalAnalysisService()
+        service.is_initialized = True
+        market = AsyncMock()
+        market.get_klines.side_effect = lambda symbol, period, limit: (
+            make_klines(limit, seed=len(symbol)) if symbol != "SHFE.bad" else []
+        )
+
+        with patch("app.services.technical_analysis_service.market_data_service", market):
+            result = await service.get_indicator_batch(
+                ["SHFE.cu2401", "DCE.m2405", "SHFE.bad"],
+                [{"ema": 12}, {"macd": [12, 26, 9]}, {"atr": 14}, {"boll": [20, 2]}],
+                period="5m", limit=120, tail=30
+            )
+
+        assert result["indicators"] == ["ema(12)", "macd(12,26,9)", "atr(14)", "boll(20,2)"]
+        assert set(result["data"]) == {"SHFE.cu2401", "DCE.m2405"}
+        assert "SHFE.bad" in result["errors"]
+
+        columns = result["data"]["DCE.m2405"]
+        assert len(columns["datetime"]) == 30
+        assert set(columns["indicators"]["macd(12,26,9)"]) == {"macd", "signal", "histogram"}
+        assert all(len(values) == 30 for values in columns["indicators"]["boll(20,2)"].values())
+
+    @pytest.mark.asyncio
+    async def test_batch_rejects_unknown_indicator(self):
+        service = TechnicalAnalysisService()
+        with pytest.raises(ValidationError):
+            await service.get_indicator_batch(["SHFE.cu2401"], [{"supertrend": 10}])
@@ -0,0 +1,71 @@
+"""
+InfluxDB查询层测试用例
+"""
+import pytest
+import pandas as pd
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, Mock
+
+from app.core.influxdb import AsyncInfluxQuery, build_kline_query, build_quote_query
+
+
+class TestFluxBuilders:
+    """Flux查询构建测试"""
+
+    def test_kline_query_pivots_and_sorts_before_limit(self):
+        """服务端pivot，先排序再limit，参数通过绑定传入"""
+        query, params = build_kline_query(
+            "market-data", "SHFE.cu2401", "60s",
+            datetime(2024, 1, 2, tzinfo=timezone.utc), datetime(2024, 1, 3, tzinfo=timezone.utc), 500
+        )
+
+        assert query.index("pivot(") < query.index("sort(") < query.index("limit(n: 500)")
+        assert "SHFE.cu2401" not in query
+        assert params["symbol"] == "SHFE.cu2401"
+        assert params["period"] == "60s"
+        assert params["start"] == datetime(2024, 1, 2, tzinfo=timezone.utc)
+        assert params["stop"] > datetime(2024, 1, 3, tzinfo=timezone.utc)
+
+    def test_quote_query_without_limit(self):
+        """不传limit时不截断"""
+        query, params = build_quote_query("market-data", "SHFE.cu2401", datetime(2024, 1, 2))
+
+        assert "limit(" not in query
+        assert 'r._measurement == "quotes"' in query
+        assert params["start"].tzinfo is not None
+
+
+class TestAsyncInfluxQuery:
+    """异步查询测试"""
+
+    @pytest.mark.asyncio
+    async def test_stream_klines_in_batches(self):
+        """结果按批次返回，以时间为索引"""
+        times = pd.date_range("2024-01-02 09:00", periods=5, freq="1min", tz="UTC")
+        raw = pd.DataFrame({
+            "result": "_result", "table": 0, "_time": times, "symbol": "SHFE.cu2401",
+            "open": range(5), "high": range(5), "low": range(5), "close": range(5), "volume": range(5)
+        })
+
+        async def frames():
+            yield raw
+
+        query_api = Mock()
+        query_api.query_data_frame_stream = AsyncMock(return_value=frames())
+        client = Mock()
+        client.query_api.return_value = query_api
+
+        service = AsyncInfluxQuery()
+        service._client = client
+
+        batches = [
+            batch async for batch in service.stream_klines(
+                "SHFE.cu2401", "60s", datetime(2024, 1, 2), datetime(2024, 1, 3), batch_rows=2
+            )
+        ]
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert list(batches[0].columns) == ["open", "high", "low", "close", "volume"]
+        assert batches[0].index[0] == times[0]
+        assert "params.symbol" in query_api.query_data_frame_stream.call_args.args[0]
+        assert query_api.query_data_frame_stream.call_args.kwargs["params"]["symbol"] == "SHFE.cu2401"
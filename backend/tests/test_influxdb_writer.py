@@ -0,0 +1,112 @@
+"""
+InfluxDB批量写入器测试用例
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.influxdb_writer import InfluxBatchWriter, OverflowPolicy, to_line_protocol
+
+
+class TestLineProtocol:
+    """行协议生成测试"""
+
+    def test_escape_and_types(self):
+        """标签转义、整数后缀、字符串加引号，时间为纳秒"""
+        line = to_line_protocol(
+            "quotes",
+            {"symbol": "SHFE.cu 2401", "exchange": None},
+            {"last_price": 68000.5, "volume": 12, "status": 'a"b', "flag": True, "bid_price": None},
+            datetime(2024, 1, 2, 9, 0, 0, 123456, tzinfo=timezone.utc)
+        )
+        assert line == (
+            'quotes,symbol=SHFE.cu\\ 2401 last_price=68000.5,volume=12i,status="a\\"b",flag=true '
+            '1704186000123456000'
+        )
+
+    def test_no_fields(self):
+        """没有有效字段时不生成"""
+        assert to_line_protocol("quotes", {"symbol": "x"}, {"last_price": None}) is None
+        assert to_line_protocol("quotes", {"symbol": "x"}, {"last_price": float("nan")}) is None
+
+
+class TestInfluxBatchWriter:
+    """批量写入器测试"""
+
+    @pytest.mark.asyncio
+    async def test_flush_by_size_and_interval(self):
+        """攒满一批立即写出，不足一批时按间隔写出"""
+        bodies = []
+        writer = InfluxBatchWriter(write_func=bodies.append, batch_size=3, flush_interval=0.05)
+
+        for i in range(4):
+            await writer.write("klines", {"symbol": "SHFE.cu2401"}, {"close": float(i)}, i + 1)
+
+        await asyncio.sleep(0.2)
+        await writer.stop()
+
+        assert [body.count("\n") + 1 for body in bodies] == [3, 1]
+        metrics = writer.get_metrics()
+        assert metrics["points_written"] == 4
+        assert metrics["flush_count"] == 2
+        assert metrics["queue_depth"] == 0
+
+    @pytest.mark.asyncio
+    async def test_drop_oldest_when_full(self):
+        """队列满时丢弃最早的数据"""
+        writer = InfluxBatchWriter(write_func=lambda body: None, max_queue_size=2,
+                                   overflow_policy=OverflowPolicy.DROP_OLDEST)
+        await writer.start()
+        writer._task.cancel()
+
+        for i in range(3):
+            await writer.write("quotes", {"symbol": "x"}, {"last_price": float(i)}, i + 1)
+
+        assert writer.points_dropped == 1
+        assert [line.split()[1] for line in list(writer._queue._queue)] == ["last_price=1.0", "last_price=2.0"]
+
+    @pytest.mark.asyncio
+    async def test_write_nowait_before_start(self):
+        """启动前的同步写入在启动后进入队列"""
+        bodies = []
+        writer = InfluxBatchWriter(write_func=bodies.append, flush_interval=0.01)
+
+        assert writer.write_nowait("trades", {"symbol": "x"}, {"price": 1.0}, 1)
+        await writer.start()
+        await writer.stop()
+
+        assert len(bodies) == 1
+
+    @pytest.mark.asyncio
+    async def test_spool_and_replay(self, tmp_path):
+        """重试失败的批次落盘，恢复后补写"""
+        bodies = []
+        state = {"down": True}
+
+        def write_func(body):
+            if state["down"]:
+                raise ConnectionError("influxdb down")
+            bodies.append(body)
+
+        writer = InfluxBatchWriter(write_func=write_func, batch_size=2, flush_interval=0.01,
+                                   max_retries=1, retry_backoff=0.001, spool_dir=str(tmp_path))
+
+        await writer.write("quotes", {"symbol": "x"}, {"last_price": 1.0}, 1)
+        await writer.write("quotes", {"symbol": "x"}, {"last_price": 2.0}, 2)
+        await asyncio.sleep(0.1)
+
+        assert writer.failed_flushes == 1
+        assert writer.points_spooled == 2
+        assert len(os.listdir(tmp_path)) == 1
+
+        state["down"] = False
+        await writer.write("quotes", {"symbol": "x"}, {"last_price": 3.0}, 3)
+        await asyncio.sleep(0.1)
+        await writer.stop()
+
+        assert os.listdir(tmp_path) == []
+        assert writer.points_written == 3
+        assert writer.points_spooled == 0
+        assert sum(body.count("\n") + 1 for body in bodies) == 3
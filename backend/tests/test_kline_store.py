@@ -0,0 +1,167 @@
+"""
+本地K线存储测试用例
+"""
+import time
+
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timezone
+
+pytest.importorskip("pyarrow")
+
+from app.services.kline_store import KlineStore, KLINE_FIELDS
+
+
+def make_bars(start, periods, freq="1min"):
+    index = pd.date_range(start, periods=periods, freq=freq)
+    close = 70000 + np.arange(periods, dtype=float)
+    return pd.DataFrame({
+        'open': close - 1,
+        'high': close + 5,
+        'low': close - 5,
+        'close': close,
+        'volume': np.full(periods, 10.0)
+    }, index=index)
+
+
+@pytest.fixture
+def shanghai_tz(monkeypatch):
+    """在非UTC时区（Asia/Shanghai）下运行"""
+    monkeypatch.setenv("TZ", "Asia/Shanghai")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+class TestKlineStore:
+    """K线存储测试"""
+
+    def setup_method(self):
+        import tempfile
+        self.root = tempfile.mkdtemp(prefix="kline_store_test_")
+        self.store = KlineStore(self.root)
+
+    def teardown_method(self):
+        self.store.clear()
+
+    def test_round_trip_across_partitions(self):
+        """跨月写入后按时间范围读取"""
+        bars = make_bars("2024-01-31 23:00", 180)
+        assert self.store.write("SHFE.cu2401", 60, bars) == 180
+
+        df = self.store.read("SHFE.cu2401", 60)
+        assert list(df.columns) == list(KLINE_FIELDS)
+        assert df.index.equals(bars.index.as_unit('ns'))
+        np.testing.assert_array_equal(df['close'].to_numpy(), bars['close'].to_numpy())
+        assert (df['open_interest'] == 0).all()
+
+        window = self.store.read(
+            "SHFE.cu2401", 60,
+            datetime(2024, 1, 31, 23, 30, tzinfo=timezone.utc), datetime(2024, 2, 1, 0, 30, tzinfo=timezone.utc)
+        )
+        assert len(window) == 61
+        assert window.index[0] == pd.Timestamp("2024-01-31 23:30")
+        assert window.index[-1] == pd.Timestamp("2024-02-01 00:30")
+
+    def test_incremental_write_overwrites_duplicates(self):
+        """增量写入去重并保持有序"""
+        self.store.write("SHFE.cu2401", 60, make_bars("2024-01-02 09:00", 60))
+        update = make_bars("2024-01-02 09:30", 60)
+        update['close'] += 1000
+        self.store.write("SHFE.cu2401", 60, update)
+
+        df = self.store.read("SHFE.cu2401", 60)
+        assert len(df) == 90
+        assert df.index.is_monotonic_increasing
+        assert df.loc["2024-01-02 09:30", 'close'] == update['close'].iloc[0]
+
+    def test_manifest_and_read_many(self):
+        """同步清单和多合约读取"""
+        self.store.write("SHFE.cu2401", 60, make_bars("2024-01-02 09:00", 10))
+        self.store.mark_synced("SHFE.cu2401", 60, [date(2024, 1, 2)])
+        self.store.mark_synced("SHFE.cu2401", 60, [date(2024, 1, 3)])
+
+        assert self.store.synced_days("SHFE.cu2401", 60) == {date(2024, 1, 2), date(2024, 1, 3)}
+        assert self.store.synced_days("SHFE.al2401", 60) == set()
+
+        data = self.store.read_many(["SHFE.cu2401", "SHFE.al2401"], 60)
+        assert list(data.keys()) == ["SHFE.cu2401"]
+
+    def test_local_bounds_in_non_utc_zone(self, shanghai_tz):
+        """索引为UTC，无时区的查询时间按本地时间处理"""
+        bars = make_bars(pd.Timestamp("2024-01-02 09:00", tz="Asia/Shanghai"), 120)
+        self.store.write("SHFE.cu2401", 60, bars)
+
+        df = self.store.read("SHFE.cu2401", 60, datetime(2024, 1, 2, 9), datetime(2024, 1, 2, 10, 59))
+        assert len(df) == 120
+        assert df.index[0] == pd.Timestamp("2024-01-02 01:00")
+
+
+class TestHistoryServiceKlineStore:
+    """历史数据服务与本地存储的同步测试"""
+
+    def setup_method(self):
+        import tempfile
+        from app.services.history_service import HistoryService
+        self.service = HistoryService()
+        self.service.kline_store = KlineStore(tempfile.mkdtemp(prefix="kline_store_test_"))
+
+    def teardown_method(self):
+        self.service.kline_store.clear()
+
+    @pytest.mark.asyncio
+    async def test_sync_fills_missing_days_once(self):
+        """缺失的交易日只从InfluxDB拉取一次"""
+        from unittest.mock import AsyncMock, patch
+
+        bars = make_bars("2024-01-02 09:00", 30)
+        # InfluxDB服务端pivot后每行一根K线，时间为UTC
+        pivoted = bars.set_index(bars.index.tz_localize('UTC'))
+
+        with patch("app.services.history_service.influx_query") as influx:
+            influx.available = True
+            influx.query_klines_frame = AsyncMock(return_value=pivoted)
+            df = await self.service.get_klines_frame(
+                "SHFE.cu2401", 60,
+                datetime(2024, 1, 2, tzinfo=timezone.utc), datetime(2024, 1, 2, 23, 59, tzinfo=timezone.utc)
+            )
+            assert influx.query_klines_frame.await_count == 1
+
+            again = await self.service.get_klines_frame(
+                "SHFE.cu2401", 60,
+                datetime(2024, 1, 2, 9, 10, tzinfo=timezone.utc), datetime(2024, 1, 2, 9, 19, tzinfo=timezone.utc)
+            )
+            assert influx.query_klines_frame.await_count == 1
+
+        assert len(df) == 30
+        np.testing.assert_array_equal(df['close'].to_numpy(), bars['close'].to_numpy())
+        assert len(again) == 10
+        assert again['close'].iloc[0] == bars['close'].iloc[10]
+
+    @pytest.mark.asyncio
+    async def test_sync_in_non_utc_zone(self, shanghai_tz):
+        """非UTC时区下按UTC日期记录同步，读取和输出的时间保留时区"""
+        from unittest.mock import AsyncMock, patch
+
+        bars = make_bars(pd.Timestamp("2024-01-02 09:00", tz="Asia/Shanghai"), 120)
+        pivoted = bars.set_index(bars.index.tz_convert('UTC'))
+
+        with patch("app.services.history_service.influx_query") as influx:
+            influx.available = True
+            influx.query_klines_frame = AsyncMock(return_value=pivoted)
+            df = await self.service.get_klines_frame(
+                "SHFE.cu2401", 60, datetime(2024, 1, 2), datetime(2024, 1, 2, 23, 59)
+            )
+            again = await self.service.get_klines_frame(
+                "SHFE.cu2401", 60, datetime(2024, 1, 2, 9, 10), datetime(2024, 1, 2, 9, 19)
+            )
+            assert influx.query_klines_frame.await_count == 1
+
+        assert len(df) == 120
+        assert len(again) == 10
+        assert self.service.kline_store.synced_days("SHFE.cu2401", 60) == {date(2024, 1, 2)}
+        klines = self.service._frame_to_klines(again)
+        assert klines[0].datetime == "2024-01-02T01:10:00+00:00"
+        assert datetime.fromisoformat(klines[0].datetime) == datetime(2024, 1, 2, 9, 10).astimezone()
@@ -0,0 +1,81 @@
+"""
+事件循环监控测试用例：调度延迟、阻塞调用点采集、Prometheus指标
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.core.loop_monitor import UNKNOWN_SITE, LoopMonitor
+
+
+def blocking_query():
+    time.sleep(0.12)
+
+
+async def handler():
+    blocking_query()
+
+
+async def run_monitored(monitor, workload):
+    await monitor.start()
+    await asyncio.sleep(0.03)
+    try:
+        await workload()
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+
+class TestLoopMonitor:
+    """事件循环监控测试"""
+
+    @pytest.mark.asyncio
+    async def test_blocking_call_site_is_captured(self):
+        monitor = LoopMonitor(interval=0.01, threshold=0.04)
+
+        async def workload():
+            for _ in range(3):
+                await handler()
+                await asyncio.sleep(0.03)
+
+        await run_monitored(monitor, workload)
+
+        stats = monitor.get_stats()
+        top = stats["blocking_sites"][0]
+        assert stats["blocked_total"] == 3 and not stats["running"]
+        assert top["count"] == 3 and top["total_ms"] >= 3 * 100
+        assert top["site"].endswith("blocking_query")
+        assert "tests/test_loop_monitor.py" in top["site"]
+        assert any(line.endswith(" handler") for line in top["stack"])
+        assert stats["lag"]["max_ms"] >= 100
+
+    @pytest.mark.asyncio
+    async def test_short_stalls_are_not_reported(self):
+        monitor = LoopMonitor(interval=0.01, threshold=0.05)
+
+        async def workload():
+            for _ in range(5):
+                time.sleep(0.005)
+                await asyncio.sleep(0.01)
+
+        await run_monitored(monitor, workload)
+
+        assert monitor.blocked_total == 0 and monitor.sites == {}
+        assert monitor.lag.count > 0
+
+    def test_prometheus_exposition(self):
+        monitor = LoopMonitor(interval=0.01, threshold=0.05, top_n=1)
+        for lag in (0.002, 0.02, 0.3):
+            monitor._on_beat(lag)
+        monitor._record_site('app/x.py:1 "quoted"', [], 0.5)
+
+        text = monitor.render_prometheus()
+
+        assert 'event_loop_lag_seconds_bucket{le="0.005"} 1' in text
+        assert 'event_loop_lag_seconds_bucket{le="0.025"} 2' in text
+        assert 'event_loop_lag_seconds_bucket{le="+Inf"} 3' in text
+        assert "event_loop_lag_seconds_count 3" in text
+        assert "event_loop_blocked_total 1" in text
+        assert 'event_loop_blocking_seconds_total{site="app/x.py:1 \\"quoted\\""} 0.500000' in text
+        assert UNKNOWN_SITE not in text
@@ -0,0 +1,117 @@
+"""
+模拟撮合引擎测试用例
+"""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.adapters.trading_system_adapter import MockTradingSystemAdapter
+from app.models.order import OrderSide, OrderType
+from app.services.backtest_engine import BacktestTradeExecutor, OrderStatus
+from app.services.backtest_engine import OrderSide as BacktestSide, OrderType as BacktestType
+from app.services.matching_engine import MatchingEngine, depth_liquidity
+
+
+def bar(open_, high, low, volume=None):
+    return {"open": open_, "high": high, "low": low, "close": open_, "volume": volume}
+
+
+class TestMatchingEngine:
+    """撮合引擎测试"""
+
+    def test_only_crossed_orders_match_in_price_time_priority(self):
+        engine = MatchingEngine(participation_rate=1.0)
+        engine.add("b1", "cu", "buy", "limit", 5, price=100)
+        engine.add("b2", "cu", "buy", "limit", 5, price=101)
+        engine.add("b3", "cu", "buy", "limit", 5, price=99)
+        engine.add("s1", "cu", "sell", "limit", 5, price=105)
+
+        fills = engine.on_bar("cu", bar(102, 103, 99.5))
+
+        assert [(f.order.order_id, f.price) for f in fills] == [("b2", 101.0), ("b1", 100.0)]
+        assert {o.order_id for o in engine.orders()} == {"b3", "s1"}
+
+    def test_participation_limits_fills_and_partial_orders_rest(self):
+        engine = MatchingEngine(participation_rate=0.1)
+        engine.add("b1", "cu", "buy", "limit", 30, price=100)
+
+        first = engine.on_bar("cu", bar(101, 101, 99, volume=200))
+        second = engine.on_bar("cu", bar(101, 101, 99, volume=200))
+
+        assert [f.quantity for f in first] == [20.0]
+        assert [f.quantity for f in second] == [10.0] and engine.get("b1") is None
+
+    def test_queue_position_only_applies_when_price_is_touched(self):
+        engine = MatchingEngine(participation_rate=1.0)
+        engine.on_depth("cu", {"bid_price1": 100, "bid_volume1": 50, "ask_price1": 101, "ask_volume1": 10})
+        order = engine.add("b1", "cu", "buy", "limit", 10, price=100)
+        assert order.queue_ahead == 50
+
+        # 只触及限价：先消耗前面的40手队列
+        assert engine.on_bar("cu", bar(101, 101, 100, volume=40)) == []
+        assert order.queue_ahead == 10
+        fills = engine.on_bar("cu", bar(101, 101, 100, volume=15))
+        assert [f.quantity for f in fills] == [5.0]
+
+        # 价格穿越限价：不再排队
+        fills = engine.on_bar("cu", bar(101, 101, 99, volume=100))
+        assert [f.quantity for f in fills] == [5.0] and order.is_filled
+
+    def test_stops_trigger_and_cancel_is_lazy(self):
+        engine = MatchingEngine(participation_rate=1.0, slippage=0.01)
+        engine.add("stop", "cu", "sell", "stop", 2, stop_price=95)
+        engine.add("stop_limit", "cu", "buy", "stop_limit", 2, price=106, stop_price=105)
+        engine.add("gone", "cu", "buy", "limit", 1, price=200)
+        engine.cancel("gone")
+
+        assert engine.on_bar("cu", bar(100, 104, 96)) == []
+        fills = engine.on_bar("cu", bar(100, 105, 94))
+
+        assert [(f.order.order_id, f.price) for f in fills] == [("stop", pytest.approx(94.05)), ("stop_limit", 106.0)]
+        assert len(engine) == 0
+
+    def test_depth_sweeps_displayed_liquidity(self):
+        engine = MatchingEngine()
+        engine.add("m", "cu", "buy", "market", 15)
+        engine.add("l", "cu", "sell", "limit", 4, price=99)
+        quote = {"last_price": 100, "ask_price1": 100, "ask_volume1": 10, "ask_price2": 101, "ask_volume2": 10,
+                 "bid_price1": 99.5, "bid_volume1": 3, "bid_price2": 99, "bid_volume2": 5}
+
+        fills = engine.on_depth("cu", quote)
+
+        assert [(f.order.order_id, f.quantity, f.price) for f in fills] == [
+            ("m", 10.0, 100.0), ("m", 5.0, 101.0), ("l", 3.0, 99.5), ("l", 1.0, 99.0)
+        ]
+        assert depth_liquidity(quote, "buy", 100) == 10 and depth_liquidity(None, "buy") is None
+
+
+class TestMatchingConsumers:
+    """回测执行器与模拟适配器接入撮合引擎"""
+
+    def test_backtest_executor_records_partial_fills(self):
+        executor = BacktestTradeExecutor(participation_rate=0.1)
+        order = executor.create_order("cu", BacktestSide.SELL, BacktestType.LIMIT, 30, price=100)
+
+        fills = executor.process_orders(datetime(2024, 1, 2), {"cu": bar(99, 101, 98, volume=200)})
+        assert [f.filled_quantity for f in fills] == [20.0]
+        assert order.status == OrderStatus.PARTIALLY_FILLED and executor.pending_orders == [order]
+
+        fills = executor.process_orders(datetime(2024, 1, 2), {"cu": bar(99, 101, 98, volume=200)})
+        assert [f.filled_quantity for f in fills] == [10.0]
+        assert order.status == OrderStatus.FILLED and order.filled_quantity == 30
+        assert executor.pending_orders == [] and len(executor.filled_orders) == 2
+
+    def test_mock_adapter_fills_resting_orders(self):
+        adapter = MockTradingSystemAdapter({"participation_rate": 1.0})
+        asyncio.run(adapter.connect())
+        order = SimpleNamespace(id=1, symbol="AAPL", side=OrderSide.BUY, order_type=OrderType.LIMIT,
+                                quantity=10, price=1000, stop_price=None)
+
+        result = asyncio.run(adapter.submit_order(order))
+        asyncio.run(adapter.get_market_data("AAPL"))
+
+        info = asyncio.run(adapter.get_order_status(result.external_order_id))
+        assert info["status"] == "filled" and info["avg_fill_price"] == 1000
+        assert asyncio.run(adapter.get_positions())[0]["quantity"] == 10
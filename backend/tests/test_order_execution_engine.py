@@ -0,0 +1,165 @@
+"""
+订单执行引擎测试用例
+"""
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.order_execution_engine import (
+    TRIGGER_DOWN, TRIGGER_UP, OrderExecutionEngine, PriceTriggerIndex
+)
+from app.models.order import OrderPriority, OrderSide, OrderStatus, OrderType
+from app.services.quote_bus import QuoteBus
+from app.services.tqsdk_adapter import tqsdk_adapter
+
+
+def make_order(order_id, side=OrderSide.BUY, order_type=OrderType.LIMIT, price=None, stop_price=None,
+               priority=OrderPriority.NORMAL, symbol="SHFE.cu2401"):
+    return SimpleNamespace(
+        id=order_id, symbol=symbol, side=side, order_type=order_type, priority=priority,
+        price=None if price is None else Decimal(str(price)),
+        stop_price=None if stop_price is None else Decimal(str(stop_price)),
+        quantity=Decimal("1"), filled_quantity=Decimal("0"), remaining_quantity=Decimal("1"),
+        status=OrderStatus.ACCEPTED, is_active=True
+    )
+
+
+def adapter_tick(last_price, ask_price, bid_price=None, volume=10):
+    """按行情适配器的输出格式构造行情"""
+    quote = SimpleNamespace(
+        last_price=last_price, ask_price1=ask_price, ask_volume1=volume,
+        bid_price1=bid_price or last_price - 10, bid_volume1=volume
+    )
+    return tqsdk_adapter._quote_to_dict("SHFE.cu2401", quote)
+
+
+def make_engine(workers=2):
+    engine = OrderExecutionEngine(workers=workers)
+    engine.quote_bus = QuoteBus()
+    fills = []
+
+    async def execute_fill(order, price, triggered_at=None):
+        fills.append((order.id, price))
+        if triggered_at is not None:
+            engine.trigger_to_fill.record(0.001)
+
+    async def update_status(order, status):
+        order.status = status
+
+    engine._execute_fill = execute_fill
+    engine._update_order_status = update_status
+    return engine, fills
+
+
+class TestPriceTriggerIndex:
+    """价格触发索引测试"""
+
+    def test_pops_only_crossed_orders(self):
+        index = PriceTriggerIndex()
+        buy_limit = make_order(1, price=100)
+        buy_stop = make_order(2, order_type=OrderType.STOP, stop_price=105)
+        sell_stop = make_order(3, side=OrderSide.SELL, order_type=OrderType.STOP, stop_price=95)
+        far = make_order(4, price=90)
+        index.add(buy_limit, TRIGGER_DOWN, 100)
+        index.add(buy_stop, TRIGGER_UP, 105)
+        index.add(sell_stop, TRIGGER_DOWN, 95)
+        index.add(far, TRIGGER_DOWN, 90)
+
+        assert index.pop_triggered("SHFE.cu2401", bid=99, ask=101) == []
+        assert index.pop_triggered("SHFE.cu2401", bid=94, ask=100) == [buy_limit, sell_stop]
+        assert index.pop_triggered("SHFE.cu2401", bid=104, ask=105) == [buy_stop]
+        assert len(index) == 1 and index.has_symbol("SHFE.cu2401")
+
+        index.remove(far.id)
+        assert index.pop_triggered("SHFE.cu2401", bid=80, ask=80) == []
+        assert not index.has_symbol("SHFE.cu2401")
+
+    def test_re_adding_replaces_threshold(self):
+        index = PriceTriggerIndex()
+        order = make_order(1, price=100)
+        index.add(order, TRIGGER_DOWN, 100)
+        index.add(order, TRIGGER_DOWN, 90)
+
+        assert index.pop_triggered("SHFE.cu2401", bid=95, ask=95) == []
+        assert index.pop_triggered("SHFE.cu2401", bid=90, ask=90) == [order] and len(index) == 0
+
+
+class TestOrderExecutionEngine:
+    """事件驱动执行测试"""
+
+    @pytest.mark.asyncio
+    async def test_resting_limit_is_woken_by_crossing_tick(self):
+        engine, fills = make_engine()
+        engine.quote_bus.publish("SHFE.cu2401", adapter_tick(70100.0, 70110.0))
+        order = make_order(1, price=70000)
+
+        await engine.submit_order(order)
+        await engine.execution_queue.join()
+        assert fills == [] and 1 in engine.trigger_index
+
+        engine.quote_bus.publish("SHFE.cu2401", adapter_tick(70050.0, 70060.0))
+        await asyncio.sleep(0.01)
+        assert fills == []
+
+        engine.quote_bus.publish("SHFE.cu2401", adapter_tick(69990.0, 69995.0))
+        await asyncio.sleep(0.01)
+        await engine.execution_queue.join()
+
+        assert fills == [(1, Decimal("69995.0"))]
+        stats = engine.get_execution_stats()
+        assert stats["resting_orders"] == 0 and stats["trigger_to_fill_latency"]["count"] == 1
+        assert engine.quote_bus.subscribed_symbols() == []
+        await engine.stop_execution_workers()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_resting_order_is_not_executed(self):
+        engine, fills = make_engine()
+        engine.quote_bus.publish("SHFE.cu2401", {"last_price": 70100.0})
+        order = make_order(1, side=OrderSide.SELL, order_type=OrderType.STOP, stop_price=70000)
+
+        await engine.submit_order(order)
+        await engine.execution_queue.join()
+        await engine.cancel_order(order)
+        order.is_active = False
+
+        engine.quote_bus.publish("SHFE.cu2401", {"last_price": 69900.0})
+        await asyncio.sleep(0.01)
+        assert fills == [] and len(engine.trigger_index) == 0
+        await engine.stop_execution_workers()
+
+    @pytest.mark.asyncio
+    async def test_priority_lanes(self):
+        engine, fills = make_engine(workers=1)
+        engine.quote_bus.publish("SHFE.cu2401", {"last_price": 70000.0})
+        orders = [
+            make_order(1, order_type=OrderType.MARKET, priority=OrderPriority.LOW),
+            make_order(2, order_type=OrderType.MARKET, priority=OrderPriority.NORMAL),
+            make_order(3, order_type=OrderType.MARKET, priority=OrderPriority.URGENT),
+        ]
+
+        for order in orders:
+            await engine.submit_order(order)
+        assert engine.get_execution_stats()["lane_depth"] == {"urgent": 1, "high": 0, "normal": 1, "low": 1}
+        await engine.execution_queue.join()
+
+        assert [order_id for order_id, _ in fills] == [3, 2, 1]
+        assert engine.get_execution_stats()["queue_depth"]["count"] == 3
+        await engine.stop_execution_workers()
+
+    @pytest.mark.asyncio
+    async def test_fill_quantity_is_sized_by_adapter_depth(self):
+        engine, _ = make_engine()
+        quote = tqsdk_adapter._get_mock_quote("SHFE.cu2401")
+        engine.quote_bus.publish("SHFE.cu2401", quote)
+        ask_volume = sum(quote[f"ask_volume{level}"] for level in range(1, 6))
+
+        market = make_order(1, order_type=OrderType.MARKET)
+        assert await engine._calculate_fill_quantity(market, Decimal("100000")) == Decimal(str(float(ask_volume)))
+
+        # 限价只够得着一档时按一档挂量成交
+        limit = make_order(2, price=quote["ask_price1"])
+        assert await engine._calculate_fill_quantity(limit, Decimal("100000")) == \
+            Decimal(str(float(quote["ask_volume1"])))
+        await engine.stop_execution_workers()
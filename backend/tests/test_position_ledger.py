@@ -0,0 +1,143 @@
+"""
+持仓账本测试用例
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.models.order import Order, OrderFill, OrderSide, OrderType
+from app.models.position import Position, PositionCheckpoint, PositionStatus, PositionType
+from app.services.position_ledger import PositionLedger
+from app.services.position_service import PositionCalculationService
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    for model in (Order, OrderFill, Position, PositionCheckpoint):
+        model.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_fills(db, trades, symbol="SHFE.cu2401", user_id=1, strategy_id=None, created_at=None):
+    """trades: [(side, quantity, price), ...]，每笔成交对应一个订单"""
+    start = db.execute(select(Order.id).order_by(Order.id.desc())).scalar() or 0
+    created_at = created_at or datetime(2024, 1, 1)
+    db.execute(insert(Order.__table__), [
+        {"id": start + i + 1, "uuid": f"o{start + i}", "symbol": symbol, "user_id": user_id,
+         "strategy_id": strategy_id, "order_type": OrderType.MARKET, "side": side, "quantity": Decimal(quantity)}
+        for i, (side, quantity, _) in enumerate(trades)
+    ])
+    db.execute(insert(OrderFill.__table__), [
+        {"id": start + i + 1, "uuid": f"f{start + i}", "order_id": start + i + 1, "quantity": Decimal(quantity),
+         "price": Decimal(price), "value": Decimal(quantity) * Decimal(price), "commission": Decimal("1"),
+         "fill_time": created_at, "created_at": created_at}
+        for i, (side, quantity, price) in enumerate(trades)
+    ])
+    db.commit()
+
+
+class TestPositionLedger:
+    """增量持仓账本测试"""
+
+    def test_replay_matches_add_trade_rules(self, db):
+        add_fills(db, [
+            (OrderSide.BUY, "2", "100"),
+            (OrderSide.BUY, "2", "110"),
+            (OrderSide.SELL, "1", "120"),
+        ])
+        add_fills(db, [(OrderSide.SELL, "1", "3000")], symbol="DCE.m2405", strategy_id=7)
+
+        states = PositionLedger(db).rebuild_many(1)
+        long = states[("SHFE.cu2401", None, None)]
+        short = states[("DCE.m2405", 7, None)]
+
+        # 均价含手续费：(200 + 1 + 220 + 1) / 4
+        assert long.position_type == PositionType.LONG and long.quantity == Decimal("3")
+        assert long.average_cost == Decimal("105.5")
+        assert long.realized_pnl == Decimal("13.5")
+        assert long.total_cost == Decimal("316.5")
+        assert short.position_type == PositionType.SHORT and short.quantity == Decimal("1")
+        assert long.last_fill_id == 3 and long.fill_count == 3
+
+    def test_rebuild_starts_from_checkpoint(self, db):
+        add_fills(db, [(OrderSide.BUY, "1", str(100 + i)) for i in range(10)])
+        ledger = PositionLedger(db, checkpoint_interval=5, settle_seconds=0)
+
+        full = ledger.rebuild(1, "SHFE.cu2401")
+        db.commit()
+        checkpoint = db.execute(select(PositionCheckpoint)).scalar_one()
+        assert checkpoint.last_fill_id == 10 and checkpoint.quantity == Decimal("10")
+
+        add_fills(db, [(OrderSide.SELL, "4", "120")])
+        loaded = []
+        original = ledger._load_fills
+        ledger._load_fills = lambda *args: loaded.extend(original(*args)) or loaded
+
+        state = ledger.rebuild(1, "SHFE.cu2401")
+
+        # 只回放检查点之后的一笔成交
+        assert [fill.id for fill in loaded] == [11]
+        assert state.quantity == Decimal("6") and state.average_cost == full.average_cost
+        assert state.realized_pnl == 4 * (Decimal("120") - full.average_cost) - 1
+
+    def test_rebuild_all_loads_only_new_fills(self, db):
+        add_fills(db, [(OrderSide.BUY, "1", "3000")], symbol="DCE.m2405")
+        add_fills(db, [(OrderSide.BUY, "1", str(100 + i)) for i in range(5)])
+        add_fills(db, [(OrderSide.BUY, "1", "3000")], symbol="DCE.m2405", strategy_id=7)
+        ledger = PositionLedger(db, checkpoint_interval=5, settle_seconds=0)
+        ledger.rebuild_many(1)
+        db.commit()
+        assert len(db.execute(select(PositionCheckpoint)).scalars().all()) == 1
+
+        add_fills(db, [(OrderSide.SELL, "2", "120")])
+        loaded = []
+        original = ledger._load_fills
+
+        def load_fills(*args):
+            rows = original(*args)
+            loaded.extend(rows)
+            return rows
+
+        ledger._load_fills = load_fills
+        states = ledger.rebuild_many(1)
+
+        # 有检查点的持仓只回放新成交，没有检查点的持仓从头回放
+        assert [fill.id for fill in loaded] == [1, 7, 8]
+        assert states[("SHFE.cu2401", None, None)].quantity == Decimal("3")
+        assert states[("DCE.m2405", None, None)].quantity == Decimal("1")
+        assert states[("DCE.m2405", 7, None)].quantity == Decimal("1")
+
+    def test_unsettled_fills_stay_out_of_checkpoint(self, db):
+        add_fills(db, [(OrderSide.BUY, "1", "100")] * 3, created_at=datetime(2024, 1, 1, 9))
+        add_fills(db, [(OrderSide.BUY, "1", "100")] * 3, created_at=datetime(2024, 1, 1, 9) + timedelta(seconds=10))
+
+        state = PositionLedger(db, checkpoint_interval=2, settle_seconds=60).rebuild(1, "SHFE.cu2401")
+        db.commit()
+
+        assert state.quantity == Decimal("6")
+        assert db.execute(select(PositionCheckpoint)).scalars().all() == []
+
+    def test_service_rebuild_repair_and_consistency(self, db):
+        add_fills(db, [(OrderSide.BUY, "3", "100"), (OrderSide.SELL, "1", "110")])
+        service = PositionCalculationService(db)
+        service.ledger.checkpoint_interval = 1
+
+        position = service.calculate_position_from_trades(1, "SHFE.cu2401")
+        assert position.quantity == Decimal("2") and position.status == PositionStatus.OPEN
+        assert service.check_position_consistency(1)["is_consistent"]
+
+        position.quantity = Decimal("5")
+        db.commit()
+        assert service.check_position_consistency(1)["inconsistencies_found"] == 1
+
+        add_fills(db, [(OrderSide.SELL, "2", "90")])
+        assert service.repair_position_data(1)["repaired_positions"] == 1
+        db.refresh(position)
+        assert position.quantity == Decimal("0") and position.status == PositionStatus.CLOSED
+        assert service.check_position_consistency(1)["is_consistent"]
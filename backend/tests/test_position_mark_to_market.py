@@ -0,0 +1,104 @@
+"""
+持仓批量盯市测试用例
+"""
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from app.models.position import Position, PositionStatus, PositionType
+from app.services.position_service import PositionCalculationService
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Position.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_positions(db, rows):
+    defaults = dict(status=PositionStatus.OPEN, realized_pnl=Decimal("0"), max_profit=Decimal("0"),
+                    max_drawdown=Decimal("0"), user_id=1, current_price=None, unrealized_pnl=Decimal("0"),
+                    stop_loss_price=None)
+    db.execute(insert(Position.__table__), [
+        {**defaults, "id": i + 1, "uuid": f"p{i}", **row} for i, row in enumerate(rows)
+    ])
+    db.commit()
+
+
+def load(db):
+    table = Position.__table__
+    return {row.id: row for row in db.execute(select(table)).all()}
+
+
+class TestBulkMarkToMarket:
+    """集合式盯市测试"""
+
+    def test_updates_all_and_returns_material_changes(self, db):
+        add_positions(db, [
+            dict(symbol="SHFE.cu2401", position_type=PositionType.LONG, quantity=Decimal("10"),
+                 average_cost=Decimal("70000"), current_price=Decimal("70000"), unrealized_pnl=Decimal("0")),
+            dict(symbol="SHFE.cu2401", position_type=PositionType.SHORT, quantity=Decimal("2"),
+                 average_cost=Decimal("71000"), current_price=Decimal("70000"), unrealized_pnl=Decimal("1900"),
+                 realized_pnl=Decimal("50")),
+            dict(symbol="DCE.m2405", position_type=PositionType.LONG, quantity=Decimal("5"),
+                 average_cost=Decimal("3000"), user_id=2),
+            dict(symbol="DCE.m2405", position_type=PositionType.LONG, quantity=Decimal("1"),
+                 average_cost=Decimal("3000"), status=PositionStatus.CLOSED),
+        ])
+        service = PositionCalculationService(db)
+
+        marked = service.batch_update_market_data(
+            {"SHFE.cu2401": Decimal("70100"), "DCE.m2405": Decimal("3010")},
+            min_pnl_change=1.0, min_pnl_change_ratio=0.001
+        )
+        rows = load(db)
+
+        # 多头 +1000（阈值700），首次定价的持仓也推送；空头 -100 低于阈值142
+        assert sorted(p.id for p in marked) == [1, 3]
+        assert rows[1].unrealized_pnl == Decimal("1000") and rows[1].market_value == Decimal("701000")
+        assert rows[2].unrealized_pnl == Decimal("1800") and rows[2].total_pnl == Decimal("1850")
+        assert rows[2].current_price == Decimal("70100")
+        assert rows[3].unrealized_pnl == Decimal("50") and rows[3].max_profit == Decimal("0")
+        assert rows[4].current_price is None
+
+        first = next(p for p in marked if p.id == 1)
+        assert first.previous_pnl == Decimal("0") and first.unrealized_pnl == Decimal("1000")
+        assert first.to_dict()["position_type"] == PositionType.LONG.value
+        assert rows[1].max_profit == Decimal("1000")
+
+    def test_small_moves_and_stop_triggers(self, db):
+        add_positions(db, [
+            dict(symbol="SHFE.cu2401", position_type=PositionType.LONG, quantity=Decimal("1"),
+                 average_cost=Decimal("70000"), current_price=Decimal("70000"), unrealized_pnl=Decimal("0"),
+                 stop_loss_price=Decimal("69000")),
+        ])
+        service = PositionCalculationService(db)
+
+        assert service.batch_update_market_data({"SHFE.cu2401": Decimal("70010")}) == []
+        assert load(db)[1].unrealized_pnl == Decimal("10")
+
+        # 变化低于阈值但触发止损
+        db.execute(Position.__table__.update().values(stop_loss_price=Decimal("70020")))
+        db.commit()
+        marked = service.batch_update_market_data({"SHFE.cu2401": Decimal("70015")})
+        assert [p.id for p in marked] == [1] and marked[0].stop_loss_triggered
+
+    def test_postgresql_uses_single_update_from_values(self):
+        db = MagicMock()
+        db.get_bind.return_value.dialect.name = "postgresql"
+        db.execute.return_value.all.return_value = []
+
+        PositionCalculationService(db).batch_update_market_data({"SHFE.cu2401": Decimal("70000"), "DCE.m2405": 3000})
+
+        assert db.execute.call_count == 1
+        sql = str(db.execute.call_args[0][0].compile(dialect=postgresql.dialect()))
+        assert "UPDATE positions SET" in sql
+        assert "FROM (VALUES" in sql and "AS prices (symbol, price)" in sql
+        assert "RETURNING" in sql and db.commit.called
@@ -0,0 +1,181 @@
+"""
+行情总线测试用例
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.services.quote_bus import QuoteBus
+
+
+def quote(symbol, price):
+    return {"symbol": symbol, "last_price": price, "pre_close": 68000.0, "volume": 100}
+
+
+class FakeSource:
+    """记录上游订阅的行情源"""
+
+    def __init__(self):
+        self.callbacks = []
+        self.subscribe_quotes = AsyncMock()
+        self.unsubscribe_quotes = AsyncMock()
+
+    def add_quote_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def remove_quote_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def emit(self, symbol, price, received_at=None):
+        for callback in self.callbacks:
+            callback(symbol, quote(symbol, price), received_at)
+
+
+class TestQuoteBus:
+    """行情总线测试"""
+
+    @pytest.mark.asyncio
+    async def test_dispatch_to_callbacks_and_iterators(self):
+        """同一笔行情分发给回调和迭代器"""
+        bus = QuoteBus()
+        received = []
+
+        async def on_quote(tick):
+            received.append((tick.symbol, tick.last_price))
+
+        callback = await bus.subscribe(["SHFE.cu2401"], on_quote)
+        iterator = await bus.subscribe(["SHFE.cu2401", "SHFE.rb2401"])
+
+        assert bus.publish("SHFE.cu2401", quote("SHFE.cu2401", 68010.0)) == 2
+        bus.publish("SHFE.rb2401", quote("SHFE.rb2401", 3500.0))
+        bus.publish("SHFE.au2401", quote("SHFE.au2401", 480.0))
+        await asyncio.sleep(0.01)
+
+        assert received == [("SHFE.cu2401", 68010.0)]
+        assert [(await iterator.next_tick()).symbol for _ in range(2)] == ["SHFE.cu2401", "SHFE.rb2401"]
+        assert bus.latest("SHFE.au2401").last_price == 480.0
+
+        await bus.unsubscribe(iterator)
+        assert [tick async for tick in iterator] == []
+        await bus.unsubscribe(callback)
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_keeps_latest_per_symbol(self):
+        """慢消费者每个合约只处理最新一笔，不影响其他消费者"""
+        bus = QuoteBus()
+        slow, fast = [], []
+
+        async def on_slow(tick):
+            await asyncio.sleep(0.02)
+            slow.append(tick.last_price)
+
+        subscriptions = [
+            await bus.subscribe(["SHFE.cu2401"], on_slow),
+            await bus.subscribe(["SHFE.cu2401"], lambda tick: fast.append(tick.last_price)),
+        ]
+
+        for i in range(10):
+            bus.publish("SHFE.cu2401", quote("SHFE.cu2401", float(i)))
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.1)
+
+        assert fast == [float(i) for i in range(10)]
+        assert len(slow) < 10 and slow[-1] == 9.0
+        assert bus.get_stats()["coalesced"] > 0
+        for subscription in subscriptions:
+            await bus.unsubscribe(subscription)
+
+    @pytest.mark.asyncio
+    async def test_upstream_reference_counting(self):
+        """第一个订阅者出现时订阅上游，最后一个离开时取消"""
+        bus = QuoteBus()
+        source = FakeSource()
+        await bus.start(source)
+
+        first = await bus.subscribe(["SHFE.cu2401"], lambda tick: None)
+        second = await bus.subscribe(["SHFE.cu2401", "SHFE.rb2401"], lambda tick: None)
+        assert [c.args[0] for c in source.subscribe_quotes.call_args_list] == [["SHFE.cu2401"], ["SHFE.rb2401"]]
+
+        await bus.unsubscribe(first)
+        source.unsubscribe_quotes.assert_not_called()
+        await bus.unsubscribe(second)
+        assert sorted(sym for c in source.unsubscribe_quotes.call_args_list for sym in c.args[0]) == [
+            "SHFE.cu2401", "SHFE.rb2401"
+        ]
+
+        await bus.stop()
+        assert source.callbacks == []
+
+    @pytest.mark.asyncio
+    async def test_wait_for_price_condition(self):
+        """等待满足条件的行情，超时返回None"""
+        bus = QuoteBus()
+        source = FakeSource()
+        await bus.start(source)
+
+        waiter = asyncio.create_task(
+            bus.wait_for("SHFE.cu2401", lambda tick: tick.last_price <= 67900.0, timeout=1)
+        )
+        await asyncio.sleep(0)
+        source.emit("SHFE.cu2401", 68000.0)
+        source.emit("SHFE.cu2401", 67850.0)
+
+        tick = await waiter
+        assert tick.last_price == 67850.0
+        assert bus.get_stats()["subscriptions"] == 0
+        assert await bus.wait_for("SHFE.cu2401", lambda tick: tick.last_price > 70000.0, timeout=0.01) is None
+
+    @pytest.mark.asyncio
+    async def test_adapter_pushes_subscribed_quotes(self):
+        """适配器按订阅的合约推送行情"""
+        from app.services.tqsdk_adapter import TQSDKAdapter
+
+        adapter = TQSDKAdapter()
+        adapter.mock_quote_interval = 0.01
+        bus = QuoteBus()
+        await bus.start(adapter)
+        try:
+            subscription = await bus.subscribe(["SHFE.cu2401"])
+            tick = await asyncio.wait_for(subscription.next_tick(), 1)
+            assert tick.symbol == "SHFE.cu2401" and tick.last_price > 0
+
+            await bus.unsubscribe(subscription)
+            assert adapter._pump_symbols == set()
+        finally:
+            await bus.stop()
+
+    @pytest.mark.asyncio
+    async def test_tick_to_websocket_latency(self):
+        """行情推送到WebSocket连接，并统计从适配器收到行情到发送的延迟"""
+        from app.services.realtime_service import RealtimeDataService
+
+        bus = QuoteBus()
+        source = FakeSource()
+        await bus.start(source)
+
+        service = RealtimeDataService()
+        service.quote_bus = bus
+        market = Mock()
+        market.get_instrument_by_symbol = AsyncMock(return_value=object())
+        market.get_quotes = AsyncMock(return_value={})
+
+        websocket = Mock(accept=AsyncMock(), send_text=AsyncMock())
+        with patch("app.services.realtime_service.market_service", market):
+            await service.add_connection(websocket, 1, "c1")
+            await service.subscribe_quotes("c1", ["SHFE.cu2401"])
+
+        source.subscribe_quotes.assert_awaited_once_with(["SHFE.cu2401"])
+        source.emit("SHFE.cu2401", 68010.0)
+        await asyncio.sleep(0.01)
+
+        messages = [json.loads(c.args[0]) for c in websocket.send_text.call_args_list]
+        assert messages[-1]["type"] == "quote_update"
+        assert messages[-1]["data"]["last_price"] == 68010.0
+        assert service.get_connection_stats()["fanout"]["tick_to_send"]["count"] == 1
+
+        await service.remove_connection("c1")
+        source.unsubscribe_quotes.assert_awaited_once_with(["SHFE.cu2401"])
+        await service.stop()
+        await bus.stop()
@@ -0,0 +1,142 @@
+"""
+增量行情流测试用例
+"""
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.websocket.quote_stream import ENCODING_MSGPACK, MSGPACK_AVAILABLE, QuoteDeltaStream
+
+
+def quote(price, volume=100):
+    return {"symbol": "SHFE.cu2401", "last_price": price, "bid_price": price - 10, "volume": volume}
+
+
+class TestQuoteDeltaStream:
+    """行情版本和增量测试"""
+
+    def test_only_changed_fields(self):
+        """只包含基准版本之后变化的字段"""
+        stream = QuoteDeltaStream()
+        stream.update("SHFE.cu2401", quote(68000.0))
+        assert stream.update("SHFE.cu2401", quote(68000.0)) is False
+
+        stream.update("SHFE.cu2401", quote(68010.0))
+        stream.update("SHFE.cu2401", quote(68010.0, volume=120))
+
+        assert stream.delta("SHFE.cu2401", 2) == (2, 3, {"volume": 120})
+        assert stream.delta("SHFE.cu2401", 1) == (1, 3, {"last_price": 68010.0, "bid_price": 68000.0, "volume": 120})
+        assert stream.delta("SHFE.cu2401", 3) is None
+
+    def test_stale_base_gets_full_quote(self):
+        """基准版本超出历史窗口时返回完整行情"""
+        stream = QuoteDeltaStream(history_size=2)
+        for i in range(5):
+            stream.update("SHFE.cu2401", quote(68000.0 + i))
+
+        base, seq, fields = stream.delta("SHFE.cu2401", 1)
+        assert (base, seq) == (0, 5)
+        assert fields == quote(68004.0)
+
+    def test_entry_shared_until_next_update(self):
+        """同一基准版本的条目只编码一次"""
+        stream = QuoteDeltaStream()
+        stream.update("SHFE.cu2401", quote(68000.0))
+        stream.update("SHFE.cu2401", quote(68010.0))
+
+        entry = stream.encode_entry("SHFE.cu2401", 1)
+        assert stream.encode_entry("SHFE.cu2401", 1) is entry
+
+        frame = json.loads(stream.frame([entry]).text)
+        assert frame == {
+            "type": "quote_delta",
+            "updates": [["SHFE.cu2401", 1, 2, {"last_price": 68010.0, "bid_price": 68000.0}]],
+        }
+
+        stream.update("SHFE.cu2401", quote(68020.0))
+        assert stream.encode_entry("SHFE.cu2401", 1) is not entry
+
+    @pytest.mark.skipif(not MSGPACK_AVAILABLE, reason="msgpack未安装")
+    def test_msgpack_frame(self):
+        """MessagePack帧与JSON帧内容一致"""
+        import msgpack
+
+        stream = QuoteDeltaStream()
+        entries = []
+        for i in range(20):
+            symbol = f"SHFE.sym{i:02d}"
+            stream.update(symbol, {"last_price": float(i)})
+            entries.append(stream.encode_entry(symbol, 0, ENCODING_MSGPACK))
+
+        frame = stream.frame(entries, ENCODING_MSGPACK)
+        assert frame.binary
+        decoded = msgpack.unpackb(frame.data)
+        assert decoded["type"] == "quote_delta"
+        assert decoded["updates"][19] == ["SHFE.sym19", 0, 1, {"last_price": 19.0}]
+
+
+class TestCompactQuoteStream:
+    """实时服务增量推送测试"""
+
+    def setup_method(self):
+        from app.services.realtime_service import RealtimeDataService, WebSocketConnection
+
+        from app.services.quote_bus import QuoteBus
+
+        self.service = RealtimeDataService()
+        self.service.quote_bus = QuoteBus()
+        self.service.fanout = Mock()
+        self.service.fanout.send.return_value = True
+        self.sent = lambda: [json.loads(c.args[1].text) for c in self.service.fanout.send.call_args_list]
+
+        self.connection = WebSocketConnection(Mock(), 1, "c1")
+        self.connection.send_message = AsyncMock(return_value=True)
+        self.service.connections["c1"] = self.connection
+
+    @pytest.mark.asyncio
+    async def test_snapshot_then_deltas(self):
+        """先推送快照，之后只推送变化字段，并限制推送频率"""
+        market = Mock()
+        market.get_instrument_by_symbol = AsyncMock(return_value=object())
+        market.subscribe_quotes = AsyncMock(return_value=True)
+        market.get_quotes = AsyncMock(return_value={"SHFE.cu2401": Mock(dict=Mock(return_value=quote(68000.0)))})
+
+        with patch("app.services.realtime_service.market_service", market):
+            await self.service.set_stream_mode("c1", "compact", max_updates_per_sec=2)
+            await self.service.subscribe_quotes("c1", ["SHFE.cu2401"])
+
+        snapshot = self.sent()[0]
+        assert snapshot["type"] == "quote_snapshot"
+        assert snapshot["quotes"]["SHFE.cu2401"]["seq"] == 1
+
+        self.service.quote_stream.update("SHFE.cu2401", quote(68010.0))
+        self.service._push_quote_deltas()
+        self.service.quote_stream.update("SHFE.cu2401", quote(68020.0))
+        self.service._push_quote_deltas()
+
+        deltas = self.sent()[1:]
+        assert len(deltas) == 1
+        assert deltas[0]["updates"] == [["SHFE.cu2401", 1, 2, {"last_price": 68010.0, "bid_price": 68000.0}]]
+
+        # 到达下一个推送时间后，从已推送的版本继续
+        self.connection.next_delta_at = 0
+        self.service._push_quote_deltas()
+        assert self.sent()[-1]["updates"][0][1:3] == [2, 3]
+
+    @pytest.mark.asyncio
+    async def test_dropped_frame_keeps_version(self):
+        """发送队列已满时不推进版本"""
+        self.service.compact_connections.add("c1")
+        self.connection.subscribed_symbols.add("SHFE.cu2401")
+        self.connection.quote_versions["SHFE.cu2401"] = 0
+        self.service.quote_stream.update("SHFE.cu2401", quote(68000.0))
+
+        self.service.fanout.send.return_value = False
+        self.service._push_quote_deltas()
+        assert self.connection.quote_versions["SHFE.cu2401"] == 0
+
+        self.service.fanout.send.return_value = True
+        await self.service.resync_quotes("c1")
+        assert self.connection.quote_versions["SHFE.cu2401"] == 1
+        assert self.sent()[-1]["type"] == "quote_snapshot"
@@ -0,0 +1,169 @@
+"""
+组合风险分析引擎测试用例
+"""
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from app.services.risk_analytics import RiskAnalyticsEngine, ReturnsUniverse, batch_portfolio_risk
+from app.utils.risk_calculator import RiskCalculator
+
+
+START = date(2024, 1, 1)
+
+
+def make_history(symbols, days, seed=3):
+    rng = np.random.default_rng(seed)
+    prices = 100.0 * np.cumprod(1 + rng.normal(0.0005, 0.02, (days, len(symbols))), axis=0)
+    return {
+        symbol: [(START + timedelta(days=d), float(prices[d, j])) for d in range(days)]
+        for j, symbol in enumerate(symbols)
+    }
+
+
+class TestReturnsUniverse:
+    """滚动收益率矩阵测试"""
+
+    def test_incremental_covariance_matches_full_recompute(self):
+        symbols = ["A", "B", "C"]
+        universe = ReturnsUniverse(window=20)
+        universe.add_symbols(make_history(symbols, 15))
+        assert len(universe) == 14
+
+        rng = np.random.default_rng(8)
+        for d in range(15, 60):
+            closes = dict(zip(symbols, universe.last_close * (1 + rng.normal(0, 0.02, 3))))
+            assert universe.roll_day(START + timedelta(days=d), closes)
+            returns = universe.returns()
+            np.testing.assert_allclose(universe.covariance(), np.cov(returns, rowvar=False), rtol=1e-9, atol=1e-14)
+            np.testing.assert_allclose(universe.mean(), returns.mean(axis=0), rtol=1e-9)
+
+        assert len(universe) == 20
+        assert universe.days()[-1] == START + timedelta(days=59)
+        # 同一交易日不重复滚动
+        assert not universe.roll_day(START + timedelta(days=59), {"A": 1.0})
+
+    def test_new_symbol_aligned_to_existing_days(self):
+        history = make_history(["A", "B"], 30)
+        universe = ReturnsUniverse(window=252)
+        universe.add_symbols({"A": history["A"]})
+        # B 缺少前10个交易日，缺失部分收益率记0
+        universe.add_symbols({"B": history["B"][10:]})
+
+        returns = universe.returns()
+        closes_b = np.array([close for _, close in history["B"][10:]])
+        assert np.all(returns[:10, 1] == 0)
+        np.testing.assert_allclose(returns[10:, 1], closes_b[1:] / closes_b[:-1] - 1)
+        np.testing.assert_allclose(universe.correlation(), np.corrcoef(returns, rowvar=False))
+
+
+class TestBatchPortfolioRisk:
+    """批量VaR/CVaR测试"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(21)
+        self.returns = rng.multivariate_normal(
+            [0.0005, 0.0, 0.001], [[4e-4, 1e-4, 0], [1e-4, 2.5e-4, -5e-5], [0, -5e-5, 9e-4]], size=500
+        )
+        self.exposures = np.array([[1e6, 0, 0], [5e5, -2e5, 3e5], [0, 0, 0]])
+        self.mean = self.returns.mean(axis=0)
+        self.cov = np.cov(self.returns, rowvar=False)
+
+    def test_matches_per_portfolio_reference(self):
+        report = batch_portfolio_risk(
+            ["u1", "u2", "u3"], ["A", "B", "C"], self.exposures, self.returns, self.mean, self.cov
+        )
+        for i, weights in enumerate(self.exposures):
+            pnl = self.returns @ weights
+            threshold = np.percentile(pnl, 5)
+            assert report.var["historical"][0.95][i] == pytest.approx(max(-threshold, 0.0))
+            if weights.any():
+                assert report.cvar["historical"][0.95][i] == pytest.approx(-pnl[pnl <= threshold].mean())
+
+            sigma = np.sqrt(weights @ self.cov @ weights)
+            z = stats.norm.ppf(0.01)
+            assert report.var["parametric"][0.99][i] == pytest.approx(max(-(weights @ self.mean + z * sigma), 0.0))
+            # 成分VaR之和等于组合参数VaR的波动部分
+            assert report.component_var[0.99][i].sum() == pytest.approx(-z * sigma)
+
+        # 空组合风险为0
+        assert report.row(2)["var"]["historical"][0.95] == 0.0
+        assert set(report.row(1)["component_var"][0.95]) == {"A", "B", "C"}
+
+    def test_monte_carlo_close_to_parametric(self):
+        engine = RiskAnalyticsEngine(window=500, simulations=20000, seed=1)
+        with patch.object(engine.universe, "rows", return_value=self.returns), \
+                patch.object(engine.universe, "mean", return_value=self.mean), \
+                patch.object(engine.universe, "covariance", return_value=self.cov):
+            engine.universe.symbols, engine.universe.index = ["A", "B", "C"], {"A": 0, "B": 1, "C": 2}
+            report = engine.evaluate({"u1": {"A": 1e6}, "u2": {"A": 5e5, "B": -2e5, "C": 3e5}})
+
+        for c in (0.95, 0.99):
+            np.testing.assert_allclose(report.var["monte_carlo"][c], report.var["parametric"][c], rtol=0.05)
+
+
+class TestRiskAnalyticsEngine:
+    """引擎加载、日终滚动与批量缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_load_roll_and_compute(self):
+        history = make_history(["SHFE.cu2401", "DCE.m2405"], 40)
+        calls = []
+
+        async def loader(symbol, limit):
+            calls.append((symbol, limit))
+            if symbol == "SHFE.bad":
+                raise RuntimeError("no data")
+            return history.get(symbol, [])[-limit:]
+
+        engine = RiskAnalyticsEngine(window=30, simulations=1000, history_loader=loader, seed=2)
+        added = await engine.ensure_symbols(["SHFE.cu2401", "DCE.m2405", "SHFE.bad"])
+        assert added == ["DCE.m2405", "SHFE.cu2401"]
+        assert len(engine.universe) == 30
+        assert await engine.ensure_symbols(["SHFE.cu2401"]) == []
+
+        version = engine.universe.version
+        last_day = engine.universe.last_day
+        assert await engine.end_of_day(last_day + timedelta(days=1), {"SHFE.cu2401": 120.0})
+        assert engine.universe.version > version
+        assert engine.universe.returns()[-1, engine.universe.index["DCE.m2405"]] == 0.0
+
+        report = engine.compute({
+            1: {"SHFE.cu2401": 1e6},
+            2: {"SHFE.cu2401": 5e5, "DCE.m2405": -5e5},
+            3: {"CZCE.SR405": 1e5},
+        })
+        assert engine.get_result(1)["var"]["historical"][0.95] > 0
+        assert engine.get_result(3)["var"]["historical"][0.95] == 0.0
+        assert engine.get_result(2) == report.row(1)
+        assert engine.get_result(4) is None
+        assert engine.get_stats()["last_portfolios"] == 3
+
+        # 未加载的合约登记后在下次加载时补齐
+        assert await engine.ensure_symbols([]) == []
+        assert ("CZCE.SR405", 31) in calls
+
+    def test_risk_calculator_delegates_to_engine(self):
+        engine = RiskAnalyticsEngine(window=60, simulations=0)
+        engine.universe.add_symbols(make_history(["A", "B"], 61))
+        positions = [SimpleNamespace(symbol="A", quantity=10), SimpleNamespace(symbol="B", quantity=5)]
+        prices = {"A": 100.0, "B": 200.0}
+        calculator = RiskCalculator()
+
+        with patch("app.utils.risk_calculator.risk_analytics", engine):
+            var = calculator.calculate_var(positions, prices, confidence=0.95)
+            cvar = calculator.calculate_cvar(positions, prices, confidence=0.95)
+            corr = calculator.calculate_correlation_matrix(positions, prices)
+            contributions = calculator.calculate_risk_contribution(positions, prices)
+            assert calculator.calculate_var([SimpleNamespace(symbol="X", quantity=1)], {"X": 1.0}) is None
+
+        pnl = engine.universe.returns() @ np.array([1000.0, 1000.0])
+        assert float(var) == pytest.approx(-np.percentile(pnl, 5))
+        assert cvar >= var
+        assert list(corr.index) == ["A", "B"]
+        weights = np.array([0.5, 0.5])
+        assert sum(contributions.values()) == pytest.approx(np.sqrt(weights @ engine.universe.covariance() @ weights))
@@ -0,0 +1,146 @@
+"""
+内存风控账本测试用例
+"""
+import asyncio
+
+import pytest
+
+from app.services.risk_book import RiskBookManager, RiskSnapshot
+
+
+def make_snapshot(**overrides):
+    values = dict(
+        total_balance=1_000_000.0,
+        available_balance=800_000.0,
+        positions={"SHFE.cu2401": 2.0},
+        marks={"SHFE.cu2401": 70_000.0},
+        daily_notional=100_000.0,
+        rules=[
+            {"rule_type": "order_size_limit", "symbol": None, "rule_value": 10},
+            {"rule_type": "position_limit", "symbol": "SHFE.cu2401", "rule_value": 5},
+            {"rule_type": "daily_loss_limit", "symbol": None, "rule_value": 20_000},
+        ],
+    )
+    values.update(overrides)
+    return RiskSnapshot(**values)
+
+
+class CountingLoader:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.calls = 0
+
+    def __call__(self, user_id):
+        self.calls += 1
+        return self.snapshot
+
+
+def order(symbol="SHFE.cu2401", side="buy", quantity=1, price=1_000.0):
+    return {"symbol": symbol, "side": side, "quantity": quantity, "price": price}
+
+
+class TestRiskBook:
+    """交易前检查与增量更新"""
+
+    @pytest.mark.asyncio
+    async def test_loads_once_and_checks_rules(self):
+        loader = CountingLoader(make_snapshot())
+        manager = RiskBookManager(loader=loader, reconcile_interval=0)
+
+        results = await asyncio.gather(*(manager.check_order(1, order()) for _ in range(5)))
+        assert all(result == [] for result in results)
+        assert loader.calls == 1
+
+        failed = await manager.check_order(1, order(quantity=11, price=1.0))
+        assert {check["rule_type"] for check in failed} == {"order_size_limit", "position_limit"}
+
+        # 卖出减仓不受持仓限制
+        assert await manager.check_order(1, order(side="sell", quantity=6, price=1.0)) == []
+
+    @pytest.mark.asyncio
+    async def test_fills_update_state_incrementally(self):
+        manager = RiskBookManager(loader=CountingLoader(make_snapshot()), reconcile_interval=0)
+        book = await manager.get_book(1)
+
+        manager.on_fill(1, "SHFE.cu2401", "BUY", 2, 70_000.0, commission=10.0)
+        assert book.positions["SHFE.cu2401"] == 4.0
+        assert book.daily_notional == pytest.approx(240_000.0)
+        assert book.available_balance == pytest.approx(800_000.0 - 140_000.0 - 10.0)
+
+        # 持仓4手时再买2手超过持仓限制5手
+        failed = await manager.check_order(1, order(quantity=2, price=1.0))
+        assert [check["rule_type"] for check in failed] == ["position_limit"]
+
+        # 平仓后释放持仓
+        manager.on_position(1, "SHFE.cu2401", -4.0, 70_000.0)
+        assert "SHFE.cu2401" not in book.positions
+        assert book.available_balance == pytest.approx(800_000.0 - 10.0 + 140_000.0)
+
+    @pytest.mark.asyncio
+    async def test_fills_realize_pnl_from_average_cost(self):
+        manager = RiskBookManager(
+            loader=CountingLoader(make_snapshot(costs={"SHFE.cu2401": 68_000.0})), reconcile_interval=0
+        )
+        book = await manager.get_book(1)
+
+        # 加仓更新持仓均价
+        manager.on_fill(1, "SHFE.cu2401", "buy", 2, 72_000.0)
+        assert book.costs["SHFE.cu2401"] == pytest.approx(70_000.0)
+        assert book.daily_pnl == 0.0
+
+        # 反手：平掉4手按均价结算，剩余1手空头以成交价为均价
+        manager.on_fill(1, "SHFE.cu2401", "sell", 5, 71_000.0, commission=5.0)
+        assert book.daily_pnl == pytest.approx(4 * 1_000.0 - 5.0)
+        assert book.positions["SHFE.cu2401"] == -1.0
+        assert book.costs["SHFE.cu2401"] == 71_000.0
+
+        # 空头在更高价平仓亏损，亏损超过当日限额后拒单
+        manager.on_fill(1, "SHFE.cu2401", "buy", 1, 95_000.0)
+        assert book.daily_pnl == pytest.approx(3_995.0 - 24_000.0)
+        assert "SHFE.cu2401" not in book.costs
+        failed = await manager.check_order(1, order())
+        assert [check["rule_type"] for check in failed] == ["daily_loss_limit"]
+
+    @pytest.mark.asyncio
+    async def test_account_limits(self):
+        manager = RiskBookManager(
+            loader=CountingLoader(make_snapshot(rules=[], daily_pnl=-30_000.0)), reconcile_interval=0
+        )
+        failed = await manager.check_order(1, order(symbol="DCE.m2405", quantity=100, price=3_000.0))
+        messages = " ".join(check["message"] for check in failed)
+        assert "单笔订单金额过大" in messages and "集中度" in messages
+
+        # 资金不足
+        failed = await manager.check_order(1, order(symbol="DCE.m2405", quantity=300, price=3_000.0))
+        assert any("资金不足" in check["message"] for check in failed)
+
+        # 账户不存在
+        manager = RiskBookManager(loader=CountingLoader(make_snapshot(has_account=False)), reconcile_interval=0)
+        assert (await manager.check_order(2, order()))[0]["risk_level"] == "critical"
+
+    @pytest.mark.asyncio
+    async def test_reconcile_corrects_drift(self):
+        loader = CountingLoader(make_snapshot())
+        manager = RiskBookManager(loader=loader, reconcile_interval=0)
+        book = await manager.get_book(1)
+
+        # 漏掉的成交：数据库已有而账本没有
+        loader.snapshot = make_snapshot(positions={"SHFE.cu2401": 3.0}, daily_notional=170_000.0)
+        drift = await manager.reconcile(1)
+        assert drift["position:SHFE.cu2401"] == (2.0, 3.0)
+        assert book.positions["SHFE.cu2401"] == 3.0 and book.daily_notional == 170_000.0
+        assert manager.get_stats()["drift_corrections"] == 1
+
+    @pytest.mark.asyncio
+    async def test_reconcile_skips_when_events_arrive_during_load(self):
+        manager = RiskBookManager(loader=CountingLoader(make_snapshot()), reconcile_interval=0)
+        book = await manager.get_book(1)
+
+        def loader_with_fill(user_id):
+            book.apply_fill("SHFE.cu2401", "buy", 1, 70_000.0)
+            return make_snapshot()
+
+        manager.loader = loader_with_fill
+        assert await manager.reconcile(1) == {}
+        assert book.positions["SHFE.cu2401"] == 3.0
+        assert manager.get_stats()["reconcile_skipped"] == 1
@@ -0,0 +1,131 @@
+"""
+分片实时风险监控测试用例
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.risk_monitor import ShardedRiskMonitor, shard_of
+from app.services.quote_bus import QuoteBus
+
+
+class RecordingCheck:
+    def __init__(self, delay=0.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id):
+        with self._lock:
+            self.calls.append(user_id)
+            self.threads.add(threading.get_ident())
+        if self.delay:
+            time.sleep(self.delay)
+        if user_id in self.fail:
+            raise RuntimeError("boom")
+
+
+class TestShardedRiskMonitor:
+    """分片监控测试"""
+
+    @pytest.mark.asyncio
+    async def test_only_dirty_users_are_checked(self):
+        check = RecordingCheck()
+        users = {1: ["SHFE.cu2401"], 2: ["SHFE.cu2401", "DCE.m2405"], 3: ["DCE.m2405"], 4: []}
+        monitor = ShardedRiskMonitor("test", check, user_loader=lambda: users, interval=0, shards=4, workers=2)
+        try:
+            # 第一个周期全量检查
+            stats = await monitor.run_cycle()
+            assert sorted(check.calls) == [1, 2, 3, 4]
+            assert stats["last_cycle_users"] == 4 and stats["backlog"] == 0
+
+            # 没有变动时不检查
+            check.calls.clear()
+            assert (await monitor.run_cycle())["last_cycle_users"] == 0
+
+            # 价格变动检查持有该合约的用户，成交检查成交用户
+            monitor.mark_symbol_dirty("DCE.m2405")
+            monitor.mark_dirty(4, "SHFE.rb2405")
+            await monitor.run_cycle()
+            assert sorted(check.calls) == [2, 3, 4]
+
+            check.calls.clear()
+            monitor.mark_symbol_dirty("SHFE.rb2405")
+            await monitor.run_cycle()
+            assert check.calls == [4]
+        finally:
+            await monitor.stop()
+
+    @pytest.mark.asyncio
+    async def test_prepare_cycle_batches_all_users(self):
+        """批量预计算每个周期只调用一次，且先于逐用户检查"""
+        check = RecordingCheck()
+        batches = []
+
+        async def prepare(user_ids):
+            batches.append((sorted(user_ids), len(check.calls)))
+
+        monitor = ShardedRiskMonitor("test", check, interval=0, shards=8, workers=4, prepare_cycle=prepare)
+        try:
+            for user_id in range(10):
+                monitor.mark_dirty(user_id)
+            await monitor.run_cycle()
+            await monitor.run_cycle()
+            assert batches == [(list(range(10)), 0)]
+            assert sorted(check.calls) == list(range(10))
+        finally:
+            await monitor.stop()
+
+    @pytest.mark.asyncio
+    async def test_shards_run_in_parallel(self):
+        """16个分片各自一个用户，每个检查耗时20ms，8个线程并行"""
+        check = RecordingCheck(delay=0.02, fail=[5])
+        monitor = ShardedRiskMonitor("test", check, interval=0, shards=16, workers=8)
+        try:
+            for user_id in range(16):
+                monitor.mark_dirty(user_id)
+            begin = time.perf_counter()
+            stats = await monitor.run_cycle()
+            elapsed = time.perf_counter() - begin
+        finally:
+            await monitor.stop()
+
+        assert stats["last_cycle_users"] == 16 and stats["errors"] == 1
+        assert elapsed < 16 * 0.02 / 2
+        assert len(check.threads) > 1
+
+    @pytest.mark.asyncio
+    async def test_quote_bus_marks_holders(self):
+        bus = QuoteBus()
+        check = RecordingCheck()
+        monitor = ShardedRiskMonitor(
+            "test", check, user_loader=lambda: {7: ["SHFE.cu2401"]}, interval=0, shards=4, workers=1, quote_bus=bus
+        )
+        try:
+            await monitor.run_cycle()
+            assert bus.subscribed_symbols() == ["SHFE.cu2401"]
+
+            check.calls.clear()
+            bus.publish("SHFE.cu2401", {"last_price": 70000.0})
+            bus.publish("DCE.m2405", {"last_price": 3000.0})
+            await asyncio.sleep(0.01)
+            await monitor.run_cycle()
+            assert check.calls == [7]
+        finally:
+            await monitor.stop()
+
+    def test_multi_node_shard_ownership(self):
+        """多节点时每个分片只归一个节点"""
+        monitor = ShardedRiskMonitor("test", RecordingCheck(), shards=10)
+        owners = {}
+        for index in range(3):
+            monitor.node_index, monitor.node_count = index, 3
+            for shard in monitor.owned_shards():
+                assert shard not in owners
+                owners[shard] = index
+        assert sorted(owners) == list(range(10))
+        assert shard_of(12, 10) == 2 and 0 <= shard_of("abc", 10) < 10
@@ -0,0 +1,238 @@
+"""
+两级缓存测试用例：并发合并、旧值后台刷新、提前刷新、Redis共享与跨进程失效
+"""
+import asyncio
+
+import pytest
+
+from app.core.tiered_cache import TieredCache, cached
+
+
+class FakeRedis:
+    """内存版异步Redis，只实现两级缓存用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.published = []
+        self.fail = False
+
+    async def get(self, key):
+        if self.fail:
+            raise ConnectionError("redis down")
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def unlink(self, *keys):
+        return sum((self.data.pop(key, None) or self.sets.pop(key, None)) is not None for key in keys)
+
+    async def sadd(self, key, *members):
+        self.sets.setdefault(key, set()).update(members)
+
+    async def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    async def expire(self, key, ttl, nx=False, gt=False):
+        pass
+
+    def pipeline(self, transaction=True):
+        redis = self
+        commands = []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: commands.append((name, args, kwargs))
+
+            async def execute(self):
+                return [await getattr(redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+        return Pipeline()
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    async def aclose(self):
+        pass
+
+
+def make_cache(redis=None, **kwargs):
+    kwargs.setdefault("beta", 0)
+    return TieredCache(redis_client=redis or FakeRedis(), **kwargs)
+
+
+def counting_loader(value="v", delay=0.0):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return f"{value}{len(calls)}"
+
+    return loader, calls
+
+
+class TestTieredCache:
+    """两级缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_are_coalesced(self):
+        cache = make_cache()
+        loader, calls = counting_loader(delay=0.01)
+
+        results = await asyncio.gather(*(cache.get_or_load("summary", "k", loader) for _ in range(100)))
+
+        assert results == ["v1"] * 100 and len(calls) == 1
+        assert await cache.get_or_load("summary", "k", loader) == "v1"
+        stats = cache.get_stats()["namespaces"]["summary"]
+        assert (stats["misses"], stats["coalesced"], stats["local_hits"]) == (1, 99, 1)
+        assert stats["hit_ratio"] == pytest.approx(1 / 101)
+
+    @pytest.mark.asyncio
+    async def test_stale_value_is_served_while_refreshing(self):
+        cache = make_cache(stale_ttl=10)
+        loader, calls = counting_loader(delay=0.01)
+        await cache.get_or_load("summary", "k", loader, ttl=0.02)
+        await asyncio.sleep(0.03)
+
+        assert await cache.get_or_load("summary", "k", loader, ttl=0.02) == "v1"
+        assert await cache.get_or_load("summary", "k", loader, ttl=0.02) == "v1"
+        await asyncio.sleep(0.02)
+
+        assert await cache.get_or_load("summary", "k", loader, ttl=0.02) == "v2"
+        assert len(calls) == 2 and cache.stats["summary"].stale_hits == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_keeps_stale_value(self):
+        cache = make_cache(stale_ttl=10)
+        await cache.get_or_load("summary", "k", counting_loader()[0], ttl=0.01)
+        await asyncio.sleep(0.02)
+
+        async def failing():
+            raise RuntimeError("upstream down")
+
+        assert await cache.get_or_load("summary", "k", failing, ttl=0.01) == "v1"
+        await asyncio.sleep(0.01)
+        assert cache.stats["summary"].load_errors == 1
+        assert await cache.get_or_load("summary", "k", failing, ttl=0.01) == "v1"
+        await cache.stop()
+
+    @pytest.mark.asyncio
+    async def test_slow_loads_refresh_early(self):
+        cache = make_cache(beta=1e6)
+        loader, calls = counting_loader(delay=0.01)
+        await cache.get_or_load("summary", "k", loader, ttl=60)
+
+        assert await cache.get_or_load("summary", "k", loader, ttl=60) == "v1"
+        await asyncio.wait_for(cache._inflight[("summary", "k")], timeout=1)
+        assert await cache.get_or_load("summary", "k", loader, ttl=60) == "v2"
+        assert cache.stats["summary"].early_refreshes >= 1
+        await cache.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_inflight_loads(self):
+        cache = make_cache()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        load = asyncio.create_task(cache.get_or_load("summary", "k", slow))
+        await started.wait()
+        task = cache._inflight[("summary", "k")]
+        await cache.stop()
+
+        assert task.cancelled()
+        with pytest.raises(asyncio.CancelledError):
+            await load
+
+    @pytest.mark.asyncio
+    async def test_processes_share_redis_and_invalidate_each_other(self):
+        redis = FakeRedis()
+        first, second = make_cache(redis), make_cache(redis)
+        loader, calls = counting_loader()
+
+        assert await first.get_or_load("instruments", "SHFE", loader) == "v1"
+        assert await second.get_or_load("instruments", "SHFE", loader) == "v1"
+        assert len(calls) == 1 and second.stats["instruments"].redis_hits == 1
+
+        await first.set("instruments", "SHFE", "new")
+        channel, message = redis.published[-1]
+        first.handle_invalidation(message)
+        assert await first.get("instruments", "SHFE") == "new"
+        second.handle_invalidation(message)
+        assert len(second.local) == 0
+        assert await second.get("instruments", "SHFE") == "new"
+
+        await second.invalidate_local("instruments")
+        first.handle_invalidation(redis.published[-1][1])
+        assert len(first.local) == 0
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation_across_tiers_and_processes(self):
+        redis = FakeRedis()
+        first, second = make_cache(redis), make_cache(redis)
+        for symbol in ("rb2405", "cu2401"):
+            loader, _ = counting_loader(symbol)
+            await first.get_or_load("summary", symbol, loader, tags=[f"symbol:{symbol}"])
+            await second.get_or_load("summary", symbol, loader, tags=[f"symbol:{symbol}"])
+        await first.get_or_load("summary", "both", counting_loader("both")[0], tags=["symbol:rb2405", "symbol:cu2401"])
+        assert len(second.local) == 2 and len(redis.data) == 3
+
+        assert await first.invalidate_tags("symbol:rb2405") == 2
+        assert [key for key in first.local._entries] == [("summary", "cu2401")]
+        assert list(redis.data) == ["tc:summary:cu2401"]
+
+        second.handle_invalidation(redis.published[-1][1])
+        assert [key for key in second.local._entries] == [("summary", "cu2401")]
+        assert "symbol:rb2405" not in second.local._tags
+
+    @pytest.mark.asyncio
+    async def test_load_in_flight_during_invalidation_is_not_stored(self):
+        cache = make_cache()
+        loader, calls = counting_loader(delay=0.02)
+
+        pending = asyncio.create_task(cache.get_or_load("summary", "k", loader, tags=["user:42"]))
+        await asyncio.sleep(0.005)
+        await cache.invalidate_tags("user:42")
+
+        assert await pending == "v1"
+        assert len(cache.local) == 0 and cache._redis.data == {}
+        assert await cache.get_or_load("summary", "k", loader, tags=["user:42"]) == "v2"
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_fall_back_to_local_cache(self):
+        redis = FakeRedis()
+        redis.fail = True
+        cache = make_cache(redis)
+        loader, calls = counting_loader()
+
+        assert await cache.get_or_load("summary", "k", loader) == "v1"
+        assert await cache.get_or_load("summary", "k", loader) == "v1"
+        assert len(calls) == 1 and cache.redis is None
+
+    @pytest.mark.asyncio
+    async def test_decorator_keys_methods_by_arguments(self):
+        cache = make_cache()
+        calls = []
+
+        class Service:
+            @cached("summary", ttl=60, cache=cache)
+            async def summary(self, symbols, period=86400):
+                calls.append((tuple(symbols), period))
+                return {symbol: period for symbol in symbols}
+
+        assert await Service().summary(["cu"]) == {"cu": 86400}
+        assert await Service().summary(["cu"]) == {"cu": 86400}
+        assert await Service().summary(["cu"], period=60) == {"cu": 60}
+        assert calls == [(("cu",), 86400), (("cu",), 60)]
+
+        with pytest.raises(TypeError):
+            cached("summary")(lambda: None)
@@ -0,0 +1,141 @@
+"""
+交易系统适配器测试用例：批量提交/撤单、订单状态事件流、连接池流水线
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.adapters.trading_system_adapter import ConnectionPool, MockTradingSystemAdapter
+from app.models.order import OrderSide, OrderType
+from app.services.order_execution_service import OrderExecutionService
+
+
+def make_order(order_id, price=100.0, order_type=OrderType.LIMIT):
+    return SimpleNamespace(id=order_id, symbol="AAPL", side=OrderSide.BUY, order_type=order_type,
+                           quantity=1, price=price, stop_price=None, order_id_external=None)
+
+
+async def connected_adapter(**config):
+    adapter = MockTradingSystemAdapter(config)
+    await adapter.connect()
+    return adapter
+
+
+async def collect_updates(adapter, events):
+    async for update in adapter.subscribe_order_updates():
+        events.append(update)
+
+
+class TestMockTradingSystemAdapter:
+    """模拟适配器批量接口与事件流测试"""
+
+    @pytest.mark.asyncio
+    async def test_batch_cancel_is_one_round_trip_and_streams_updates(self):
+        adapter = await connected_adapter()
+        events = []
+        consumer = asyncio.create_task(collect_updates(adapter, events))
+        await asyncio.sleep(0)
+
+        orders = [make_order(i) for i in range(500)]
+        results = await adapter.submit_orders(orders)
+        assert all(result.success for result in results) and adapter.round_trips == 1
+        for order, result in zip(orders, results):
+            order.order_id_external = result.external_order_id
+
+        assert await adapter.cancel_orders(orders) == [True] * 500
+        assert adapter.round_trips == 2 and len(adapter.matching) == 0
+
+        await asyncio.sleep(0)
+        assert [e["status"] for e in events] == ["submitted"] * 500 + ["cancelled"] * 500
+        assert events[-1]["external_order_id"] == orders[-1].order_id_external
+
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        assert adapter._order_update_queues == []
+
+    @pytest.mark.asyncio
+    async def test_fills_are_streamed_with_last_fill_price(self):
+        adapter = await connected_adapter(participation_rate=1.0)
+        events = []
+        consumer = asyncio.create_task(collect_updates(adapter, events))
+        await asyncio.sleep(0)
+
+        result = await adapter.submit_order(make_order(1, price=10_000.0))
+        await adapter.get_market_data("AAPL")
+        await asyncio.sleep(0)
+
+        assert events[-1]["status"] == "filled"
+        assert events[-1]["external_order_id"] == result.external_order_id
+        assert events[-1]["last_fill_price"] == events[-1]["avg_fill_price"]
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+
+
+class TestConnectionPool:
+    """连接池流水线测试"""
+
+    @pytest.mark.asyncio
+    async def test_in_flight_requests_are_capped_and_spread(self):
+        adapter = await connected_adapter(pool_size=2, max_in_flight=3, latency=0.01)
+
+        results = await asyncio.gather(*(adapter.submit_order(make_order(i)) for i in range(20)))
+
+        stats = adapter.pool.get_stats()
+        assert all(result.success for result in results)
+        assert stats["peak_in_flight"] == 6 and stats["in_flight"] == 0 and stats["waiting"] == 0
+        assert stats["requests"] == [10, 10]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_releases_its_turn(self):
+        pool = ConnectionPool(size=1, max_in_flight=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.request():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+
+        async with pool.request() as connection:
+            assert connection.in_flight == 1
+        assert pool.get_stats()["waiting"] == 0
+
+
+class TestOrderExecutionServiceUpdates:
+    """订单执行服务消费状态事件流"""
+
+    @pytest.mark.asyncio
+    async def test_updates_are_routed_to_tracked_orders(self):
+        adapter = await connected_adapter()
+        service = OrderExecutionService()
+        processed = []
+
+        async def process(order, update):
+            processed.append((order.id, update["status"]))
+
+        async def load_active_order(external_order_id):
+            return None
+
+        service._process_external_status_update = process
+        service._load_active_order = load_active_order
+        orders = [make_order(i) for i in range(3)]
+        for order, result in zip(orders, await adapter.submit_orders(orders)):
+            order.order_id_external = result.external_order_id
+
+        consumer = asyncio.create_task(service._consume_order_updates(adapter))
+        await asyncio.sleep(0)
+        service.tracked_orders = {order.order_id_external: order for order in orders[:2]}
+        await adapter.cancel_orders(orders)
+        await asyncio.sleep(0)
+
+        assert processed == [(0, "cancelled"), (1, "cancelled")]
+        assert service.tracked_orders == {}
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
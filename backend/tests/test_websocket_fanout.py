@@ -0,0 +1,106 @@
+"""
+WebSocket消息扇出测试用例
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.websocket.fanout import FanoutHub, encode_message
+
+
+class FakeWebSocket:
+    """记录发送内容，可模拟慢连接和断开"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+
+    async def send_text(self, text):
+        if self.fail:
+            raise ConnectionError("closed")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(text)
+
+
+def quote(symbol, price):
+    return {"type": "quote_update", "symbol": symbol, "data": {"last_price": price}}
+
+
+class TestFanoutHub:
+    """扇出测试"""
+
+    @pytest.mark.asyncio
+    async def test_serialize_once_for_all_subscribers(self):
+        """所有连接收到同一个序列化结果"""
+        hub = FanoutHub()
+        sockets = [FakeWebSocket() for _ in range(3)]
+        for i, ws in enumerate(sockets):
+            hub.register(i, ws)
+
+        assert hub.publish(range(3), quote("SHFE.cu2401", 68000.0)) == 3
+        await asyncio.sleep(0.01)
+
+        texts = [ws.sent[0] for ws in sockets]
+        assert texts[0] is texts[1] is texts[2]
+        assert json.loads(texts[0])["data"]["last_price"] == 68000.0
+        await hub.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_keeps_latest_quote(self):
+        """慢连接只保留每个合约的最新行情，不影响其他连接"""
+        hub = FanoutHub()
+        slow, fast = FakeWebSocket(delay=0.05), FakeWebSocket()
+        hub.register("slow", slow)
+        hub.register("fast", fast)
+
+        for price in range(10):
+            hub.publish(["slow", "fast"], quote("SHFE.cu2401", float(price)), conflate_key="quote:SHFE.cu2401")
+            hub.publish(["slow", "fast"], quote("SHFE.rb2401", float(price)), conflate_key="quote:SHFE.rb2401")
+            await asyncio.sleep(0.001)
+
+        await asyncio.sleep(0.2)
+
+        assert len(fast.sent) == 20
+        slow_prices = [(m["symbol"], m["data"]["last_price"]) for m in map(json.loads, slow.sent)]
+        assert len(slow_prices) < 20
+        assert ("SHFE.cu2401", 9.0) in slow_prices and ("SHFE.rb2401", 9.0) in slow_prices
+        assert hub.get_stats()["coalesced"] > 0
+        await hub.close()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_drops_instead_of_blocking(self):
+        """队列满时丢弃新消息"""
+        hub = FanoutHub(max_pending=2)
+        hub.register("slow", FakeWebSocket(delay=1))
+
+        results = [hub.send("slow", {"seq": i}) for i in range(4)]
+
+        assert results == [True, True, False, False]
+        assert hub.get_stats()["dropped"] == 2
+        await hub.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_send_closes_connection(self):
+        """发送失败时回调关闭连接"""
+        closed = []
+
+        async def on_close():
+            closed.append(True)
+            hub.unregister("bad")
+
+        hub = FanoutHub()
+        hub.register("bad", FakeWebSocket(fail=True), on_close=on_close)
+        hub.send("bad", {"type": "heartbeat"})
+        await asyncio.sleep(0.01)
+
+        assert closed == [True]
+        assert hub.send("bad", {"type": "heartbeat"}) is False
+        await hub.close()
+
+    def test_encode_message_passthrough(self):
+        """字符串消息不再序列化"""
+        assert encode_message('{"a":1}').text == '{"a":1}'
+        assert json.loads(encode_message({"a": 1, 2: "b"}).data) == {"a": 1, "2": "b"}